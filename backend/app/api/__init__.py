@@ -1,24 +1,29 @@
 # backend/app/api/__init__.py
 
-# 注册路由
-from .routes import router as api_router
-
 # Alembic 自动识别所有模型的 metadata
 from app.models.base import Base
 from app.models.user import User
-from app.models.prompt import Prompt
-from app.models.tag import Tag
+from app.models.prompt import Prompt, PromptVersion
+from app.models.tag import Tag, PromptTagFacet
+from app.models.quota import DailyApiUsage
+from app.models.job import Job
+from app.models.gallery import PublicPromptSnapshot, PublicGalleryMeta
+from app.models.embedding import PromptEmbedding
+from app.models.dedupe import PromptSignature
 
-# 注册 API 路由
+# 注册 API 路由：每个路由只在这里挂一次，create_app 再把 api_router 挂到 API_V1_STR 下
 from fastapi import APIRouter
-from app.api.v1 import users, prompts
+from app.api.v1 import jobs, prompts, public, tags, users
+from app.api import mcp
 
 api_router = APIRouter()
-api_router.include_router(users.router)
-api_router.include_router(prompts.router)
+api_router.include_router(users.router, prefix="/users", tags=["users"])
+api_router.include_router(prompts.router, prefix="/prompts", tags=["prompts"])
+api_router.include_router(tags.router, prefix="/tags", tags=["tags"])
+api_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+api_router.include_router(public.router, prefix="/public", tags=["public"])
 
 
 # 挂载 MCP，独立前缀
-# MCP还没写完
-# mcp_router = APIRouter()
-# mcp_router.include_router(mcp.router, prefix="/mcp", tags=["mcp"])
\ No newline at end of file
+mcp_router = APIRouter()
+mcp_router.include_router(mcp.router, prefix="/mcp", tags=["mcp"])
@@ -4,13 +4,15 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import get_settings
-from app.core.security import verify_token
+from app.core.security import principal_from_claims, verify_token
+from app.core.tokens import REFRESH, deny_list
+from app.db.replica import bind_user, get_read_db, use_primary
 from app.db.session import get_db
 from app.services.user_service import get_user_by_email
 from app.models.user import User
 
 from app.services.user_service import get_user_by_id
-from types import SimpleNamespace
+from app.core.principal_cache import Principal, principal_cache
 
 # ✅ 读取配置（不要 from app.core.config import settings）
 settings = get_settings()
@@ -24,32 +26,58 @@ async def get_db_session() -> AsyncSession:
         yield session
 
 
+# 只读 DB 会话依赖：配置了 DATABASE_READ_URL 时读走副本（见 app/db/replica.py），否则同 get_db_session
+async def get_read_session() -> AsyncSession:
+    async for session in get_read_db():
+        yield session
+
+
+# 当前请求的 token 声明（登出等需要 jti / exp 的接口用）
+async def get_token_claims(token: str = Depends(oauth2_scheme)) -> dict:
+    return verify_token(token)
+
+
 # 从 Bearer Token 解出当前用户（用 sub 作为 User.id）
+# 返回 Principal 快照（id/email/is_active）：
+#   - 新格式 access token（带 act / ep 声明）验签 + 查吊销名单即可，不查库
+#   - 旧格式 token（或关掉 AUTH_STATELESS_ENABLED 时）先查缓存，未命中再查库
+# 不管走哪条路，吊销名单（登出 / 全部登出 / 停用）和 is_active 都要检查
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db_session),
-) -> User:
-    try:
-        # email = verify_token(token)
-        # user_id = verify_token(token) 
-        payload_or_sub = verify_token(token)
-        if isinstance(payload_or_sub, dict):
-            user_id = payload_or_sub.get("sub")
-        else:
-            user_id = payload_or_sub
-        #这里总报错兼容一下
-
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token: missing sub")
-            # 兜底：如果 DB 暂时没这条用户记录（比如老 token），先返回一个轻量对象，保证 current_user.id 可用
-            return SimpleNamespace(id=user_id, email=None)
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    db: AsyncSession = Depends(get_read_session),
+) -> Principal:
+    payload = verify_token(token)
+    if payload.get("typ") == REFRESH:
+        raise HTTPException(status_code=401, detail="Refresh token cannot be used for API access")
+    if deny_list.is_denied(payload):
+        raise HTTPException(status_code=401, detail="Token revoked")
+
+    principal = principal_from_claims(payload) if settings.AUTH_STATELESS_ENABLED else None
+    if principal is None:
+        principal = await _load_principal(db, payload.get("sub"))
+    if not principal.is_active:
+        raise HTTPException(status_code=403, detail="User is inactive")
+    return principal
+
+
+async def _load_principal(db: AsyncSession, user_id) -> Principal:
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid token: missing sub")
+
+    cached = principal_cache.get_by_id(user_id)
+    if cached is not None:
+        return cached
 
+    generation = principal_cache.generation()
+    bind_user(db, user_id)
     user = await get_user_by_id(db, user_id=user_id)
+    if not user and use_primary(db):
+        user = await get_user_by_id(db, user_id=user_id)  # 刚注册，副本上还没有
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    principal = Principal.from_user(user)
+    principal_cache.put_by_id(principal, generation)
+    return principal
 
 # API Key 校验；显式使用 X-API-Key 作为头名
 async def verify_api_key(x_api_key: str = Header(..., alias="X-API-Key")):
@@ -1,12 +1,29 @@
 # backend/app/api/mcp.py
-from typing import Any, Dict, List, Optional
-from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
-from pydantic import BaseModel, Field
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional, Type, Union
+import orjson
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError, model_validator
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.deps import get_db_session
-from app.core.security import get_user_by_api_key_or_401  # 后面实现？
+from app.api.deps import get_read_session
+from app.core.config import get_settings
+from app.core.principal_cache import Principal
+from app.core.rate_limit import RateLimitDecision, rate_limiter
+from app.core.security import get_user_by_api_key_or_401
+from app.db.replica import ReadSessionLocal
+from app.schemas.prompt import PromptRenderRequest
 from app.services import prompt_service
+from app.services.mcp_sessions import SessionLimitExceeded, session_registry
+from app.services.quota_service import quota_tracker
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -18,13 +35,13 @@ class MCPMessageType(str, Enum):
 
 class MCPRequest(BaseModel):
     jsonrpc: str = "2.0"
-    id: Optional[str] = None
+    id: Optional[Union[str, int]] = None
     method: str
     params: Optional[Dict[str, Any]] = None
 
 class MCPResponse(BaseModel):
     jsonrpc: str = "2.0"
-    id: Optional[str] = None
+    id: Optional[Union[str, int]] = None
     result: Optional[Dict[str, Any]] = None
     error: Optional[Dict[str, Any]] = None
 
@@ -40,27 +57,244 @@ class ListPromptsArgs(BaseModel):
     search: Optional[str] = None
     limit: int = Field(default=50, ge=1, le=200)  # 合理限制，避免滥用
     category: Optional[str] = Field(default=None, max_length=100)
+    search_mode: Literal["auto", "fulltext", "trigram", "like"] = Field(
+        default="auto", description="auto: 英文走全文索引，短查询/中文走 pg_trgm"
+    )
 
 class GetPromptArgs(BaseModel):
     prompt_id: str = Field(..., description="提示词ID（UUID 字符串）")
 
-# ==== 工具注册 ====
-TOOLS: List[MCPTool] = [
-    MCPTool(
-        name="list_available_prompts",
-        description="获取用户可用的提示词列表",
-        inputSchema=ListPromptsArgs.model_json_schema()
-    ),
-    MCPTool(
-        name="get_prompt_content",
-        description="获取指定提示词的完整内容",
-        inputSchema=GetPromptArgs.model_json_schema()
+class RenderPromptArgs(PromptRenderRequest):
+    prompt_id: str = Field(..., description="提示词ID（UUID 字符串）")
+
+class SearchSimilarArgs(BaseModel):
+    query: Optional[str] = Field(default=None, max_length=4000, description="按这段文本找相似的提示词")
+    prompt_id: Optional[str] = Field(default=None, description="或按已有提示词找相似的（结果不含它自己）")
+    limit: int = Field(default=10, ge=1, le=50)
+    min_score: float = Field(default=0.0, ge=-1.0, le=1.0, description="余弦相似度下限")
+
+    @model_validator(mode="after")
+    def _one_source(self):
+        if not (self.query and self.query.strip()) and not self.prompt_id:
+            raise ValueError("Either query or prompt_id is required")
+        return self
+
+
+# ==== 工具注册表 ====
+# handler 签名：async (db, user, args) -> dict 或已序列化的 JSON bytes；args 已经用 args_model 校验过
+ToolHandler = Callable[[AsyncSession, Principal, BaseModel], Awaitable[Union[Dict[str, Any], bytes]]]
+
+@dataclass(frozen=True)
+class ToolSpec:
+    name: str
+    description: str
+    args_model: Type[BaseModel]
+    handler: ToolHandler
+
+    def describe(self) -> MCPTool:
+        return MCPTool(
+            name=self.name,
+            description=self.description,
+            inputSchema=self.args_model.model_json_schema(),
+        )
+
+
+TOOL_REGISTRY: Dict[str, ToolSpec] = {}
+_tools_cache: Optional[Dict[str, Any]] = None  # tools/list 的响应体，注册表变化时清空
+
+def register_tool(name: str, description: str, args_model: Type[BaseModel]):
+    """装饰器：把一个工具 handler 注册到 TOOL_REGISTRY"""
+    def decorator(handler: ToolHandler) -> ToolHandler:
+        if name in TOOL_REGISTRY:
+            raise ValueError(f"MCP tool already registered: {name}")
+        global _tools_cache
+        TOOL_REGISTRY[name] = ToolSpec(name, description, args_model, handler)
+        _tools_cache = None
+        return handler
+    return decorator
+
+
+@register_tool("list_available_prompts", "获取用户可用的提示词列表", ListPromptsArgs)
+async def _list_available_prompts(db: AsyncSession, user: Principal, args: ListPromptsArgs):
+    return await prompt_service.mcp_list_available_prompts(
+        db=db,
+        user_id=user.id,
+        tags=args.tags,
+        search=args.search,
+        limit=args.limit,
+        category=args.category,
+        search_mode=args.search_mode,
+    )
+
+@register_tool("get_prompt_content", "获取指定提示词的完整内容", GetPromptArgs)
+async def _get_prompt_content(db: AsyncSession, user: Principal, args: GetPromptArgs):
+    # 返回缓存里已序列化好的 bytes，编码响应时原样拼接
+    return await prompt_service.mcp_get_prompt_content_raw(
+        db=db,
+        user_id=user.id,
+        prompt_id=args.prompt_id
+    )
+
+
+@register_tool("render_prompt", "用变量渲染提示词模板（variable_sets 可批量渲染）", RenderPromptArgs)
+async def _render_prompt(db: AsyncSession, user: Principal, args: RenderPromptArgs):
+    try:
+        pid = uuid.UUID(args.prompt_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid prompt_id")
+    data = await prompt_service.render_prompt(
+        db, user_id=user.id, prompt_id=pid, variable_sets=args.sets(), strict=args.strict
+    )
+    data["content"] = [{"type": "text", "text": text} for text in data["rendered"]]
+    return data
+
+
+@register_tool("search_similar_prompts", "按语义相似度查找提示词（给一段文本或一个已有提示词）", SearchSimilarArgs)
+async def _search_similar_prompts(db: AsyncSession, user: Principal, args: SearchSimilarArgs):
+    from app.services import embedding_service  # numpy 按需加载
+    return await embedding_service.mcp_search_similar_prompts(
+        db, user_id=user.id, query=args.query, prompt_id=args.prompt_id, limit=args.limit, min_score=args.min_score
     )
-]
+
+
+def tools_payload() -> Dict[str, Any]:
+    """工具清单（每个工具的 JSON Schema 生成一次后缓存）"""
+    global _tools_cache
+    if _tools_cache is None:
+        _tools_cache = {"tools": [spec.describe().model_dump() for spec in TOOL_REGISTRY.values()]}
+    return _tools_cache
+
+
+# ==== 响应编码 ====
+# 热路径不再经过 MCPResponse 模型 + response_model 的二次校验，直接拼 dict 再用 orjson 编码；
+# result 也可以是已经序列化好的 JSON bytes（如 prompt_cache 命中），此时原样拼接，不再解析
+RPCMessage = Dict[str, Any]
+
+def _ok(req_id, result: Union[Dict[str, Any], bytes]) -> RPCMessage:
+    return {"jsonrpc": "2.0", "id": req_id, "result": result, "error": None}
+
+def _err(req_id, code: int, message: Any) -> RPCMessage:
+    return {"jsonrpc": "2.0", "id": req_id, "result": None, "error": {"code": code, "message": message}}
+
+def encode_message(msg: RPCMessage) -> bytes:
+    result = msg["result"]
+    if isinstance(result, (bytes, bytearray)):
+        return (
+            b'{"jsonrpc":"2.0","id":' + orjson.dumps(msg["id"])
+            + b',"result":' + bytes(result) + b',"error":null}'
+        )
+    return orjson.dumps(msg)
+
+def _json_response(body: bytes, headers: Optional[Dict[str, str]] = None, status_code: int = 200) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers, status_code=status_code)
+
+
+# ==== 限流 / 配额 ====
+RATE_LIMITED = 429  # JSON-RPC error.code 沿用 HTTP 状态码，与工具内的 HTTPException 一致
+
+async def _admit(user: Principal, tool: Optional[str] = None, cost: int = 1, charge_quota: bool = True, req_id=None):
+    """
+    认证之后、执行之前调用。返回 (拒绝时的 429 响应, 要附加到正常响应上的头)。
+    限流先于配额检查，被限流拒绝的调用不计入当日配额。
+    """
+    headers: Dict[str, str] = {}
+    decision: Optional[RateLimitDecision] = await rate_limiter.check(user.id, tool, cost)
+    if decision is not None:
+        headers.update(decision.headers())
+        if not decision.allowed:
+            body = encode_message(_err(req_id, RATE_LIMITED, "Rate limit exceeded"))
+            return _json_response(body, headers, status_code=429), headers
+    if charge_quota:
+        quota = quota_tracker.consume(user.id, cost)
+        if quota is not None:
+            headers.update(quota.headers())
+            if not quota.allowed:
+                body = encode_message(_err(req_id, RATE_LIMITED, "Daily quota exceeded"))
+                return _json_response(body, headers, status_code=429), headers
+    return None, headers
+
+
+def _tool_name(req: MCPRequest) -> Optional[str]:
+    name = (req.params or {}).get("name")
+    # 未注册的工具名不建桶，避免随意的名字撑大限流表；这类调用会在分发时报 Unknown tool
+    return name if isinstance(name, str) and name in TOOL_REGISTRY else None
+
+
+# ==== 调度 ====
+# initialize 的响应：prompts.listChanged 表示 SSE 会话会收到 notifications/prompts/list_changed
+_SERVER_INFO = {
+    "protocolVersion": "2024-11-05",
+    "capabilities": {"tools": {}, "prompts": {"listChanged": True}},
+    "serverInfo": {"name": "prompt-manager", "version": "1.0.0"},
+}
+
+
+def _is_notification(req: MCPRequest) -> bool:
+    """客户端发来的通知（没有 id）不需要响应"""
+    return req.id is None and req.method.startswith("notifications/")
+
+
+async def _call_tool(db: AsyncSession, user: Principal, req: MCPRequest) -> RPCMessage:
+    if not req.params or "name" not in req.params:
+        return _err(req.id, -32602, "Missing 'name' in params")
+
+    tool_name = req.params["name"]
+    spec = TOOL_REGISTRY.get(tool_name)
+    if spec is None:
+        return _err(req.id, -32601, f"Unknown tool: {tool_name}")
+
+    try:
+        parsed = spec.args_model(**(req.params.get("arguments", {}) or {}))
+    except ValidationError as e:
+        return _err(req.id, -32602, str(e))
+
+    try:
+        return _ok(req.id, await spec.handler(db, user, parsed))
+    except HTTPException as e:
+        return _err(req.id, e.status_code, e.detail)
+    except Exception:
+        # 异常原文可能带 SQL / DSN / 内部路径，只写日志，不回给客户端
+        logger.exception("MCP tool %s failed", tool_name)
+        return _err(req.id, -32603, "Internal error")
+
+
+async def dispatch(db: AsyncSession, user: Principal, req: MCPRequest) -> RPCMessage:
+    """按 JSON-RPC method 分发单条请求（调用方已完成认证）"""
+    if req.method == "tools/list":
+        return _ok(req.id, tools_payload())
+    if req.method == "tools/call":
+        return await _call_tool(db, user, req)
+    if req.method == "initialize":
+        return _ok(req.id, _SERVER_INFO)
+    if req.method == "ping":
+        return _ok(req.id, {})
+    return _err(req.id, -32601, "Unknown method")
+
+
+async def dispatch_batch(user: Principal, reqs: List[MCPRequest]) -> List[RPCMessage]:
+    """
+    批量请求：每个调用使用独立 session 并发执行，互不影响事务；
+    用信号量限制并发，避免一个大批次占满连接池。
+    批内的通知不执行也不响应，返回的响应按其余请求的原顺序排列（全是通知时为空列表）。
+    """
+    sem = asyncio.Semaphore(settings.MCP_BATCH_CONCURRENCY)
+
+    async def run_one(req: MCPRequest) -> RPCMessage:
+        tool = _tool_name(req) if req.method == "tools/call" else None
+        if tool is not None:
+            decision = await rate_limiter.check_tool(user.id, tool)
+            if decision is not None and not decision.allowed:
+                return _err(req.id, RATE_LIMITED, f"Rate limit exceeded for tool {tool}")
+        async with sem:
+            async with ReadSessionLocal() as session:
+                return await dispatch(session, user, req)
+
+    return list(await asyncio.gather(*(run_one(r) for r in reqs if not _is_notification(r))))
+
 
 @router.post("/v1/tools/list", response_model=MCPResponse)
 async def mcp_tools_list(
-    db: AsyncSession = Depends(get_db_session),
+    db: AsyncSession = Depends(get_read_session),
     authorization: Optional[str] = Header(default=None)
 ):
     """
@@ -68,13 +302,17 @@ async def mcp_tools_list(
     API Key 读取规则：Authorization: Bearer <api_key>
     """
     user = await get_user_by_api_key_or_401(db, authorization)
+    denied, headers = await _admit(user, charge_quota=False)
+    if denied is not None:
+        return denied
     # 这里不返回用户信息，仅返回工具清单
-    return MCPResponse(result={"tools": [t.model_dump() for t in TOOLS]})
+    return _json_response(encode_message(_ok(None, tools_payload())), headers)
 
-@router.post("/v1/tools/call", response_model=MCPResponse)
+# response_model 只用于生成文档；直接返回 Response，FastAPI 不会再做校验/序列化
+@router.post("/v1/tools/call", response_model=Union[MCPResponse, List[MCPResponse]])
 async def mcp_tools_call(
-    req: MCPRequest,
-    db: AsyncSession = Depends(get_db_session),
+    req: Union[MCPRequest, List[MCPRequest]] = Body(...),
+    db: AsyncSession = Depends(get_read_session),
     authorization: Optional[str] = Header(default=None)
 ):
     """
@@ -84,43 +322,110 @@ async def mcp_tools_call(
       "method": "tools/call",
       "params": { "name": "list_available_prompts", "arguments": {...} }
     }
+    也支持 JSON-RPC 批量数组 [{...}, {...}]：整批只认证一次，各调用并发执行，按原顺序返回。
+    限流：用户桶按整批条数扣减，超出返回 429；工具桶逐条扣减，超出的条目单独返回 429 错误。
     """
     user = await get_user_by_api_key_or_401(db, authorization)
 
-    if req.method != "tools/call":
-        return MCPResponse(error={"code": -32601, "message": "Unknown method"})
+    if isinstance(req, list):
+        if not req:
+            return _json_response(encode_message(_err(None, -32600, "Empty batch")))
+        if len(req) > settings.MCP_MAX_BATCH_SIZE:
+            return _json_response(encode_message(
+                _err(None, -32600, f"Batch too large (max {settings.MCP_MAX_BATCH_SIZE})")
+            ))
+        denied, headers = await _admit(user, cost=len(req))
+        if denied is not None:
+            return denied
+        messages = await dispatch_batch(user, req)
+        if not messages:
+            return Response(status_code=202)
+        return _json_response(b"[" + b",".join(encode_message(m) for m in messages) + b"]", headers)
 
-    if not req.params or "name" not in req.params:
-        return MCPResponse(error={"code": -32602, "message": "Missing 'name' in params"})
+    tool = _tool_name(req) if req.method == "tools/call" else None
+    denied, headers = await _admit(user, tool, req_id=req.id)
+    if denied is not None:
+        return denied
+    return _json_response(encode_message(await dispatch(db, user, req)), headers)
 
-    tool_name = req.params["name"]
-    args = req.params.get("arguments", {}) or {}
 
+# ==== SSE 会话 ====
+# GET /mcp/v1/sse 认证一次后保持长连接：首个事件 endpoint 给出本会话的消息地址，
+# 之后 POST /mcp/v1/messages?session_id=... 发的调用立即返回 202，响应从 SSE 流推回；
+# 该用户的提示词变化时推 notifications/prompts/list_changed（同一种通知未发出前不重复推）
+@router.get("/v1/sse")
+async def mcp_sse(request: Request, authorization: Optional[str] = Header(default=None)):
+    # 认证用的 session 在开流之前关闭：长连接不占数据库连接
+    async with ReadSessionLocal() as db:
+        user = await get_user_by_api_key_or_401(db, authorization)
+    denied, headers = await _admit(user, charge_quota=False)
+    if denied is not None:
+        return denied
     try:
-        if tool_name == "list_available_prompts":
-            parsed = ListPromptsArgs(**args)
-            data = await prompt_service.mcp_list_available_prompts(
-                db=db,
-                user_id=user.id,
-                tags=parsed.tags,
-                search=parsed.search,
-                limit=parsed.limit,
-                category=parsed.category
-            )
-            return MCPResponse(result=data)
-
-        elif tool_name == "get_prompt_content":
-            parsed = GetPromptArgs(**args)
-            data = await prompt_service.mcp_get_prompt_content(
-                db=db,
-                user_id=user.id,
-                prompt_id=parsed.prompt_id
-            )
-            return MCPResponse(result=data)
+        s = session_registry.open(user.id, user)
+    except SessionLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    endpoint = f"{request.scope.get('root_path', '')}/mcp/v1/messages?session_id={s.id}"
+    ping = settings.MCP_SESSION_PING_SECONDS
 
+    async def stream():
+        try:
+            yield b"event: endpoint\ndata: " + endpoint.encode() + b"\n\n"
+            while True:
+                frame = await s.next_frame(ping)
+                if frame is None:
+                    break
+                # 空闲时发注释行当心跳，顺便让代理不断开、让服务端尽早发现断开的连接
+                yield frame or b": ping\n\n"
+        finally:
+            session_registry.discard(s)
+
+    headers.update({"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Mcp-Session-Id": s.id})
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
+
+
+@router.post("/v1/messages", status_code=202)
+async def mcp_session_message(
+    session_id: str = Query(...),
+    req: Union[MCPRequest, List[MCPRequest]] = Body(...),
+):
+    """
+    会话内的调用（单条或批量，规则同 /v1/tools/call），不再带 API Key。
+    返回 202 表示响应已放进会话的发送队列；会话不存在 404，会话在发送前关闭 410，限流 429 直接在本响应里返回。
+    客户端读流太慢导致发送队列长时间满着时，会话会被断开。
+    """
+    s = session_registry.get(session_id)
+    if s is None:
+        raise HTTPException(status_code=404, detail="Unknown or closed MCP session")
+    user: Principal = s.principal
+
+    if isinstance(req, list):
+        if not req:
+            body = encode_message(_err(None, -32600, "Empty batch"))
+            headers: Dict[str, str] = {}
+        elif len(req) > settings.MCP_MAX_BATCH_SIZE:
+            body = encode_message(_err(None, -32600, f"Batch too large (max {settings.MCP_MAX_BATCH_SIZE})"))
+            headers = {}
         else:
-            return MCPResponse(error={"code": -32601, "message": f"Unknown tool: {tool_name}"})
-    except HTTPException as e:
-        return MCPResponse(error={"code": e.status_code, "message": e.detail})
-    except Exception as e:
-        return MCPResponse(error={"code": 500, "message": str(e)})
+            calls = [r for r in req if not _is_notification(r)]
+            if not calls:
+                return Response(status_code=202)
+            denied, headers = await _admit(user, cost=len(calls))
+            if denied is not None:
+                return denied
+            messages = await dispatch_batch(user, calls)
+            body = b"[" + b",".join(encode_message(m) for m in messages) + b"]"
+    else:
+        if _is_notification(req):
+            return Response(status_code=202)
+        tool = _tool_name(req) if req.method == "tools/call" else None
+        denied, headers = await _admit(user, tool, req_id=req.id)
+        if denied is not None:
+            return denied
+        async with ReadSessionLocal() as db:
+            body = encode_message(await dispatch(db, user, req))
+
+    if not await session_registry.send(s, body):
+        raise HTTPException(status_code=410, detail="MCP session closed")
+    return Response(status_code=202, headers=headers)
@@ -0,0 +1,63 @@
+# backend/app/api/v1/jobs.py
+import uuid
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_current_user, get_db_session, verify_api_key
+from app.models.user import User
+from app.schemas.job import JobCreate, JobList, JobRead
+from app.services import job_service
+
+router = APIRouter()
+
+
+# 提交后台任务：只写一行 jobs 就返回 202，由 worker 进程执行
+@router.post("/", response_model=JobRead, status_code=202, dependencies=[Depends(verify_api_key)])
+async def create_job(
+    job_in: JobCreate,
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    spec = job_service.JOB_REGISTRY.get(job_in.kind)
+    if spec is None or not spec.user_scoped:
+        raise HTTPException(status_code=400, detail=f"Unsupported job kind: {job_in.kind}")
+    # 作用范围固定为当前用户；同类任务还在排队 / 执行时不重复提交
+    payload = {**job_in.payload, "user_id": str(current_user.id)}
+    return await job_service.enqueue(db, job_in.kind, payload, user_id=current_user.id, dedupe=True)
+
+
+@router.get("/", response_model=JobList, dependencies=[Depends(verify_api_key)])
+async def list_jobs(
+    status: Optional[Literal["queued", "running", "succeeded", "failed", "cancelled"]] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    return {"items": await job_service.list_jobs(db, current_user.id, status=status, limit=limit)}
+
+
+@router.get("/{job_id}", response_model=JobRead, dependencies=[Depends(verify_api_key)])
+async def get_job(
+    job_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    job = await job_service.get_job(db, job_id, user_id=current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+# 取消排队中的任务（执行中的任务不打断）
+@router.post("/{job_id}/cancel", response_model=JobRead, dependencies=[Depends(verify_api_key)])
+async def cancel_job(
+    job_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    job = await job_service.cancel_job(db, job_id, user_id=current_user.id)
+    if job is None:
+        raise HTTPException(status_code=409, detail="Job not found or no longer queued")
+    return job
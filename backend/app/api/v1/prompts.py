@@ -1,8 +1,26 @@
 # backend/app/api/v1/prompts.py
-from fastapi import APIRouter, Depends
-from app.schemas.prompt import PromptCreate, PromptRead
-from app.services import prompt_service
+import uuid
+
+import orjson
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from app.schemas.prompt import (
+    DuplicateReport,
+    PromptCreate,
+    PromptCreated,
+    PromptRead,
+    PromptRenderRequest,
+    PromptRenderResponse,
+    PromptUpdate,
+    PromptVersionDiff,
+    PromptVersionList,
+    PromptVersionRead,
+)
+from app.services import prompt_service, version_service
 from app.api.deps import get_current_user, get_db_session, verify_api_key
+from app.db.session import AsyncSessionLocal
 from app.models.user import User
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -12,11 +30,170 @@ router = APIRouter()
 
 
 #防止 A 用户看到 B 用户的数据，必须“每个 API 调用都验证用户身份”
-@router.post("/", response_model=PromptRead, dependencies=[Depends(verify_api_key)])
+# 响应的 duplicates 列出近似重复的已有提示词；dedupe=strict 时有重复直接 409
+@router.post("/", response_model=PromptCreated, dependencies=[Depends(verify_api_key)])
 async def create_prompt(
     prompt_in: PromptCreate,
+    dedupe: Optional[Literal["off", "report", "strict"]] = Query(None, description="默认 DEDUPE_MODE"),
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    return await prompt_service.create_prompt(db, user_id=current_user.id, prompt_in=prompt_in, dedupe_mode=dedupe)
+    #加上 user_id 限制查询范围。
+
+
+# 列表：keyset 分页；format=ndjson 时流式导出全部（忽略 limit/cursor）
+@router.get("/", dependencies=[Depends(verify_api_key)])
+async def list_prompts(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    fields: Optional[str] = Query(None, description="逗号分隔的返回字段，默认不含 content"),
+    format: Literal["json", "ndjson"] = Query("json"),
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    wanted = prompt_service.parse_fields(fields)
+
+    if format == "ndjson":
+        user_id = current_user.id
+
+        # 依赖注入的 session 在响应开始发送前就会关闭，流式导出自己开一个
+        async def body():
+            async with AsyncSessionLocal() as stream_db:
+                async for item in prompt_service.stream_prompts(stream_db, user_id, wanted):
+                    yield orjson.dumps(item) + b"\n"
+
+        return StreamingResponse(body(), media_type="application/x-ndjson")
+
+    return await prompt_service.list_prompts_page(
+        db, user_id=current_user.id, limit=limit, cursor=cursor, fields=wanted
+    )
+
+
+# 批量导入：请求体为 NDJSON 或 CSV 流；单行错误不影响其它行
+# 进度记在 jobs 表（kind=import_prompts，返回 job_id），每块数据和进度一起提交，GET /api/v1/jobs/{job_id} 可查；
+# 中断后带上 job_id 重新提交同一份数据即可续传
+@router.post("/import", dependencies=[Depends(verify_api_key)])
+async def import_prompts(
+    request: Request,
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    job_id: Optional[uuid.UUID] = Query(None, description="续传：之前导入返回的 job_id"),
+    start_at: Optional[int] = Query(None, ge=0, description="跳过前 N 行；续传时默认取任务记录里的 rows_processed"),
+    chunk_size: int = Query(1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    from app.services import bulk_service
+    try:
+        report = await bulk_service.import_with_job(
+            db, current_user.id, request.stream(), format, job_id=job_id, start_at=start_at, chunk_size=chunk_size
+        )
+    except bulk_service.ImportSuperseded:
+        raise HTTPException(status_code=409, detail="Import job was taken over by another request")
+    return report.as_dict()
+
+
+# 批量导出：格式与导入互通
+@router.get("/export", dependencies=[Depends(verify_api_key)])
+async def export_prompts(
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    current_user: User = Depends(get_current_user)
+):
+    from app.services import bulk_service
+    user_id = current_user.id
+
+    async def body():
+        async with AsyncSessionLocal() as export_db:
+            async for chunk in bulk_service.export_prompts(export_db, user_id, format):
+                yield chunk
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(body(), media_type=media_type)
+
+
+# 语义相似搜索：q 为任意文本，或 prompt_id 指定一个已有提示词（结果不含它自己）
+@router.get("/similar", dependencies=[Depends(verify_api_key)])
+async def similar_prompts(
+    q: Optional[str] = Query(None, max_length=4000),
+    prompt_id: Optional[uuid.UUID] = Query(None),
+    limit: int = Query(10, ge=1, le=50),
+    min_score: float = Query(0.0, ge=-1.0, le=1.0),
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    from app.services import embedding_service
+    items = await embedding_service.search_similar(
+        db, current_user.id, query=q, prompt_id=prompt_id, limit=limit, min_score=min_score
+    )
+    return {"items": items, "total": len(items)}
+
+
+# 近似重复报告：把整个库按正文相似度聚类，每组给出建议保留的一条
+@router.get("/duplicates", response_model=DuplicateReport, dependencies=[Depends(verify_api_key)])
+async def duplicate_report(
+    threshold: Optional[float] = Query(None, ge=0.3, le=1.0, description="默认 DEDUPE_THRESHOLD"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    from app.services import dedupe_service
+    return await dedupe_service.duplicate_report(db, current_user.id, threshold=threshold, limit=limit)
+
+
+# 服务端渲染模板（支持批量）
+@router.post("/{prompt_id}/render", response_model=PromptRenderResponse, dependencies=[Depends(verify_api_key)])
+async def render_prompt(
+    prompt_id: uuid.UUID,
+    body: PromptRenderRequest,
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    return await prompt_service.render_prompt(
+        db, user_id=current_user.id, prompt_id=prompt_id, variable_sets=body.sets(), strict=body.strict
+    )
+
+
+# 更新提示词：只改传入的字段，version + 1 并写入版本历史
+@router.patch("/{prompt_id}", response_model=PromptRead, dependencies=[Depends(verify_api_key)])
+async def update_prompt(
+    prompt_id: uuid.UUID,
+    prompt_in: PromptUpdate,
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    return await prompt_service.update_prompt(db, user_id=current_user.id, prompt_id=prompt_id, prompt_in=prompt_in)
+
+
+# 版本列表（新到旧）
+@router.get("/{prompt_id}/versions", response_model=PromptVersionList, dependencies=[Depends(verify_api_key)])
+async def list_prompt_versions(
+    prompt_id: uuid.UUID,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[int] = Query(None, ge=1, description="上一页返回的 next_before"),
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    return await version_service.list_versions(db, current_user.id, prompt_id, limit=limit, before=before)
+
+
+# 两个版本的差异
+@router.get("/{prompt_id}/versions/diff", response_model=PromptVersionDiff, dependencies=[Depends(verify_api_key)])
+async def diff_prompt_versions(
+    prompt_id: uuid.UUID,
+    from_version: int = Query(..., alias="from", ge=1),
+    to_version: int = Query(..., alias="to", ge=1),
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    return await version_service.diff_versions(db, current_user.id, prompt_id, from_version, to_version)
+
+
+# 取某个历史版本的完整内容
+@router.get("/{prompt_id}/versions/{version}", response_model=PromptVersionRead, dependencies=[Depends(verify_api_key)])
+async def get_prompt_version(
+    prompt_id: uuid.UUID,
+    version: int,
     db: AsyncSession = Depends(get_db_session),
     current_user: User = Depends(get_current_user)
 ):
-    return await prompt_service.create_prompt(db, user_id=current_user.id, prompt_in=prompt_in)
-    #加上 user_id 限制查询范围。
\ No newline at end of file
+    return await version_service.get_version(db, current_user.id, prompt_id, version)
@@ -0,0 +1,89 @@
+# backend/app/api/v1/public.py
+# 公开提示词广场：不需要登录。列表 / 搜索读快照表，响应带 ETag / Last-Modified，
+# 客户端或 CDN 带 If-None-Match 重新验证时，快照没变就直接 304（通常不查库）
+import uuid
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_db_session
+from app.core.config import get_settings
+from app.core.http_cache import cache_headers, is_not_modified
+from app.services import gallery_service
+
+settings = get_settings()
+
+router = APIRouter()
+
+Sort = Literal["popular", "recent", "usage"]
+
+
+def _parse_cursor(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None:
+        return None
+    try:
+        return int(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def _listing(request: Request, db: AsyncSession, **kwargs) -> Response:
+    state = await gallery_service.current_state(db)
+    headers = cache_headers(state.etag, state.changed_at, settings.PUBLIC_GALLERY_MAX_AGE_SECONDS)
+    if is_not_modified(request, state.etag, state.changed_at):
+        return Response(status_code=304, headers=headers)
+    data = await gallery_service.list_public(db, **kwargs)
+    data["generation"] = state.generation
+    return ORJSONResponse(data, headers=headers)
+
+
+# 列表：popular（使用量 + 新鲜度）/ recent / usage；cursor 为上一页的 next_cursor
+@router.get("/prompts")
+async def list_public_prompts(
+    request: Request,
+    sort: Sort = Query("popular"),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    category: Optional[str] = Query(None, max_length=100),
+    tag: Optional[str] = Query(None, max_length=100),
+    db: AsyncSession = Depends(get_db_session),
+):
+    return await _listing(
+        request, db, sort=sort, limit=limit, after=_parse_cursor(cursor), category=category, tag=tag
+    )
+
+
+# 搜索：英文走全文索引，中文 / 短查询走 ILIKE；结果按所选排序的名次返回
+@router.get("/prompts/search")
+async def search_public_prompts(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    sort: Sort = Query("popular"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    category: Optional[str] = Query(None, max_length=100),
+    tag: Optional[str] = Query(None, max_length=100),
+    db: AsyncSession = Depends(get_db_session),
+):
+    return await _listing(
+        request, db, sort=sort, limit=limit, after=_parse_cursor(cursor), category=category, tag=tag, search=q
+    )
+
+
+# 详情：读 prompts 本表（内容实时），ETag 按 version + usage_count 生成（两者都在响应体里）
+@router.get("/prompts/{prompt_id}")
+async def get_public_prompt(
+    prompt_id: uuid.UUID,
+    request: Request,
+    db: AsyncSession = Depends(get_db_session),
+):
+    data = await gallery_service.get_public_prompt(db, prompt_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Prompt not found")
+    etag = f'W/"{data["id"]}-v{data["version"]}-u{data["usage_count"]}"'
+    headers = cache_headers(etag, None, settings.PUBLIC_GALLERY_MAX_AGE_SECONDS)
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(data, headers=headers)
@@ -0,0 +1,47 @@
+# backend/app/api/v1/tags.py
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_current_user, get_db_session, verify_api_key
+from app.models.user import User
+from app.schemas.job import JobRead
+from app.services import job_service, tag_service
+
+router = APIRouter()
+
+
+# 当前用户最常用的标签（读物化的分面表）
+@router.get("/top", dependencies=[Depends(verify_api_key)])
+async def top_tags(
+    limit: int = Query(20, ge=1, le=200),
+    category: Optional[str] = Query(None, max_length=100),
+    tag: Optional[str] = Query(None, max_length=100, description="只统计同时带有该标签的提示词"),
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    return {"tags": await tag_service.top_tags(db, current_user.id, limit=limit, category=category, tag=tag)}
+
+
+# 分面计数：总数 / 各标签 / 各分类
+@router.get("/facets", dependencies=[Depends(verify_api_key)])
+async def tag_facets(
+    category: Optional[str] = Query(None, max_length=100),
+    tag: Optional[str] = Query(None, max_length=100),
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    return await tag_service.facet_counts(db, current_user.id, category=category, tag=tag, limit=limit)
+
+
+# 重新计算当前用户的分面计数（修复漂移）：提交后台任务，用 GET /api/v1/jobs/{id} 查看结果
+@router.post("/reconcile", response_model=JobRead, status_code=202, dependencies=[Depends(verify_api_key)])
+async def reconcile_tags(
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    return await job_service.enqueue(
+        db, "reconcile_tags", {"user_id": str(current_user.id)}, user_id=current_user.id, dedupe=True
+    )
@@ -1,14 +1,17 @@
 # backend/app/api/v1/users.py
 from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+
 from pydantic import BaseModel, EmailStr
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas.user import UserCreate, UserRead
-from app.core.security import create_access_token
-from app.api.deps import get_db_session, get_current_user  
+from app.core.security import create_token_pair, refresh_token_pair, revoke_token, verify_token
+from app.api.deps import get_db_session, get_current_user, get_token_claims
 from app.services.user_service import (
     create_user as create_user_service,
     get_user_by_email,
+    revoke_all_tokens,
 )
 
 router = APIRouter()
@@ -37,8 +40,41 @@ async def login(data: LoginRequest, db: AsyncSession = Depends(get_db_session)):
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    token = create_access_token({"sub": str(user.id), "email": user.email})
-    return {"access_token": token, "token_type": "bearer"}
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="User is inactive")
+
+    # 短期 access token（带完整声明，免查库）+ 长期 refresh token
+    return create_token_pair(user)
+
+
+# -------- 刷新：refresh token 换一对新 token --------
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+@router.post("/token/refresh")
+async def refresh(data: RefreshRequest, db: AsyncSession = Depends(get_db_session)):
+    return await refresh_token_pair(db, data.refresh_token)
+
+
+# -------- 登出：当前 access token（和可选的 refresh token）立即失效 --------
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+@router.post("/logout")
+async def logout(data: Optional[LogoutRequest] = None, claims: dict = Depends(get_token_claims)):
+    revoke_token(claims)
+    if data is not None and data.refresh_token:
+        refresh_claims = verify_token(data.refresh_token)
+        if refresh_claims.get("sub") == claims.get("sub"):
+            revoke_token(refresh_claims)
+    return {"status": "ok"}
+
+
+# -------- 全部登出：该用户所有已签发的 token 作废 --------
+@router.post("/logout-all")
+async def logout_all(db: AsyncSession = Depends(get_db_session), current_user = Depends(get_current_user)):
+    await revoke_all_tokens(db, current_user.id)
+    return {"status": "ok"}
 
 
 
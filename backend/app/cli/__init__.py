@@ -0,0 +1 @@
+# backend/app/cli/__init__.py
@@ -0,0 +1,115 @@
+# backend/app/cli/bulk.py
+"""
+提示词批量导入 / 导出命令行：
+    PYTHONPATH=./backend python -m app.cli.bulk import prompts.ndjson --email a@b.com
+    PYTHONPATH=./backend python -m app.cli.bulk import prompts.csv --email a@b.com --format csv --checkpoint import.ckpt
+    PYTHONPATH=./backend python -m app.cli.bulk export out.ndjson --email a@b.com
+--checkpoint 文件记录已提交的行号，中断后用同样的参数重跑会从断点继续。
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import AsyncIterator, BinaryIO
+
+from app.db.session import AsyncSessionLocal, dispose_engine
+from app.services import bulk_service
+from app.services.user_service import get_user_by_email
+
+_READ_SIZE = 1 << 20
+
+
+async def _read_file(f: BinaryIO) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await asyncio.to_thread(f.read, _READ_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _load_checkpoint(path: str, source: str) -> int:
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("source") != os.path.abspath(source):
+        raise SystemExit(f"checkpoint {path} 属于另一个文件：{data.get('source')}")
+    return int(data.get("rows_processed", 0))
+
+
+async def _run_import(args) -> None:
+    start_at = _load_checkpoint(args.checkpoint, args.path)
+    started = time.perf_counter()
+
+    async def on_checkpoint(report: bulk_service.ImportReport) -> None:
+        elapsed = time.perf_counter() - started
+        print(
+            f"rows={report.rows_processed} imported={report.imported} failed={report.failed} "
+            f"({report.imported / elapsed if elapsed else 0:.0f} rows/s)",
+            file=sys.stderr,
+        )
+        if args.checkpoint:
+            tmp = args.checkpoint + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"source": os.path.abspath(args.path), **report.as_dict()}, f, ensure_ascii=False)
+            os.replace(tmp, args.checkpoint)
+
+    async with AsyncSessionLocal() as db:
+        user = await get_user_by_email(db, args.email)
+        if not user:
+            raise SystemExit(f"user not found: {args.email}")
+        with open(args.path, "rb") as f:
+            rows = bulk_service.parse_stream(_read_file(f), args.format)
+            report = await bulk_service.import_prompts(
+                db, user.id, rows,
+                chunk_size=args.chunk_size, start_at=start_at, on_checkpoint=on_checkpoint,
+            )
+    print(json.dumps(report.as_dict(), ensure_ascii=False, indent=2))
+
+
+async def _run_export(args) -> None:
+    async with AsyncSessionLocal() as db:
+        user = await get_user_by_email(db, args.email)
+        if not user:
+            raise SystemExit(f"user not found: {args.email}")
+        out = sys.stdout.buffer if args.path == "-" else open(args.path, "wb")
+        try:
+            async for chunk in bulk_service.export_prompts(db, user.id, args.format):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli.bulk")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_imp = sub.add_parser("import", help="从 NDJSON / CSV 文件导入")
+    p_imp.add_argument("path")
+    p_imp.add_argument("--email", required=True, help="导入到哪个用户")
+    p_imp.add_argument("--format", choices=bulk_service.FORMATS, default="ndjson")
+    p_imp.add_argument("--chunk-size", type=int, default=1000)
+    p_imp.add_argument("--checkpoint", default="", help="断点文件路径")
+
+    p_exp = sub.add_parser("export", help="导出为 NDJSON / CSV（path 为 - 时写到 stdout）")
+    p_exp.add_argument("path")
+    p_exp.add_argument("--email", required=True)
+    p_exp.add_argument("--format", choices=bulk_service.FORMATS, default="ndjson")
+
+    args = parser.parse_args()
+    runner = _run_import if args.command == "import" else _run_export
+
+    async def run() -> None:
+        try:
+            await runner(args)
+        finally:
+            await dispose_engine()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# backend/app/cli/jobs.py
+"""
+后台任务 worker 与管理命令：
+    PYTHONPATH=./backend python -m app.cli.jobs worker --concurrency 4
+    PYTHONPATH=./backend python -m app.cli.jobs enqueue purge_user_prompts --payload '{"user_id": "..."}'
+    PYTHONPATH=./backend python -m app.cli.jobs drain          # 执行完所有到期任务后退出（测试 / 本地）
+    PYTHONPATH=./backend python -m app.cli.jobs status <job_id>
+    PYTHONPATH=./backend python -m app.cli.jobs kinds
+worker 收到 SIGTERM / SIGINT 后停止领取新任务，等执行中的任务最多 JOB_SHUTDOWN_GRACE_SECONDS 秒。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import signal
+import uuid
+
+from app.api import Base  # noqa: F401  注册全部模型，关系映射才能解析
+from app.db.session import AsyncSessionLocal, dispose_engine
+from app.schemas.job import JobRead
+from app.services import job_service
+
+
+async def _run_worker(args) -> None:
+    worker = job_service.JobWorker(concurrency=args.concurrency, poll_interval=args.poll_interval)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+    print(json.dumps(worker.stats()))
+
+
+async def _run_enqueue(args) -> None:
+    payload = json.loads(args.payload) if args.payload else {}
+    user_id = uuid.UUID(payload["user_id"]) if payload.get("user_id") else None
+    async with AsyncSessionLocal() as db:
+        job = await job_service.enqueue(db, args.kind, payload, user_id=user_id, max_attempts=args.max_attempts)
+    print(job.id)
+
+
+async def _run_drain(args) -> None:
+    worker = job_service.JobWorker(concurrency=args.concurrency)
+    n = await worker.drain(max_jobs=args.max_jobs)
+    print(json.dumps({"executed": n, **worker.stats()}))
+
+
+async def _run_status(args) -> None:
+    async with AsyncSessionLocal() as db:
+        job = await job_service.get_job(db, uuid.UUID(args.job_id))
+    if job is None:
+        raise SystemExit(f"job not found: {args.job_id}")
+    print(JobRead.model_validate(job).model_dump_json(indent=2))
+
+
+async def _run_kinds(args) -> None:
+    for spec in job_service.JOB_REGISTRY.values():
+        print(f"{spec.kind:24} {'user' if spec.user_scoped else 'admin':6} {spec.description}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli.jobs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_worker = sub.add_parser("worker", help="常驻 worker 进程")
+    p_worker.add_argument("--concurrency", type=int, default=None, help="默认 JOB_WORKER_CONCURRENCY")
+    p_worker.add_argument("--poll-interval", type=float, default=None, help="默认 JOB_POLL_INTERVAL_SECONDS")
+
+    p_enq = sub.add_parser("enqueue", help="提交一个任务（可提交任意类型，包括只允许管理员执行的）")
+    p_enq.add_argument("kind", choices=sorted(job_service.JOB_REGISTRY))
+    p_enq.add_argument("--payload", default="", help="JSON")
+    p_enq.add_argument("--max-attempts", type=int, default=None)
+
+    p_drain = sub.add_parser("drain", help="执行所有到期任务后退出")
+    p_drain.add_argument("--concurrency", type=int, default=None)
+    p_drain.add_argument("--max-jobs", type=int, default=None)
+
+    p_status = sub.add_parser("status", help="查看任务状态")
+    p_status.add_argument("job_id")
+
+    sub.add_parser("kinds", help="列出已注册的任务类型")
+
+    args = parser.parse_args()
+    runner = {
+        "worker": _run_worker,
+        "enqueue": _run_enqueue,
+        "drain": _run_drain,
+        "status": _run_status,
+        "kinds": _run_kinds,
+    }[args.command]
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    async def run() -> None:
+        try:
+            await runner(args)
+        finally:
+            await dispose_engine()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# backend/app/cli/partition.py
+"""
+prompts 表在线改成按 user_id HASH 分区（先部署会写 prompt_versions.user_id 的新代码，PROMPTS_PARTITIONS 仍为 0）：
+    PYTHONPATH=./backend python -m app.cli.partition migrate --partitions 16 --batch-size 5000 --pause 0.05
+    PYTHONPATH=./backend python -m app.cli.partition status
+    PYTHONPATH=./backend python -m app.cli.partition check            # EXPLAIN 确认按用户的查询只扫一个分区
+    PYTHONPATH=./backend python -m app.cli.partition drop-old         # 确认无误后删掉旧表
+也可以分步执行 prepare / backfill / index / cutover；每一步中断后重跑都会从断点继续，cutover 之前可以 abort。
+迁移完成后把 PROMPTS_PARTITIONS 设为同样的分区数再重启（之前的进程照常可用，只是写入时不带分区键）。
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+
+from app.api import Base  # noqa: F401  注册全部模型，关系映射才能解析
+from app.core.config import get_settings
+from app.db.session import dispose_engine
+from app.services import partition_service
+
+
+def _printer():
+    started = time.perf_counter()
+
+    async def progress(info) -> None:
+        print(f"[{time.perf_counter() - started:7.1f}s] {json.dumps(info, ensure_ascii=False)}", file=sys.stderr)
+
+    return progress
+
+
+def _dump(obj) -> None:
+    print(json.dumps(obj, ensure_ascii=False, indent=2, default=str))
+
+
+async def _run(args) -> None:
+    progress = _printer()
+    if args.command == "status":
+        _dump(await partition_service.status())
+    elif args.command == "prepare":
+        _dump(await partition_service.prepare(args.partitions))
+    elif args.command == "backfill":
+        await partition_service.backfill_versions(args.batch_size, progress)
+        _dump(await partition_service.backfill(args.batch_size, args.pause, progress))
+    elif args.command == "index":
+        _dump(await partition_service.build_indexes(progress))
+    elif args.command == "cutover":
+        _dump(await partition_service.cutover(args.lock_timeout, args.verify_counts))
+    elif args.command == "migrate":
+        _dump(await partition_service.migrate(
+            args.partitions, args.batch_size, args.pause, args.lock_timeout, args.verify_counts, progress
+        ))
+    elif args.command == "check":
+        rows = await partition_service.check_pruning(uuid.UUID(args.user_id) if args.user_id else None)
+        _dump(rows)
+        if not all(r["pruned"] for r in rows):
+            raise SystemExit("有查询扫描了不止一个分区")
+    elif args.command == "drop-old":
+        await partition_service.drop_old()
+    elif args.command == "abort":
+        await partition_service.abort()
+
+
+def main() -> None:
+    default_partitions = get_settings().PROMPTS_PARTITIONS or None
+    parser = argparse.ArgumentParser(prog="python -m app.cli.partition")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_partitions(p):
+        p.add_argument("--partitions", type=int, default=default_partitions, required=default_partitions is None,
+                       help="分区数，默认 PROMPTS_PARTITIONS")
+
+    def add_copy(p):
+        p.add_argument("--batch-size", type=int, default=5000)
+        p.add_argument("--pause", type=float, default=0.0, help="批间停顿（秒），给线上负载让路")
+
+    def add_cutover(p):
+        p.add_argument("--lock-timeout", type=float, default=5.0, help="切换时等旧表排他锁的最长秒数，超时失败可重试")
+        p.add_argument("--verify-counts", action="store_true", help="锁内比对两表行数（大表上会拉长停写时间）")
+
+    sub.add_parser("status", help="查看分区情况和迁移进度")
+    add_partitions(sub.add_parser("prepare", help="建分区表 prompts_new 和同步触发器"))
+    add_copy(sub.add_parser("backfill", help="分批复制旧表"))
+    sub.add_parser("index", help="逐个分区并发建索引")
+    add_cutover(sub.add_parser("cutover", help="改名切换并改子表外键"))
+    p_migrate = sub.add_parser("migrate", help="从当前进度一直执行到切换完成")
+    add_partitions(p_migrate)
+    add_copy(p_migrate)
+    add_cutover(p_migrate)
+    p_check = sub.add_parser("check", help="EXPLAIN 检查分区裁剪")
+    p_check.add_argument("--user-id", default="")
+    sub.add_parser("drop-old", help="删除切换后保留的旧表")
+    sub.add_parser("abort", help="切换前放弃迁移")
+
+    args = parser.parse_args()
+
+    async def run() -> None:
+        try:
+            await _run(args)
+        except partition_service.PartitionMigrationError as e:
+            raise SystemExit(str(e))
+        finally:
+            await dispose_engine()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
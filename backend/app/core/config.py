@@ -3,6 +3,7 @@ from pydantic_settings import BaseSettings
 # 使用 pydantic.BaseSettings 可以直接从.env或系统环境变量加载配置，并自动做类型检查（如 int、str）。
 from functools import lru_cache
 import os
+from typing import Dict, Optional
 # or
 
 class Settings(BaseSettings):
@@ -11,10 +12,125 @@ class Settings(BaseSettings):
 
     DATABASE_URL: str  # PostgreSQL 连接URL
     SECRET_KEY: str  # JWT加密密钥
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60  # Token有效期（分钟）
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 15  # access token 有效期（分钟），过期后用 refresh token 换新
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 14  # refresh token 有效期（天）
+    AUTH_STATELESS_ENABLED: bool = True  # 带完整声明的 access token 直接信任，不查 users 表
+    TOKEN_DENYLIST_MAX_SIZE: int = 100000  # 进程内吊销名单上限（单个 token 的 jti 条目数）
     API_KEY: str 
     # API_KEY: Optional[str] = None
 
+    # 数据库连接池（每个 worker 一个池）
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0  # 池满时等待空闲连接的秒数
+    DB_POOL_RECYCLE: int = 1800  # 连接最长存活秒数，-1 表示不回收
+    DB_POOL_PRE_PING: bool = True  # 有 DB_POOL_RECYCLE 兜底时可以关掉，省掉每次 checkout 的往返
+    DB_STATEMENT_CACHE_SIZE: int = 100  # asyncpg 预编译语句缓存；走 pgbouncer 时设为 0
+    DB_POOL_WARMUP_CONNECTIONS: int = 2  # 启动时预先建立的连接数（不超过 DB_POOL_SIZE），0 不预热
+
+    # 只读副本（可选）：MCP 列表 / 取内容、认证查询走副本，连接池参数同上
+    DATABASE_READ_URL: Optional[str] = None
+    DB_READ_STICKY_SECONDS: float = 5.0  # 用户写入后这段时间内读主库（read-your-writes），应大于允许的复制延迟
+    DB_READ_MAX_LAG_SECONDS: float = 2.0  # 副本复制延迟超过该值时回退主库
+    DB_READ_CHECK_SECONDS: float = 1.0  # 副本健康 / 延迟检查间隔
+
+    # prompts 表按 user_id HASH 分区的分区数，0 不分区。影响表结构（主键变为 (id, user_id)、子表复合外键），
+    # 新库建表时生效；已有的库用 python -m app.cli.partition 在线迁移后再改这个值
+    PROMPTS_PARTITIONS: int = 0
+
+    # 启动：预先 import 按需加载的重模块（numpy 向量索引等）、生成 MCP 工具清单，第一个请求不用再付这部分开销
+    STARTUP_WARMUP: bool = True
+
+    # 认证主体缓存（get_current_user / MCP API Key 认证）
+    PRINCIPAL_CACHE_ENABLED: bool = True
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10000
+
+    # MCP 批量调用
+    MCP_MAX_BATCH_SIZE: int = 50  # 单个 JSON-RPC 批次最多多少条
+    MCP_BATCH_CONCURRENCY: int = 8  # 批内并发数（每个调用占一个连接）
+
+    # MCP SSE 会话（GET /mcp/v1/sse）
+    MCP_SESSION_MAX: int = 10000  # 每个进程最多保持的会话数
+    MCP_SESSION_MAX_PER_USER: int = 20
+    MCP_SESSION_QUEUE_SIZE: int = 64  # 每个会话待发送消息的上限，通知发不进去时断开该会话
+    MCP_SESSION_SEND_TIMEOUT_SECONDS: float = 10.0  # 调用响应等发送队列空位的最长时间，超时断开会话
+    MCP_SESSION_PING_SECONDS: float = 15.0  # 空闲时的心跳间隔
+
+    # usage_count 聚合写回
+    USAGE_TRACKING_ENABLED: bool = True
+    USAGE_FLUSH_INTERVAL_SECONDS: float = 5.0
+    USAGE_BUFFER_MAX_KEYS: int = 10000  # 缓冲区最多累计多少个不同的 prompt
+
+    # get_prompt_content 响应缓存
+    PROMPT_CACHE_ENABLED: bool = True
+    PROMPT_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # 一级缓存字节上限
+    PROMPT_CACHE_VERSION_TTL_SECONDS: float = 30.0  # 版本指针多久回源确认一次
+    PROMPT_CACHE_SECOND_TIER: str = ""  # 二级缓存："" 关闭，"memory" 为进程内替身
+
+    # 跨 worker 的缓存失效总线（Postgres LISTEN/NOTIFY，SQLite 下不生效）
+    CACHE_BUS_ENABLED: bool = True
+    CACHE_BUS_CHANNEL: str = "cache_invalidation"
+    CACHE_BUS_COALESCE_SECONDS: float = 0.05  # 收到消息后攒这么久再统一失效，合并突发
+    CACHE_BUS_MAX_PENDING: int = 10000  # 待处理的不同 key 超过该数直接整体清空
+    CACHE_BUS_RECONNECT_MAX_SECONDS: float = 30.0  # 监听连接断开后重连的最大退避
+    CACHE_BUS_HEALTHCHECK_SECONDS: float = 10.0  # 空闲时探测监听连接的间隔
+
+    # 版本历史：每隔多少个版本存一份完整快照，其余存差异
+    PROMPT_VERSION_SNAPSHOT_INTERVAL: int = 20
+
+    # MCP 限流（令牌桶）：每个用户合计 + 每个（用户, 工具）
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_PER_MINUTE: int = 600  # 每个用户所有 MCP 调用合计
+    RATE_LIMIT_BURST: int = 60  # 用户桶容量（允许的突发请求数）
+    RATE_LIMIT_TOOL_PER_MINUTE: int = 300  # 每个用户单个工具
+    RATE_LIMIT_TOOL_BURST: int = 30
+    RATE_LIMIT_TOOL_OVERRIDES: Dict[str, int] = {}  # 按工具单独配置每分钟次数，JSON，如 {"render_prompt": 120}
+    RATE_LIMIT_BACKEND: str = ""  # "" 进程内；"memory" 为共享后端的进程内替身
+    RATE_LIMIT_MAX_KEYS: int = 100000  # 进程内最多保留多少个桶
+
+    # 每日调用配额（0 不限），计数按批写回 api_usage_daily
+    QUOTA_DAILY_CALLS: int = 0
+    QUOTA_FLUSH_INTERVAL_SECONDS: float = 10.0
+
+    # 公开提示词广场：快照表定期重建（多个 API 进程靠 advisory lock 去重）
+    PUBLIC_GALLERY_REFRESH_ENABLED: bool = True  # 关掉后可改由 worker 定时执行 refresh_public_gallery 任务
+    PUBLIC_GALLERY_REFRESH_SECONDS: float = 60.0
+    PUBLIC_GALLERY_MAX_AGE_SECONDS: int = 30  # Cache-Control max-age
+    PUBLIC_GALLERY_HALF_LIFE_DAYS: float = 14.0  # popular 排序里新鲜度的半衰期
+    PUBLIC_GALLERY_RECENCY_WEIGHT: float = 2.0  # 新鲜度相对 ln(1 + 使用次数) 的权重
+    PUBLIC_GALLERY_PREVIEW_CHARS: int = 300
+
+    # 语义相似搜索：本地 embedding + 进程内向量索引
+    EMBEDDING_ENABLED: bool = True
+    EMBEDDER: str = "hashing"  # "hashing" 为内置的特征哈希向量；或 "包.模块:工厂函数" 接入本地模型
+    EMBEDDING_DIM: int = 256  # 哈希向量维度（自定义 embedder 以其自身维度为准）
+    EMBEDDING_IVF_MIN_SIZE: int = 20000  # 单个用户的向量数超过该值改用 IVF 近似检索
+    EMBEDDING_IVF_NPROBE: int = 16  # IVF 每次查询扫描的簇数，越大召回越高、越慢
+    EMBEDDING_INDEX_MAX_BYTES: int = 256 * 1024 * 1024  # 进程内向量索引总字节上限，超出按 LRU 淘汰用户
+    EMBEDDING_INDEX_RECHECK_SECONDS: float = 5.0  # 多久回库确认一次用户的向量是否被其他进程改过
+
+    # 近似重复检测（MinHash + LSH，按用户）
+    DEDUPE_MODE: str = "report"  # off 不检测；report 在创建响应里列出疑似重复；strict 直接拒绝（409）
+    DEDUPE_THRESHOLD: float = 0.8  # 估计的 Jaccard 相似度（正文字符 5-gram）达到该值算疑似重复
+    DEDUPE_INDEX_MAX_BYTES: int = 256 * 1024 * 1024  # 进程内 LSH 索引总字节上限，超出按 LRU 淘汰用户
+    DEDUPE_INDEX_RECHECK_SECONDS: float = 5.0
+
+    # 后台任务（python -m app.cli.jobs worker）
+    JOB_WORKER_CONCURRENCY: int = 4  # 每个 worker 进程同时执行的任务数
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0  # 队列为空时的轮询间隔
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BASE_SECONDS: float = 5.0  # 重试退避：base * 2^(n-1)，带抖动
+    JOB_RETRY_MAX_SECONDS: float = 600.0
+    JOB_LEASE_SECONDS: float = 300.0  # 执行中任务的租约，worker 每 1/3 租约续期一次
+    JOB_SHUTDOWN_GRACE_SECONDS: float = 30.0  # 停机时等待执行中任务的时间，超时放回队列
+
+    # 性能埋点：/metrics、Server-Timing 响应头、慢查询日志
+    METRICS_ENABLED: bool = True
+    METRICS_REQUIRE_API_KEY: bool = True  # /metrics 要求 X-API-Key；Prometheus 在内网直接抓取时可关掉
+    SERVER_TIMING_ENABLED: bool = True
+    SLOW_QUERY_THRESHOLD_MS: float = 200.0  # 超过该耗时的 SQL 记 WARNING 日志（只记参数类型），0 关闭
+
 #    class Config:
 #        env_file = ".env"  # 指定环境变量文件位置
 #        case_sensitive = True  # 变量名大小写敏感
@@ -0,0 +1,283 @@
+# backend/app/core/instrumentation.py
+# 请求级性能埋点：按路由的延迟直方图、每个请求的 SQL 次数 / 耗时、慢查询日志、Prometheus 文本导出
+import bisect
+import logging
+import re
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger("app.slow_query")
+
+# 秒；与 Prometheus 客户端默认桶接近，低端加密一点
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_WS = re.compile(r"\s+")
+_SLOW_SQL_MAX_CHARS = 1000
+
+
+class Histogram:
+    """按标签分组的累积直方图（只存各桶计数 + sum + count）"""
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._data: Dict[Tuple[str, ...], List[float]] = {}  # key -> [b0..bn, +Inf, sum]
+
+    def observe(self, key: Tuple[str, ...], value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._data.get(key)
+            if row is None:
+                row = self._data[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._data.items())
+        for key, row in items:
+            base = _labels(self.labels, key)
+            running = 0
+            for le, n in zip(self.buckets + (float("inf"),), row[:-1]):
+                running += n
+                le_s = "+Inf" if le == float("inf") else repr(le)
+                out.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="{le_s}"}} {running}')
+            out.append(f"{self.name}_sum{{{base}}} {row[-1]}")
+            out.append(f"{self.name}_count{{{base}}} {running}")
+        return out
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._data: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, key: Tuple[str, ...] = (), amount: float = 1) -> None:
+        with self._lock:
+            self._data[key] = self._data.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._data.items())
+        for key, v in items:
+            out.append(f"{self.name}{{{_labels(self.labels, key)}}} {v}")
+        return out
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    def esc(v: str) -> str:
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{n}="{esc(v)}"' for n, v in zip(names, values))
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status")
+)
+REQUEST_DB_QUERIES = Counter(
+    "http_request_db_queries_total", "SQL statements executed while serving requests", ("route",)
+)
+REQUEST_DB_SECONDS = Counter(
+    "http_request_db_seconds_total", "Time spent in SQL while serving requests", ("route",)
+)
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "SQL statement latency by verb", ("verb",))
+DB_SLOW_QUERIES = Counter("db_slow_queries_total", "SQL statements above SLOW_QUERY_THRESHOLD_MS", ("verb",))
+
+_METRICS = (REQUEST_LATENCY, REQUEST_DB_QUERIES, REQUEST_DB_SECONDS, DB_QUERY_LATENCY, DB_SLOW_QUERIES)
+
+
+# ==== 请求上下文 ====
+@dataclass
+class RequestTimings:
+    started: float = field(default_factory=time.perf_counter)
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    request: str = ""  # "GET /api/v1/prompts/..."，慢查询日志里带上
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def _route_of(scope) -> str:
+    # 用路由模板（/api/v1/prompts/{prompt_id}）做标签，避免每个 id 一条时间序列
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def server_timing(t: RequestTimings, now: float) -> str:
+    total_ms = (now - t.started) * 1000
+    db_ms = t.db_seconds * 1000
+    return (
+        f'app;dur={max(total_ms - db_ms, 0):.1f}, '
+        f'db;dur={db_ms:.1f};desc="{t.db_queries} queries", '
+        f'total;dur={total_ms:.1f}'
+    )
+
+
+class RequestMetricsMiddleware:
+    """
+    纯 ASGI 中间件（不用 BaseHTTPMiddleware，流式响应和 contextvars 都不受影响）：
+    记录按路由的延迟直方图，并在响应头里加 Server-Timing（app / db / total）。
+    流式响应的 Server-Timing 只覆盖到发送响应头为止。
+    """
+
+    def __init__(self, app, server_timing_enabled: Optional[bool] = None):
+        self.app = app
+        self.server_timing_enabled = (
+            settings.SERVER_TIMING_ENABLED if server_timing_enabled is None else server_timing_enabled
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        t = RequestTimings(request=f"{scope['method']} {scope['path']}")
+        token = _current.set(t)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing_enabled:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(t, time.perf_counter()).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = _route_of(scope)
+            REQUEST_LATENCY.observe((scope["method"], route, str(status)), time.perf_counter() - t.started)
+            if t.db_queries:
+                REQUEST_DB_QUERIES.inc((route,), t.db_queries)
+                REQUEST_DB_SECONDS.inc((route,), t.db_seconds)
+
+
+# ==== SQL 埋点（由 app/db/session.py 挂到 engine 上） ====
+def _verb(statement: str) -> str:
+    head = statement.lstrip()[:10].split(None, 1)
+    verb = head[0].upper() if head else ""
+    return verb if verb in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK") else "OTHER"
+
+
+def _shape(value: Any, depth: int = 0) -> Any:
+    # 只记录参数的“形状”（类型 / 长度），不落日志参数值
+    if isinstance(value, dict):
+        return {k: _shape(v, depth + 1) for k, v in list(value.items())[:20]}
+    if isinstance(value, (list, tuple)):
+        if depth > 0:
+            return f"{type(value).__name__}[{len(value)}]"
+        shaped = [_shape(v, depth + 1) for v in value[:20]]
+        if len(value) > 20:
+            shaped.append(f"...(+{len(value) - 20})")
+        return shaped
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def param_shape(parameters: Any, executemany: bool) -> str:
+    if executemany and parameters:
+        return f"{len(parameters)} x {_shape(parameters[0])}"
+    return str(_shape(parameters))
+
+
+def observe_query(statement: str, parameters: Any, executemany: bool, elapsed: float) -> None:
+    verb = _verb(statement)
+    DB_QUERY_LATENCY.observe((verb,), elapsed)
+    t = _current.get()
+    if t is not None:
+        t.db_queries += 1
+        t.db_seconds += elapsed
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    if threshold > 0 and elapsed * 1000 >= threshold:
+        DB_SLOW_QUERIES.inc((verb,))
+        sql = _WS.sub(" ", statement).strip()
+        if len(sql) > _SLOW_SQL_MAX_CHARS:
+            sql = sql[:_SLOW_SQL_MAX_CHARS] + "..."
+        logger.warning(
+            "slow query %.1fms%s: %s | params=%s",
+            elapsed * 1000,
+            f" [{t.request}]" if t is not None else "",
+            sql,
+            param_shape(parameters, executemany),
+        )
+
+
+def install_query_hooks(sync_engine) -> None:
+    """before/after_cursor_execute 计时；一个连接上语句是串行的，用 conn.info 里的栈存开始时间"""
+    from sqlalchemy import event
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("query_start")
+        if stack:
+            observe_query(statement, parameters, executemany, time.perf_counter() - stack.pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _on_error(exception_context):
+        # 出错时 after_cursor_execute 不会触发，丢掉开始时间，避免栈错位
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+
+# ==== 瞬时值（gauge） ====
+# 各组件在创建单例的地方注册自己的 gauge 来源（连接池、缓存等），/metrics 只遍历注册表，
+# 不再逐个 import 组件；按需加载的重模块在 import（启动预热或第一次用到）时才注册
+GaugeSource = Callable[[], Dict[str, Optional[float]]]
+_GAUGE_SOURCES: Dict[str, GaugeSource] = {}
+
+
+def register_gauges(name: str, source: GaugeSource) -> None:
+    """同名重复注册时覆盖；返回的名字需已是合法的指标名，值为 None 的不导出"""
+    _GAUGE_SOURCES[name] = source
+
+
+def collect_gauges() -> Dict[str, Optional[float]]:
+    gauges: Dict[str, Optional[float]] = {}
+    for name, source in list(_GAUGE_SOURCES.items()):
+        try:
+            gauges.update(source())
+        except Exception:
+            # 一个组件出错不影响其它指标的导出
+            logging.getLogger(__name__).warning("gauge source %s failed", name, exc_info=True)
+    return gauges
+
+
+# ==== Prometheus 导出 ====
+def render_prometheus(gauges: Optional[Dict[str, Optional[float]]] = None) -> str:
+    """导出直方图 / 计数器和已注册的 gauge；gauges 为额外的瞬时值"""
+    lines: List[str] = []
+    for m in _METRICS:
+        lines.extend(m.render())
+    for name, value in sorted({**collect_gauges(), **(gauges or {})}.items()):
+        if value is None:
+            continue
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {float(value)}")
+    return "\n".join(lines) + "\n"
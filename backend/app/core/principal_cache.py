@@ -0,0 +1,167 @@
+# backend/app/core/principal_cache.py
+# 进程内的认证主体缓存（TTL + LRU），避免每个请求都查一次 users 表
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import get_settings
+from app.core.instrumentation import register_gauges
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """已认证用户的只读快照，只保留鉴权需要的字段"""
+    id: uuid.UUID
+    email: str
+    is_active: bool
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(id=user.id, email=user.email, is_active=bool(user.is_active))
+
+
+def hash_api_key(api_key: str) -> str:
+    # 缓存里不保存明文 API Key
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class PrincipalCache:
+    """
+    有界 TTL + LRU 缓存。
+    key 有两种：("id", user_id) 和 ("key", sha256(api_key))，同一个用户两种 key 都可能存在，
+    失效时通过 _keys_by_user 一起删掉。
+    查库回填：查库前取 generation()，put 时带上。查库期间该用户被失效过（停用、轮换 Key），
+    查到的可能是失效前的状态，这次就不放进缓存，免得旧状态再留一个 TTL。
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 60.0, enabled: bool = True):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, Principal]]" = OrderedDict()
+        self._keys_by_user: Dict[uuid.UUID, set] = {}
+        self._lock = threading.Lock()
+        # 失效代数：每次 invalidate_user / clear 加一，_invalidated_at 记下每个用户最近一次失效时的代数。
+        # 按 API Key 查库时还不知道是哪个用户，所以用全局计数取快照、按用户比较
+        self._generation = 0
+        self._invalidated_at: Dict[uuid.UUID, int] = {}
+        self._floor = 0  # 早于它的快照一律不回填（clear 或 _invalidated_at 清理之后）
+        self.hits = 0
+        self.misses = 0
+
+    # ---- 读 ----
+    def _get(self, key: Tuple[str, str]) -> Optional[Principal]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, principal = entry
+            if expires_at < time.monotonic():
+                self._remove(key, principal.id)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return principal
+
+    def get_by_id(self, user_id) -> Optional[Principal]:
+        return self._get(("id", str(user_id)))
+
+    def get_by_api_key(self, api_key: str) -> Optional[Principal]:
+        return self._get(("key", hash_api_key(api_key)))
+
+    # ---- 写 ----
+    def generation(self) -> int:
+        """查库前调用，结果传给 put_by_id / put_by_api_key"""
+        return self._generation
+
+    def _stale(self, user_id: uuid.UUID, generation: Optional[int]) -> bool:
+        if generation is None:
+            return False
+        return generation < self._floor or self._invalidated_at.get(user_id, -1) > generation
+
+    def _put(self, key: Tuple[str, str], principal: Principal, generation: Optional[int] = None) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._stale(principal.id, generation):
+                return
+            self._data[key] = (time.monotonic() + self.ttl_seconds, principal)
+            self._data.move_to_end(key)
+            self._keys_by_user.setdefault(principal.id, set()).add(key)
+            while len(self._data) > self.max_size:
+                old_key, (_, old_principal) = self._data.popitem(last=False)
+                self._forget_key(old_key, old_principal.id)
+
+    def put_by_id(self, principal: Principal, generation: Optional[int] = None) -> None:
+        self._put(("id", str(principal.id)), principal, generation)
+
+    def put_by_api_key(self, api_key: str, principal: Principal, generation: Optional[int] = None) -> None:
+        self._put(("key", hash_api_key(api_key)), principal, generation)
+
+    # ---- 失效 ----
+    def _forget_key(self, key: Tuple[str, str], user_id: uuid.UUID) -> None:
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+
+    def _remove(self, key: Tuple[str, str], user_id: uuid.UUID) -> None:
+        self._data.pop(key, None)
+        self._forget_key(key, user_id)
+
+    def invalidate_user(self, user_id) -> None:
+        """用户被停用、API Key 轮换时调用"""
+        if not isinstance(user_id, uuid.UUID):
+            user_id = uuid.UUID(str(user_id))
+        with self._lock:
+            for key in self._keys_by_user.pop(user_id, set()):
+                self._data.pop(key, None)
+            self._generation += 1
+            if len(self._invalidated_at) >= self.max_size:
+                # 只在有查库正在进行时才用得上；清掉后由 _floor 兜底（代价是这期间的回填都跳过）
+                self._invalidated_at.clear()
+                self._floor = self._generation
+            self._invalidated_at[user_id] = self._generation
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._keys_by_user.clear()
+            self._invalidated_at.clear()
+            self._generation += 1
+            self._floor = self._generation
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_settings = get_settings()
+
+principal_cache = PrincipalCache(
+    max_size=_settings.PRINCIPAL_CACHE_MAX_SIZE,
+    ttl_seconds=_settings.PRINCIPAL_CACHE_TTL_SECONDS,
+    enabled=_settings.PRINCIPAL_CACHE_ENABLED,
+)
+
+
+def _gauges() -> Dict[str, Any]:
+    s = principal_cache.stats()
+    return {"principal_cache_hits": s["hits"], "principal_cache_misses": s["misses"]}
+
+
+register_gauges("principal_cache", _gauges)
@@ -0,0 +1,195 @@
+# backend/app/core/rate_limit.py
+# MCP 调用限流：按用户、按（用户, 工具）两级令牌桶，返回 RateLimit-* / Retry-After 响应头
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+from app.core.config import get_settings
+from app.core.instrumentation import register_gauges
+
+
+class BucketBackend(Protocol):
+    """
+    令牌桶存储。take() 需要是原子的：补充令牌 + 扣减 + 写回。
+    多 worker 部署时换成共享实现（例如 Redis 上的 Lua 脚本），接口不变。
+    返回 (是否放行, 扣减后剩余令牌数)。
+    """
+
+    async def take(self, key: str, rate: float, burst: float, cost: float) -> Tuple[bool, float]: ...
+
+
+class LocalBucketBackend:
+    """进程内令牌桶：一次字典查找 + 几次浮点运算，没有 await 点，单线程事件循环下天然原子"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, List[float]] = {}  # key -> [tokens, last_refill, full_at]
+
+    async def take(self, key: str, rate: float, burst: float, cost: float) -> Tuple[bool, float]:
+        return self.take_now(key, rate, burst, cost, time.monotonic())
+
+    def take_now(self, key: str, rate: float, burst: float, cost: float, now: float) -> Tuple[bool, float]:
+        b = self._buckets.get(key)
+        if b is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune(now)
+            b = self._buckets[key] = [burst, now, now]
+        else:
+            b[0] = min(burst, b[0] + (now - b[1]) * rate)
+            b[1] = now
+        allowed = b[0] >= cost
+        if allowed:
+            b[0] -= cost
+        b[2] = now + (burst - b[0]) / rate if rate > 0 else math.inf
+        return allowed, b[0]
+
+    def _prune(self, now: float) -> None:
+        # 已经补满的桶和新建的桶等价，可以直接丢掉
+        self._buckets = {k: b for k, b in self._buckets.items() if b[2] > now}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class MemorySharedBackend(LocalBucketBackend):
+    """共享后端的进程内替身（测试 / 单进程），用墙钟时间，模拟跨进程存储的语义"""
+
+    async def take(self, key: str, rate: float, burst: float, cost: float) -> Tuple[bool, float]:
+        return self.take_now(key, rate, burst, cost, time.time())
+
+
+@dataclass(slots=True)  # 不用 frozen：frozen 的 __init__ 走 object.__setattr__，热路径上慢一倍
+class RateLimitDecision:
+    allowed: bool
+    limit: int  # 桶容量（突发上限）
+    remaining: int
+    reset: float  # 多少秒后桶补满
+    retry_after: float  # 被拒绝时多少秒后可以重试
+    policy: str  # RateLimit-Policy，例如 "600;w=60;burst=60"
+
+    def headers(self) -> Dict[str, str]:
+        h = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(self.reset)),
+            "RateLimit-Policy": self.policy,
+        }
+        if not self.allowed:
+            h["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return h
+
+
+class Limit:
+    """每分钟 per_minute 个令牌，桶容量 burst；rate / policy 预先算好，热路径上不再重复计算"""
+
+    __slots__ = ("per_minute", "burst", "rate", "policy")
+
+    def __init__(self, per_minute: int, burst: int):
+        self.per_minute = per_minute
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        self.policy = f"{per_minute};w=60;burst={burst}"
+
+    def __repr__(self) -> str:
+        return f"Limit(per_minute={self.per_minute}, burst={self.burst})"
+
+
+class RateLimiter:
+    """
+    每次调用扣两个桶：用户总桶（"*"）和该工具的桶（tool 为空时只扣用户桶）。
+    任一桶不够就拒绝；响应头取两者中更紧的那个。被工具桶拒绝时，用户桶已扣的令牌不退还。
+    """
+
+    def __init__(
+        self,
+        backend: BucketBackend,
+        user_limit: Limit,
+        tool_limit: Optional[Limit] = None,
+        tool_overrides: Optional[Dict[str, Limit]] = None,
+        enabled: bool = True,
+    ):
+        self.backend = backend
+        self.user_limit = user_limit
+        self.tool_limit = tool_limit
+        self.tool_overrides = tool_overrides or {}
+        self.enabled = enabled
+        self.rejected = 0
+
+    def _tool_limit(self, tool: str) -> Optional[Limit]:
+        return self.tool_overrides.get(tool, self.tool_limit)
+
+    def _decision(self, allowed: bool, tokens: float, cost: float, limit: Limit) -> RateLimitDecision:
+        rate = limit.rate or 1e-9
+        if not allowed:
+            self.rejected += 1
+        return RateLimitDecision(
+            allowed,
+            limit.burst,
+            int(tokens) if tokens > 0 else 0,
+            (limit.burst - tokens) / rate,
+            0.0 if allowed else (cost - tokens) / rate,
+            limit.policy,
+        )
+
+    async def check(self, user_id, tool: Optional[str] = None, cost: int = 1) -> Optional[RateLimitDecision]:
+        """返回 None 表示限流关闭"""
+        if not self.enabled:
+            return None
+        uid = str(user_id)
+        ul = self.user_limit
+        ok, tokens = await self.backend.take(f"rl:{uid}:*", ul.rate, ul.burst, cost)
+        tl = self._tool_limit(tool) if ok and tool else None
+        if tl is not None:
+            tok, ttokens = await self.backend.take(f"rl:{uid}:{tool}", tl.rate, tl.burst, cost)
+            # 只为更紧的那个桶生成决策
+            if not tok or ttokens < tokens:
+                return self._decision(tok, ttokens, cost, tl)
+        return self._decision(ok, tokens, cost, ul)
+
+    async def check_tool(self, user_id, tool: str, cost: int = 1) -> Optional[RateLimitDecision]:
+        """只扣工具桶（批量请求已按整批扣过用户桶）"""
+        if not self.enabled:
+            return None
+        tl = self._tool_limit(tool)
+        if tl is None:
+            return None
+        ok, tokens = await self.backend.take(f"rl:{str(user_id)}:{tool}", tl.rate, tl.burst, cost)
+        return self._decision(ok, tokens, cost, tl)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "keys": len(self.backend) if hasattr(self.backend, "__len__") else None,
+            "rejected": self.rejected,
+        }
+
+
+def _build_backend(name: str, max_keys: int) -> BucketBackend:
+    if name == "memory":
+        return MemorySharedBackend(max_keys=max_keys)
+    if name:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {name}")
+    return LocalBucketBackend(max_keys=max_keys)
+
+
+_settings = get_settings()
+
+rate_limiter = RateLimiter(
+    backend=_build_backend(_settings.RATE_LIMIT_BACKEND, _settings.RATE_LIMIT_MAX_KEYS),
+    user_limit=Limit(_settings.RATE_LIMIT_PER_MINUTE, _settings.RATE_LIMIT_BURST),
+    tool_limit=Limit(_settings.RATE_LIMIT_TOOL_PER_MINUTE, _settings.RATE_LIMIT_TOOL_BURST),
+    tool_overrides={
+        name: Limit(per_minute, max(1, per_minute // 10))
+        for name, per_minute in _settings.RATE_LIMIT_TOOL_OVERRIDES.items()
+    },
+    enabled=_settings.RATE_LIMIT_ENABLED,
+)
+
+
+def _gauges() -> Dict[str, Any]:
+    s = rate_limiter.stats()
+    return {"rate_limit_buckets": s["keys"], "rate_limit_rejected": s["rejected"]}
+
+
+register_gauges("rate_limiter", _gauges)
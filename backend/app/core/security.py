@@ -1,28 +1,54 @@
 # backend/app/core/security.py
-from jose import JWTError, jwt
-from datetime import datetime, timedelta
+import time
+import uuid
+from typing import Any, Dict, Optional
+
 from app.core.config import get_settings
+from app.core import tokens
+from app.core.tokens import TokenError, codec, deny_list
 
 
 from fastapi import Header, HTTPException, status
 # API
 
 #基于 API Key 的用户识别（数据库校验）
-from typing import Optional
-from app.services.user_service import get_user_by_api_key
+from app.services.user_service import get_user_by_api_key, get_user_by_id
 #user_service.py ↑
+from app.core.principal_cache import Principal, principal_cache
+from app.db.replica import bind_user, read_router, use_primary
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
 settings = get_settings()
 
-ALGORITHM = "HS256"
+ALGORITHM = tokens.ALGORITHM
 
-def create_access_token(data: dict, expires_minutes: int = 60):
+def create_access_token(data: dict, expires_minutes: Optional[int] = None):
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=expires_minutes)
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
+    minutes = expires_minutes if expires_minutes is not None else settings.ACCESS_TOKEN_EXPIRE_MINUTES
+    to_encode.update({"exp": int(time.time()) + minutes * 60})
+    return codec.encode(to_encode)
+
+
+def create_token_pair(user) -> Dict[str, Any]:
+    """
+    登录 / 刷新时签发：
+    access token 带上路由需要的全部声明（id、email、是否启用、token_epoch），验签通过即可直接使用；
+    refresh token 只带 sub + ep，换新时查库校验用户状态和 epoch。
+    """
+    sub = str(user.id)
+    epoch = user.token_epoch or 0
+    access_ttl = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    access = tokens.new_claims(
+        tokens.ACCESS, sub, access_ttl, email=user.email, act=bool(user.is_active), ep=epoch
+    )
+    refresh = tokens.new_claims(tokens.REFRESH, sub, settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400, ep=epoch)
+    return {
+        "access_token": codec.encode(access),
+        "refresh_token": codec.encode(refresh),
+        "token_type": "bearer",
+        "expires_in": access_ttl,
+    }
 
 
 def verify_token(token: str) -> dict:
@@ -31,13 +57,44 @@ def verify_token(token: str) -> dict:
     让上游通过 payload.get("sub") 读取用户 ID。
     """
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
+        return codec.decode(token)
+    except TokenError:
         # 让上层看到 401
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
+def principal_from_claims(claims: Dict[str, Any]) -> Optional[Principal]:
+    """无状态快速路径：声明齐全的 access token 直接得到 Principal；旧格式 token 返回 None（走查库）"""
+    if claims.get("typ") != tokens.ACCESS or "ep" not in claims or "act" not in claims:
+        return None
+    if deny_list.is_denied(claims):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    try:
+        return Principal(id=uuid.UUID(claims["sub"]), email=claims.get("email"), is_active=bool(claims["act"]))
+    except (KeyError, ValueError, TypeError):
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def revoke_token(claims: Dict[str, Any]) -> None:
+    """登出：把这个 token 的 jti 放进吊销名单，直到它自然过期"""
+    if claims.get("jti") and claims.get("exp"):
+        deny_list.deny(claims["jti"], float(claims["exp"]))
+
+
+async def refresh_token_pair(db: AsyncSession, refresh_token: str) -> Dict[str, Any]:
+    """用 refresh token 换一对新 token（旧 refresh token 作废）；这里才查库校验用户状态和 token_epoch"""
+    claims = verify_token(refresh_token)
+    if claims.get("typ") != tokens.REFRESH or deny_list.is_denied(claims):
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    user = await get_user_by_id(db, user_id=str(claims.get("sub")))
+    if not user or int(claims.get("ep", -1)) != (user.token_epoch or 0):
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="User is inactive")
+    revoke_token(claims)
+    return create_token_pair(user)
+
+
 # 从 Authorization 头提取 Bearer token
 def _extract_bearer_token(authorization: Optional[str]) -> str:
     if not authorization:
@@ -48,13 +105,24 @@ def _extract_bearer_token(authorization: Optional[str]) -> str:
     return parts[1]
 
 # 根据 API Key 查用户，失败抛 401
-async def get_user_by_api_key_or_401(db: AsyncSession, authorization: Optional[str]):
+# 先查进程内缓存，未命中再查库；返回的是 Principal 快照而不是 ORM 对象
+# db 是只读 session 时：副本上查不到（刚注册 / 刚轮换 Key）或该用户刚写过（可能读到停用前的状态）就回主库再查一次；
+# 认证通过后把用户绑到 session 上，后面的读按该用户的 read-your-writes 选库
+async def get_user_by_api_key_or_401(db: AsyncSession, authorization: Optional[str]) -> Principal:
     api_key = _extract_bearer_token(authorization)
-    user = await get_user_by_api_key(db, api_key)
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid API Key")
+    user = principal_cache.get_by_api_key(api_key)
+    if user is None:
+        generation = principal_cache.generation()
+        row = await get_user_by_api_key(db, api_key)
+        if (row is None or read_router.is_sticky(row.id)) and use_primary(db):
+            row = await get_user_by_api_key(db, api_key)
+        if not row:
+            raise HTTPException(status_code=401, detail="Invalid API Key")
+        user = Principal.from_user(row)
+        principal_cache.put_by_api_key(api_key, user, generation)
     if not user.is_active:
         raise HTTPException(status_code=403, detail="User is inactive")
+    bind_user(db, user.id)
     return user
 
 
@@ -0,0 +1,150 @@
+# backend/app/core/tokens.py
+# JWT（HS256）编解码 + 吊销名单。
+# 只支持 HS256，密钥预先做好 HMAC 对象，解码不再走 python-jose 的通用流程；
+# 生成的仍是标准 JWT，旧 token（python-jose 签发）照常能验。
+import base64
+import hashlib
+import hmac
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+import orjson
+
+from app.core.config import get_settings
+
+ALGORITHM = "HS256"
+_HEADER = {"alg": ALGORITHM, "typ": "JWT"}
+
+# 令牌类型（typ 声明）
+ACCESS = "access"
+REFRESH = "refresh"
+
+
+class TokenError(Exception):
+    pass
+
+
+def _b64encode(raw: bytes) -> bytes:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+class TokenCodec:
+    def __init__(self, secret: str, leeway_seconds: int = 0):
+        self._mac = hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+        self._header = _b64encode(orjson.dumps(_HEADER))
+        self.leeway_seconds = leeway_seconds
+
+    def _sign(self, signing_input: bytes) -> bytes:
+        mac = self._mac.copy()
+        mac.update(signing_input)
+        return mac.digest()
+
+    def encode(self, claims: Dict[str, Any]) -> str:
+        signing_input = self._header + b"." + _b64encode(orjson.dumps(claims))
+        return (signing_input + b"." + _b64encode(self._sign(signing_input))).decode("ascii")
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        try:
+            raw = token.encode("ascii")
+            signing_input, _, sig = raw.rpartition(b".")
+            header_b64, _, payload_b64 = signing_input.partition(b".")
+            if not header_b64 or not payload_b64 or b"." in payload_b64:
+                raise TokenError("Malformed token")
+            # 头部与我们签发的一致时跳过解析（常见情况）
+            if header_b64 != self._header and orjson.loads(_b64decode(header_b64)).get("alg") != ALGORITHM:
+                raise TokenError("Unsupported algorithm")
+            if not hmac.compare_digest(self._sign(signing_input), _b64decode(sig)):
+                raise TokenError("Signature verification failed")
+            claims = orjson.loads(_b64decode(payload_b64))
+        except TokenError:
+            raise
+        except (ValueError, UnicodeError, orjson.JSONDecodeError):
+            raise TokenError("Malformed token")
+        if not isinstance(claims, dict):
+            raise TokenError("Malformed token")
+        now = time.time()
+        exp = claims.get("exp")
+        if exp is not None and now > float(exp) + self.leeway_seconds:
+            raise TokenError("Token expired")
+        nbf = claims.get("nbf")
+        if nbf is not None and now + self.leeway_seconds < float(nbf):
+            raise TokenError("Token not yet valid")
+        return claims
+
+
+def new_claims(typ: str, sub: str, ttl_seconds: int, **extra: Any) -> Dict[str, Any]:
+    now = int(time.time())
+    return {"sub": sub, "typ": typ, "jti": uuid.uuid4().hex, "iat": now, "exp": now + ttl_seconds, **extra}
+
+
+class DenyList:
+    """
+    进程内吊销名单，条目在对应 token 过期后自动清理，所以大小和“有效期内被吊销的 token 数”成正比：
+      - jti：单个 token（登出、refresh 轮换）
+      - 用户：token_epoch 小于某值的所有 token（停用、全部登出、轮换 API Key 时 epoch + 1）
+    多 worker 部署时每个进程各自一份；最坏情况下被吊销的 access token 在其余进程里
+    继续有效到过期为止（所以 access token 要短），refresh 时还会再按 token_epoch 校验一次。
+    """
+
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self._jti: Dict[bytes, float] = {}  # 16 字节 jti -> 过期时间
+        self._users: Dict[str, tuple] = {}  # user_id -> (最小有效 epoch, 条目过期时间)
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    @staticmethod
+    def _key(jti: str) -> bytes:
+        try:
+            return bytes.fromhex(jti)
+        except ValueError:
+            return hashlib.blake2b(jti.encode("utf-8"), digest_size=16).digest()
+
+    def _prune(self, now: float) -> None:
+        self._jti = {k: exp for k, exp in self._jti.items() if exp > now}
+        self._users = {k: v for k, v in self._users.items() if v[1] > now}
+
+    def deny(self, jti: str, expires_at: float) -> None:
+        now = time.time()
+        if expires_at <= now:
+            return
+        with self._lock:
+            if len(self._jti) >= self.max_size:
+                self._prune(now)
+                if len(self._jti) >= self.max_size:
+                    self.dropped += 1
+                    return
+            self._jti[self._key(jti)] = expires_at
+
+    def deny_user(self, user_id: str, min_epoch: int, ttl_seconds: float) -> None:
+        """让该用户 ep < min_epoch 的 token 失效；ttl 取 access token 的最长有效期即可"""
+        with self._lock:
+            self._users[str(user_id)] = (min_epoch, time.time() + ttl_seconds)
+
+    def is_denied(self, claims: Dict[str, Any]) -> bool:
+        jti = claims.get("jti")
+        # 无锁读：dict 单次查找是原子的
+        if jti and self._jti.get(self._key(jti), 0) > time.time():
+            return True
+        entry = self._users.get(str(claims.get("sub")))
+        return entry is not None and entry[1] > time.time() and int(claims.get("ep", 0)) < entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._jti.clear()
+            self._users.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"jti": len(self._jti), "users": len(self._users), "dropped": self.dropped}
+
+
+_settings = get_settings()
+
+codec = TokenCodec(_settings.SECRET_KEY)
+deny_list = DenyList(max_size=_settings.TOKEN_DENYLIST_MAX_SIZE)
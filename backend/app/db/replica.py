@@ -0,0 +1,270 @@
+# backend/app/db/replica.py
+# 读写分离：可选的只读副本（DATABASE_READ_URL，不配则全部走主库）。
+# 只读路径用 ReadSessionLocal / get_read_db，每条语句在 get_bind 里选库：
+#   - 副本不健康（连不上、复制延迟超过 DB_READ_MAX_LAG_SECONDS）-> 主库
+#   - session 绑定的用户 DB_READ_STICKY_SECONDS 内写过（read-your-writes）-> 主库
+#   - flush（写）-> 主库
+# 副本上查不到（还没复制过来）时，调用方用 use_primary() 切到主库再查一次
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.core.instrumentation import register_gauges
+from app.db.session import build_engine, get_engine
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# 备库上：收到的 WAL 都已回放则延迟为 0（主库空闲时 replay_timestamp 会一直变旧），否则取最后回放事务的时间差
+_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def _as_uuid(value) -> Optional[uuid.UUID]:
+    if value is None or isinstance(value, uuid.UUID):
+        return value
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+# 副本引擎和主库一样在第一次用到时才创建
+_read_engine: Optional[AsyncEngine] = None
+_read_engine_lock = threading.Lock()
+
+
+def get_read_engine() -> Optional[AsyncEngine]:
+    """没配 DATABASE_READ_URL 时返回 None"""
+    global _read_engine
+    if _read_engine is None and settings.DATABASE_READ_URL:
+        with _read_engine_lock:
+            if _read_engine is None:
+                eng = build_engine(url=settings.DATABASE_READ_URL)
+
+                @event.listens_for(eng.sync_engine, "handle_error")
+                def _on_error(ctx):
+                    # 连接断开 / 连不上：不等下一次探测，立即回退主库
+                    if ctx.is_disconnect or isinstance(ctx.original_exception, (OSError, ConnectionError)):
+                        read_router.mark_down()
+
+                _read_engine = eng
+    return _read_engine
+
+
+async def dispose_read_engine() -> None:
+    global _read_engine
+    eng, _read_engine = _read_engine, None
+    if eng is not None:
+        await eng.dispose()
+
+
+class ReadRouter:
+    """
+    记录副本是否可用（后台每 check_seconds 秒测一次复制延迟）和最近写过的用户。
+    写过的用户由失效总线记录（本进程的写入在 publish 时，其它进程的写入在收到消息时），
+    所以多 worker 下也能读到自己刚写的数据。
+    """
+
+    def __init__(self, sticky_seconds: float = 5.0, max_lag_seconds: float = 2.0, check_seconds: float = 1.0,
+                 max_sticky_users: int = 100000):
+        self.sticky_seconds = sticky_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self.check_seconds = check_seconds
+        self.max_sticky_users = max_sticky_users
+        # 返回副本的复制延迟（秒）；连不上时抛异常
+        self.probe: Callable[[], Awaitable[float]] = self._probe_lag
+        self.healthy = False  # 第一次探测成功之前都走主库
+        self.lag_seconds: Optional[float] = None
+        self._sticky: Dict[uuid.UUID, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        # 统计（按语句计）
+        self.replica_reads = 0
+        self.sticky_reads = 0
+        self.unhealthy_reads = 0
+        self.retries = 0
+        self.errors = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(settings.DATABASE_READ_URL)
+
+    # ---- read-your-writes ----
+    def note_write(self, user_id) -> None:
+        user_id = _as_uuid(user_id)
+        if user_id is None or not self.configured:
+            return
+        now = time.monotonic()
+        self._sticky[user_id] = now + self.sticky_seconds
+        if len(self._sticky) > self.max_sticky_users:
+            self._sticky = {k: v for k, v in self._sticky.items() if v > now}
+
+    def is_sticky(self, user_id) -> bool:
+        user_id = _as_uuid(user_id)
+        until = self._sticky.get(user_id) if user_id is not None else None
+        if until is None:
+            return False
+        if until < time.monotonic():
+            self._sticky.pop(user_id, None)
+            return False
+        return True
+
+    # ---- 选库 ----
+    def choose_replica(self, user_id=None) -> bool:
+        if not self.configured:
+            return False
+        if not self.healthy:
+            self.unhealthy_reads += 1
+            return False
+        if user_id is not None and self.is_sticky(user_id):
+            self.sticky_reads += 1
+            return False
+        self.replica_reads += 1
+        return True
+
+    def mark_down(self) -> None:
+        if self.healthy:
+            logger.warning("read replica marked down, reading from primary")
+        self.healthy = False
+        self.errors += 1
+
+    # ---- 健康检查 ----
+    async def _probe_lag(self) -> float:
+        eng = get_read_engine()
+        async with eng.connect() as conn:
+            if eng.dialect.name != "postgresql":
+                await conn.execute(text("SELECT 1"))
+                return 0.0
+            return float((await conn.execute(_LAG_SQL)).scalar() or 0.0)
+
+    async def check(self) -> bool:
+        try:
+            lag = await self.probe()
+        except Exception:
+            self.lag_seconds = None
+            self.mark_down()
+            logger.debug("read replica check failed", exc_info=True)
+            return False
+        self.lag_seconds = lag
+        healthy = lag <= self.max_lag_seconds
+        if healthy != self.healthy:
+            logger.info("read replica %s (lag %.2fs)", "healthy" if healthy else "lagging", lag)
+        self.healthy = healthy
+        return healthy
+
+    async def _run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.check_seconds)
+
+    def start(self) -> None:
+        if self.configured and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="read-replica-check")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.healthy = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "configured": self.configured,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag_seconds,
+            "sticky_users": len(self._sticky),
+            "replica_reads": self.replica_reads,
+            "sticky_reads": self.sticky_reads,
+            "unhealthy_reads": self.unhealthy_reads,
+            "retries": self.retries,
+            "errors": self.errors,
+        }
+
+
+read_router = ReadRouter(
+    sticky_seconds=settings.DB_READ_STICKY_SECONDS,
+    max_lag_seconds=settings.DB_READ_MAX_LAG_SECONDS,
+    check_seconds=settings.DB_READ_CHECK_SECONDS,
+)
+
+
+def _gauges() -> Dict[str, Any]:
+    s = read_router.stats()
+    return {
+        "read_replica_healthy": int(s["healthy"]),
+        "read_replica_lag_seconds": s["lag_seconds"],
+        "read_replica_reads": s["replica_reads"],
+        "read_replica_sticky_reads": s["sticky_reads"],
+        "read_replica_unhealthy_reads": s["unhealthy_reads"],
+        "read_replica_primary_retries": s["retries"],
+    }
+
+
+register_gauges("read_replica", _gauges)
+
+
+def _is_write(clause) -> bool:
+    """Core 的 INSERT / UPDATE / DELETE 以及 SELECT ... FOR UPDATE"""
+    return clause is not None and (
+        getattr(clause, "is_dml", False) or getattr(clause, "_for_update_arg", None) is not None
+    )
+
+
+class RoutingSession(Session):
+    """
+    info["user_id"]：当前用户（stickiness 用）；info["primary"]：之后全部走主库。
+    写语句（ORM flush、db.execute(update(...)) 等）走主库，并且这个 session 之后的读也留在主库（读到自己刚写的）
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if _is_write(clause):
+            self.info["primary"] = True
+        if not self._flushing and not self.info.get("primary") and read_router.choose_replica(self.info.get("user_id")):
+            self.info["replica_used"] = True
+            return get_read_engine().sync_engine
+        return get_engine().sync_engine
+
+
+ReadSessionLocal = async_sessionmaker(
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+def bind_user(db: AsyncSession, user_id) -> None:
+    """认证之后调用：该用户刚写过时，这个 session 后面的读走主库"""
+    db.info["user_id"] = _as_uuid(user_id)
+
+
+def use_primary(db: AsyncSession) -> bool:
+    """
+    副本上查不到 / 读到的可能是旧数据时调用：这个 session 之后都读主库。
+    返回 True 表示之前确实读的是副本，调用方应该重查一次；普通（主库）session 返回 False。
+    """
+    if not isinstance(db.sync_session, RoutingSession) or db.info.get("primary") or not db.info.get("replica_used"):
+        return False
+    db.info["primary"] = True
+    db.expunge_all()  # 丢掉副本读到的对象，重查时从主库加载
+    read_router.retries += 1
+    return True
+
+
+async def get_read_db():
+    async with ReadSessionLocal() as session:
+        yield session
@@ -1,26 +1,228 @@
 # backend/app/db/session.py
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
-from app.core.config import get_settings
+import asyncio
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.core.config import Settings, get_settings
+from app.core.instrumentation import install_query_hooks, register_gauges
 
 settings = get_settings()
 
-# 创建数据库引擎（异步）
-engine = create_async_engine(
-    settings.DATABASE_URL.replace("psycopg2", "asyncpg"),  # 使用 asyncpg 驱动
-    pool_pre_ping=True,   # 检查连接是否可用
-    pool_size=5,          # 连接池大小
-    max_overflow=10       # 允许的最大连接溢出数
-)
+# 同步驱动名 -> 异步驱动名
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def build_async_url(database_url: str) -> URL:
+    """把 .env 里的 URL 规范成异步驱动（不再用字符串 replace）"""
+    url = make_url(database_url)
+    return url.set(drivername=_ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+class PoolStats:
+    """连接池指标：当前借出数（in-use）和 checkout 等待时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.checkouts = 0
+        self.wait_count = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.timeouts = 0
+
+    def observe_wait(self, ms: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total_ms += ms
+            self.wait_max_ms = max(self.wait_max_ms, ms)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_use": self.in_use,
+                "checkouts": self.checkouts,
+                "checkout_wait_count": self.wait_count,
+                "checkout_wait_avg_ms": self.wait_total_ms / self.wait_count if self.wait_count else 0.0,
+                "checkout_wait_max_ms": self.wait_max_ms,
+                "checkout_timeouts": self.timeouts,
+            }
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """在取连接处计时，记录排队等待时间（池满时这里会阻塞到 pool_timeout）"""
+
+    stats: Optional[PoolStats] = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except Exception:
+            timed_out = True
+            raise
+        finally:
+            if self.stats is not None:
+                self.stats.observe_wait((time.perf_counter() - started) * 1000, timed_out)
+
+    def recreate(self):
+        new_pool = super().recreate()
+        new_pool.stats = self.stats
+        return new_pool
+
+
+def build_engine(cfg: Optional[Settings] = None, **overrides: Any) -> AsyncEngine:
+    """按 Settings 创建引擎；overrides 用于压测时覆盖单项参数"""
+    cfg = cfg or settings
+    url = build_async_url(overrides.pop("url", cfg.DATABASE_URL))
+    opts: Dict[str, Any] = {
+        "pool_size": cfg.DB_POOL_SIZE,                # 连接池大小
+        "max_overflow": cfg.DB_MAX_OVERFLOW,          # 允许的最大连接溢出数
+        "pool_timeout": cfg.DB_POOL_TIMEOUT,          # 等待空闲连接的超时（秒）
+        "pool_recycle": cfg.DB_POOL_RECYCLE,          # 连接最长存活时间（秒），替代每次 pre-ping
+        "pool_pre_ping": cfg.DB_POOL_PRE_PING,        # 每次 checkout 前 ping 一次（多一个往返）
+        "statement_cache_size": cfg.DB_STATEMENT_CACHE_SIZE,
+    }
+    opts.update(overrides)
+
+    statement_cache_size = opts.pop("statement_cache_size")
+    connect_args: Dict[str, Any] = {}
+    if url.drivername == "postgresql+asyncpg":
+        # 走 pgbouncer(transaction 模式) 时要设为 0
+        connect_args["prepared_statement_cache_size"] = statement_cache_size
+
+    stats = PoolStats()
+    engine = create_async_engine(url, poolclass=InstrumentedQueuePool, connect_args=connect_args, **opts)
+    engine.sync_engine.pool.stats = stats
+
+    @event.listens_for(engine.sync_engine, "checkout")
+    def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+        with stats._lock:
+            stats.in_use += 1
+            stats.checkouts += 1
+
+    @event.listens_for(engine.sync_engine, "checkin")
+    def _on_checkin(dbapi_conn, conn_record):
+        with stats._lock:
+            stats.in_use -= 1
+
+    # SQL 计时：按请求累计次数 / 耗时，超过阈值记慢查询日志
+    if cfg.METRICS_ENABLED:
+        install_query_hooks(engine.sync_engine)
+
+    return engine
+
 
-# 创建异步 Session 厂
-AsyncSessionLocal = sessionmaker(
-    autocommit=False,
+def pool_status(eng: Optional[AsyncEngine] = None) -> Dict[str, Any]:
+    """连接池当前状态（给调试端点 / 指标导出用）"""
+    eng = eng or get_engine()
+    pool = eng.sync_engine.pool
+    data = pool.stats.snapshot() if getattr(pool, "stats", None) else {}
+    data.update({
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    })
+    return data
+
+
+# 引擎在第一次用到时才创建（import 本模块不连库、不加载驱动），由 app 的 lifespan 预先建好并预热
+_engine: Optional[AsyncEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> AsyncEngine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = build_engine()
+                AsyncSessionLocal.configure(bind=_engine)
+    return _engine
+
+
+def _gauges() -> Dict[str, Any]:
+    if _engine is None:  # 不为了导出指标去建引擎
+        return {}
+    pool = pool_status(_engine)
+    return {
+        "db_pool_size": pool["size"],
+        "db_pool_checked_out": pool["checked_out"],
+        "db_pool_overflow": pool["overflow"],
+        "db_pool_in_use": pool.get("in_use"),
+        "db_pool_checkout_wait_avg_seconds": pool.get("checkout_wait_avg_ms", 0) / 1000,
+        "db_pool_checkout_wait_max_seconds": pool.get("checkout_wait_max_ms", 0) / 1000,
+        "db_pool_checkout_timeouts": pool.get("checkout_timeouts"),
+    }
+
+
+register_gauges("db_pool", _gauges)
+
+
+async def dispose_engine() -> None:
+    """关闭连接池；之后再用到时重新创建"""
+    global _engine
+    eng, _engine = _engine, None
+    AsyncSessionLocal.configure(bind=None)
+    if eng is not None:
+        await eng.dispose()
+
+
+async def warm_pool(connections: int) -> int:
+    """预先建立 connections 个连接（不超过池大小）放回池里，第一批请求不用再等建连；返回建好的个数"""
+    eng = get_engine()
+    n = min(connections, eng.sync_engine.pool.size())
+    if n <= 0:
+        return 0
+
+    async def one(conn):
+        await conn.exec_driver_sql("SELECT 1")
+
+    conns = [await eng.connect() for _ in range(n)]
+    try:
+        await asyncio.gather(*(one(c) for c in conns))
+    finally:
+        for c in conns:
+            await c.close()
+    return n
+
+
+class _LazySessionMaker(async_sessionmaker):
+    """第一次创建 session 时才创建引擎"""
+
+    def __call__(self, **local_kw: Any) -> AsyncSession:
+        if self.kw.get("bind") is None:
+            get_engine()
+        return super().__call__(**local_kw)
+
+
+# 创建异步 Session 厂；commit 后不过期对象，避免提交后访问属性又触发一次查询
+AsyncSessionLocal = _LazySessionMaker(
+    class_=AsyncSession,
     autoflush=False,
-    bind=engine,
-    class_=AsyncSession
+    expire_on_commit=False,
 )
 
+
+def __getattr__(name: str) -> Any:
+    # 兼容 from app.db.session import engine：访问时才创建
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 # 获取数据库会话
 async def get_db():
     async with AsyncSessionLocal() as session:
@@ -30,4 +232,3 @@ async def get_db():
 #async def get_session() -> AsyncSession:
 #    async with AsyncSessionLocal() as session:
 #        yield session
-
@@ -1,93 +1,179 @@
 # backend/app/main.py
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+# 应用工厂：uvicorn app.main:app，或 uvicorn --factory app.main:create_app
+# import 本模块只注册路由，不连库；引擎、连接池预热和后台任务都在 lifespan 里启动
+import asyncio
+import importlib
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.core.config import get_settings
-
-
-settings = get_settings()
-
-app = FastAPI(
-    title="提示词管理系统",
-    description="MCP协议提示词管理服务",
-    version="1.0.0"
-)
-
-
-# class PromptCreate(BaseModel):
-
-
-# 1. 配置 CORS 中间件
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # 允许所有来源访问，生产环境建议改成具体域名
-    allow_credentials=True,
-    allow_methods=["*"],  # 允许所有 HTTP 方法
-    allow_headers=["*"],  # 允许所有请求头
-)
-#CORS 配置好后，前端（React）才能直接请求API。
-
-# 2. 全局异常处理（示例：500 错误）
-@app.exception_handler(Exception)
-async def global_exception_handler(request: Request, exc: Exception):
-    return JSONResponse(
-        status_code=500,
-        content={"message": "服务器内部错误，请稍后重试"},
-    )
-
-# 3. 路由挂载示例
-from app.api import api_router
-app.include_router(api_router, prefix=settings.API_V1_STR)
-
-
-
-
-# 健康检查等简单端点
-@app.get("/health")
-async def health_check():
-    return {"status": "ok"}
-
-@app.get("/test/env")
-async def test_env():
-    settings = get_settings()
-    # 对SECRET_KEY进行掩码处理（显示前3后3字符，中间用*代替）
-    masked_key = settings.SECRET_KEY[:3] + "*" * (len(settings.SECRET_KEY) - 6) + settings.SECRET_KEY[-3:]
-    return {
-        "PROJECT_NAME": settings.PROJECT_NAME,
-        "DATABASE_URL": settings.DATABASE_URL,
-        "SECRET_KEY": masked_key
-    }
-
-@app.get("/test/error")
-async def test_error():
-    raise Exception("模拟错误")
-
-
-
-#测试数据库连接
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import Depends
-from app.db.session import get_db
-
-@app.get("/test/db-connect")
-async def test_db_connect(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(text("SELECT 1"))
-    return {"db_result": result.scalar()}
-
 
+from app.api.deps import verify_api_key
+from app.core.config import Settings, get_settings
+from app.core.instrumentation import RequestMetricsMiddleware, render_prometheus
+from app.db.replica import dispose_read_engine, get_read_engine, read_router
+from app.db.session import dispose_engine, get_db, get_engine, pool_status, warm_pool
 
-# 注册具体的 API 路由
-from app.api.v1 import users, prompts
-app.include_router(users.router, prefix="/api/v1/users", tags=["users"])
-app.include_router(prompts.router, prefix="/api/v1/prompts", tags=["prompts"])
 
+logger = logging.getLogger(__name__)
 
-# 在 main.py 中分开挂：
-# from app.api import mcp
-# app.include_router(api_router, prefix=settings.API_V1_STR)
-# app.include_router(mcp_router)
+# 只在用到时才 import 的重模块（numpy 向量索引 / MinHash、批量导入），启动时在线程里预先加载
+_LAZY_MODULES = (
+    "app.services.embedding_service",
+    "app.services.dedupe_service",
+    "app.services.bulk_service",
+)
 
 
-# 打印DATABASE_URL
-print(">>> EFFECTIVE DATABASE_URL:", settings.DATABASE_URL)
\ No newline at end of file
+async def _preload_modules() -> None:
+    for name in _LAZY_MODULES:
+        await asyncio.to_thread(importlib.import_module, name)
+    from app.api.mcp import tools_payload
+    tools_payload()
+
+
+async def _warm_pool(connections: int) -> None:
+    try:
+        await warm_pool(connections)
+    except Exception:
+        # 数据库暂时连不上不阻止启动，第一个请求会再试
+        logger.warning("connection pool warm-up failed", exc_info=True)
+
+
+async def warm_up(settings: Settings) -> None:
+    """建连（网络 I/O）和 import 重模块（CPU）同时进行"""
+    started = time.perf_counter()
+    tasks = [_warm_pool(settings.DB_POOL_WARMUP_CONNECTIONS)]
+    if settings.STARTUP_WARMUP:
+        tasks.append(_preload_modules())
+    await asyncio.gather(*tasks)
+    logger.info("warm-up done in %.0f ms", (time.perf_counter() - started) * 1000)
+
+
+# 启动/停机钩子：引擎和后台任务在这里启停
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from app.services.cache_bus import cache_bus
+    from app.services.gallery_service import gallery_refresher
+    from app.services.mcp_sessions import session_registry
+    from app.services.quota_service import quota_tracker
+    from app.services.usage_service import usage_aggregator
+
+    settings = app.state.settings
+    engine = get_engine()
+    # 不再在 import 时 print 连接串；只记录去掉密码的 URL
+    logger.info("database: %s", engine.url.render_as_string(hide_password=True))
+    read_engine = get_read_engine()
+    if read_engine is not None:
+        logger.info("read replica: %s", read_engine.url.render_as_string(hide_password=True))
+        await read_router.check()  # 第一次探测成功前所有读都走主库
+    await warm_up(settings)
+    usage_aggregator.start()
+    quota_tracker.start()
+    gallery_refresher.start()
+    cache_bus.start()
+    read_router.start()
+    yield
+    await read_router.stop()
+    await cache_bus.stop()
+    # 结束所有 SSE 长连接，否则停机要等客户端自己断开
+    session_registry.close_all()
+    await gallery_refresher.stop()
+    # 停机前把内存里的 usage_count / 当日调用次数增量写回
+    await usage_aggregator.stop()
+    await quota_tracker.stop()
+    await dispose_read_engine()
+    await dispose_engine()
+
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    settings = settings or get_settings()
+    app = FastAPI(
+        title="提示词管理系统",
+        description="MCP协议提示词管理服务",
+        version="1.0.0",
+        lifespan=lifespan,
+        # 默认用 orjson 序列化响应，比标准库 json 快很多
+        default_response_class=ORJSONResponse,
+    )
+    app.state.settings = settings
+
+    # 1. 配置 CORS 中间件
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # 允许所有来源访问，生产环境建议改成具体域名
+        allow_credentials=True,
+        allow_methods=["*"],  # 允许所有 HTTP 方法
+        allow_headers=["*"],  # 允许所有请求头
+    )
+    #CORS 配置好后，前端（React）才能直接请求API。
+
+    # 请求耗时直方图 + Server-Timing（最后添加 = 最外层，计时覆盖其它中间件）
+    if settings.METRICS_ENABLED:
+        app.add_middleware(RequestMetricsMiddleware)
+
+    # 2. 全局异常处理（示例：500 错误）
+    @app.exception_handler(Exception)
+    async def global_exception_handler(request: Request, exc: Exception):
+        return JSONResponse(
+            status_code=500,
+            content={"message": "服务器内部错误，请稍后重试"},
+        )
+
+    # 3. 路由：/api/v1/...（每个路由只注册一次，见 app/api/__init__.py）和 MCP（/mcp/v1/tools/...）
+    from app.api import api_router, mcp_router
+    app.include_router(api_router, prefix=settings.API_V1_STR)
+    app.include_router(mcp_router)
+
+    _add_probe_routes(app, settings)
+    return app
+
+
+def _add_probe_routes(app: FastAPI, settings: Settings) -> None:
+    # 健康检查等简单端点
+    @app.get("/health")
+    async def health_check():
+        return {"status": "ok"}
+
+    @app.get("/test/env")
+    async def test_env():
+        # 对SECRET_KEY进行掩码处理（显示前3后3字符，中间用*代替）
+        masked_key = settings.SECRET_KEY[:3] + "*" * (len(settings.SECRET_KEY) - 6) + settings.SECRET_KEY[-3:]
+        return {
+            "PROJECT_NAME": settings.PROJECT_NAME,
+            "DATABASE_URL": settings.DATABASE_URL,
+            "SECRET_KEY": masked_key
+        }
+
+    @app.get("/test/error")
+    async def test_error():
+        raise Exception("模拟错误")
+
+    #测试数据库连接
+    @app.get("/test/db-connect")
+    async def test_db_connect(db: AsyncSession = Depends(get_db)):
+        result = await db.execute(text("SELECT 1"))
+        return {"db_result": result.scalar()}
+
+    # 连接池状态：in-use / checkout 等待
+    @app.get("/test/db-pool")
+    async def test_db_pool():
+        return pool_status()
+
+    # Prometheus 指标：请求 / SQL 直方图 + 各组件注册的瞬时值（连接池、缓存、usage 缓冲区、限流 / 配额等）
+    # 指标里有用户数、缓存规模等运营数据，默认要带 X-API-Key；只在内网抓取时可用 METRICS_REQUIRE_API_KEY=false 放开
+    if settings.METRICS_ENABLED:
+        guards = [Depends(verify_api_key)] if settings.METRICS_REQUIRE_API_KEY else []
+
+        @app.get("/metrics", include_in_schema=False, dependencies=guards)
+        async def metrics():
+            return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+app = create_app()
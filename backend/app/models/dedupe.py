@@ -0,0 +1,29 @@
+# backend/app/models/dedupe.py
+# 提示词正文的 MinHash 签名：每个提示词一行，跟随当前版本更新，由 dedupe_service 写入
+import uuid
+from datetime import datetime
+
+from sqlalchemy import DateTime, Index, Integer, LargeBinary
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+from .prompt import prompt_ref, prompt_ref_constraint
+
+
+class PromptSignature(Base):
+    """
+    signature 为 NUM_PERM 个 uint16 的小端字节（64 * 2 = 128 字节），LSH 分段键在加载时由它算出，不单独存储。
+    """
+    __tablename__ = "prompt_signatures"
+
+    prompt_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), *prompt_ref(), primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)  # 冗余自 prompts，按用户加载不用 JOIN
+    version: Mapped[int] = mapped_column(Integer, nullable=False)  # 对应的提示词版本
+    signature: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("idx_prompt_signatures_user", "user_id", "updated_at"),
+        *prompt_ref_constraint(),
+    )
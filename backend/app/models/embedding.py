@@ -0,0 +1,34 @@
+# backend/app/models/embedding.py
+# 提示词的语义向量：每个提示词一行，跟随当前版本更新，由 embedding_service 写入
+import uuid
+from datetime import datetime
+
+from sqlalchemy import DateTime, Index, Integer, LargeBinary, String
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+from .prompt import prompt_ref, prompt_ref_constraint
+
+
+class PromptEmbedding(Base):
+    """
+    vector 为 L2 归一化后的 float32 小端字节（dim * 4 字节，256 维即 1 KB），
+    读出后 np.frombuffer 即可，不经过 JSON / 数组类型的解析。
+    model 记录生成它的 embedder（如 hashing-256），换 embedder 后旧向量会被忽略并由 embed_prompts 任务重算。
+    """
+    __tablename__ = "prompt_embeddings"
+
+    prompt_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), *prompt_ref(), primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)  # 冗余自 prompts，按用户加载不用 JOIN
+    version: Mapped[int] = mapped_column(Integer, nullable=False)  # 对应的提示词版本
+    model: Mapped[str] = mapped_column(String(100), nullable=False)
+    dim: Mapped[int] = mapped_column(Integer, nullable=False)
+    vector: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    __table_args__ = (
+        # 按用户加载全部向量 + 检查 (count, max(updated_at)) 是否变化，都只走这个索引
+        Index("idx_prompt_embeddings_user", "user_id", "model", "updated_at"),
+        *prompt_ref_constraint(),
+    )
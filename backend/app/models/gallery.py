@@ -0,0 +1,63 @@
+# backend/app/models/gallery.py
+# 公开提示词广场的快照表：由 gallery_service 定期整表重建，排名预先算好，请求时只按 rank 顺序读
+import uuid
+from datetime import datetime
+
+from sqlalchemy import DateTime, Float, Index, Integer, String, Text, text
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+# 广场搜索的全文表达式：索引和查询必须一致
+GALLERY_SEARCH_TSVECTOR = (
+    "to_tsvector('english', title || ' ' || coalesce(description, '') || ' ' || preview)"
+)
+
+
+class PublicPromptSnapshot(Base):
+    """
+    每行一个公开提示词（作者未停用）。三种排序各有一列预先算好的名次（从 1 开始），
+    列表分页用 WHERE rank_x > :after ORDER BY rank_x LIMIT n，不做请求时排序。
+    """
+    __tablename__ = "public_prompt_gallery"
+
+    prompt_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    author: Mapped[str] = mapped_column(String(50), nullable=False)
+    title: Mapped[str] = mapped_column(String(255), nullable=False)
+    description: Mapped[str] = mapped_column(Text, nullable=True)
+    preview: Mapped[str] = mapped_column(Text, nullable=False)  # content 的前 N 个字符
+    tags: Mapped[list[str]] = mapped_column(ARRAY(String), default=list)
+    category: Mapped[str] = mapped_column(String(100), nullable=True)
+    usage_count: Mapped[int] = mapped_column(Integer, default=0)
+    version: Mapped[int] = mapped_column(Integer, default=1)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+    updated_at: Mapped[datetime] = mapped_column(DateTime)
+    score: Mapped[float] = mapped_column(Float, nullable=False)
+    rank_popular: Mapped[int] = mapped_column(Integer, nullable=False)  # 使用量 + 新鲜度综合分
+    rank_recent: Mapped[int] = mapped_column(Integer, nullable=False)  # updated_at 倒序
+    rank_usage: Mapped[int] = mapped_column(Integer, nullable=False)  # usage_count 倒序
+
+    __table_args__ = (
+        Index("idx_gallery_rank_popular", "rank_popular", unique=True),
+        Index("idx_gallery_rank_recent", "rank_recent", unique=True),
+        Index("idx_gallery_rank_usage", "rank_usage", unique=True),
+        Index("idx_gallery_category_popular", "category", "rank_popular"),
+        Index("idx_gallery_tags", "tags", postgresql_using="gin"),
+        Index("idx_gallery_search", text(GALLERY_SEARCH_TSVECTOR), postgresql_using="gin"),
+    )
+
+
+class PublicGalleryMeta(Base):
+    """
+    单行（id = 1）：快照的代号和时间。generation 只在内容变化时 + 1，
+    列表接口的 ETag / Last-Modified 由它生成，客户端重新验证时不用读快照表。
+    """
+    __tablename__ = "public_gallery_meta"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    generation: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    checksum: Mapped[str] = mapped_column(String(32), nullable=True)  # 源数据的摘要，不变则跳过重建
+    row_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    changed_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)  # 内容最近一次变化
+    refreshed_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)  # 最近一次检查
@@ -0,0 +1,54 @@
+# backend/app/models/job.py
+# 后台任务队列表：API 进程只负责写入，worker（python -m app.cli.jobs worker）用 FOR UPDATE SKIP LOCKED 领取执行
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import JSON, DateTime, ForeignKey, Index, Integer, String, Text, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+# 状态流转：queued -> running -> succeeded / failed；失败可重试时回到 queued 并推迟 run_at
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+# 本地用 SQLite 跑任务时没有 JSONB
+_JSON = JSON().with_variant(JSONB, "postgresql")
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    kind: Mapped[str] = mapped_column(String(50), nullable=False)
+    payload: Mapped[dict] = mapped_column(_JSON, default=dict, nullable=False)
+    # 发起任务的用户（系统任务为空），状态接口只返回自己的任务
+    user_id: Mapped[Optional[uuid.UUID]] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=True
+    )
+    status: Mapped[str] = mapped_column(String(20), default=JOB_QUEUED, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    max_attempts: Mapped[int] = mapped_column(Integer, default=5, nullable=False)
+    run_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    # 租约：locked_at 由 worker 定期续期，超过 JOB_LEASE_SECONDS 未续期视为 worker 已挂，任务重新排队
+    locked_by: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    locked_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    result: Mapped[Optional[dict]] = mapped_column(_JSON, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # 领取：WHERE status = 'queued' AND run_at <= now ORDER BY run_at；只索引排队中的行，索引始终很小
+        Index("idx_jobs_queued_run_at", "run_at", postgresql_where=text("status = 'queued'")),
+        # 租约过期回收
+        Index("idx_jobs_running_locked_at", "locked_at", postgresql_where=text("status = 'running'")),
+        # 状态接口：某用户最近的任务
+        Index("idx_jobs_user_created", "user_id", "created_at"),
+    )
@@ -2,20 +2,56 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import String, Text, Integer, Boolean, DateTime, ForeignKey
+from sqlalchemy import String, Text, Integer, Boolean, DateTime, ForeignKey, ForeignKeyConstraint, LargeBinary, event
 from sqlalchemy.dialects.postgresql import UUID, ARRAY, JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
+from app.core.config import get_settings
+
 from .base import Base
 
 # for index
 from sqlalchemy import Index, text
 
+# 全文检索表达式：索引和查询必须用完全相同的表达式，planner 才会走 idx_prompts_search
+PROMPT_SEARCH_TSVECTOR = "to_tsvector('english', title || ' ' || content)"
+
+# 按 user_id HASH 分区（PROMPTS_PARTITIONS > 0）：分区键必须在主键里，主键变为 (id, user_id)；
+# 父表上的索引会在每个分区上各建一份。按用户的查询都带 user_id = ?，planner 只扫一个分区
+PROMPTS_PARTITIONS = get_settings().PROMPTS_PARTITIONS
+PROMPTS_PARTITIONED = PROMPTS_PARTITIONS > 0
+
+
+def partition_names(table: str = "prompts", n: int = PROMPTS_PARTITIONS) -> list[str]:
+    return [f"{table}_p{i}" for i in range(n)]
+
+
+def partitions_ddl(table: str = "prompts", n: int = PROMPTS_PARTITIONS) -> list[str]:
+    return [
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES WITH (MODULUS {n}, REMAINDER {i})"
+        for i, name in enumerate(partition_names(table, n))
+    ]
+
+
+def prompt_ref() -> tuple:
+    """子表 prompt_id 列上的外键；分区时改由 prompt_ref_constraint() 的复合外键引用"""
+    return () if PROMPTS_PARTITIONED else (ForeignKey("prompts.id", ondelete="CASCADE"),)
+
+
+def prompt_ref_constraint() -> tuple:
+    """分区后 prompts 只有 (id, user_id) 唯一，子表用 (prompt_id, user_id) 复合外键"""
+    if not PROMPTS_PARTITIONED:
+        return ()
+    return (ForeignKeyConstraint(["prompt_id", "user_id"], ["prompts.id", "prompts.user_id"], ondelete="CASCADE"),)
+
+
 class Prompt(Base):
     __tablename__ = "prompts"
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"))
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=PROMPTS_PARTITIONED
+    )
     title: Mapped[str] = mapped_column(String(255), nullable=False)
     content: Mapped[str] = mapped_column(Text, nullable=False)
     description: Mapped[str] = mapped_column(Text, nullable=True)
@@ -23,6 +59,8 @@ class Prompt(Base):
     # ARRAY(String) 用于多标签（比 JSONB 检索更快
     category: Mapped[str] = mapped_column(String(100), nullable=True)
     variables: Mapped[list[str]] = mapped_column(JSONB, default=list)
+    # 预编译的模板片段 {"v": version, "literals": [...], "slots": [...]}，见 template_service
+    compiled_template: Mapped[dict] = mapped_column(JSONB, nullable=True)
     is_public: Mapped[bool] = mapped_column(Boolean, default=False)
     usage_count: Mapped[int] = mapped_column(Integer, default=0)
     version: Mapped[int] = mapped_column(Integer, default=1)
@@ -36,10 +74,77 @@ class Prompt(Base):
     # 全文搜索索引 - 改了一点
     __table_args__ = (
         Index("idx_prompts_user_id", "user_id"),
+        # 列表页 keyset 分页：WHERE user_id = ? AND (updated_at, id) < (?, ?) ORDER BY updated_at DESC, id DESC
+        Index("idx_prompts_user_updated_id", "user_id", "updated_at", "id"),
+        # 热门列表：只索引被用过的提示词，索引小且能按 usage_count 倒序直接取前 N 条
+        Index(
+            "idx_prompts_user_usage_used",
+            "user_id",
+            text("usage_count DESC"),
+            "id",
+            postgresql_where=text("usage_count > 0"),
+        ),
         Index("idx_prompts_tags", "tags", postgresql_using="gin"),
         Index(
             "idx_prompts_search",
-            text("to_tsvector('english', title || ' ' || content)"),
+            text(PROMPT_SEARCH_TSVECTOR),
             postgresql_using="gin"
         ),
-    )
\ No newline at end of file
+        # 三元组索引：短查询 / 中文等非英文查询的兜底（需要 CREATE EXTENSION pg_trgm）
+        Index(
+            "idx_prompts_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ),
+        Index(
+            "idx_prompts_content_trgm",
+            "content",
+            postgresql_using="gin",
+            postgresql_ops={"content": "gin_trgm_ops"},
+        ),
+        # 公开提示词只占很小一部分：部分索引只含 is_public 的行，刷新广场快照时按它们扫描
+        Index(
+            "idx_prompts_public_usage",
+            text("usage_count DESC"),
+            "id",
+            postgresql_where=text("is_public = true"),
+        ),
+        Index(
+            "idx_prompts_public_updated",
+            text("updated_at DESC"),
+            "id",
+            postgresql_where=text("is_public = true"),
+        ),
+        {"postgresql_partition_by": "HASH (user_id)"} if PROMPTS_PARTITIONED else {},
+    )
+
+
+@event.listens_for(Prompt.__table__, "after_create")
+def _create_partitions(target, connection, **kw):
+    if PROMPTS_PARTITIONED and connection.dialect.name == "postgresql":
+        for ddl in partitions_ddl(target.name):
+            connection.exec_driver_sql(ddl)
+
+
+class PromptVersion(Base):
+    """
+    提示词修订历史，由 version_service 在每次创建 / 更新时写入。
+    每隔 PROMPT_VERSION_SNAPSHOT_INTERVAL 个版本存一份完整快照（kind="snapshot"），
+    中间只存相对上一版本的差异（kind="delta"）；payload 为 zlib 压缩的 JSON。
+    重建任意版本最多读 1 个快照 + (间隔 - 1) 个差异。
+    """
+    __tablename__ = "prompt_versions"
+
+    prompt_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), *prompt_ref(), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # 冗余自 prompts，分区后复合外键要用；加列之前写入的旧行为空，由 app.cli.partition 回填
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=True)
+    kind: Mapped[str] = mapped_column(String(10), nullable=False)  # snapshot / delta
+    base_version: Mapped[int] = mapped_column(Integer, nullable=False)  # 所在链的快照版本
+    changed_fields: Mapped[list[str]] = mapped_column(ARRAY(String), default=list)
+    payload: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    size_bytes: Mapped[int] = mapped_column(Integer, nullable=False)  # 压缩前 JSON 的字节数
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = prompt_ref_constraint()
@@ -0,0 +1,17 @@
+# backend/app/models/quota.py
+# 每个用户每天的 MCP 调用次数（配额），由 quota_service 批量累加写入
+import uuid
+from datetime import date
+from sqlalchemy import Date, ForeignKey, Integer
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+from .base import Base
+
+class DailyApiUsage(Base):
+    __tablename__ = "api_usage_daily"
+
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    day: Mapped[date] = mapped_column(Date, primary_key=True)  # UTC 日期
+    calls: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
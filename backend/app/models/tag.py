@@ -1,7 +1,7 @@
 # backend/app/models/tag.py
 import uuid
 from datetime import datetime
-from sqlalchemy import String, Integer, DateTime, Boolean
+from sqlalchemy import String, Integer, DateTime, Boolean, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column
 from .base import Base
@@ -17,3 +17,26 @@ class Tag(Base):
     # usage_count 可以做标签排序。不一定需要，先写着
     is_system: Mapped[bool] = mapped_column(Boolean, default=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class PromptTagFacet(Base):
+    """
+    按用户物化的标签分面计数，由 tag_service 在提示词写入时增量维护。
+    每条提示词（分类 c，标签集合 T）贡献：
+      (c, "", "")   +1            -> 分类计数 / 总数
+      (c, "", t)    +1  t ∈ T     -> 标签计数
+      (c, f, t)     +1  f≠t ∈ T   -> 在标签 f 过滤下 t 的计数（共现）
+    category 为空时存 ""。
+    """
+    __tablename__ = "prompt_tag_facets"
+
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    category: Mapped[str] = mapped_column(String(100), primary_key=True, default="")
+    filter_tag: Mapped[str] = mapped_column(String(100), primary_key=True, default="")
+    facet_tag: Mapped[str] = mapped_column(String(100), primary_key=True, default="")
+    prompt_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        # top tags：WHERE user_id = ? AND filter_tag = ? GROUP BY facet_tag
+        Index("idx_tag_facets_user_filter", "user_id", "filter_tag", "facet_tag"),
+    )
@@ -0,0 +1,34 @@
+# backend/app/schemas/job.py
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+
+#JobCreate：提交后台任务（只能提交 user_scoped 的任务，作用范围固定为当前用户）
+class JobCreate(BaseModel):
+    kind: str = Field(..., max_length=50, description="任务类型，如 recompute_variables / reconcile_tags")
+    payload: Dict[str, Any] = Field(default_factory=dict)
+
+
+#JobRead：任务状态
+class JobRead(BaseModel):
+    id: UUID
+    kind: str
+    status: str  # queued / running / succeeded / failed / cancelled
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    last_error: Optional[str]
+    result: Optional[Dict[str, Any]]
+
+    class Config:
+        from_attributes = True
+
+
+class JobList(BaseModel):
+    items: List[JobRead]
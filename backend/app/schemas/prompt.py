@@ -1,6 +1,6 @@
 # backend/app/schemas/prompt.py
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, Dict, List, Optional
 #PromptCreate：用于新建提示词
 
 from typing import Optional
@@ -11,15 +11,19 @@ from datetime import datetime
 #PromptRead - 返回完整提示词信息
 
 
+# 每条提示词的标签数上限：标签分面按两两组合计数（见 tag_service.facet_keys），行数随标签数平方增长
+MAX_TAGS = 50
+
 
 #PromptCreate：用于新建提示词
 class PromptCreate(BaseModel):
     title: str = Field(..., max_length=255, description="提示词标题")
     content: str = Field(..., min_length=1, description="提示词正文内容")
     description: Optional[str] = Field(None, description="可选描述")
-    tags: List[str] = Field(default_factory=list)
+    tags: List[str] = Field(default_factory=list, max_length=MAX_TAGS)
     category: Optional[str] = Field(None, max_length=100)
     variables: List[str] = Field(default_factory=list)
+    is_public: bool = Field(False, description="公开到广场（/api/v1/public/prompts）")
 #default_factory=list：避免用 [] 作为默认值，这样每次实例化都会新建一个列表，防止“多个用户共享一个标签列表”的 bug。
 
 
@@ -27,11 +31,20 @@ class PromptCreate(BaseModel):
 #PromptUpdate：用于编辑提示词
 class PromptUpdate(BaseModel):
     title: Optional[str] = Field(None, max_length=255)
-    content: Optional[str] = Field(None)
+    content: Optional[str] = Field(None, min_length=1)
     description: Optional[str] = None
-    tags: Optional[List[str]] = None
+    tags: Optional[List[str]] = Field(None, max_length=MAX_TAGS)
     category: Optional[str] = Field(None, max_length=100)
     variables: Optional[List[str]] = None
+    is_public: Optional[bool] = None
+
+    # 不传表示不改；显式传 null 对这几个非空列没有意义，直接 422（description / category 可以置空）
+    @field_validator("title", "content", "tags", "variables", "is_public")
+    @classmethod
+    def _not_null(cls, v):
+        if v is None:
+            raise ValueError("不能为 null，不修改请省略该字段")
+        return v
 
 
 
@@ -44,10 +57,101 @@ class PromptRead(BaseModel):
     tags: List[str]
     category: Optional[str]
     variables: List[str]
+    is_public: bool
     version: int
     usage_count: int
     created_at: datetime
     updated_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+#PromptCreated：创建接口的响应，附带疑似重复（DEDUPE_MODE=report）
+class PromptDuplicate(BaseModel):
+    id: UUID
+    title: str
+    similarity: float = Field(..., description="估计的 Jaccard 相似度")
+
+
+class PromptCreated(PromptRead):
+    duplicates: List[PromptDuplicate] = Field(default_factory=list)
+
+
+#DuplicateReport：整个库的近似重复聚类
+class DuplicateMember(BaseModel):
+    id: UUID
+    title: str
+    usage_count: int
+    updated_at: Optional[datetime]
+
+
+class DuplicateCluster(BaseModel):
+    size: int
+    keep_id: UUID = Field(..., description="建议保留的一条（使用次数最多，其次最近更新）")
+    min_similarity: float
+    prompts: List[DuplicateMember]
+
+
+class DuplicateReport(BaseModel):
+    threshold: float
+    clusters: List[DuplicateCluster]
+    cluster_count: int
+    duplicate_prompts: int = Field(..., description="删掉后可以减少的提示词数量（每组保留一条）")
+    unindexed: int = Field(..., description="尚未计算签名、未参与聚类的提示词数量")
+
+
+#PromptRender：服务端渲染模板
+class PromptRenderRequest(BaseModel):
+    variables: Dict[str, Any] = Field(default_factory=dict, description="单组变量")
+    variable_sets: Optional[List[Dict[str, Any]]] = Field(
+        None, max_length=1000, description="批量渲染：同一模板 N 组变量，传了就忽略 variables"
+    )
+    strict: bool = Field(False, description="缺少变量时报错；否则保留 {{name}} 原样")
+
+    def sets(self) -> List[Dict[str, Any]]:
+        return self.variable_sets if self.variable_sets is not None else [self.variables]
+
+
+class PromptRenderResponse(BaseModel):
+    prompt_id: UUID
+    version: int
+    variables: List[str]
+    rendered: List[str]
+
+
+#PromptVersion：版本历史
+class PromptVersionInfo(BaseModel):
+    version: int
+    kind: str  # snapshot / delta
+    changed_fields: List[str]
+    size_bytes: int
+    created_at: datetime
+
+
+class PromptVersionList(BaseModel):
+    prompt_id: UUID
+    current_version: int
+    items: List[PromptVersionInfo]
+    next_before: Optional[int] = None
+
+
+class PromptVersionRead(BaseModel):
+    prompt_id: UUID
+    version: int
+    title: str
+    content: str
+    description: Optional[str]
+    tags: List[str]
+    category: Optional[str]
+    variables: List[str]
+    created_at: Optional[datetime]
+
+
+class PromptVersionDiff(BaseModel):
+    prompt_id: UUID
+    from_version: int
+    to_version: int
+    changed_fields: List[str]
+    fields: Dict[str, Dict[str, Any]]  # 非 content 字段：{"from": ..., "to": ...}
+    content_diff: str  # unified diff
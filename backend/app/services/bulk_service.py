@@ -0,0 +1,429 @@
+# backend/app/services/bulk_service.py
+# 批量导入 / 导出提示词：NDJSON 或 CSV 流，分块校验，COPY 写入，逐行报告错误
+import codecs
+import csv
+import io
+import json
+import logging
+import secrets
+import uuid
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import orjson
+from asyncpg.exceptions import DataError as PgDataError, IntegrityConstraintViolationError
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import insert, update
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.job import JOB_FAILED, JOB_RUNNING, JOB_SUCCEEDED, Job
+from app.models.prompt import Prompt
+from app.schemas.prompt import PromptCreate
+from app.core.config import get_settings
+from app.services import cache_bus, dedupe_service, job_service, mcp_sessions, prompt_service, tag_service, template_service
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "csv")
+EXPORT_FIELDS = ("title", "content", "description", "tags", "category", "variables")
+MAX_REPORTED_ERRORS = 1000
+
+# COPY 的列顺序
+_COPY_COLUMNS = (
+    "id", "user_id", "title", "content", "description", "tags", "category", "variables",
+    "compiled_template", "is_public", "usage_count", "version", "created_at", "updated_at",
+)
+
+# 某些行本身有问题（违反约束、库里存不下的字符等）：COPY 直接抛驱动的异常，INSERT / 标签 upsert 抛 SQLAlchemy 包装过的。
+# 只有这些才值得逐行重试；连接断开、超时之类的直接往上抛
+_ROW_ERRORS = (PgDataError, IntegrityConstraintViolationError, DataError, IntegrityError)
+
+
+@dataclass
+class ImportReport:
+    rows_processed: int = 0  # 已处理（含失败）的数据行数，可作为下一次的 start_at
+    imported: int = 0
+    failed: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    method: str = ""
+    job_id: Optional[str] = None  # 经 HTTP 导入时对应的 jobs 记录，续传时带上
+
+    def add_error(self, row: int, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": error})
+
+    def as_dict(self) -> Dict[str, Any]:
+        out = {
+            "rows_processed": self.rows_processed,
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "method": self.method,
+        }
+        if self.job_id is not None:
+            out["job_id"] = self.job_id
+        return out
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "ImportReport":
+        data = data or {}
+        return cls(
+            rows_processed=int(data.get("rows_processed", 0)),
+            imported=int(data.get("imported", 0)),
+            failed=int(data.get("failed", 0)),
+            errors=list(data.get("errors") or []),
+            method=data.get("method", ""),
+            job_id=data.get("job_id"),
+        )
+
+
+Checkpoint = Callable[[ImportReport], Awaitable[None]]
+
+
+class ImportSuperseded(Exception):
+    """同一个导入任务已被另一个（续传）请求接管，本请求停止写入"""
+
+
+# ==== 解析 ====
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """把任意切分的字节流拆成完整的行（保留换行符），UTF-8 增量解码"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    async for chunk in chunks:
+        buf += decoder.decode(chunk)
+        lines = buf.splitlines(keepends=True)
+        buf = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        for line in lines:
+            yield line
+    buf += decoder.decode(b"", final=True)
+    if buf:
+        yield buf
+
+
+def _split_list(value: Any) -> List[str]:
+    # CSV 里的列表列：JSON 数组，或逗号分隔
+    if value is None or value == "":
+        return []
+    if isinstance(value, list):
+        return value
+    value = str(value).strip()
+    if value.startswith("["):
+        return json.loads(value)
+    return [x.strip() for x in value.split(",") if x.strip()]
+
+
+async def parse_ndjson(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Any]]:
+    """产出 (行号, dict 或解析异常)；空行跳过但计入行号"""
+    n = 0
+    async for line in lines:
+        n += 1
+        if not line.strip():
+            continue
+        try:
+            yield n, orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield n, e
+
+
+async def parse_csv(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Any]]:
+    """第一行为表头；带引号的字段可以跨行（按引号是否配对判断一条记录是否结束）"""
+    header: Optional[List[str]] = None
+    record, n = "", 0
+    async for line in lines:
+        record += line
+        if record.count('"') % 2:
+            continue
+        text, record = record, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader(io.StringIO(text)))
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        n += 1
+        row = dict(zip(header, values))
+        try:
+            for key in ("tags", "variables"):
+                if key in row:
+                    row[key] = _split_list(row[key])
+            yield n, row
+        except ValueError as e:
+            yield n, e
+
+
+def parse_stream(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, Any]]:
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    lines = iter_lines(chunks)
+    return parse_ndjson(lines) if fmt == "ndjson" else parse_csv(lines)
+
+
+# ==== 写入 ====
+def _to_record(user_id: uuid.UUID, p: PromptCreate, now: datetime) -> Dict[str, Any]:
+    compiled = template_service.compile_template(p.content, version=1)
+    return {
+        "id": uuid.uuid4(),
+        "user_id": user_id,
+        "title": p.title,
+        "content": p.content,
+        "description": p.description,
+        "tags": p.tags,
+        "category": p.category,
+        "variables": p.variables or compiled.variables,
+        "compiled_template": compiled.to_json(),
+        "is_public": p.is_public,
+        "usage_count": 0,
+        "version": 1,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+async def _copy_records(db: AsyncSession, records: List[Dict[str, Any]]) -> None:
+    """asyncpg 二进制 COPY；jsonb 列需要先编码成字符串"""
+    conn = await db.connection()
+    raw = await conn.get_raw_connection()
+    if not raw.driver_connection.is_in_transaction():
+        # asyncpg 适配层在第一条经它执行的语句时才发 BEGIN：直接 COPY 会在事务外自动提交，回滚不掉
+        await conn.exec_driver_sql("SELECT 1")
+    await raw.driver_connection.copy_records_to_table(
+        Prompt.__tablename__,
+        records=[
+            tuple(
+                json.dumps(r[c], ensure_ascii=False) if c in ("variables", "compiled_template") else r[c]
+                for c in _COPY_COLUMNS
+            )
+            for r in records
+        ],
+        columns=list(_COPY_COLUMNS),
+    )
+
+
+async def _insert_records(db: AsyncSession, records: List[Dict[str, Any]]) -> None:
+    """多行 INSERT（非 asyncpg 驱动，或 COPY 失败后逐行重试时使用）"""
+    await db.execute(insert(Prompt).values(records))
+
+
+def _uses_copy(db: AsyncSession) -> bool:
+    return db.bind is not None and db.bind.dialect.driver == "asyncpg"
+
+
+async def _commit(
+    db: AsyncSession, report: ImportReport, stage_checkpoint: Optional[Checkpoint], imported: int = 0
+) -> None:
+    """提交这一块；stage_checkpoint 在同一个事务里写进度（imported 为这一块新增、还没计入 report 的行数）"""
+    if stage_checkpoint is not None:
+        await stage_checkpoint(replace(report, imported=report.imported + imported))
+    await db.commit()
+
+
+async def _write_chunk(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    chunk: List[Tuple[int, Dict[str, Any]]],
+    report: ImportReport,
+    stage_checkpoint: Optional[Checkpoint] = None,
+) -> None:
+    records = [r for _, r in chunk]
+    try:
+        if _uses_copy(db):
+            await _copy_records(db, records)
+        else:
+            await _insert_records(db, records)
+        await tag_service.apply_bulk_additions(db, user_id, [(r["category"], r["tags"]) for r in records])
+        await _commit(db, report, stage_checkpoint, len(records))
+        report.imported += len(records)
+        return
+    except _ROW_ERRORS as e:
+        await db.rollback()
+        logger.warning("bulk chunk rows %d-%d failed, retrying row by row: %s", chunk[0][0], chunk[-1][0], e)
+    except Exception:
+        await db.rollback()
+        raise
+
+    # 整块失败（如某行违反约束）：逐行用 SAVEPOINT 插入，只跳过坏行
+    for row_no, record in chunk:
+        try:
+            async with db.begin_nested():
+                await _insert_records(db, [record])
+                await tag_service.apply_bulk_additions(db, user_id, [(record["category"], record["tags"])])
+            report.imported += 1
+        except Exception as e:
+            report.add_error(row_no, str(getattr(e, "orig", e)))
+    await _commit(db, report, stage_checkpoint)
+
+
+async def import_prompts(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    rows: AsyncIterator[Tuple[int, Any]],
+    chunk_size: int = 1000,
+    start_at: int = 0,
+    on_checkpoint: Optional[Checkpoint] = None,
+    stage_checkpoint: Optional[Checkpoint] = None,
+    report: Optional[ImportReport] = None,
+) -> ImportReport:
+    """
+    rows 为 parse_stream 的输出。每 chunk_size 行校验 + 写入 + 提交一次，
+    提交后回调 on_checkpoint；中断后用 report.rows_processed 作为 start_at 重跑即可续传。
+    stage_checkpoint 在每块的事务里、提交之前调用（不要 commit），进度和数据一起提交，续传时不会重复导入。
+    report 为续传时上一次的报告，计数接着累加。
+    """
+    report = report or ImportReport()
+    report.rows_processed = start_at
+    report.method = "copy" if _uses_copy(db) else "insert"
+    chunk: List[Tuple[int, Dict[str, Any]]] = []
+    now = datetime.utcnow()
+
+    async def flush() -> None:
+        if chunk:
+            await _write_chunk(db, user_id, chunk, report, stage_checkpoint)
+            chunk.clear()
+        elif stage_checkpoint is not None:
+            await _commit(db, report, stage_checkpoint)  # 只有解析 / 校验失败的行，也要记进度
+        if on_checkpoint is not None:
+            await on_checkpoint(report)
+
+    async for row_no, data in rows:
+        if row_no <= start_at:
+            continue
+        report.rows_processed = row_no
+        if isinstance(data, Exception):
+            report.add_error(row_no, f"parse error: {data}")
+        else:
+            try:
+                chunk.append((row_no, _to_record(user_id, PromptCreate.model_validate(data), now)))
+            except ValidationError as e:
+                report.add_error(row_no, "; ".join(
+                    f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()
+                ))
+        if len(chunk) >= chunk_size:
+            await flush()
+    await flush()
+    if report.imported:
+        # 其它 worker 的索引缓存 / SSE 会话；数据已经按块提交，这条消息单独一个事务
+        await cache_bus.publish(db, cache_bus.user_prompts_changed(user_id))
+        await db.commit()
+    # COPY 路径不逐行算语义向量 / 重复检测签名，导入完成后交给后台任务补算（不去重：执行中的任务可能已扫过新行）
+    if report.imported and settings.EMBEDDING_ENABLED:
+        await job_service.enqueue(db, "embed_prompts", {"user_id": str(user_id)}, user_id=user_id)
+    if report.imported and dedupe_service.enabled():
+        await job_service.enqueue(db, "sign_prompts", {"user_id": str(user_id)}, user_id=user_id)
+    if report.imported:
+        mcp_sessions.prompts_changed(user_id)
+    return report
+
+
+# ==== 可续传的 HTTP 导入 ====
+# 每次导入对应 jobs 表里一行 kind=import_prompts：不进队列、worker 不执行（locked_at 为空，租约回收也不会碰），
+# 只用来记进度。result 即 ImportReport，和每块数据在同一个事务里提交，GET /api/v1/jobs/{id} 可查；
+# 中断后带上 job_id 重新提交同一份数据，从已提交的 rows_processed 之后继续。
+# locked_by 为当前请求的令牌：续传请求会接管（比如原请求所在进程已经挂了），原请求下次写进度时发现后停止
+IMPORT_JOB_KIND = "import_prompts"
+
+
+async def _open_import_job(
+    db: AsyncSession, user_id: uuid.UUID, fmt: str, job_id: Optional[uuid.UUID]
+) -> Tuple[uuid.UUID, str, ImportReport]:
+    token = f"import:{secrets.token_hex(8)}"
+    now = datetime.utcnow()
+    if job_id is None:
+        job = Job(
+            id=uuid.uuid4(), kind=IMPORT_JOB_KIND, payload={"format": fmt}, user_id=user_id,
+            status=JOB_RUNNING, attempts=1, max_attempts=settings.JOB_MAX_ATTEMPTS, run_at=now,
+            locked_by=token, result=ImportReport().as_dict(), created_at=now, started_at=now,
+        )
+        db.add(job)
+        await db.commit()
+        return job.id, token, ImportReport(job_id=str(job.id))
+    res = await db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.user_id == user_id, Job.kind == IMPORT_JOB_KIND, Job.status != JOB_SUCCEEDED)
+        .values(status=JOB_RUNNING, locked_by=token, attempts=Job.attempts + 1, finished_at=None, last_error=None)
+        .returning(Job.payload, Job.result)
+    )
+    row = res.first()
+    await db.commit()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Import job not found or already finished")
+    if row.payload.get("format") != fmt:
+        raise HTTPException(status_code=400, detail=f"Import job was started with format={row.payload.get('format')}")
+    report = ImportReport.from_dict(row.result)
+    report.job_id = str(job_id)
+    return job_id, token, report
+
+
+async def _finish_import_job(db: AsyncSession, job_id: uuid.UUID, token: str, **values: Any) -> None:
+    await db.execute(
+        update(Job).where(Job.id == job_id, Job.locked_by == token)
+        .values(locked_by=None, finished_at=datetime.utcnow(), **values)
+    )
+    await db.commit()
+
+
+async def import_with_job(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    job_id: Optional[uuid.UUID] = None,
+    start_at: Optional[int] = None,
+    chunk_size: int = 1000,
+) -> ImportReport:
+    """
+    HTTP 导入：进度写进 jobs 记录。job_id 为空时新建一条；否则续传，start_at 默认取记录里的 rows_processed。
+    被另一个请求接管时抛 ImportSuperseded（已提交的块保留，未提交的这一块回滚）
+    """
+    job_id, token, report = await _open_import_job(db, user_id, fmt, job_id)
+
+    async def stage_checkpoint(r: ImportReport) -> None:
+        res = await db.execute(
+            update(Job).where(Job.id == job_id, Job.locked_by == token).values(result=r.as_dict())
+        )
+        if res.rowcount == 0:
+            raise ImportSuperseded(str(job_id))
+
+    try:
+        report = await import_prompts(
+            db, user_id, parse_stream(chunks, fmt), chunk_size=chunk_size,
+            start_at=report.rows_processed if start_at is None else start_at,
+            stage_checkpoint=stage_checkpoint, report=report,
+        )
+    except ImportSuperseded:
+        await db.rollback()
+        raise
+    except Exception as e:
+        # 客户端断开、库不可用等：记为失败，已提交的进度保留，可以带 job_id 续传
+        await db.rollback()
+        await _finish_import_job(db, job_id, token, status=JOB_FAILED, last_error=str(e)[:2000] or type(e).__name__)
+        raise
+    await _finish_import_job(db, job_id, token, status=JOB_SUCCEEDED, result=report.as_dict())
+    return report
+
+
+# ==== 导出 ====
+async def export_prompts(db: AsyncSession, user_id: uuid.UUID, fmt: str) -> AsyncIterator[bytes]:
+    """流式导出（与导入格式互通），内存占用与行数无关"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(EXPORT_FIELDS)
+        yield buf.getvalue().encode()
+    async for item in prompt_service.stream_prompts(db, user_id, EXPORT_FIELDS):
+        if fmt == "ndjson":
+            yield orjson.dumps(item) + b"\n"
+        else:
+            buf.seek(0)
+            buf.truncate()
+            writer.writerow([
+                json.dumps(item[f] or [], ensure_ascii=False) if f in ("tags", "variables") else item[f]
+                for f in EXPORT_FIELDS
+            ])
+            yield buf.getvalue().encode()
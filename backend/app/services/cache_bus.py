@@ -0,0 +1,333 @@
+# backend/app/services/cache_bus.py
+# 跨 worker 的缓存失效总线：写操作在同一个事务里 NOTIFY（提交后才送达，回滚则不发），
+# 每个进程一条专用的 asyncpg 监听连接，收到后删掉本进程缓存里对应的条目。
+# 消息是一行文本："<来源进程> <类型> <id> <版本|-> [<user_id>]"，远小于 NOTIFY 的 8000 字节上限
+import asyncio
+import logging
+import secrets
+import sys
+import uuid
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import Text
+
+from app.core.config import get_settings
+from app.core.instrumentation import register_gauges
+from app.core.principal_cache import principal_cache
+from app.core.tokens import deny_list
+from app.db.replica import read_router
+from app.services.mcp_sessions import PROMPTS_LIST_CHANGED, session_registry
+from app.services.prompt_cache import prompt_cache
+
+logger = logging.getLogger(__name__)
+
+# 消息类型
+PROMPT = "p"  # 单个提示词（id = prompt_id，带 user_id）；版本为 - 表示删除 / 版本号没变但内容变了
+PROMPT_SET = "s"  # 某个用户的提示词整体变了（批量导入），id = user_id
+USER = "u"  # 用户（停用 / 轮换 API Key / 全部登出），版本 = token_epoch
+
+# 按需加载的按用户索引（numpy），没 import 过说明本进程没有这份缓存
+_INDEX_MODULES = (("app.services.embedding_service", "embedding_index"), ("app.services.dedupe_service", "duplicate_index"))
+
+
+class Change(NamedTuple):
+    kind: str
+    id: str
+    version: Optional[int] = None
+    user_id: Optional[str] = None
+
+
+def prompt_changed(prompt_id: uuid.UUID, user_id: uuid.UUID, version: Optional[int] = None) -> Change:
+    return Change(PROMPT, str(prompt_id), version, str(user_id))
+
+
+def user_prompts_changed(user_id: uuid.UUID) -> Change:
+    return Change(PROMPT_SET, str(user_id))
+
+
+def user_changed(user_id: uuid.UUID, token_epoch: Optional[int] = None) -> Change:
+    return Change(USER, str(user_id), token_epoch)
+
+
+def user_of(c: Change) -> str:
+    return c.user_id if c.kind == PROMPT else c.id
+
+
+def encode(origin: str, c: Change) -> str:
+    parts = [origin, c.kind, c.id, "-" if c.version is None else str(c.version)]
+    if c.user_id:
+        parts.append(c.user_id)
+    return " ".join(parts)
+
+
+def decode(payload: str) -> Tuple[str, Change]:
+    parts = payload.split(" ")
+    if len(parts) not in (4, 5) or parts[1] not in (PROMPT, PROMPT_SET, USER):
+        raise ValueError(f"bad invalidation message: {payload!r}")
+    version = None if parts[3] == "-" else int(parts[3])
+    return parts[0], Change(parts[1], parts[2], version, parts[4] if len(parts) == 5 else None)
+
+
+def _merge(old: Change, new: Change) -> Change:
+    """同一个 key 的多条消息合并成一条：版本取大的，有一条不带版本（删除等）就无条件失效"""
+    if old.version is None or new.version is None:
+        return new._replace(version=None)
+    return new if new.version >= old.version else old
+
+
+_NOTIFY = text("SELECT pg_notify(:channel, p) FROM unnest(:payloads) AS p").bindparams(
+    bindparam("payloads", type_=ARRAY(Text))
+)
+
+
+class InvalidationBus:
+    """
+    监听端：NOTIFY 回调只把消息放进待处理表（同一个 key 合并），等 coalesce_seconds 后统一处理，
+    一次突发的几百条修改只清一次缓存、每个用户只推一次 list_changed。
+    监听连接断开期间的消息收不到，所以每次（重新）连上后整体清空本进程的缓存；
+    待处理的 key 太多（max_pending）时也直接整体清空。
+    """
+
+    def __init__(
+        self,
+        channel: str = "cache_invalidation",
+        coalesce_seconds: float = 0.05,
+        max_pending: int = 10000,
+        reconnect_max_seconds: float = 30.0,
+        healthcheck_seconds: float = 10.0,
+        enabled: bool = True,
+        access_token_ttl: float = 15 * 60,
+    ):
+        self.channel = channel
+        self.coalesce_seconds = coalesce_seconds
+        self.max_pending = max_pending
+        self.reconnect_max_seconds = reconnect_max_seconds
+        self.healthcheck_seconds = healthcheck_seconds
+        self.enabled = enabled
+        self.access_token_ttl = access_token_ttl  # 吊销名单条目的有效期，取 access token 的最长有效期
+        self.origin = secrets.token_hex(4)  # 本进程发出的消息自己已经处理过，收到时跳过
+        self._pending: Dict[Tuple[str, str], Change] = {}
+        self._overflow = False
+        self._wake = asyncio.Event()
+        self._lost = False
+        self._task: Optional[asyncio.Task] = None
+        self.connected = False
+        # 统计
+        self.received = 0
+        self.own = 0
+        self.coalesced = 0
+        self.applied = 0
+        self.full_flushes = 0
+        self.reconnects = 0
+        self.errors = 0
+
+    # ---- 发布 ----
+    async def publish(self, db: AsyncSession, changes: Sequence[Change]) -> None:
+        """
+        在写操作的事务里、commit 之前调用；非 Postgres（SQLite 测试库）时只记录 read-your-writes。
+        """
+        for c in changes:
+            read_router.note_write(user_of(c))
+        if not self.enabled or not changes or db.bind is None or db.bind.dialect.name != "postgresql":
+            return
+        await db.execute(_NOTIFY, {"channel": self.channel, "payloads": [encode(self.origin, c) for c in changes]})
+
+    # ---- 接收 ----
+    def _on_notify(self, conn, pid, channel, payload: str) -> None:
+        self.received += 1
+        try:
+            origin, change = decode(payload)
+        except ValueError:
+            self.errors += 1
+            logger.warning("ignoring %s", payload[:200])
+            return
+        if origin == self.origin:
+            self.own += 1
+            return
+        if not self._overflow:
+            key = (change.kind, change.id)
+            old = self._pending.get(key)
+            if old is not None:
+                self.coalesced += 1
+                change = _merge(old, change)
+            self._pending[key] = change
+            if len(self._pending) > self.max_pending:
+                self._overflow = True
+                self._pending.clear()
+        self._wake.set()
+
+    def _on_terminate(self, conn) -> None:
+        self._lost = True
+        self._wake.set()
+
+    def apply_pending(self) -> int:
+        if self._overflow:
+            self._overflow = False
+            self.flush_all()
+            return 0
+        pending, self._pending = self._pending, {}
+        users: Set[uuid.UUID] = set()
+        for c in pending.values():
+            # 别的进程刚写过：该用户接下来的读走主库，免得从延迟的副本读到旧数据又放回缓存
+            read_router.note_write(user_of(c))
+            if c.kind == PROMPT:
+                prompt_cache.evict_stale(uuid.UUID(c.id), c.version)
+                users.add(uuid.UUID(c.user_id))
+            elif c.kind == PROMPT_SET:
+                users.add(uuid.UUID(c.id))
+            elif c.kind == USER:
+                principal_cache.invalidate_user(c.id)
+                session_registry.close_user(uuid.UUID(c.id))
+                if c.version is not None:
+                    # 无状态 access token 不查库：本进程的吊销名单也要跟上新的 token_epoch
+                    deny_list.deny_user(c.id, c.version, self.access_token_ttl)
+        indexes = _loaded_indexes()
+        for user_id in users:
+            for index in indexes:
+                index.expire(user_id)
+            session_registry.notify(user_id, PROMPTS_LIST_CHANGED)
+        self.applied += len(pending)
+        return len(pending)
+
+    def flush_all(self) -> None:
+        """可能漏了消息：清空本进程的全部缓存，所有会话都推一次 list_changed"""
+        self._pending.clear()
+        principal_cache.clear()
+        prompt_cache.clear()
+        for index in _loaded_indexes():
+            index.expire_all()
+        session_registry.notify_all(PROMPTS_LIST_CHANGED)
+        self.full_flushes += 1
+
+    async def _connect(self):
+        import asyncpg  # 只有监听端需要直接用驱动
+
+        from app.db.session import get_engine
+        dsn = get_engine().url.set(drivername="postgresql").render_as_string(hide_password=False)
+        conn = await asyncpg.connect(dsn, server_settings={"application_name": "prompt-manager-cache-bus"})
+        await conn.add_listener(self.channel, self._on_notify)
+        conn.add_termination_listener(self._on_terminate)
+        return conn
+
+    async def _serve(self, conn) -> None:
+        while not self._lost:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.healthcheck_seconds)
+            except asyncio.TimeoutError:
+                # 半开的 TCP 连接不会触发 termination listener，定期探测一下
+                await conn.fetchval("SELECT 1")
+                continue
+            if self._lost:
+                break
+            await asyncio.sleep(self.coalesce_seconds)
+            self._wake.clear()
+            self.apply_pending()
+
+    async def _run(self) -> None:
+        backoff = 0.5
+        first = True
+        while True:
+            try:
+                conn = await self._connect()
+            except Exception:
+                self.errors += 1
+                logger.warning("cache bus: connect failed, retrying in %.1fs", backoff, exc_info=True)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.reconnect_max_seconds)
+                continue
+            backoff = 0.5
+            self._lost = False
+            self.connected = True
+            if not first:
+                self.reconnects += 1
+            first = False
+            # 连上（LISTEN 生效）之后再清空：之前漏掉的都作废，之后的都能收到
+            self.flush_all()
+            try:
+                await self._serve(conn)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.errors += 1
+                logger.warning("cache bus: listener connection lost", exc_info=True)
+            finally:
+                self.connected = False
+                if not conn.is_closed():
+                    conn.terminate()
+
+    def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        from app.db.session import get_engine
+        if get_engine().dialect.name != "postgresql":
+            return
+        self._task = asyncio.create_task(self._run(), name="cache-bus")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connected": self.connected,
+            "received": self.received,
+            "own": self.own,
+            "coalesced": self.coalesced,
+            "applied": self.applied,
+            "pending": len(self._pending),
+            "full_flushes": self.full_flushes,
+            "reconnects": self.reconnects,
+            "errors": self.errors,
+        }
+
+
+def _loaded_indexes():
+    out = []
+    for module_name, attr in _INDEX_MODULES:
+        module = sys.modules.get(module_name)
+        if module is not None:
+            out.append(getattr(module, attr))
+    return out
+
+
+def _build_bus() -> InvalidationBus:
+    settings = get_settings()
+    return InvalidationBus(
+        channel=settings.CACHE_BUS_CHANNEL,
+        coalesce_seconds=settings.CACHE_BUS_COALESCE_SECONDS,
+        max_pending=settings.CACHE_BUS_MAX_PENDING,
+        reconnect_max_seconds=settings.CACHE_BUS_RECONNECT_MAX_SECONDS,
+        healthcheck_seconds=settings.CACHE_BUS_HEALTHCHECK_SECONDS,
+        enabled=settings.CACHE_BUS_ENABLED,
+        access_token_ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    )
+
+
+cache_bus = _build_bus()
+
+
+def _gauges() -> Dict[str, Any]:
+    s = cache_bus.stats()
+    return {
+        "cache_bus_connected": int(s["connected"]),
+        "cache_bus_received": s["received"],
+        "cache_bus_coalesced": s["coalesced"],
+        "cache_bus_applied": s["applied"],
+        "cache_bus_full_flushes": s["full_flushes"],
+        "cache_bus_reconnects": s["reconnects"],
+    }
+
+
+register_gauges("cache_bus", _gauges)
+
+
+async def publish(db: AsyncSession, *changes: Change) -> None:
+    await cache_bus.publish(db, changes)
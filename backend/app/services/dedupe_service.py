@@ -0,0 +1,327 @@
+# backend/app/services/dedupe_service.py
+# 近似重复检测：创建提示词时算正文的 MinHash 签名，在该用户的 LSH 索引里找相似度 >= DEDUPE_THRESHOLD 的已有提示词；
+# DEDUPE_MODE=report 时在响应里列出，strict 时直接拒绝（409）。签名存 prompt_signatures 表，检索在进程内进行
+import asyncio
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import func, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.core.instrumentation import register_gauges
+from app.models.dedupe import PromptSignature
+from app.models.prompt import Prompt
+from app.services.minhash import NUM_PERM, LSHIndex, Matches, MinHasher
+from app.services.user_index_cache import UserIndexCache
+
+settings = get_settings()
+
+MODES = ("off", "report", "strict")
+_BATCH = 500
+_MAX_REPORTED = 5  # 创建时最多返回几个疑似重复
+# 签名数超过该值时，加载 / 聚类放到线程里执行，避免阻塞事件循环
+_THREAD_MIN_ROWS = 20000
+
+hasher = MinHasher()
+
+
+def signature_of(content: str) -> np.ndarray:
+    return hasher.signature(content)
+
+
+def _from_rows(raws: Sequence[bytes]) -> np.ndarray:
+    if not raws:
+        return np.empty((0, NUM_PERM), dtype=np.uint16)
+    return np.frombuffer(b"".join(raws), dtype="<u2").reshape(len(raws), NUM_PERM)
+
+
+class DuplicateIndex(UserIndexCache[LSHIndex]):
+    """按用户缓存 LSH 索引（见 UserIndexCache）"""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, recheck_seconds: float = 5.0):
+        super().__init__(max_bytes, recheck_seconds)
+        self.queries = 0
+        self.rebuilds = 0
+
+    def _where(self, user_id: uuid.UUID):
+        return PromptSignature.user_id == user_id
+
+    def _updated_at(self):
+        return PromptSignature.updated_at
+
+    async def _load(self, db: AsyncSession, user_id: uuid.UUID) -> LSHIndex:
+        res = await db.execute(
+            select(PromptSignature.prompt_id, PromptSignature.signature).where(self._where(user_id))
+        )
+        rows = [r for r in res.all() if len(r.signature) == NUM_PERM * 2]
+        ids = [r.prompt_id for r in rows]
+        sigs = _from_rows([r.signature for r in rows])
+        if len(ids) >= _THREAD_MIN_ROWS:
+            return await asyncio.to_thread(LSHIndex.build, ids, sigs)
+        return LSHIndex.build(ids, sigs)
+
+    def apply(self, user_id: uuid.UUID, prompt_id: uuid.UUID, sig: np.ndarray, updated_at: datetime) -> None:
+        """本进程写入并提交后调用"""
+        idx = self.note_upsert(user_id, prompt_id, updated_at)
+        if idx is not None:
+            idx.upsert(prompt_id, sig)
+
+    def discard(self, user_id: uuid.UUID, prompt_id: uuid.UUID) -> None:
+        idx = self.note_remove(user_id, prompt_id)
+        if idx is not None:
+            idx.remove(prompt_id)
+
+    async def _ready(self, db: AsyncSession, user_id: uuid.UUID) -> LSHIndex:
+        idx = await self.get(db, user_id)
+        if idx.needs_rebuild():
+            await asyncio.to_thread(idx.rebuild)
+            self.rebuilds += 1
+        return idx
+
+    async def query(
+        self, db: AsyncSession, user_id: uuid.UUID, sig: np.ndarray, threshold: float,
+        exclude: Optional[Set[uuid.UUID]] = None,
+    ) -> Matches:
+        idx = await self._ready(db, user_id)
+        self.queries += 1
+        return idx.query(sig, threshold, exclude)
+
+    async def clusters(self, db: AsyncSession, user_id: uuid.UUID, threshold: float):
+        idx = await self._ready(db, user_id)
+        if len(idx) >= _THREAD_MIN_ROWS:
+            return await asyncio.to_thread(idx.clusters, threshold)
+        return idx.clusters(threshold)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.base_stats(),
+            "signatures": sum(len(i) for i in self._entries.values()),
+            "queries": self.queries,
+            "rebuilds": self.rebuilds,
+        }
+
+
+def _build_index() -> DuplicateIndex:
+    return DuplicateIndex(
+        max_bytes=settings.DEDUPE_INDEX_MAX_BYTES,
+        recheck_seconds=settings.DEDUPE_INDEX_RECHECK_SECONDS,
+    )
+
+
+duplicate_index = _build_index()
+
+
+def _gauges() -> Dict[str, Any]:
+    s = duplicate_index.stats()
+    return {
+        "dedupe_index_users": s["users"],
+        "dedupe_index_signatures": s["signatures"],
+        "dedupe_index_bytes": s["bytes"],
+        "dedupe_index_loads": s["loads"],
+    }
+
+
+register_gauges("dedupe_index", _gauges)
+
+
+# ==== 写入 ====
+@dataclass(frozen=True)
+class PendingSignature:
+    """已写入当前事务、提交后要应用到进程内索引的签名"""
+    user_id: uuid.UUID
+    prompt_id: uuid.UUID
+    signature: np.ndarray
+    updated_at: datetime
+
+    def apply(self) -> None:
+        duplicate_index.apply(self.user_id, self.prompt_id, self.signature, self.updated_at)
+
+
+def _insert_for(db: AsyncSession):
+    return sqlite_insert if db.bind is not None and db.bind.dialect.name == "sqlite" else pg_insert
+
+
+async def _upsert_rows(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    stmt = _insert_for(db)(PromptSignature).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PromptSignature.prompt_id],
+        set_={c: stmt.excluded[c] for c in ("user_id", "version", "signature", "updated_at")},
+    )
+    await db.execute(stmt)
+
+
+def enabled() -> bool:
+    return settings.DEDUPE_MODE != "off"
+
+
+def resolve_mode(mode: Optional[str]) -> str:
+    mode = mode or settings.DEDUPE_MODE
+    if mode not in MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid dedupe mode: {mode}")
+    return mode
+
+
+async def check_content(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    content: str,
+    mode: str,
+    exclude: Optional[Set[uuid.UUID]] = None,
+) -> Tuple[Optional[np.ndarray], List[Dict[str, Any]]]:
+    """
+    返回 (签名, 疑似重复列表)。strict 模式下有疑似重复直接抛 409，detail 里带上它们；
+    mode=off 时不计算，返回 (None, [])。
+    """
+    if mode == "off":
+        return None, []
+    sig = signature_of(content)
+    matches = (await duplicate_index.query(db, user_id, sig, settings.DEDUPE_THRESHOLD, exclude))[:_MAX_REPORTED]
+    duplicates: List[Dict[str, Any]] = []
+    if matches:
+        res = await db.execute(
+            select(Prompt.id, Prompt.title).where(Prompt.id.in_([pid for pid, _ in matches]), Prompt.user_id == user_id)
+        )
+        titles = {r.id: r.title for r in res.all()}
+        duplicates = [
+            {"id": str(pid), "title": titles[pid], "similarity": round(score, 3)}
+            for pid, score in matches if pid in titles
+        ]
+    if duplicates and mode == "strict":
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Near-duplicate of an existing prompt", "duplicates": duplicates},
+        )
+    return sig, duplicates
+
+
+async def stage_signature(db: AsyncSession, p: Prompt, sig: Optional[np.ndarray] = None) -> PendingSignature:
+    """在调用方的事务里写入 / 更新 p 的签名（不提交）；提交成功后调用返回值的 apply()"""
+    if sig is None:
+        sig = signature_of(p.content)
+    now = datetime.utcnow()
+    await _upsert_rows(db, [{
+        "prompt_id": p.id,
+        "user_id": p.user_id,
+        "version": p.version or 1,
+        "signature": sig.astype("<u2", copy=False).tobytes(),
+        "updated_at": now,
+    }])
+    return PendingSignature(p.user_id, p.id, sig, now)
+
+
+def forget(user_id: uuid.UUID, prompt_id: uuid.UUID) -> None:
+    """提示词删除并提交后调用；库里的签名行随 ON DELETE CASCADE 删除"""
+    duplicate_index.discard(user_id, prompt_id)
+
+
+def _stale_filter(q):
+    return q.where(or_(
+        PromptSignature.prompt_id.is_(None),
+        PromptSignature.version != func.coalesce(Prompt.version, 1),
+    ))
+
+
+async def backfill(
+    db: AsyncSession,
+    user_id: Optional[uuid.UUID] = None,
+    prompt_ids: Optional[Sequence[uuid.UUID]] = None,
+    force: bool = False,
+) -> Dict[str, Any]:
+    """为缺少签名或签名落后于当前版本的提示词补算（force 时全部重算），按 id keyset 分批提交"""
+    scanned = 0
+    last_id: Optional[uuid.UUID] = None
+    while True:
+        q = (
+            select(Prompt.id, Prompt.user_id, Prompt.version, Prompt.content)
+            .outerjoin(PromptSignature, PromptSignature.prompt_id == Prompt.id)
+        )
+        if user_id is not None:
+            q = q.where(Prompt.user_id == user_id)
+        if prompt_ids:
+            q = q.where(Prompt.id.in_(list(prompt_ids)))
+        if not force:
+            q = _stale_filter(q)
+        if last_id is not None:
+            q = q.where(Prompt.id > last_id)
+        rows = (await db.execute(q.order_by(Prompt.id).limit(_BATCH))).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        scanned += len(rows)
+        sigs = await asyncio.to_thread(lambda: [signature_of(r.content) for r in rows])
+        now = datetime.utcnow()
+        await _upsert_rows(db, [
+            {
+                "prompt_id": r.id,
+                "user_id": r.user_id,
+                "version": r.version or 1,
+                "signature": sig.astype("<u2", copy=False).tobytes(),
+                "updated_at": now,
+            }
+            for r, sig in zip(rows, sigs)
+        ])
+        await db.commit()
+        for r, sig in zip(rows, sigs):
+            duplicate_index.apply(r.user_id, r.id, sig, now)
+    return {"signed": scanned}
+
+
+# ==== 报告 ====
+async def duplicate_report(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    threshold: Optional[float] = None,
+    limit: int = 100,
+) -> Dict[str, Any]:
+    """
+    把该用户的整个库按近似重复聚类，返回最大的 limit 组。每组建议保留使用次数最多（其次最近更新）的一条。
+    unindexed 为还没有最新签名的提示词数量（如批量导入后 sign_prompts 任务尚未执行），它们不参与聚类。
+    """
+    threshold = settings.DEDUPE_THRESHOLD if threshold is None else threshold
+    groups = await duplicate_index.clusters(db, user_id, threshold)
+    unindexed = (await db.execute(_stale_filter(
+        select(func.count())
+        .select_from(Prompt)
+        .outerjoin(PromptSignature, PromptSignature.prompt_id == Prompt.id)
+        .where(Prompt.user_id == user_id)
+    ))).scalar()
+
+    shown = groups[:limit]
+    ids = [pid for members, _ in shown for pid in members]
+    meta = {}
+    if ids:
+        res = await db.execute(
+            select(Prompt.id, Prompt.title, Prompt.usage_count, Prompt.updated_at)
+            .where(Prompt.id.in_(ids), Prompt.user_id == user_id)
+        )
+        meta = {r.id: r for r in res.all()}
+
+    clusters = []
+    for members, min_similarity in shown:
+        rows = [meta[pid] for pid in members if pid in meta]
+        if len(rows) < 2:
+            continue
+        rows.sort(key=lambda r: (r.usage_count or 0, r.updated_at or datetime.min), reverse=True)
+        clusters.append({
+            "size": len(rows),
+            "keep_id": rows[0].id,
+            "min_similarity": round(min_similarity, 3),
+            "prompts": [
+                {"id": r.id, "title": r.title, "usage_count": r.usage_count or 0, "updated_at": r.updated_at}
+                for r in rows
+            ],
+        })
+    return {
+        "threshold": threshold,
+        "clusters": clusters,
+        "cluster_count": len(groups),
+        "duplicate_prompts": sum(len(m) - 1 for m, _ in groups),
+        "unindexed": unindexed,
+    }
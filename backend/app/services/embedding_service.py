@@ -0,0 +1,452 @@
+# backend/app/services/embedding_service.py
+# 语义相似搜索：
+#   embedder  把提示词文本变成 L2 归一化的 float32 向量（默认特征哈希，不依赖模型文件，结果确定）
+#   存储      prompt_embeddings 表，每个提示词一行，写提示词时在同一个事务里更新
+#   检索      进程内按用户缓存向量（vector_index），小规模暴力 matmul，超过阈值用 IVF
+import asyncio
+import hashlib
+import importlib
+import logging
+import math
+import re
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Protocol, Sequence, Set, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.core.instrumentation import register_gauges
+from app.models.embedding import PromptEmbedding
+from app.models.prompt import Prompt
+from app.services.user_index_cache import UserIndexCache
+from app.services.vector_index import Hits, UserVectors, VectorSet
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+_BATCH = 500
+
+
+# ==== Embedder ====
+class Embedder(Protocol):
+    name: str  # 写入 prompt_embeddings.model，换模型后旧向量自动失效
+    dim: int
+    inline: bool  # 足够快：写提示词时同步计算；否则交给 embed_prompts 后台任务
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """返回 (len(texts), dim) 的 float32 矩阵，每行 L2 归一化（全零文本返回零向量）"""
+        ...
+
+
+# ASCII 单词 / 数字，或单个汉字（连续汉字之间的二元组由相邻 token 组合得到）
+_TOKEN_RE = re.compile(r"[0-9a-z]+|[\u3400-\u9fff]")
+
+
+@lru_cache(maxsize=1 << 17)
+def _slot(feature: str, dim: int) -> Tuple[int, float]:
+    """特征 -> (维度下标, 符号)；带符号的哈希让冲突在期望上相互抵消"""
+    h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+    return h % dim, (1.0 if h >> 63 else -1.0)
+
+
+class HashingEmbedder:
+    """
+    特征哈希（hashing trick）：单词 + 相邻词二元组 + 单词内部的字符三元组，
+    词频取 1 + ln(tf)。没有语义知识，但对同义改写以外的相似文本（改了几句、换了语序、
+    拼写差异）效果不错，而且确定、无依赖，适合离线测试和 benchmark。
+    """
+
+    inline = True
+    # 各类特征的权重：词 > 词组 > 字符片段
+    _WORD, _BIGRAM, _TRIGRAM = 1.0, 0.7, 0.3
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+        # 单词 -> 它自己和字符三元组落到的 (下标, 带符号权重)；词表有限，缓存命中率很高
+        self._token_features = lru_cache(maxsize=1 << 16)(self._features_of)
+
+    def _features_of(self, tok: str) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+        idx, sign = _slot("w" + tok, self.dim)
+        idxs, vals = [idx], [sign * self._WORD]
+        if len(tok) >= 4 and tok.isascii():
+            padded = f"#{tok}#"
+            for j in range(len(padded) - 2):
+                idx, sign = _slot("c" + padded[j:j + 3], self.dim)
+                idxs.append(idx)
+                vals.append(sign * self._TRIGRAM)
+        return tuple(idxs), tuple(vals)
+
+    def embed_one(self, text: str) -> np.ndarray:
+        tokens = _TOKEN_RE.findall(text.lower())
+        idxs: List[int] = []
+        vals: List[float] = []
+        for tok, tf in Counter(tokens).items():
+            ti, tv = self._token_features(tok)
+            idxs.extend(ti)
+            vals.extend(tv if tf == 1 else [v * (1.0 + math.log(tf)) for v in tv])
+        for (a, b), tf in Counter(zip(tokens, tokens[1:])).items():
+            idx, sign = _slot(f"b{a} {b}", self.dim)
+            idxs.append(idx)
+            vals.append(sign * self._BIGRAM * (1.0 + math.log(tf)))
+        if not idxs:
+            return np.zeros(self.dim, dtype=np.float32)
+        vec = np.bincount(idxs, weights=vals, minlength=self.dim).astype(np.float32)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            out[i] = self.embed_one(t)
+        return out
+
+
+def _build_embedder() -> Embedder:
+    """EMBEDDER="hashing"，或 "包.模块:工厂函数"（无参调用，返回满足 Embedder 协议的对象）"""
+    spec = settings.EMBEDDER
+    if spec == "hashing":
+        return HashingEmbedder(settings.EMBEDDING_DIM)
+    module_name, _, attr = spec.partition(":")
+    if not module_name or not attr:
+        raise ValueError(f"Invalid EMBEDDER: {spec!r} (expected 'hashing' or 'package.module:factory')")
+    return getattr(importlib.import_module(module_name), attr)()
+
+
+embedder = _build_embedder()
+
+
+def embedding_text(p: Any) -> str:
+    """参与向量化的文本；标题重复一次，提高它的权重"""
+    parts = [p.title, p.title, p.description or "", " ".join(p.tags or []), p.category or "", p.content]
+    return "\n".join(parts)
+
+
+def to_bytes(vec: np.ndarray) -> bytes:
+    return vec.astype("<f4", copy=False).tobytes()
+
+
+def from_bytes(raw: bytes) -> np.ndarray:
+    return np.frombuffer(raw, dtype="<f4")
+
+
+# ==== 进程内索引 ====
+class EmbeddingIndex(UserIndexCache[UserVectors]):
+    """按用户缓存向量（见 UserIndexCache），首次查询时从库里整批加载（每行 1 KB 的 bytes，直接 frombuffer）"""
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        ivf_min_size: int = 20000,
+        nprobe: int = 16,
+        max_bytes: int = 256 * 1024 * 1024,
+        recheck_seconds: float = 5.0,
+    ):
+        super().__init__(max_bytes, recheck_seconds)
+        self.embedder = embedder
+        self.ivf_min_size = ivf_min_size
+        self.nprobe = nprobe
+        self.searches = 0
+        self.ivf_builds = 0
+
+    def _where(self, user_id: uuid.UUID):
+        return and_(PromptEmbedding.user_id == user_id, PromptEmbedding.model == self.embedder.name)
+
+    def _updated_at(self):
+        return PromptEmbedding.updated_at
+
+    async def _load(self, db: AsyncSession, user_id: uuid.UUID) -> UserVectors:
+        res = await db.execute(
+            select(PromptEmbedding.prompt_id, PromptEmbedding.vector).where(self._where(user_id))
+        )
+        rows = res.all()
+        vs = VectorSet(self.embedder.dim, capacity=max(64, len(rows)))
+        for pid, raw in rows:
+            vec = from_bytes(raw)
+            if vec.shape[0] == self.embedder.dim:
+                vs.upsert(pid, vec)
+        uv = UserVectors(vs, self.ivf_min_size, self.nprobe)
+        if uv.needs_rebuild():
+            await self._rebuild(uv)
+        return uv
+
+    async def _rebuild(self, uv: UserVectors) -> None:
+        await asyncio.to_thread(uv.rebuild_ivf)
+        self.ivf_builds += 1
+
+    def apply(self, user_id: uuid.UUID, prompt_id: uuid.UUID, vec: np.ndarray, updated_at: datetime) -> None:
+        """本进程写入并提交后调用"""
+        uv = self.note_upsert(user_id, prompt_id, updated_at)
+        if uv is not None:
+            uv.upsert(prompt_id, vec)
+
+    def discard(self, user_id: uuid.UUID, prompt_id: uuid.UUID) -> None:
+        uv = self.note_remove(user_id, prompt_id)
+        if uv is not None:
+            uv.remove(prompt_id)
+
+    async def search(
+        self, db: AsyncSession, user_id: uuid.UUID, q: np.ndarray, k: int, exclude: Optional[Set] = None
+    ) -> Hits:
+        uv = await self.get(db, user_id)
+        if uv.needs_rebuild():
+            await self._rebuild(uv)
+        self.searches += 1
+        return uv.search(q, k, exclude)
+
+    async def vector_of(self, db: AsyncSession, user_id: uuid.UUID, prompt_id: uuid.UUID) -> Optional[np.ndarray]:
+        uv = await self.get(db, user_id)
+        vec = uv.vectors.get(prompt_id)
+        return None if vec is None else vec.copy()
+
+    def stats(self) -> Dict[str, Any]:
+        entries = list(self._entries.values())
+        return {
+            **self.base_stats(),
+            "vectors": sum(len(u.vectors) for u in entries),
+            "ivf_users": sum(1 for u in entries if u.ivf is not None),
+            "searches": self.searches,
+            "ivf_builds": self.ivf_builds,
+        }
+
+
+def _build_index() -> EmbeddingIndex:
+    return EmbeddingIndex(
+        embedder=embedder,
+        ivf_min_size=settings.EMBEDDING_IVF_MIN_SIZE,
+        nprobe=settings.EMBEDDING_IVF_NPROBE,
+        max_bytes=settings.EMBEDDING_INDEX_MAX_BYTES,
+        recheck_seconds=settings.EMBEDDING_INDEX_RECHECK_SECONDS,
+    )
+
+
+embedding_index = _build_index()
+
+
+def _gauges() -> Dict[str, Any]:
+    s = embedding_index.stats()
+    return {
+        "embedding_index_users": s["users"],
+        "embedding_index_vectors": s["vectors"],
+        "embedding_index_bytes": s["bytes"],
+        "embedding_index_loads": s["loads"],
+        "embedding_index_evictions": s["evictions"],
+    }
+
+
+register_gauges("embedding_index", _gauges)
+
+
+# ==== 写入 ====
+@dataclass(frozen=True)
+class PendingEmbedding:
+    """已写入当前事务、提交后要应用到进程内索引的向量"""
+    user_id: uuid.UUID
+    prompt_id: uuid.UUID
+    vector: np.ndarray
+    updated_at: datetime
+
+    def apply(self) -> None:
+        embedding_index.apply(self.user_id, self.prompt_id, self.vector, self.updated_at)
+
+
+def _insert_for(db: AsyncSession):
+    # prompt_embeddings 的 upsert；SQLite 用于本地压测 / 脚本
+    return sqlite_insert if db.bind is not None and db.bind.dialect.name == "sqlite" else pg_insert
+
+
+async def _upsert_rows(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    stmt = _insert_for(db)(PromptEmbedding).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PromptEmbedding.prompt_id],
+        set_={c: stmt.excluded[c] for c in ("user_id", "version", "model", "dim", "vector", "updated_at")},
+    )
+    await db.execute(stmt)
+
+
+async def stage_embedding(db: AsyncSession, p: Prompt) -> Optional[PendingEmbedding]:
+    """
+    在调用方的事务里写入 / 更新 p 的向量（不提交）。提交成功后调用返回值的 apply()。
+    embedder 不适合同步计算时改为提交一个 embed_prompts 任务，同样随业务事务提交。
+    """
+    if not settings.EMBEDDING_ENABLED:
+        return None
+    if not embedder.inline:
+        from app.services import job_service  # job_service 依赖本模块，延迟导入避免循环
+        await job_service.enqueue(
+            db, "embed_prompts", {"user_id": str(p.user_id), "prompt_ids": [str(p.id)]},
+            user_id=p.user_id, commit=False,
+        )
+        return None
+    vec = embedder.embed([embedding_text(p)])[0]
+    now = datetime.utcnow()
+    await _upsert_rows(db, [{
+        "prompt_id": p.id,
+        "user_id": p.user_id,
+        "version": p.version or 1,
+        "model": embedder.name,
+        "dim": embedder.dim,
+        "vector": to_bytes(vec),
+        "updated_at": now,
+    }])
+    return PendingEmbedding(p.user_id, p.id, vec, now)
+
+
+def forget(user_id: uuid.UUID, prompt_id: uuid.UUID) -> None:
+    """提示词删除并提交后调用；库里的向量行随 ON DELETE CASCADE 删除"""
+    embedding_index.discard(user_id, prompt_id)
+
+
+async def backfill(
+    db: AsyncSession,
+    user_id: Optional[uuid.UUID] = None,
+    prompt_ids: Optional[Sequence[uuid.UUID]] = None,
+    force: bool = False,
+) -> Dict[str, Any]:
+    """
+    为缺少向量、向量落后于当前版本或由其它 embedder 生成的提示词补算向量（force 时全部重算）。
+    按 id keyset 分批，每批一个短事务；计算放在线程里，不阻塞事件循环。
+    """
+    scanned = embedded = 0
+    last_id: Optional[uuid.UUID] = None
+    while True:
+        q = (
+            select(Prompt.id, Prompt.user_id, Prompt.version, Prompt.title, Prompt.description,
+                   Prompt.tags, Prompt.category, Prompt.content)
+            .outerjoin(PromptEmbedding, PromptEmbedding.prompt_id == Prompt.id)
+        )
+        if user_id is not None:
+            q = q.where(Prompt.user_id == user_id)
+        if prompt_ids:
+            q = q.where(Prompt.id.in_(list(prompt_ids)))
+        if not force:
+            q = q.where(or_(
+                PromptEmbedding.prompt_id.is_(None),
+                PromptEmbedding.model != embedder.name,
+                PromptEmbedding.version != func.coalesce(Prompt.version, 1),
+            ))
+        if last_id is not None:
+            q = q.where(Prompt.id > last_id)
+        rows = (await db.execute(q.order_by(Prompt.id).limit(_BATCH))).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        scanned += len(rows)
+        vectors = await asyncio.to_thread(embedder.embed, [embedding_text(r) for r in rows])
+        now = datetime.utcnow()
+        await _upsert_rows(db, [
+            {
+                "prompt_id": r.id,
+                "user_id": r.user_id,
+                "version": r.version or 1,
+                "model": embedder.name,
+                "dim": embedder.dim,
+                "vector": to_bytes(vec),
+                "updated_at": now,
+            }
+            for r, vec in zip(rows, vectors)
+        ])
+        await db.commit()
+        for r, vec in zip(rows, vectors):
+            embedding_index.apply(r.user_id, r.id, vec, now)
+        embedded += len(rows)
+    return {"scanned": scanned, "embedded": embedded, "model": embedder.name}
+
+
+# ==== 查询 ====
+async def _embed_query(text: str) -> np.ndarray:
+    if embedder.inline:
+        return embedder.embed([text])[0]
+    return (await asyncio.to_thread(embedder.embed, [text]))[0]
+
+
+async def search_similar(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    query: Optional[str] = None,
+    prompt_id: Optional[uuid.UUID] = None,
+    limit: int = 10,
+    min_score: float = 0.0,
+) -> List[Dict[str, Any]]:
+    """
+    按文本（query）或已有提示词（prompt_id，结果不含它自己）找当前用户最相似的提示词。
+    返回按相似度（余弦，-1 ~ 1）降序的列表。
+    """
+    if not settings.EMBEDDING_ENABLED:
+        raise HTTPException(status_code=503, detail="Semantic search is disabled")
+    exclude: Set[uuid.UUID] = set()
+    if prompt_id is not None:
+        exclude.add(prompt_id)
+        q = await embedding_index.vector_of(db, user_id, prompt_id)
+        if q is None:
+            # 还没算过向量（如批量导入后任务尚未执行）：现场算一次
+            res = await db.execute(select(Prompt).where(Prompt.id == prompt_id, Prompt.user_id == user_id))
+            p = res.scalar_one_or_none()
+            if p is None:
+                raise HTTPException(status_code=404, detail="Prompt not found")
+            q = await _embed_query(embedding_text(p))
+    elif query and query.strip():
+        q = await _embed_query(query.strip())
+    else:
+        raise HTTPException(status_code=400, detail="Either query or prompt_id is required")
+    if not q.any():
+        return []
+
+    hits = [h for h in await embedding_index.search(db, user_id, q, limit, exclude) if h[1] >= min_score]
+    if not hits:
+        return []
+    res = await db.execute(
+        select(Prompt.id, Prompt.title, Prompt.description, Prompt.tags, Prompt.category,
+               Prompt.usage_count, Prompt.updated_at)
+        .where(Prompt.id.in_([pid for pid, _ in hits]), Prompt.user_id == user_id)
+    )
+    rows = {r.id: r for r in res.all()}
+    items = []
+    for pid, score in hits:
+        r = rows.get(pid)
+        if r is None:  # 索引里还有、库里刚被删掉
+            continue
+        items.append({
+            "id": str(r.id),
+            "title": r.title,
+            "description": r.description,
+            "tags": r.tags or [],
+            "category": r.category,
+            "usage_count": r.usage_count or 0,
+            "updated_at": r.updated_at.isoformat() if r.updated_at else None,
+            "score": round(score, 4),
+        })
+    return items
+
+
+async def mcp_search_similar_prompts(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    query: Optional[str],
+    prompt_id: Optional[str],
+    limit: int,
+    min_score: float,
+) -> Dict[str, Any]:
+    pid = None
+    if prompt_id:
+        try:
+            pid = uuid.UUID(prompt_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid prompt_id")
+    items = await search_similar(db, user_id, query=query, prompt_id=pid, limit=limit, min_score=min_score)
+    lines = [f"• {it['title']} (ID: {it['id']}, 相似度 {it['score']:.2f})" for it in items]
+    readable = "找到 {} 个相似的提示词:\n".format(len(items)) + "\n".join(lines)
+    return {
+        "content": [{"type": "text", "text": readable}],
+        "prompts": items,
+        "total": len(items),
+    }
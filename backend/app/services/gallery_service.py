@@ -0,0 +1,333 @@
+# backend/app/services/gallery_service.py
+# 公开提示词广场：读远多于写，列表 / 搜索都读 public_prompt_gallery 快照表（排名预先算好），
+# 快照由后台任务定期重建；源数据没变时只更新检查时间，generation 不变，客户端的 ETag 继续有效
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.core.instrumentation import register_gauges
+from app.db.session import AsyncSessionLocal
+from app.models.gallery import GALLERY_SEARCH_TSVECTOR, PublicGalleryMeta, PublicPromptSnapshot
+from app.models.prompt import Prompt
+from app.models.user import User
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+_META_ID = 1
+# pg_try_advisory_xact_lock 的键：多个 API worker 同时刷新时只有一个真正执行
+_REFRESH_LOCK_KEY = 0x67616C6C
+# 进程内缓存快照代号的时间；304 重新验证在这段时间内不查库
+_META_TTL_SECONDS = 5.0
+
+SORTS = ("popular", "recent", "usage")
+_RANK_COLUMNS = {
+    "popular": PublicPromptSnapshot.rank_popular,
+    "recent": PublicPromptSnapshot.rank_recent,
+    "usage": PublicPromptSnapshot.rank_usage,
+}
+
+# 源数据摘要：公开且作者未停用的提示词的 (id, version, usage_count, updated_at)；
+# 带上日期，保证新鲜度衰减至少每天重算一次
+_CHECKSUM_SQL = """
+SELECT md5(coalesce(string_agg(
+           p.id::text || ':' || coalesce(p.version, 1) || ':' || coalesce(p.usage_count, 0)
+           || ':' || extract(epoch FROM p.updated_at)::bigint,
+           ',' ORDER BY p.id), '') || CAST(:day AS text)) AS checksum,
+       count(*) AS n
+  FROM prompts p
+  JOIN users u ON u.id = p.user_id
+ WHERE p.is_public = true AND u.is_active
+"""
+
+# popular 分数 = ln(1 + 使用次数) + 新鲜度权重 * 0.5^(距上次更新天数 / 半衰期)
+_REBUILD_SQL = """
+INSERT INTO public_prompt_gallery (
+    prompt_id, author, title, description, preview, tags, category, usage_count, version,
+    created_at, updated_at, score, rank_popular, rank_recent, rank_usage
+)
+SELECT p.id, u.username, p.title, left(p.description, CAST(:preview_chars AS int)), left(p.content, CAST(:preview_chars AS int)),
+       coalesce(p.tags, '{}'), p.category, coalesce(p.usage_count, 0), coalesce(p.version, 1),
+       p.created_at, p.updated_at, s.score,
+       row_number() OVER (ORDER BY s.score DESC, p.id),
+       row_number() OVER (ORDER BY p.updated_at DESC, p.id),
+       row_number() OVER (ORDER BY coalesce(p.usage_count, 0) DESC, p.id)
+  FROM prompts p
+  JOIN users u ON u.id = p.user_id
+ CROSS JOIN LATERAL (
+       SELECT ln(1 + coalesce(p.usage_count, 0))
+              + CAST(:recency_weight AS double precision)
+                * power(0.5, extract(epoch FROM (CAST(:now AS timestamp) - p.updated_at)) / 86400.0
+                             / CAST(:half_life_days AS double precision))
+              AS score
+ ) s
+ WHERE p.is_public = true AND u.is_active
+"""
+
+
+@dataclass(frozen=True)
+class GalleryState:
+    generation: int
+    changed_at: Optional[datetime]
+    row_count: int
+
+    @property
+    def etag(self) -> str:
+        return f'W/"g{self.generation}"'
+
+
+_EMPTY = GalleryState(0, None, 0)
+_state_cache: Dict[str, Any] = {"state": None, "expires": 0.0}
+
+
+async def current_state(db: AsyncSession) -> GalleryState:
+    """当前快照代号（进程内缓存 _META_TTL_SECONDS 秒）"""
+    now = time.monotonic()
+    cached = _state_cache["state"]
+    if cached is not None and now < _state_cache["expires"]:
+        return cached
+    meta = await db.get(PublicGalleryMeta, _META_ID)
+    state = GalleryState(meta.generation, meta.changed_at, meta.row_count) if meta is not None else _EMPTY
+    _state_cache.update(state=state, expires=now + _META_TTL_SECONDS)
+    return state
+
+
+def _set_state(state: GalleryState) -> None:
+    _state_cache.update(state=state, expires=time.monotonic() + _META_TTL_SECONDS)
+
+
+# ==== 重建 ====
+async def refresh_gallery(db: AsyncSession, force: bool = False) -> Dict[str, Any]:
+    """
+    源数据摘要变化（或 force）时在一个事务里 DELETE + INSERT 整个快照；
+    事务提交前读者看到的一直是旧快照（MVCC），不会读到半成品。
+    """
+    locked = (await db.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": _REFRESH_LOCK_KEY})).scalar()
+    if not locked:
+        await db.rollback()
+        return {"skipped": "another refresh in progress"}
+
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    src = (await db.execute(text(_CHECKSUM_SQL), {"day": now.date().isoformat()})).one()
+    meta = await db.get(PublicGalleryMeta, _META_ID)
+    if meta is None:
+        meta = PublicGalleryMeta(id=_META_ID, generation=0, row_count=0)
+        db.add(meta)
+
+    rebuilt = force or meta.checksum != src.checksum
+    if rebuilt:
+        await db.execute(delete(PublicPromptSnapshot))
+        await db.execute(
+            text(_REBUILD_SQL),
+            {
+                "now": now,
+                "preview_chars": settings.PUBLIC_GALLERY_PREVIEW_CHARS,
+                "recency_weight": settings.PUBLIC_GALLERY_RECENCY_WEIGHT,
+                "half_life_days": settings.PUBLIC_GALLERY_HALF_LIFE_DAYS,
+            },
+        )
+        meta.generation = (meta.generation or 0) + 1
+        meta.checksum = src.checksum
+        meta.row_count = src.n
+        meta.changed_at = now
+    meta.refreshed_at = now
+    await db.commit()
+    _set_state(GalleryState(meta.generation, meta.changed_at, meta.row_count))
+    return {
+        "rebuilt": rebuilt,
+        "generation": meta.generation,
+        "rows": meta.row_count,
+        "ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+class GalleryRefresher:
+    """后台定期刷新快照；多 worker 时靠 advisory lock 去重，所以每个进程都跑也没关系"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        interval: float = 60.0,
+        enabled: bool = True,
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.enabled = enabled
+        self._task: Optional[asyncio.Task] = None
+        self.rebuilds = 0
+        self.errors = 0
+        self.last_refresh_ms = 0.0
+
+    async def refresh(self, force: bool = False) -> Dict[str, Any]:
+        async with self.session_factory() as db:
+            result = await refresh_gallery(db, force=force)
+        if result.get("rebuilt"):
+            self.rebuilds += 1
+        self.last_refresh_ms = result.get("ms", 0.0)
+        return result
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                self.errors += 1
+                logger.exception("public gallery refresh failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="gallery-refresher")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        state = _state_cache["state"] or _EMPTY
+        return {
+            "generation": state.generation,
+            "rows": state.row_count,
+            "rebuilds": self.rebuilds,
+            "errors": self.errors,
+            "last_refresh_ms": self.last_refresh_ms,
+        }
+
+
+# ==== 查询 ====
+_LIST_COLUMNS = (
+    PublicPromptSnapshot.prompt_id,
+    PublicPromptSnapshot.author,
+    PublicPromptSnapshot.title,
+    PublicPromptSnapshot.description,
+    PublicPromptSnapshot.preview,
+    PublicPromptSnapshot.tags,
+    PublicPromptSnapshot.category,
+    PublicPromptSnapshot.usage_count,
+    PublicPromptSnapshot.version,
+    PublicPromptSnapshot.updated_at,
+)
+
+
+def _item(row, rank: int) -> Dict[str, Any]:
+    return {
+        "id": str(row.prompt_id),
+        "author": row.author,
+        "title": row.title,
+        "description": row.description,
+        "preview": row.preview,
+        "tags": row.tags or [],
+        "category": row.category,
+        "usage_count": row.usage_count,
+        "version": row.version,
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+        "rank": rank,
+    }
+
+
+def _like_pattern(q: str) -> str:
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+async def list_public(
+    db: AsyncSession,
+    sort: str = "popular",
+    limit: int = 50,
+    after: Optional[int] = None,
+    category: Optional[str] = None,
+    tag: Optional[str] = None,
+    search: Optional[str] = None,
+) -> Dict[str, Any]:
+    """按预先算好的名次做 keyset 分页：after 为上一页最后一条的 rank"""
+    rank_col = _RANK_COLUMNS[sort]
+    q = select(*_LIST_COLUMNS, rank_col.label("rank"))
+    if after is not None:
+        q = q.where(rank_col > after)
+    if category:
+        q = q.where(PublicPromptSnapshot.category == category)
+    if tag:
+        q = q.where(PublicPromptSnapshot.tags.contains([tag]))
+    if search:
+        search = search.strip()
+        if search.isascii() and len(search) >= 3:
+            q = q.where(text(f"{GALLERY_SEARCH_TSVECTOR} @@ websearch_to_tsquery('english', :q)").bindparams(q=search))
+        else:
+            # 中文 / 很短的查询：快照表只有公开提示词，直接 ILIKE
+            pattern = _like_pattern(search)
+            q = q.where(
+                PublicPromptSnapshot.title.ilike(pattern, escape="\\")
+                | PublicPromptSnapshot.description.ilike(pattern, escape="\\")
+                | PublicPromptSnapshot.preview.ilike(pattern, escape="\\")
+            )
+    rows = (await db.execute(q.order_by(rank_col).limit(limit + 1))).all()
+    items = [_item(r, r.rank) for r in rows[:limit]]
+    return {
+        "items": items,
+        "next_cursor": str(items[-1]["rank"]) if len(rows) > limit else None,
+    }
+
+
+async def get_public_prompt(db: AsyncSession, prompt_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+    """详情直接读 prompts（主键查找），保证内容是最新的"""
+    res = await db.execute(
+        select(Prompt, User.username)
+        .join(User, User.id == Prompt.user_id)
+        .where(Prompt.id == prompt_id, Prompt.is_public.is_(True), User.is_active.is_(True))
+    )
+    row = res.first()
+    if row is None:
+        return None
+    p, author = row
+    return {
+        "id": str(p.id),
+        "author": author,
+        "title": p.title,
+        "content": p.content,
+        "description": p.description,
+        "tags": p.tags or [],
+        "category": p.category,
+        "variables": p.variables or [],
+        "usage_count": p.usage_count or 0,
+        "version": p.version or 1,
+        "created_at": p.created_at.isoformat() if p.created_at else None,
+        "updated_at": p.updated_at.isoformat() if p.updated_at else None,
+    }
+
+
+def _build_refresher() -> GalleryRefresher:
+    return GalleryRefresher(
+        session_factory=AsyncSessionLocal,
+        interval=settings.PUBLIC_GALLERY_REFRESH_SECONDS,
+        enabled=settings.PUBLIC_GALLERY_REFRESH_ENABLED,
+    )
+
+
+gallery_refresher = _build_refresher()
+
+
+def _gauges() -> Dict[str, Any]:
+    s = gallery_refresher.stats()
+    return {
+        "public_gallery_generation": s["generation"],
+        "public_gallery_rows": s["rows"],
+        "public_gallery_refresh_errors": s["errors"],
+        "public_gallery_last_refresh_seconds": s["last_refresh_ms"] / 1000,
+    }
+
+
+register_gauges("public_gallery", _gauges)
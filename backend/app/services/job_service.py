@@ -0,0 +1,565 @@
+# backend/app/services/job_service.py
+# 后台任务：API 里只 enqueue（一次 INSERT），重活由独立的 worker 进程执行（python -m app.cli.jobs worker）。
+# 队列就是 jobs 表，worker 用 SELECT ... FOR UPDATE SKIP LOCKED 领取，多个 worker 之间互不阻塞。
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.db.session import AsyncSessionLocal
+from app.models.job import JOB_CANCELLED, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, Job
+from app.models.prompt import Prompt
+from app.models.tag import PromptTagFacet
+from app.models.user import User
+from app.services import cache_bus, gallery_service, tag_service, template_service
+from app.services.prompt_cache import prompt_cache
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+_ERROR_MAX_CHARS = 2000
+
+
+class PermanentJobError(Exception):
+    """handler 抛出后不再重试（参数错误、前置条件不满足等）"""
+
+
+# ==== 任务注册表 ====
+# handler 签名：async (db, payload) -> 可 JSON 序列化的结果 dict（或 None）
+JobHandler = Callable[[AsyncSession, Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]
+
+
+@dataclass(frozen=True)
+class JobSpec:
+    kind: str
+    description: str
+    handler: JobHandler
+    # True：普通用户可以通过 API 为自己提交，payload 里的 user_id 强制为当前用户
+    user_scoped: bool = False
+
+
+JOB_REGISTRY: Dict[str, JobSpec] = {}
+
+
+def register_job(kind: str, description: str, user_scoped: bool = False):
+    """装饰器：把一个任务 handler 注册到 JOB_REGISTRY"""
+    def decorator(handler: JobHandler) -> JobHandler:
+        if kind in JOB_REGISTRY:
+            raise ValueError(f"Job kind already registered: {kind}")
+        JOB_REGISTRY[kind] = JobSpec(kind, description, handler, user_scoped)
+        return handler
+    return decorator
+
+
+def backoff_seconds(attempts: int, base: float, cap: float) -> float:
+    """第 attempts 次失败后的等待时间：指数退避 + 抖动（full jitter 的一半），避免一批任务同时重试"""
+    delay = min(cap, base * (2 ** max(0, attempts - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+# ==== 提交 / 查询（API 进程） ====
+async def enqueue(
+    db: AsyncSession,
+    kind: str,
+    payload: Optional[Dict[str, Any]] = None,
+    user_id: Optional[uuid.UUID] = None,
+    run_at: Optional[datetime] = None,
+    max_attempts: Optional[int] = None,
+    dedupe: bool = False,
+    commit: bool = True,
+) -> Job:
+    """
+    写入一条排队中的任务。dedupe=True 时，同一用户同一 kind 已有排队 / 执行中的任务就直接返回它。
+    commit=False 用于和业务写入放在同一个事务里。
+    """
+    if kind not in JOB_REGISTRY:
+        raise ValueError(f"Unknown job kind: {kind}")
+    if dedupe:
+        res = await db.execute(
+            select(Job)
+            .where(Job.kind == kind, Job.status.in_((JOB_QUEUED, JOB_RUNNING)))
+            .where(Job.user_id == user_id if user_id is not None else Job.user_id.is_(None))
+            .limit(1)
+        )
+        existing = res.scalar_one_or_none()
+        if existing is not None:
+            return existing
+    now = datetime.utcnow()
+    job = Job(
+        id=uuid.uuid4(),
+        kind=kind,
+        payload=payload or {},
+        user_id=user_id,
+        status=JOB_QUEUED,
+        attempts=0,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_at=run_at or now,
+        created_at=now,
+    )
+    db.add(job)
+    if commit:
+        await db.commit()
+    return job
+
+
+async def get_job(db: AsyncSession, job_id: uuid.UUID, user_id: Optional[uuid.UUID] = None) -> Optional[Job]:
+    q = select(Job).where(Job.id == job_id)
+    if user_id is not None:
+        q = q.where(Job.user_id == user_id)
+    return (await db.execute(q)).scalar_one_or_none()
+
+
+async def list_jobs(
+    db: AsyncSession, user_id: uuid.UUID, status: Optional[str] = None, limit: int = 50
+) -> List[Job]:
+    q = select(Job).where(Job.user_id == user_id)
+    if status:
+        q = q.where(Job.status == status)
+    q = q.order_by(Job.created_at.desc()).limit(limit)
+    return list((await db.execute(q)).scalars().all())
+
+
+async def cancel_job(db: AsyncSession, job_id: uuid.UUID, user_id: Optional[uuid.UUID] = None) -> Optional[Job]:
+    """只能取消还在排队的任务；执行中的任务不打断。返回取消后的任务，不存在 / 不可取消返回 None"""
+    q = (
+        update(Job)
+        .where(Job.id == job_id, Job.status == JOB_QUEUED)
+        .values(status=JOB_CANCELLED, finished_at=datetime.utcnow())
+        .returning(Job.id)
+    )
+    if user_id is not None:
+        q = q.where(Job.user_id == user_id)
+    cancelled = (await db.execute(q)).scalar_one_or_none()
+    await db.commit()
+    if cancelled is None:
+        return None
+    return await get_job(db, job_id)
+
+
+# ==== 领取 / 状态变更（worker 进程） ====
+@dataclass
+class ClaimedJob:
+    id: uuid.UUID
+    kind: str
+    payload: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+
+
+async def claim_jobs(db: AsyncSession, worker_id: str, limit: int) -> List[ClaimedJob]:
+    """
+    原子地领取最多 limit 个到期任务：
+      UPDATE jobs SET status='running' ... WHERE id IN (
+          SELECT id FROM jobs WHERE status='queued' AND run_at <= now ORDER BY run_at LIMIT n FOR UPDATE SKIP LOCKED
+      ) RETURNING ...
+    被其它 worker 锁住的行直接跳过，不排队等锁。
+    """
+    if limit <= 0:
+        return []
+    now = datetime.utcnow()
+    due = (
+        select(Job.id)
+        .where(Job.status == JOB_QUEUED, Job.run_at <= now)
+        .order_by(Job.run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(Job)
+        .where(Job.id.in_(due))
+        .values(status=JOB_RUNNING, locked_by=worker_id, locked_at=now, started_at=now, attempts=Job.attempts + 1)
+        .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts)
+        .execution_options(synchronize_session=False)
+    )
+    rows = (await db.execute(stmt)).all()
+    await db.commit()
+    return [ClaimedJob(r.id, r.kind, r.payload or {}, r.attempts, r.max_attempts) for r in rows]
+
+
+async def heartbeat(db: AsyncSession, worker_id: str, job_ids: List[uuid.UUID]) -> None:
+    """续租：执行中的任务定期刷新 locked_at"""
+    if not job_ids:
+        return
+    await db.execute(
+        update(Job)
+        .where(Job.id.in_(job_ids), Job.locked_by == worker_id, Job.status == JOB_RUNNING)
+        .values(locked_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def requeue_expired(db: AsyncSession, lease_seconds: float) -> int:
+    """租约过期（worker 崩溃 / 被杀）的任务：还有重试次数的回到队列，否则标记失败"""
+    now = datetime.utcnow()
+    expired = (Job.status == JOB_RUNNING) & (Job.locked_at < now - timedelta(seconds=lease_seconds))
+    res = await db.execute(
+        update(Job)
+        .where(expired, Job.attempts < Job.max_attempts)
+        .values(status=JOB_QUEUED, locked_by=None, locked_at=None, run_at=now, last_error="lease expired")
+        .execution_options(synchronize_session=False)
+    )
+    res2 = await db.execute(
+        update(Job)
+        .where(expired, Job.attempts >= Job.max_attempts)
+        .values(status=JOB_FAILED, locked_by=None, finished_at=now, last_error="lease expired")
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return (res.rowcount or 0) + (res2.rowcount or 0)
+
+
+def _owned(job_id: uuid.UUID, worker_id: str):
+    # 只改仍归本 worker 的任务：租约过期被别人领走后，旧 worker 的结果不覆盖新状态
+    return (Job.id == job_id) & (Job.locked_by == worker_id) & (Job.status == JOB_RUNNING)
+
+
+async def mark_succeeded(db: AsyncSession, job: ClaimedJob, worker_id: str, result: Optional[Dict[str, Any]]) -> None:
+    await db.execute(
+        update(Job)
+        .where(_owned(job.id, worker_id))
+        .values(status=JOB_SUCCEEDED, result=result, locked_by=None, finished_at=datetime.utcnow(), last_error=None)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def mark_failed(db: AsyncSession, job: ClaimedJob, worker_id: str, error: str, retry: bool) -> None:
+    now = datetime.utcnow()
+    values: Dict[str, Any] = {"last_error": error[:_ERROR_MAX_CHARS], "locked_by": None}
+    if retry and job.attempts < job.max_attempts:
+        delay = backoff_seconds(job.attempts, settings.JOB_RETRY_BASE_SECONDS, settings.JOB_RETRY_MAX_SECONDS)
+        values.update(status=JOB_QUEUED, locked_at=None, run_at=now + timedelta(seconds=delay))
+    else:
+        values.update(status=JOB_FAILED, finished_at=now)
+    await db.execute(
+        update(Job).where(_owned(job.id, worker_id)).values(**values).execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def release(db: AsyncSession, job: ClaimedJob, worker_id: str) -> None:
+    """worker 停机时把没跑完的任务放回队列，本次不计入重试次数"""
+    await db.execute(
+        update(Job)
+        .where(_owned(job.id, worker_id))
+        .values(status=JOB_QUEUED, locked_by=None, locked_at=None, attempts=Job.attempts - 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+# ==== worker ====
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class JobWorker:
+    """
+    并发上限 concurrency：只在有空槽时领取，领多少取决于空槽数，不会把任务领到手里干等。
+    每个任务用独立的 session 执行；状态更新另开 session，handler 里的回滚不影响记录结果。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+        concurrency: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+        lease_seconds: Optional[float] = None,
+        worker_id: Optional[str] = None,
+    ):
+        self.session_factory = session_factory
+        self.concurrency = concurrency or settings.JOB_WORKER_CONCURRENCY
+        self.poll_interval = poll_interval if poll_interval is not None else settings.JOB_POLL_INTERVAL_SECONDS
+        self.lease_seconds = lease_seconds or settings.JOB_LEASE_SECONDS
+        self.worker_id = worker_id or default_worker_id()
+        self._running: Dict[uuid.UUID, asyncio.Task] = {}
+        self._claimed: Dict[uuid.UUID, ClaimedJob] = {}
+        self._stopping = asyncio.Event()
+        self._slot_freed = asyncio.Event()
+        self.succeeded = 0
+        self.failed = 0
+
+    async def _execute(self, job: ClaimedJob) -> None:
+        spec = JOB_REGISTRY.get(job.kind)
+        started = time.perf_counter()
+        try:
+            if spec is None:
+                raise PermanentJobError(f"Unknown job kind: {job.kind}")
+            async with self.session_factory() as db:
+                result = await spec.handler(db, job.payload)
+        except asyncio.CancelledError:
+            async with self.session_factory() as db:
+                await release(db, job, self.worker_id)
+            raise
+        except PermanentJobError as e:
+            self.failed += 1
+            logger.warning("job %s (%s) failed permanently: %s", job.id, job.kind, e)
+            async with self.session_factory() as db:
+                await mark_failed(db, job, self.worker_id, str(e), retry=False)
+        except Exception as e:
+            self.failed += 1
+            logger.exception("job %s (%s) attempt %d/%d failed", job.id, job.kind, job.attempts, job.max_attempts)
+            async with self.session_factory() as db:
+                await mark_failed(db, job, self.worker_id, f"{type(e).__name__}: {e}", retry=True)
+        else:
+            self.succeeded += 1
+            logger.info("job %s (%s) done in %.2fs", job.id, job.kind, time.perf_counter() - started)
+            async with self.session_factory() as db:
+                await mark_succeeded(db, job, self.worker_id, result)
+
+    def _spawn(self, job: ClaimedJob) -> None:
+        task = asyncio.create_task(self._execute(job), name=f"job-{job.kind}-{job.id}")
+        self._running[job.id] = task
+        self._claimed[job.id] = job
+
+        def _done(_t: asyncio.Task) -> None:
+            self._running.pop(job.id, None)
+            self._claimed.pop(job.id, None)
+            self._slot_freed.set()
+
+        task.add_done_callback(_done)
+
+    async def poll_once(self) -> int:
+        """按空槽数领取一批任务并启动，返回领取数"""
+        free = self.concurrency - len(self._running)
+        if free <= 0:
+            return 0
+        async with self.session_factory() as db:
+            jobs = await claim_jobs(db, self.worker_id, free)
+        for job in jobs:
+            self._spawn(job)
+        return len(jobs)
+
+    async def _heartbeat_loop(self) -> None:
+        interval = max(1.0, self.lease_seconds / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with self.session_factory() as db:
+                    await heartbeat(db, self.worker_id, list(self._running))
+                    await requeue_expired(db, self.lease_seconds)
+            except Exception:
+                logger.exception("job heartbeat failed")
+
+    async def run(self) -> None:
+        """一直运行到 stop() 被调用"""
+        logger.info("job worker %s started (concurrency=%d)", self.worker_id, self.concurrency)
+        async with self.session_factory() as db:
+            await requeue_expired(db, self.lease_seconds)
+        hb = asyncio.create_task(self._heartbeat_loop(), name="job-heartbeat")
+        try:
+            while not self._stopping.is_set():
+                try:
+                    claimed = await self.poll_once()
+                except Exception:
+                    logger.exception("job claim failed")
+                    claimed = 0
+                if claimed and len(self._running) < self.concurrency:
+                    continue  # 可能还有到期任务，马上再领
+                # 没活干或槽位已满：等槽位空出 / 轮询间隔 / 停机，三者先到为准
+                self._slot_freed.clear()
+                waiters = [asyncio.create_task(self._stopping.wait())]
+                if self._running:
+                    waiters.append(asyncio.create_task(self._slot_freed.wait()))
+                done, pending = await asyncio.wait(waiters, timeout=self.poll_interval, return_when=asyncio.FIRST_COMPLETED)
+                for w in pending:
+                    w.cancel()
+        finally:
+            hb.cancel()
+            await self._shutdown()
+
+    async def _shutdown(self) -> None:
+        if not self._running:
+            return
+        grace = settings.JOB_SHUTDOWN_GRACE_SECONDS
+        logger.info("waiting up to %.0fs for %d running jobs", grace, len(self._running))
+        _, pending = await asyncio.wait(list(self._running.values()), timeout=grace)
+        # 超时没跑完的取消掉，_execute 会把它们放回队列
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def drain(self, max_jobs: Optional[int] = None) -> int:
+        """
+        执行所有已到期的任务直到队列为空（含执行中新提交的到期任务），返回执行数。
+        测试 / 一次性脚本用：不需要单独起 worker 进程，本地库就能跑。
+        """
+        done = 0
+        while max_jobs is None or done < max_jobs:
+            claimed = await self.poll_once()
+            if not claimed and not self._running:
+                break
+            done += claimed
+            if self._running:
+                await asyncio.wait(list(self._running.values()), return_when=asyncio.FIRST_COMPLETED)
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+        return done
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "running": len(self._running),
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+        }
+
+
+# ==== 内置任务 ====
+_BATCH = 500
+
+
+def _uuid_arg(payload: Dict[str, Any], key: str = "user_id", required: bool = False) -> Optional[uuid.UUID]:
+    raw = payload.get(key)
+    if raw is None:
+        if required:
+            raise PermanentJobError(f"Missing '{key}' in payload")
+        return None
+    try:
+        return uuid.UUID(str(raw))
+    except ValueError:
+        raise PermanentJobError(f"Invalid '{key}': {raw}")
+
+
+@register_job("recompute_variables", "按模板重新解析 variables 并刷新预编译模板", user_scoped=True)
+async def _recompute_variables(db: AsyncSession, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    按 id keyset 分批扫描，每批一个短事务。只写 variables / compiled_template 与模板不一致的行。
+    其它进程里的内容缓存由失效总线清掉（SQLite 下没有总线，靠 PROMPT_CACHE_VERSION_TTL_SECONDS 过期）。
+    """
+    user_id = _uuid_arg(payload)
+    scanned = changed = 0
+    last_id: Optional[uuid.UUID] = None
+    while True:
+        q = select(Prompt.id, Prompt.user_id, Prompt.content, Prompt.version, Prompt.variables, Prompt.compiled_template)
+        if user_id is not None:
+            q = q.where(Prompt.user_id == user_id)
+        if last_id is not None:
+            q = q.where(Prompt.id > last_id)
+        rows = (await db.execute(q.order_by(Prompt.id).limit(_BATCH))).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        scanned += len(rows)
+        updates, changes = [], []
+        for r in rows:
+            compiled = template_service.compile_template(r.content, version=r.version or 1)
+            stored = compiled.to_json()
+            if list(r.variables or []) != compiled.variables or r.compiled_template != stored:
+                # 分区时 user_id 也是主键的一部分，按主键批量 UPDATE 需要带上
+                updates.append({"id": r.id, "user_id": r.user_id, "variables": compiled.variables, "compiled_template": stored})
+                # 版本号不变但内容变了，不带版本（无条件失效）
+                changes.append(cache_bus.prompt_changed(r.id, r.user_id))
+        if updates:
+            await db.execute(update(Prompt), updates)
+            await cache_bus.publish(db, *changes)
+            await db.commit()
+            changed += len(updates)
+            for u in updates:
+                await prompt_cache.invalidate(u["id"])
+    return {"scanned": scanned, "changed": changed}
+
+
+@register_job("reconcile_tags", "从 prompts 重算标签分面计数（修复漂移）", user_scoped=True)
+async def _reconcile_tags(db: AsyncSession, payload: Dict[str, Any]) -> Dict[str, Any]:
+    rows = await tag_service.reconcile_user_tags(db, _uuid_arg(payload))
+    return {"facet_rows": rows}
+
+
+@register_job("purge_user_prompts", "分批删除已停用用户的全部提示词")
+async def _purge_user_prompts(db: AsyncSession, payload: Dict[str, Any]) -> Dict[str, Any]:
+    user_id = _uuid_arg(payload, required=True)
+    user = await db.get(User, user_id)
+    if user is None:
+        raise PermanentJobError(f"User not found: {user_id}")
+    if user.is_active:
+        raise PermanentJobError("Refusing to purge prompts of an active user")
+    deleted = 0
+    while True:
+        # 每批一个短事务：不长时间持锁，中途失败重试时从剩下的继续
+        batch = select(Prompt.id).where(Prompt.user_id == user_id).limit(_BATCH).scalar_subquery()
+        res = await db.execute(
+            delete(Prompt)
+            .where(Prompt.user_id == user_id, Prompt.id.in_(batch))
+            .returning(Prompt.id, Prompt.category, Prompt.tags)
+            .execution_options(synchronize_session=False)
+        )
+        rows = res.all()
+        if not rows:
+            break
+        await tag_service.apply_bulk_removals(db, user_id, [(r.category, r.tags) for r in rows])
+        await cache_bus.publish(db, *(cache_bus.prompt_changed(r.id, user_id) for r in rows))
+        await db.commit()
+        deleted += len(rows)
+        for r in rows:
+            await prompt_cache.invalidate(r.id)
+    # 计数都减到 0 了，直接清掉该用户的分面行
+    await db.execute(delete(PromptTagFacet).where(PromptTagFacet.user_id == user_id))
+    await db.commit()
+    return {"deleted": deleted}
+
+
+@register_job("refresh_public_gallery", "重建公开提示词广场快照（源数据没变时跳过）")
+async def _refresh_public_gallery(db: AsyncSession, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return await gallery_service.refresh_gallery(db, force=bool(payload.get("force")))
+
+
+def _prompt_ids_arg(payload: Dict[str, Any]) -> Optional[List[uuid.UUID]]:
+    if not payload.get("prompt_ids"):
+        return None
+    try:
+        return [uuid.UUID(str(x)) for x in payload["prompt_ids"]]
+    except ValueError:
+        raise PermanentJobError("Invalid 'prompt_ids'")
+
+
+@register_job("embed_prompts", "补算 / 重算提示词的语义向量（缺失、过期或 embedder 变更的）", user_scoped=True)
+async def _embed_prompts(db: AsyncSession, payload: Dict[str, Any]) -> Dict[str, Any]:
+    from app.services import embedding_service
+    return await embedding_service.backfill(
+        db, user_id=_uuid_arg(payload), prompt_ids=_prompt_ids_arg(payload), force=bool(payload.get("force"))
+    )
+
+
+@register_job("sign_prompts", "补算近似重复检测用的 MinHash 签名（缺失或过期的）", user_scoped=True)
+async def _sign_prompts(db: AsyncSession, payload: Dict[str, Any]) -> Dict[str, Any]:
+    from app.services import dedupe_service
+    return await dedupe_service.backfill(
+        db, user_id=_uuid_arg(payload), prompt_ids=_prompt_ids_arg(payload), force=bool(payload.get("force"))
+    )
+
+
+# 提示词搜索相关索引；CONCURRENTLY 不阻塞读写，但不能在事务块里执行
+_SEARCH_INDEXES = ("idx_prompts_search", "idx_prompts_title_trgm", "idx_prompts_content_trgm", "idx_prompts_tags")
+
+
+@register_job("reindex_search", "重建提示词搜索索引（REINDEX CONCURRENTLY）并更新统计信息")
+async def _reindex_search(db: AsyncSession, payload: Dict[str, Any]) -> Dict[str, Any]:
+    names = payload.get("indexes") or list(_SEARCH_INDEXES)
+    unknown = [n for n in names if n not in _SEARCH_INDEXES]
+    if unknown:
+        raise PermanentJobError(f"Unknown index: {', '.join(unknown)}")
+    timings: Dict[str, float] = {}
+    async with db.bind.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for name in names:
+            started = time.perf_counter()
+            await conn.exec_driver_sql(f"REINDEX INDEX CONCURRENTLY {name}")
+            timings[name] = round(time.perf_counter() - started, 3)
+        await conn.exec_driver_sql("ANALYZE prompts")
+    return {"seconds": timings}
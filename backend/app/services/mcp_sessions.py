@@ -0,0 +1,212 @@
+# backend/app/services/mcp_sessions.py
+# MCP 长连接会话（SSE）的进程内订阅表：每个会话一个有界发送队列，按用户分组，
+# 提示词变化时给该用户的所有会话推 notifications/prompts/list_changed
+import asyncio
+import secrets
+import time
+import uuid
+from typing import Any, Dict, Optional, Set, Union
+
+import orjson
+
+from app.core.config import get_settings
+from app.core.instrumentation import register_gauges
+
+PROMPTS_LIST_CHANGED = "notifications/prompts/list_changed"
+
+_CLOSE = object()  # 放进队列让写出循环结束
+
+
+class SessionLimitExceeded(Exception):
+    pass
+
+
+class Session:
+    """
+    一个 SSE 连接。队列里放已编码好的消息（bytes）或通知方法名（str）：
+    同一种通知还没发出去时不再重复入队（突发的多次修改合并成一次推送）。
+    """
+
+    __slots__ = ("id", "user_id", "principal", "queue", "pending", "closed", "created_at", "sent")
+
+    def __init__(self, user_id: uuid.UUID, principal: Any, queue_size: int):
+        self.id = secrets.token_urlsafe(16)
+        self.user_id = user_id
+        self.principal = principal  # 开流时认证得到的 Principal，会话内的调用都以它的身份执行
+        self.queue: "asyncio.Queue[Union[bytes, str, object]]" = asyncio.Queue(maxsize=queue_size)
+        self.pending: Optional[Set[str]] = None  # 已入队未发出的通知方法名，按需创建（空闲会话不占这份内存）
+        self.closed = False
+        self.created_at = time.monotonic()
+        self.sent = 0
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        # 队列满时也要能唤醒写出循环：清掉积压再放结束标记
+        while self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(_CLOSE)
+
+    async def next_frame(self, timeout: float) -> Optional[bytes]:
+        """
+        写出循环调用：返回下一条要发的 SSE 帧；timeout 秒内没有消息返回 b""（调用方发心跳），
+        会话关闭返回 None。
+        """
+        try:
+            item = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return b""
+        if item is _CLOSE:
+            return None
+        if isinstance(item, str):
+            if self.pending is not None:
+                self.pending.discard(item)
+            item = orjson.dumps({"jsonrpc": "2.0", "method": item, "params": {}})
+        self.sent += 1
+        return b"event: message\ndata: " + item + b"\n\n"
+
+
+class SessionRegistry:
+    """
+    会话表 + 按用户的订阅表，全部操作在事件循环里同步完成。
+    背压：
+      - 工具调用的响应用 send() 入队，队列满时等待最多 send_timeout 秒（调用方的 POST 也随之变慢），
+        超时说明客户端不读流，断开该会话
+      - 通知用 notify() 入队，从不阻塞发布方；队列满时直接断开该会话（客户端重连后重新拉列表即可）
+    """
+
+    def __init__(self, queue_size: int = 64, send_timeout: float = 10.0, max_sessions: int = 10000,
+                 max_per_user: int = 20):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.max_sessions = max_sessions
+        self.max_per_user = max_per_user
+        self._sessions: Dict[str, Session] = {}
+        self._by_user: Dict[uuid.UUID, Set[Session]] = {}
+        # 统计
+        self.opened = 0
+        self.notifications = 0
+        self.coalesced = 0
+        self.dropped_slow = 0
+
+    def open(self, user_id: uuid.UUID, principal: Any = None) -> Session:
+        if len(self._sessions) >= self.max_sessions:
+            raise SessionLimitExceeded("Too many MCP sessions on this server")
+        subs = self._by_user.get(user_id)
+        if subs is not None and len(subs) >= self.max_per_user:
+            raise SessionLimitExceeded("Too many MCP sessions for this user")
+        s = Session(user_id, principal, self.queue_size)
+        self._sessions[s.id] = s
+        self._by_user.setdefault(user_id, set()).add(s)
+        self.opened += 1
+        return s
+
+    def get(self, session_id: str) -> Optional[Session]:
+        s = self._sessions.get(session_id)
+        return s if s is not None and not s.closed else None
+
+    def discard(self, s: Session) -> None:
+        """写出循环结束（客户端断开 / 被踢）后调用"""
+        s.close()
+        self._sessions.pop(s.id, None)
+        subs = self._by_user.get(s.user_id)
+        if subs is not None:
+            subs.discard(s)
+            if not subs:
+                del self._by_user[s.user_id]
+
+    def _drop(self, s: Session) -> None:
+        self.dropped_slow += 1
+        self.discard(s)
+
+    async def send(self, s: Session, message: bytes) -> bool:
+        """把一条已编码的 JSON-RPC 消息发给会话；会话已关闭 / 发送超时返回 False"""
+        if s.closed:
+            return False
+        try:
+            await asyncio.wait_for(s.queue.put(message), self.send_timeout)
+        except asyncio.TimeoutError:
+            self._drop(s)
+            return False
+        return not s.closed
+
+    def notify(self, user_id: uuid.UUID, method: str) -> int:
+        """给该用户的所有会话推一条（无参数的）通知，返回实际入队的会话数"""
+        subs = self._by_user.get(user_id)
+        if not subs:
+            return 0
+        n = 0
+        for s in list(subs):
+            if s.pending is not None and method in s.pending:
+                self.coalesced += 1
+                continue
+            try:
+                s.queue.put_nowait(method)
+            except asyncio.QueueFull:
+                self._drop(s)
+                continue
+            if s.pending is None:
+                s.pending = set()
+            s.pending.add(method)
+            n += 1
+        self.notifications += n
+        return n
+
+    def notify_all(self, method: str) -> int:
+        return sum(self.notify(user_id, method) for user_id in list(self._by_user))
+
+    def close_user(self, user_id: uuid.UUID) -> int:
+        """
+        断开该用户的所有会话（停用 / 轮换 API Key / 全部登出之后）：会话内的调用用的是开流时的身份，
+        不断开的话流不关就一直能以旧身份调用。客户端重连时重新认证。返回断开的会话数
+        """
+        subs = list(self._by_user.get(user_id, ()))
+        for s in subs:
+            self.discard(s)
+        return len(subs)
+
+    def close_all(self) -> None:
+        for s in list(self._sessions.values()):
+            self.discard(s)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "users": len(self._by_user),
+            "opened": self.opened,
+            "notifications": self.notifications,
+            "coalesced": self.coalesced,
+            "dropped_slow": self.dropped_slow,
+        }
+
+
+def _build_registry() -> SessionRegistry:
+    settings = get_settings()
+    return SessionRegistry(
+        queue_size=settings.MCP_SESSION_QUEUE_SIZE,
+        send_timeout=settings.MCP_SESSION_SEND_TIMEOUT_SECONDS,
+        max_sessions=settings.MCP_SESSION_MAX,
+        max_per_user=settings.MCP_SESSION_MAX_PER_USER,
+    )
+
+
+session_registry = _build_registry()
+
+
+def _gauges() -> Dict[str, Any]:
+    s = session_registry.stats()
+    return {
+        "mcp_sessions": s["sessions"],
+        "mcp_session_users": s["users"],
+        "mcp_session_notifications": s["notifications"],
+        "mcp_session_dropped_slow": s["dropped_slow"],
+    }
+
+
+register_gauges("mcp_sessions", _gauges)
+
+
+def prompts_changed(user_id: uuid.UUID) -> None:
+    """提示词增删改提交后调用（本进程内的会话）"""
+    session_registry.notify(user_id, PROMPTS_LIST_CHANGED)
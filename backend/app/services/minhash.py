@@ -0,0 +1,273 @@
+# backend/app/services/minhash.py
+# 近似重复检测的内存结构（纯 NumPy）：
+#   MinHasher  文本 -> 字符 k-gram（shingle）集合 -> MinHash 签名（NUM_PERM 个 uint16，128 字节）
+#   LSHIndex   签名分成 BANDS 段，每段 ROWS 个值拼成一个 64 位键；任意一段相同即为候选，
+#              再用签名逐位相等的比例估计 Jaccard 相似度
+import threading
+from typing import Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+NUM_PERM = 64
+BANDS, ROWS = 16, 4  # ROWS 个 uint16 正好是一个 uint64 键，不用再哈希
+SHINGLE = 5  # 字符 5-gram：对中英文都适用
+
+# Jaccard 为 s 的两段文本成为候选的概率 1 - (1 - s^ROWS)^BANDS：
+#   s=0.9 -> 1.00，s=0.8 -> 0.9997，s=0.6 -> 0.89，s=0.4 -> 0.34（候选再按估计值过滤）
+
+_FNV_PRIME = np.uint64(1099511628211)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_CHUNK = 4096  # 超长正文分块计算，避免 (NUM_PERM, n) 的中间矩阵过大
+
+Matches = List[Tuple[Hashable, float]]
+
+
+class MinHasher:
+    """乘法-移位哈希族：h_i(x) = (a_i * x + b_i) mod 2^64 的高 32 位，a_i 为奇数；种子固定，签名可持久化"""
+
+    def __init__(self, num_perm: int = NUM_PERM, shingle: int = SHINGLE, seed: int = 0x5EED):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle = shingle
+        self._a = (rng.integers(0, 2**63, num_perm, dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        """规范化（小写、空白折叠）后的字符 k-gram 哈希，去重"""
+        norm = " ".join(text.lower().split())
+        cps = np.frombuffer(norm.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        k = min(self.shingle, cps.shape[0])
+        if k == 0:
+            return np.empty(0, dtype=np.uint64)
+        n = cps.shape[0] - k + 1
+        h = np.zeros(n, dtype=np.uint64)
+        for j in range(k):
+            h = h * _FNV_PRIME + cps[j:j + n]
+        # splitmix64 末端混合，让相近的 k-gram 哈希分散开
+        h ^= h >> np.uint64(30)
+        h *= _MIX1
+        h ^= h >> np.uint64(27)
+        h *= _MIX2
+        h ^= h >> np.uint64(31)
+        return np.unique(h)
+
+    def signature(self, text: str) -> np.ndarray:
+        sh = self.shingles(text)
+        if sh.shape[0] == 0:
+            return np.full(self.num_perm, 0xFFFF, dtype=np.uint16)
+        mins = np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        for start in range(0, sh.shape[0], _CHUNK):
+            part = sh[start:start + _CHUNK]
+            hv = (part[None, :] * self._a[:, None] + self._b[:, None]) >> np.uint64(32)
+            np.minimum(mins, hv.min(axis=1), out=mins)
+        # 只保留低 16 位：签名减半，随机碰撞带来的偏差约 1/65536，可以忽略
+        return (mins & np.uint64(0xFFFF)).astype(np.uint16)
+
+
+def band_keys(sigs: np.ndarray) -> np.ndarray:
+    """(n, NUM_PERM) uint16 -> (n, BANDS) uint64：每段 ROWS 个 uint16 按字节拼成一个 uint64"""
+    sigs = np.ascontiguousarray(sigs, dtype="<u2")
+    return sigs.reshape(sigs.shape[0], BANDS * ROWS).view("<u8")
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """签名逐位相等的比例 = Jaccard 相似度的无偏估计；b 可以是 (n, NUM_PERM)"""
+    return (b == a).mean(axis=-1)
+
+
+class LSHIndex:
+    """
+    主体是构建时的快照：每段一个排好序的键数组 + 对应行号，查询是 BANDS 次 searchsorted。
+    之后的写入进 delta（dict 分桶），被覆盖 / 删除的主体行记在 dead；
+    delta + dead 超过主体的 rebuild_ratio 时需要重建（调用方在线程里执行 rebuild）。
+    """
+
+    def __init__(self, rebuild_ratio: float = 0.1, min_rebuild: int = 1000):
+        self.rebuild_ratio = rebuild_ratio
+        self.min_rebuild = min_rebuild
+        self._ids: List[Hashable] = []
+        self._pos: Dict[Hashable, int] = {}
+        self._sigs = np.empty((0, NUM_PERM), dtype=np.uint16)
+        self._keys: List[np.ndarray] = [np.empty(0, dtype=np.uint64)] * BANDS
+        self._rows: List[np.ndarray] = [np.empty(0, dtype=np.int32)] * BANDS
+        self._delta: Dict[Hashable, np.ndarray] = {}
+        self._buckets: Dict[Tuple[int, int], Set[Hashable]] = {}
+        self._dead: Set[Hashable] = set()
+        self._building: Optional[Set[Hashable]] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, ids: Sequence[Hashable], sigs: np.ndarray, **kwargs) -> "LSHIndex":
+        idx = cls(**kwargs)
+        idx._install(list(ids), np.ascontiguousarray(sigs, dtype=np.uint16))
+        return idx
+
+    def _install(self, ids: List[Hashable], sigs: np.ndarray) -> None:
+        keys = band_keys(sigs) if len(ids) else np.empty((0, BANDS), dtype=np.uint64)
+        sorted_keys, sorted_rows = [], []
+        for b in range(BANDS):
+            order = np.argsort(keys[:, b], kind="stable").astype(np.int32)
+            sorted_keys.append(np.ascontiguousarray(keys[order, b]))
+            sorted_rows.append(order)
+        self._ids = ids
+        self._pos = {k: i for i, k in enumerate(ids)}
+        self._sigs = sigs
+        self._keys = sorted_keys
+        self._rows = sorted_rows
+
+    # ---- 容量 ----
+    def __len__(self) -> int:
+        return len(self._ids) - len(self._dead) + sum(1 for k in self._delta if k not in self._pos)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._delta or (key in self._pos and key not in self._dead)
+
+    @property
+    def nbytes(self) -> int:
+        main = self._sigs.nbytes + sum(k.nbytes + r.nbytes for k, r in zip(self._keys, self._rows))
+        return main + len(self._delta) * (NUM_PERM * 2 + BANDS * 16)
+
+    def needs_rebuild(self) -> bool:
+        pending = len(self._delta) + len(self._dead)
+        return pending > max(self.min_rebuild, self.rebuild_ratio * len(self._ids))
+
+    # ---- 写入 ----
+    def _touch(self, key: Hashable) -> None:
+        if key in self._pos:
+            self._dead.add(key)
+        old = self._delta.pop(key, None)
+        if old is not None:
+            for b, bk in enumerate(band_keys(old[None, :])[0]):
+                bucket = self._buckets.get((b, int(bk)))
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[(b, int(bk))]
+        if self._building is not None:
+            self._building.add(key)
+
+    def upsert(self, key: Hashable, sig: np.ndarray) -> None:
+        with self._lock:
+            self._touch(key)
+            self._delta[key] = sig
+            for b, bk in enumerate(band_keys(sig[None, :])[0]):
+                self._buckets.setdefault((b, int(bk)), set()).add(key)
+
+    def remove(self, key: Hashable) -> None:
+        with self._lock:
+            self._touch(key)
+
+    def rebuild(self) -> None:
+        """把 delta 合并进主体、去掉 dead 行；CPU 密集，调用方用 asyncio.to_thread 执行"""
+        with self._lock:
+            if self._building is not None:
+                return
+            ids, sigs = self._live()
+            self._building = set()
+        try:
+            fresh = LSHIndex.build(ids, sigs, rebuild_ratio=self.rebuild_ratio, min_rebuild=self.min_rebuild)
+        except BaseException:
+            with self._lock:
+                self._building = None
+            raise
+        with self._lock:
+            # 构建期间的改动不在新主体里：覆盖 / 删除的记为 dead，新写入的留在 delta
+            changed = self._building
+            delta = {k: v for k, v in self._delta.items() if k in changed}
+            self._ids, self._pos, self._sigs = fresh._ids, fresh._pos, fresh._sigs
+            self._keys, self._rows = fresh._keys, fresh._rows
+            self._dead = {k for k in changed if k in self._pos}
+            self._delta, self._buckets = {}, {}
+            for k, v in delta.items():
+                self._delta[k] = v
+                for b, bk in enumerate(band_keys(v[None, :])[0]):
+                    self._buckets.setdefault((b, int(bk)), set()).add(k)
+            self._building = None
+
+    def _live(self) -> Tuple[List[Hashable], np.ndarray]:
+        keep = [i for i, k in enumerate(self._ids) if k not in self._dead]
+        ids = [self._ids[i] for i in keep] + list(self._delta)
+        parts = [self._sigs[keep]]
+        if self._delta:
+            parts.append(np.stack(list(self._delta.values())))
+        return ids, np.concatenate(parts) if parts else np.empty((0, NUM_PERM), dtype=np.uint16)
+
+    # ---- 查询 ----
+    def query(self, sig: np.ndarray, threshold: float, exclude: Optional[Set[Hashable]] = None) -> Matches:
+        """相似度 >= threshold 的已有条目，按相似度降序"""
+        keys = band_keys(sig[None, :])[0]
+        found: Dict[Hashable, float] = {}
+        if self._ids:
+            spans = []
+            for b in range(BANDS):
+                col = self._keys[b]
+                lo = col.searchsorted(keys[b], "left")
+                hi = col.searchsorted(keys[b], "right")
+                if hi > lo:
+                    spans.append(self._rows[b][lo:hi])
+            if spans:
+                rows = np.unique(np.concatenate(spans))
+                scores = similarity(sig, self._sigs[rows])
+                for r in np.nonzero(scores >= threshold)[0]:
+                    key = self._ids[rows[r]]
+                    if key not in self._dead:
+                        found[key] = float(scores[r])
+        if self._buckets:
+            for b in range(BANDS):
+                for key in self._buckets.get((b, int(keys[b])), ()):
+                    if key not in found:
+                        s = float(similarity(sig, self._delta[key]))
+                        if s >= threshold:
+                            found[key] = s
+        if exclude:
+            for key in exclude:
+                found.pop(key, None)
+        return sorted(found.items(), key=lambda kv: -kv[1])
+
+    def clusters(self, threshold: float) -> List[Tuple[List[Hashable], float]]:
+        """
+        把整个库按近似重复聚类（并查集），返回 [(成员, 组内与代表的最低相似度)]，只含 2 个以上成员的组。
+        每段里键相同的一组行，都和组内第一行比较；相似度达标就合并。
+        """
+        ids, sigs = self._live()
+        n = len(ids)
+        parent = list(range(n))
+
+        def find(x: int) -> int:
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        if n:
+            keys = band_keys(sigs)
+            for b in range(BANDS):
+                order = np.argsort(keys[:, b], kind="stable")
+                col = keys[order, b]
+                starts = np.flatnonzero(np.r_[True, col[1:] != col[:-1]])
+                ends = np.r_[starts[1:], n]
+                for s, e in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+                    group = order[s:e]
+                    rep = group[0]
+                    ok = group[1:][similarity(sigs[rep], sigs[group[1:]]) >= threshold]
+                    ra = find(int(rep))
+                    for m in ok:
+                        rb = find(int(m))
+                        if rb != ra:
+                            parent[rb] = ra
+
+        groups: Dict[int, List[int]] = {}
+        for i in range(n):
+            groups.setdefault(find(i), []).append(i)
+        out = []
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            sims = similarity(sigs[members[0]], sigs[members[1:]])
+            out.append(([ids[i] for i in members], float(sims.min())))
+        out.sort(key=lambda g: -len(g[0]))
+        return out
+
+
+__all__ = ["MinHasher", "LSHIndex", "Matches", "band_keys", "similarity", "NUM_PERM", "BANDS", "ROWS"]
@@ -0,0 +1,440 @@
+# backend/app/services/partition_service.py
+# 把已有的 prompts 表在线改成按 user_id HASH 分区（PROMPTS_PARTITIONS），由 app.cli.partition 调用。
+# 每一步都可以重复执行，中断后重跑从断点继续（进度记在 prompts_partition_migration 表里）：
+#   prepare   prompt_versions 补 user_id；建空的分区表 prompts_new（含各分区）和同步触发器
+#   backfill  按 id keyset 分批 INSERT ... SELECT 复制旧表，每批一个短事务；复制期间的写入由触发器同步过去
+#   index     逐个分区 CREATE INDEX CONCURRENTLY 再挂到父表索引上，不阻塞触发器的写入
+#   cutover   一个短事务里锁旧表、两表改名互换、子表外键改成复合外键（NOT VALID，提交后再 VALIDATE）
+#   drop-old  确认无误后删掉改名后的旧表 prompts_unpartitioned
+# 只支持 Postgres（11+ 的 HASH 分区，引用分区表的外键需要 12+）
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import MetaData, select, text, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.schema import CreateIndex
+
+from app.db.session import get_engine
+from app.models.prompt import PROMPT_SEARCH_TSVECTOR, Prompt, partition_names, partitions_ddl
+
+logger = logging.getLogger(__name__)
+
+TABLE = "prompts"
+NEW = "prompts_new"
+OLD = "prompts_unpartitioned"
+STATE = "prompts_partition_migration"
+DELETED = "prompts_partition_deleted"  # 复制期间被删掉的行，复制完再从新表里删一遍
+SYNC = "prompts_partition_sync"  # 触发器和触发器函数同名
+CHILDREN = ("prompt_versions", "prompt_embeddings", "prompt_signatures")  # 引用 prompts.id 的表
+
+_ZERO = uuid.UUID(int=0)
+
+Progress = Optional[Callable[[Dict[str, Any]], Awaitable[None]]]
+
+
+class PartitionMigrationError(Exception):
+    pass
+
+
+# ==== 查询目录 ====
+async def _exists(conn: AsyncConnection, name: str) -> bool:
+    return (await conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})).scalar()
+
+
+async def _is_partitioned(conn: AsyncConnection, name: str) -> bool:
+    return (await conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:name))"
+    ), {"name": name})).scalar()
+
+
+async def _partitions(conn: AsyncConnection, name: str) -> List[str]:
+    res = await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:name) ORDER BY c.relname"
+    ), {"name": name})
+    return [r[0] for r in res]
+
+
+async def _columns(conn: AsyncConnection, name: str) -> List[str]:
+    res = await conn.execute(text(
+        "SELECT attname FROM pg_attribute WHERE attrelid = to_regclass(:name) AND attnum > 0 AND NOT attisdropped "
+        "ORDER BY attnum"
+    ), {"name": name})
+    return [r[0] for r in res]
+
+
+async def _state(conn: AsyncConnection, lock: bool = False) -> Optional[Dict[str, Any]]:
+    if not await _exists(conn, STATE):
+        return None
+    row = (await conn.execute(text(
+        f"SELECT partitions, step, last_id, copied FROM {STATE}" + (" FOR UPDATE" if lock else "")
+    ))).mappings().first()
+    return dict(row) if row else None
+
+
+async def _set_state(conn: AsyncConnection, **values: Any) -> None:
+    sets = ", ".join(f"{k} = :{k}" for k in values)
+    await conn.execute(text(f"UPDATE {STATE} SET {sets}, updated_at = now()"), values)
+
+
+def _quoted(cols: List[str]) -> str:
+    return ", ".join(f'"{c}"' for c in cols)
+
+
+async def status() -> Dict[str, Any]:
+    async with get_engine().connect() as conn:
+        est = await conn.execute(text(
+            "SELECT relname, reltuples::bigint FROM pg_class WHERE relname IN (:a, :b, :c) AND relkind IN ('r', 'p')"
+        ), {"a": TABLE, "b": NEW, "c": OLD})
+        return {
+            "partitioned": await _is_partitioned(conn, TABLE),
+            "partitions": await _partitions(conn, TABLE),
+            "migration": await _state(conn),
+            # 分区表父表的 reltuples 为 -1 / 0，以 ANALYZE 之后各分区之和为准
+            "estimated_rows": {name: n for name, n in est},
+        }
+
+
+# ==== prepare ====
+async def prepare(partitions: int) -> Dict[str, Any]:
+    if partitions < 2:
+        raise PartitionMigrationError("partitions 至少为 2")
+    engine = get_engine()
+    if engine.dialect.name != "postgresql":
+        raise PartitionMigrationError("只支持 Postgres")
+    async with engine.begin() as conn:
+        state = await _state(conn)
+        if state is not None:
+            if state["partitions"] != partitions:
+                raise PartitionMigrationError(
+                    f"已有一次进行中的迁移（{state['partitions']} 个分区），先 abort 再换分区数"
+                )
+            return state
+        if await _is_partitioned(conn, TABLE):
+            raise PartitionMigrationError(f"{TABLE} 已经是分区表")
+        cols = await _columns(conn, TABLE)
+        # 给旧表加触发器要短暂的 SHARE ROW EXCLUSIVE 锁，拿不到就失败重试，不在长事务后面排队把写入都堵住
+        await conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+        await conn.execute(text("ALTER TABLE prompt_versions ADD COLUMN IF NOT EXISTS user_id uuid"))
+        await conn.execute(text(
+            f"CREATE TABLE {NEW} (LIKE {TABLE} INCLUDING DEFAULTS) PARTITION BY HASH (user_id)"
+        ))
+        await conn.execute(text(f"ALTER TABLE {NEW} ADD CONSTRAINT {NEW}_pkey PRIMARY KEY (id, user_id)"))
+        await conn.execute(text(
+            f"ALTER TABLE {NEW} ADD CONSTRAINT {NEW}_user_id_fkey "
+            "FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE"
+        ))
+        for ddl in partitions_ddl(NEW, partitions):
+            await conn.execute(text(ddl))
+        await conn.execute(text(
+            f"CREATE TABLE {DELETED} (id uuid NOT NULL, user_id uuid NOT NULL, PRIMARY KEY (id, user_id))"
+        ))
+        await conn.execute(text(_sync_function_sql(cols)))
+        await conn.execute(text(
+            f"CREATE TRIGGER {SYNC} AFTER INSERT OR UPDATE OR DELETE ON {TABLE} "
+            f"FOR EACH ROW EXECUTE FUNCTION {SYNC}()"
+        ))
+        await conn.execute(text(
+            f"CREATE TABLE {STATE} (partitions int NOT NULL, step text NOT NULL, last_id uuid, "
+            "copied bigint NOT NULL DEFAULT 0, updated_at timestamp NOT NULL DEFAULT now())"
+        ))
+        await conn.execute(text(f"INSERT INTO {STATE} (partitions, step) VALUES (:n, 'prepared')"), {"n": partitions})
+        return await _state(conn)
+
+
+def _sync_function_sql(cols: List[str]) -> str:
+    """
+    旧表每行变更同步到新表。新表用 upsert：和 backfill 的 INSERT ... ON CONFLICT DO NOTHING 并发时，
+    不管谁先写，最后留下的都是较新的一版。删除额外记到 DELETED，backfill 可能在删除之后又把旧快照复制过去
+    """
+    values = ", ".join(f'NEW."{c}"' for c in cols)
+    sets = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in cols if c not in ("id", "user_id"))
+    return f"""
+CREATE OR REPLACE FUNCTION {SYNC}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND (OLD.id, OLD.user_id) IS DISTINCT FROM (NEW.id, NEW.user_id)) THEN
+        DELETE FROM {NEW} WHERE id = OLD.id AND user_id = OLD.user_id;
+        INSERT INTO {DELETED} (id, user_id) VALUES (OLD.id, OLD.user_id) ON CONFLICT DO NOTHING;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        INSERT INTO {NEW} ({_quoted(cols)}) VALUES ({values})
+        ON CONFLICT (id, user_id) DO UPDATE SET {sets};
+    END IF;
+    RETURN NULL;
+END $$"""
+
+
+async def backfill_versions(batch_size: int = 5000, progress: Progress = None) -> int:
+    """prompt_versions.user_id 为空的旧行从 prompts 回填；按主键 keyset 扫描，每批一个短事务"""
+    after_id, after_version, filled = _ZERO, -1, 0
+    while True:
+        async with get_engine().begin() as conn:
+            row = (await conn.execute(text(f"""
+                WITH b AS (
+                    SELECT prompt_id, version FROM prompt_versions
+                    WHERE (prompt_id, version) > (:pid, :ver)
+                    ORDER BY prompt_id, version LIMIT :n
+                ), u AS (
+                    UPDATE prompt_versions v SET user_id = p.user_id
+                    FROM b, {TABLE} p
+                    WHERE v.prompt_id = b.prompt_id AND v.version = b.version AND v.user_id IS NULL AND p.id = v.prompt_id
+                    RETURNING 1
+                )
+                SELECT b.prompt_id, b.version, (SELECT count(*) FROM u) AS filled
+                FROM b ORDER BY b.prompt_id DESC, b.version DESC LIMIT 1
+            """), {"pid": after_id, "ver": after_version, "n": batch_size})).first()
+        if row is None:
+            return filled
+        after_id, after_version = row.prompt_id, row.version
+        filled += row.filled
+        if progress:
+            await progress({"step": "versions", "filled": filled})
+
+
+# ==== backfill ====
+async def _reconcile_deleted(conn: AsyncConnection) -> int:
+    res = await conn.execute(text(f"""
+        DELETE FROM {NEW} n USING {DELETED} d
+        WHERE n.id = d.id AND n.user_id = d.user_id
+          AND NOT EXISTS (SELECT 1 FROM {TABLE} p WHERE p.id = d.id AND p.user_id = d.user_id)
+    """))
+    return res.rowcount
+
+
+async def backfill(batch_size: int = 5000, pause_seconds: float = 0.0, progress: Progress = None) -> Dict[str, Any]:
+    """
+    按 id 顺序分批复制，每批一个短事务（只锁住这一批读到的行的插入冲突），进度写进 STATE，中断后从 last_id 继续。
+    pause_seconds 为批间停顿，给线上负载让路
+    """
+    async with get_engine().connect() as conn:
+        cols = _quoted(await _columns(conn, TABLE))
+    while True:
+        async with get_engine().begin() as conn:
+            state = await _state(conn, lock=True)
+            if state is None:
+                raise PartitionMigrationError("还没有 prepare")
+            if state["step"] != "prepared":
+                return state
+            row = (await conn.execute(text(f"""
+                WITH b AS (SELECT {cols} FROM {TABLE} WHERE id > :after ORDER BY id LIMIT :n),
+                     ins AS (INSERT INTO {NEW} ({cols}) SELECT {cols} FROM b ON CONFLICT (id, user_id) DO NOTHING RETURNING 1)
+                SELECT (SELECT id FROM b ORDER BY id DESC LIMIT 1) AS last_id, (SELECT count(*) FROM ins) AS copied
+            """), {"after": state["last_id"] or _ZERO, "n": batch_size})).one()
+            if row.last_id is None:
+                await _reconcile_deleted(conn)
+                await _set_state(conn, step="backfilled")
+                return await _state(conn)
+            await _set_state(conn, last_id=row.last_id, copied=state["copied"] + row.copied)
+        if progress:
+            await progress({"step": "backfill", "last_id": str(row.last_id), "copied": state["copied"] + row.copied})
+        if pause_seconds:
+            await asyncio.sleep(pause_seconds)
+
+
+# ==== index ====
+def _index_sql(index_name: str, table: str, name: str, *, only: bool = False, concurrently: bool = False) -> str:
+    """按模型里的索引定义生成建在 table 上、名为 name 的 CREATE INDEX"""
+    copy = Prompt.__table__.to_metadata(MetaData(), name=table)
+    idx = next(i for i in copy.indexes if i.name == index_name)
+    idx.name = name
+    idx.dialect_options["postgresql"]["concurrently"] = concurrently
+    sql = str(CreateIndex(idx, if_not_exists=True).compile(dialect=postgresql.dialect()))
+    return sql.replace(f" ON {table} ", f" ON ONLY {table} ") if only else sql
+
+
+async def build_indexes(progress: Progress = None) -> Dict[str, Any]:
+    """
+    父表上先建 ON ONLY 的空壳索引（无效状态），每个分区 CONCURRENTLY 建好后 ATTACH，全部挂上后父表索引自动生效。
+    CONCURRENTLY 中途失败会留下无效索引，重跑时先删掉再建
+    """
+    engine = get_engine()
+    async with engine.connect() as conn:
+        state = await _state(conn)
+        if state is None or state["step"] not in ("backfilled", "indexed"):
+            raise PartitionMigrationError(f"当前步骤是 {state and state['step']}，需要先完成 backfill")
+        partitions = partition_names(NEW, state["partitions"])
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for index in sorted(Prompt.__table__.indexes, key=lambda i: i.name):
+            parent = f"{index.name}_new"
+            await conn.execute(text(_index_sql(index.name, NEW, parent, only=True)))
+            for i, part in enumerate(partitions):
+                name = f"{index.name}_p{i}"
+                valid = (await conn.execute(text(
+                    "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"
+                ), {"name": name})).scalar()
+                if valid is False:
+                    await conn.execute(text(f"DROP INDEX CONCURRENTLY {name}"))
+                await conn.execute(text(_index_sql(index.name, part, name, concurrently=True)))
+                await conn.execute(text(f"ALTER INDEX {parent} ATTACH PARTITION {name}"))
+                if progress:
+                    await progress({"step": "index", "index": name})
+        await conn.execute(text(f"ANALYZE {NEW}"))
+    async with engine.begin() as conn:
+        await _set_state(conn, step="indexed")
+        return await _state(conn)
+
+
+# ==== cutover ====
+async def _child_fks(conn: AsyncConnection, table: str) -> List[Dict[str, str]]:
+    res = await conn.execute(text(
+        "SELECT conrelid::regclass::text AS child, conname FROM pg_constraint "
+        "WHERE contype = 'f' AND confrelid = to_regclass(:name)"
+    ), {"name": table})
+    return [dict(r) for r in res.mappings()]
+
+
+async def cutover(lock_timeout_seconds: float = 5.0, verify_counts: bool = False) -> Dict[str, Any]:
+    """
+    持 ACCESS EXCLUSIVE 锁的事务里只做目录操作（改名、删 / 加约束），不随数据量变长；
+    verify_counts 会在锁内两边各 count(*) 一次，大表上会明显拉长停写时间
+    """
+    async with get_engine().begin() as conn:
+        state = await _state(conn, lock=True)
+        if state is None or state["step"] != "indexed":
+            raise PartitionMigrationError(f"当前步骤是 {state and state['step']}，需要先完成 index")
+        n = state["partitions"]
+        await conn.execute(text(f"SET LOCAL lock_timeout = '{int(lock_timeout_seconds * 1000)}ms'"))
+        await conn.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+        await _reconcile_deleted(conn)
+        if verify_counts:
+            old_n = (await conn.execute(text(f"SELECT count(*) FROM {TABLE}"))).scalar()
+            new_n = (await conn.execute(text(f"SELECT count(*) FROM {NEW}"))).scalar()
+            if old_n != new_n:
+                raise PartitionMigrationError(f"行数不一致：{TABLE}={old_n} {NEW}={new_n}")
+        await conn.execute(text(f"DROP TRIGGER {SYNC} ON {TABLE}"))
+        await conn.execute(text(f"DROP FUNCTION {SYNC}()"))
+        for fk in await _child_fks(conn, TABLE):
+            await conn.execute(text(f'ALTER TABLE {fk["child"]} DROP CONSTRAINT "{fk["conname"]}"'))
+
+        # 旧表及其索引（含主键）加后缀让出名字
+        old_indexes = (await conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :t"
+        ), {"t": TABLE})).scalars().all()
+        for name in old_indexes:
+            await conn.execute(text(f'ALTER INDEX "{name}" RENAME TO "{name[:59]}_old"'))
+        await conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {OLD}"))
+
+        await conn.execute(text(f"ALTER TABLE {NEW} RENAME TO {TABLE}"))
+        await conn.execute(text(f"ALTER INDEX {NEW}_pkey RENAME TO {TABLE}_pkey"))
+        await conn.execute(text(f"ALTER TABLE {TABLE} RENAME CONSTRAINT {NEW}_user_id_fkey TO {TABLE}_user_id_fkey"))
+        for old_name, new_name in zip(partition_names(NEW, n), partition_names(TABLE, n)):
+            await conn.execute(text(f"ALTER TABLE {old_name} RENAME TO {new_name}"))
+            await conn.execute(text(f"ALTER INDEX {old_name}_pkey RENAME TO {new_name}_pkey"))
+        for index in Prompt.__table__.indexes:
+            await conn.execute(text(f"ALTER INDEX {index.name}_new RENAME TO {index.name}"))
+
+        # 子表改成复合外键；NOT VALID 不扫描子表，提交后再单独 VALIDATE
+        for child in CHILDREN:
+            await conn.execute(text(
+                f"ALTER TABLE {child} ADD CONSTRAINT {child}_prompt_id_user_id_fkey "
+                f"FOREIGN KEY (prompt_id, user_id) REFERENCES {TABLE} (id, user_id) ON DELETE CASCADE NOT VALID"
+            ))
+        await _set_state(conn, step="cutover")
+    return await finish()
+
+
+async def finish(progress: Progress = None) -> Dict[str, Any]:
+    """
+    切换后：回填切换前后由旧版本代码写入、user_id 为空的历史版本，再 VALIDATE 子表外键（只加 SHARE UPDATE EXCLUSIVE 锁）
+    """
+    await backfill_versions(progress=progress)
+    for child in CHILDREN:
+        async with get_engine().begin() as conn:
+            await conn.execute(text(f"ALTER TABLE {child} VALIDATE CONSTRAINT {child}_prompt_id_user_id_fkey"))
+    async with get_engine().begin() as conn:
+        await _set_state(conn, step="done")
+        return await _state(conn)
+
+
+async def drop_old() -> None:
+    async with get_engine().begin() as conn:
+        state = await _state(conn)
+        if state is None or state["step"] != "done":
+            raise PartitionMigrationError(f"当前步骤是 {state and state['step']}，迁移完成之后才能删旧表")
+        await conn.execute(text(f"DROP TABLE {OLD}"))
+        await conn.execute(text(f"DROP TABLE {DELETED}"))
+        await conn.execute(text(f"DROP TABLE {STATE}"))
+
+
+async def abort() -> None:
+    """切换之前放弃迁移：删掉触发器和新表，旧表不受影响（prompt_versions.user_id 列保留）"""
+    async with get_engine().begin() as conn:
+        state = await _state(conn)
+        if state is not None and state["step"] in ("cutover", "done"):
+            raise PartitionMigrationError("已经切换过，不能 abort")
+        await conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+        await conn.execute(text(f"DROP TRIGGER IF EXISTS {SYNC} ON {TABLE}"))
+        await conn.execute(text(f"DROP FUNCTION IF EXISTS {SYNC}()"))
+        for name in (NEW, DELETED, STATE):
+            await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+
+
+async def migrate(partitions: int, batch_size: int = 5000, pause_seconds: float = 0.0,
+                  lock_timeout_seconds: float = 5.0, verify_counts: bool = False, progress: Progress = None) -> Dict[str, Any]:
+    """从当前进度一直做到 cutover 完成（不删旧表）"""
+    state = await prepare(partitions)
+    if state["step"] == "prepared":
+        await backfill_versions(batch_size, progress)
+        state = await backfill(batch_size, pause_seconds, progress)
+    if state["step"] in ("backfilled", "indexed"):
+        state = await build_indexes(progress)
+    if state["step"] == "indexed":
+        state = await cutover(lock_timeout_seconds, verify_counts)
+    if state["step"] == "cutover":
+        state = await finish(progress)
+    return state
+
+
+# ==== 分区裁剪检查 ====
+def _relations(plan: Dict[str, Any]) -> List[str]:
+    out = [plan["Relation Name"]] if "Relation Name" in plan else []
+    for child in plan.get("Plans", ()):
+        out.extend(_relations(child))
+    return out
+
+
+async def scanned_relations(conn: AsyncConnection, stmt) -> List[str]:
+    """EXPLAIN 语句（参数按字面量内联，走计划期裁剪），返回计划里出现的表（分区）名"""
+    sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    plan = (await conn.execute(text("EXPLAIN (FORMAT JSON) " + sql))).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return _relations(plan[0]["Plan"])
+
+
+async def check_pruning(user_id: Optional[uuid.UUID] = None) -> List[Dict[str, Any]]:
+    """
+    对按用户的典型查询跑 EXPLAIN，确认每条都只扫一个分区。
+    user_id 不给时取表里任意一个用户；返回每条查询扫描到的分区
+    """
+    async with get_engine().connect() as conn:
+        partitions = set(await _partitions(conn, TABLE))
+        if not partitions:
+            raise PartitionMigrationError(f"{TABLE} 不是分区表")
+        q = select(Prompt.id, Prompt.user_id)
+        if user_id is not None:
+            q = q.where(Prompt.user_id == user_id)
+        row = (await conn.execute(q.limit(1))).first()
+        if row is None:
+            raise PartitionMigrationError("prompts 里没有数据")
+        prompt_id, user_id = row
+        queries = {
+            "list": select(Prompt.id).where(Prompt.user_id == user_id)
+            .order_by(Prompt.updated_at.desc(), Prompt.id.desc()).limit(20),
+            "search": select(Prompt.id).where(
+                Prompt.user_id == user_id, text(f"{PROMPT_SEARCH_TSVECTOR} @@ plainto_tsquery('english', 'email')")
+            ).limit(20),
+            "get": select(Prompt).where(Prompt.id == prompt_id, Prompt.user_id == user_id),
+            "update": update(Prompt).where(Prompt.id == prompt_id, Prompt.user_id == user_id)
+            .values(usage_count=Prompt.usage_count + 1, updated_at=Prompt.updated_at),
+        }
+        out = []
+        for name, stmt in queries.items():
+            scanned = sorted({r for r in await scanned_relations(conn, stmt) if r in partitions})
+            out.append({"query": name, "partitions": scanned, "pruned": len(scanned) == 1})
+        return out
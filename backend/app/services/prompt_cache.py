@@ -0,0 +1,208 @@
+# backend/app/services/prompt_cache.py
+# get_prompt_content 的读穿透缓存：按 (prompt_id, version) 缓存已经序列化好的响应字节
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Protocol, Tuple
+
+from app.core.config import get_settings
+from app.core.instrumentation import register_gauges
+
+
+class CacheTier(Protocol):
+    """可插拔的二级缓存（多个 uvicorn worker 共享），例如 Redis / memcached 的薄封装"""
+
+    async def get(self, key: str) -> Optional[bytes]: ...
+
+    async def set(self, key: str, value: bytes) -> None: ...
+
+    async def delete(self, key: str) -> None: ...
+
+
+class LocalMemoryTier:
+    """进程内的二级缓存替身，只用于测试 / 单进程部署"""
+
+    def __init__(self):
+        self._data: Dict[str, bytes] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._data.get(key)
+
+    async def set(self, key: str, value: bytes) -> None:
+        self._data[key] = value
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+
+def _entry_key(prompt_id: uuid.UUID, version: int) -> str:
+    return f"prompt:{prompt_id}:v{version}"
+
+
+def _version_key(prompt_id: uuid.UUID) -> str:
+    return f"prompt:{prompt_id}:ver"
+
+
+class PromptContentCache:
+    """
+    一级：进程内 LRU，按字节数限额（而不是条数），key = (prompt_id, version)。
+    另外维护 prompt_id -> 当前 version 的指针；指针有 TTL，过期后回源确认，
+    这样别的 worker 改了提示词，本进程最多在 TTL 内读到旧版本。
+    二级（可选）：共享缓存，存条目本身和版本指针。
+    条目值 = 36 字节的 owner user_id + 响应 JSON 字节，命中时校验归属，防止跨用户读取。
+    usage_count 不改 version，缓存的字节里 metadata.usage_count 停在写入缓存时的值，直到提示词下次修改。
+    """
+
+    _OWNER_LEN = 36
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        version_ttl_seconds: float = 30.0,
+        enabled: bool = True,
+        second_tier: Optional[CacheTier] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.version_ttl_seconds = version_ttl_seconds
+        self.enabled = enabled
+        self.second_tier = second_tier
+        self._entries: "OrderedDict[Tuple[uuid.UUID, int], bytes]" = OrderedDict()
+        self._versions: Dict[uuid.UUID, Tuple[int, float]] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.tier2_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ---- 一级缓存 ----
+    def _l1_put(self, key: Tuple[uuid.UUID, int], value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = value
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _l1_drop_prompt(self, prompt_id: uuid.UUID) -> None:
+        # 只删指针指向的那一版；更早的版本不会再被查到，交给 LRU 淘汰
+        ptr = self._versions.pop(prompt_id, None)
+        if ptr is not None:
+            old = self._entries.pop((prompt_id, ptr[0]), None)
+            if old is not None:
+                self._bytes -= len(old)
+
+    def _unwrap(self, value: bytes, user_id: uuid.UUID) -> Optional[bytes]:
+        if value[: self._OWNER_LEN].decode() != str(user_id):
+            return None
+        return value[self._OWNER_LEN:]
+
+    async def _current_version(self, prompt_id: uuid.UUID) -> Optional[int]:
+        ptr = self._versions.get(prompt_id)
+        if ptr is not None and time.monotonic() - ptr[1] < self.version_ttl_seconds:
+            return ptr[0]
+        if self.second_tier is not None:
+            raw = await self.second_tier.get(_version_key(prompt_id))
+            if raw is not None:
+                version = int(raw)
+                self._versions[prompt_id] = (version, time.monotonic())
+                return version
+        return None
+
+    # ---- 对外接口 ----
+    async def get(self, prompt_id: uuid.UUID, user_id: uuid.UUID) -> Optional[bytes]:
+        """命中返回响应 JSON 字节；未命中 / 不属于该用户返回 None"""
+        if not self.enabled:
+            return None
+        version = await self._current_version(prompt_id)
+        if version is not None:
+            key = (prompt_id, version)
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                payload = self._unwrap(value, user_id)
+                if payload is not None:
+                    self.hits += 1
+                    return payload
+            elif self.second_tier is not None:
+                value = await self.second_tier.get(_entry_key(prompt_id, version))
+                if value is not None:
+                    self._l1_put(key, value)
+                    payload = self._unwrap(value, user_id)
+                    if payload is not None:
+                        self.tier2_hits += 1
+                        return payload
+        # 不属于该用户的条目按未命中算：调用方会回源并得到 404
+        self.misses += 1
+        return None
+
+    async def put(self, prompt_id: uuid.UUID, version: int, user_id: uuid.UUID, payload: bytes) -> None:
+        if not self.enabled:
+            return
+        value = str(user_id).encode() + payload
+        # 同一个 prompt 只保留当前版本
+        self._l1_drop_prompt(prompt_id)
+        self._versions[prompt_id] = (version, time.monotonic())
+        self._l1_put((prompt_id, version), value)
+        if self.second_tier is not None:
+            await self.second_tier.set(_entry_key(prompt_id, version), value)
+            await self.second_tier.set(_version_key(prompt_id), str(version).encode())
+
+    async def invalidate(self, prompt_id: uuid.UUID) -> None:
+        """写操作后调用：旧版本条目随 version 变化自然失效，这里把指针一并删掉"""
+        self._l1_drop_prompt(prompt_id)
+        if self.second_tier is not None:
+            await self.second_tier.delete(_version_key(prompt_id))
+
+    def evict_stale(self, prompt_id: uuid.UUID, version: Optional[int]) -> bool:
+        """
+        其它 worker 改了提示词（失效总线）：本进程的指针比 version 旧才删，只动一级缓存
+        （二级是共享的，写入方已经删过）。version 为 None 时无条件删除。
+        """
+        ptr = self._versions.get(prompt_id)
+        if ptr is None or (version is not None and ptr[0] >= version):
+            return False
+        self._l1_drop_prompt(prompt_id)
+        return True
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._versions.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "tier2_hits": self.tier2_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def _build_cache() -> PromptContentCache:
+    settings = get_settings()
+    return PromptContentCache(
+        max_bytes=settings.PROMPT_CACHE_MAX_BYTES,
+        version_ttl_seconds=settings.PROMPT_CACHE_VERSION_TTL_SECONDS,
+        enabled=settings.PROMPT_CACHE_ENABLED,
+        second_tier=LocalMemoryTier() if settings.PROMPT_CACHE_SECOND_TIER == "memory" else None,
+    )
+
+
+prompt_cache = _build_cache()
+
+
+def _gauges() -> Dict[str, Any]:
+    s = prompt_cache.stats()
+    return {"prompt_cache_bytes": s["bytes"], "prompt_cache_hits": s["hits"], "prompt_cache_misses": s["misses"]}
+
+
+register_gauges("prompt_cache", _gauges)
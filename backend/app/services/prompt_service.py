@@ -1,19 +1,35 @@
 # backend/app/services/prompt_service.py
-from app.models.prompt import Prompt
-from app.schemas.prompt import PromptCreate
+from app.models.prompt import Prompt, PROMPT_SEARCH_TSVECTOR
+from app.schemas.prompt import PromptCreate, PromptUpdate
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, text
+from sqlalchemy import select, func, text, literal_column, tuple_, or_
+import base64
+import json
 import uuid
 from datetime import datetime
 
 #MCP
-from typing import List, Optional, Dict, Any 
+from typing import List, Optional, Dict, Any, AsyncIterator, Sequence, Tuple
 from fastapi import HTTPException
 from app.models.prompt import Prompt
+from app.services.usage_service import usage_aggregator
+from app.services.prompt_cache import prompt_cache
+from app.services.mcp_sessions import prompts_changed
+from app.services import cache_bus
+from app.db.replica import use_primary
+from app.services import tag_service, template_service, version_service
+import orjson
 
 
-#创建提示词
-async def create_prompt(db: AsyncSession, user_id: uuid.UUID, prompt_in: PromptCreate) -> Prompt:
+#创建提示词；dedupe_mode 为空时用 DEDUPE_MODE。疑似重复挂在返回对象的 duplicates 属性上（strict 时直接 409）
+async def create_prompt(
+    db: AsyncSession, user_id: uuid.UUID, prompt_in: PromptCreate, dedupe_mode: Optional[str] = None
+) -> Prompt:
+    from app.services import dedupe_service, embedding_service  # numpy 按需加载，见 main._LAZY_MODULES
+    mode = dedupe_service.resolve_mode(dedupe_mode)
+    signature, duplicates = await dedupe_service.check_content(db, user_id, prompt_in.content, mode)
+    # 写入时编译模板；未显式给出 variables 时用模板里解析出的变量
+    compiled = template_service.compile_template(prompt_in.content, version=1)
     new_prompt = Prompt(
         id=uuid.uuid4(),
         user_id=user_id,
@@ -22,75 +38,384 @@ async def create_prompt(db: AsyncSession, user_id: uuid.UUID, prompt_in: PromptC
         description=prompt_in.description,
         tags=prompt_in.tags,
         category=prompt_in.category,
-        variables=prompt_in.variables,
+        variables=prompt_in.variables or compiled.variables,
+        compiled_template=compiled.to_json(),
+        is_public=prompt_in.is_public,
+        version=1,
         created_at=datetime.utcnow(),
         updated_at=datetime.utcnow()
     )
     db.add(new_prompt)
+    # 标签分面计数、版本历史与提示词在同一个事务里写入
+    await tag_service.apply_prompt_change(db, user_id, None, (new_prompt.category, new_prompt.tags))
+    await version_service.record_version(db, new_prompt)
+    # session 关了 autoflush：先把 prompts 行写下去，下面向量 / 签名的 upsert 才不会违反外键
+    await db.flush()
+    embedded = await embedding_service.stage_embedding(db, new_prompt)
+    # 单次请求关掉检测（dedupe=off）时仍然维护签名，后续的检测和重复报告才完整
+    signed = None
+    if signature is not None or dedupe_service.enabled():
+        signed = await dedupe_service.stage_signature(db, new_prompt, signature)
+    await cache_bus.publish(db, cache_bus.prompt_changed(new_prompt.id, user_id, 1))
     await db.commit()
     await db.refresh(new_prompt)
+    for pending in (embedded, signed):
+        if pending is not None:
+            pending.apply()
+    new_prompt.duplicates = duplicates
+    prompts_changed(user_id)
     return new_prompt
 
 
+#更新提示词：有字段真正变化时 version + 1，写一条修订记录，并让内容缓存失效
+async def update_prompt(
+    db: AsyncSession, user_id: uuid.UUID, prompt_id: uuid.UUID, prompt_in: PromptUpdate
+) -> Prompt:
+    p = await get_user_prompt_or_404(db, user_id, prompt_id, for_update=True)
+    changes = {f: v for f, v in prompt_in.model_dump(exclude_unset=True).items() if getattr(p, f) != v}
+    if not changes:
+        # 空 PATCH 或值都没变：不升版本、不写历史、不失效缓存，结束事务放掉行锁即可
+        await db.commit()
+        return p
+    previous = version_service.snapshot_of(p)
+    old_facets = (p.category, list(p.tags or []))
+    for field, value in changes.items():
+        setattr(p, field, value)
+    await tag_service.apply_prompt_change(db, user_id, old_facets, (p.category, p.tags))
+    p.version = (p.version or 1) + 1
+    compiled = template_service.compile_template(p.content, version=p.version)
+    p.compiled_template = compiled.to_json()
+    if "content" in changes:
+        # 与 create_prompt 相同：改了正文又没给 variables 时，用新模板解析出的变量
+        p.variables = changes.get("variables") or compiled.variables
+    p.updated_at = datetime.utcnow()
+    await version_service.record_version(db, p, previous)
+    from app.services import dedupe_service, embedding_service
+    embedded = await embedding_service.stage_embedding(db, p)
+    signed = await dedupe_service.stage_signature(db, p) if dedupe_service.enabled() else None
+    await cache_bus.publish(db, cache_bus.prompt_changed(p.id, user_id, p.version))
+    await db.commit()
+    await db.refresh(p)
+    await prompt_cache.invalidate(p.id)
+    for pending in (embedded, signed):
+        if pending is not None:
+            pending.apply()
+    prompts_changed(user_id)
+    return p
+
+
+#删除提示词
+async def delete_prompt(db: AsyncSession, user_id: uuid.UUID, prompt_id: uuid.UUID) -> None:
+    p = await get_user_prompt_or_404(db, user_id, prompt_id)
+    await tag_service.apply_prompt_change(db, user_id, (p.category, p.tags), None)
+    await db.delete(p)
+    await cache_bus.publish(db, cache_bus.prompt_changed(prompt_id, user_id))
+    await db.commit()
+    await prompt_cache.invalidate(prompt_id)
+    from app.services import dedupe_service, embedding_service
+    embedding_service.forget(user_id, prompt_id)
+    dedupe_service.forget(user_id, prompt_id)
+    prompts_changed(user_id)
+
+
 #查询提示词列表（按用户）
 async def list_prompts(db: AsyncSession, user_id: uuid.UUID) -> list[Prompt]:
     result = await db.execute(select(Prompt).where(Prompt.user_id == user_id))
     return result.scalars().all()
 
+# ==== 列表分页（keyset） ====
+# 可选返回字段（与 PromptRead 一致）；列表页默认不带 content，需要时显式加上
+LIST_FIELDS = (
+    "id", "title", "content", "description", "tags", "category", "variables",
+    "version", "usage_count", "created_at", "updated_at",
+)
+LIST_DEFAULT_FIELDS = tuple(f for f in LIST_FIELDS if f != "content")
+_STREAM_YIELD_PER = 500
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """解析 ?fields=id,title,... ；未传时用默认字段"""
+    if not fields:
+        return LIST_DEFAULT_FIELDS
+    wanted = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in wanted if f not in LIST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return wanted
+
+
+def encode_cursor(updated_at: datetime, prompt_id: uuid.UUID) -> str:
+    raw = json.dumps([updated_at.isoformat(), str(prompt_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, pid = json.loads(raw)
+        return datetime.fromisoformat(ts), uuid.UUID(pid)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _list_stmt(user_id: uuid.UUID, fields: Sequence[str]):
+    # updated_at / id 是游标必需的列，总是查出来
+    cols = list(dict.fromkeys(("id", "updated_at") + tuple(fields)))
+    return (
+        select(*[getattr(Prompt, c) for c in cols])
+        .where(Prompt.user_id == user_id)
+        .order_by(Prompt.updated_at.desc(), Prompt.id.desc())
+    )
+
+
+def _row_to_item(row, fields: Sequence[str]) -> Dict[str, Any]:
+    item = {}
+    for f in fields:
+        v = getattr(row, f)
+        if isinstance(v, datetime):
+            v = v.isoformat()
+        elif isinstance(v, uuid.UUID):
+            v = str(v)
+        item[f] = v
+    return item
+
+
+async def list_prompts_page(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    fields: Sequence[str] = LIST_DEFAULT_FIELDS,
+) -> Dict[str, Any]:
+    """按 (updated_at, id) 倒序做 keyset 分页，走 idx_prompts_user_updated_id，深翻页也不用 OFFSET"""
+    q = _list_stmt(user_id, fields)
+    if cursor:
+        ts, pid = decode_cursor(cursor)
+        q = q.where(tuple_(Prompt.updated_at, Prompt.id) < tuple_(ts, pid))
+    # 多取一条用来判断是否还有下一页
+    res = await db.execute(q.limit(limit + 1))
+    rows = res.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.updated_at, last.id)
+
+    return {
+        "items": [_row_to_item(r, fields) for r in rows],
+        "next_cursor": next_cursor,
+    }
+
+
+async def stream_prompts(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    fields: Sequence[str] = LIST_DEFAULT_FIELDS,
+) -> AsyncIterator[Dict[str, Any]]:
+    """服务端游标流式读取，内存占用与总行数无关（用于 NDJSON 全量导出）"""
+    q = _list_stmt(user_id, fields).execution_options(yield_per=_STREAM_YIELD_PER)
+    result = await db.stream(q)
+    async for row in result:
+        yield _row_to_item(row, fields)
+
+
 #查询单个提示词
 async def get_prompt_by_id(db: AsyncSession, prompt_id: uuid.UUID) -> Prompt | None:
     result = await db.execute(select(Prompt).where(Prompt.id == prompt_id))
     return result.scalar_one_or_none()
 
+#查询当前用户的单个提示词，不存在（或不属于该用户）抛 404
+async def get_user_prompt_or_404(
+    db: AsyncSession, user_id: uuid.UUID, prompt_id: uuid.UUID, for_update: bool = False
+) -> Prompt:
+    q = select(Prompt).where(Prompt.id == prompt_id, Prompt.user_id == user_id)
+    if for_update:
+        # 行锁到本事务提交：并发修改排队，各自在最新版本上 +1（否则会撞同一个 PromptVersion 主键）
+        q = q.with_for_update().execution_options(populate_existing=True)
+    p = (await db.execute(q)).scalar_one_or_none()
+    if not p and use_primary(db):
+        p = (await db.execute(q)).scalar_one_or_none()  # 只读 session：副本上可能还没复制过来
+    if not p:
+        raise HTTPException(status_code=404, detail="Prompt not found")
+    return p
+
 
 
 # MCP 相关服务实现
 
-# 列出用户可用的提示词
-async def mcp_list_available_prompts(
-    db: AsyncSession,
-    user_id: uuid.UUID,
-    tags: Optional[List[str]],
-    search: Optional[str],
-    limit: int,
-    category: Optional[str]
-) -> Dict[str, Any]:
-    q = select(Prompt).where(
-        Prompt.user_id == user_id
+# 搜索模式：
+#   fulltext - 走 idx_prompts_search（to_tsvector），ts_rank_cd 排序，ts_headline 高亮
+#   trigram  - 走 pg_trgm 三元组索引，适合短查询和中文等非英文查询
+#   like     - 旧的 ILIKE 模糊匹配（保留用于对比）
+#   auto     - 根据查询内容在 fulltext / trigram 之间自动选择
+SEARCH_MODES = ("auto", "fulltext", "trigram", "like")
+
+_FTS_MIN_QUERY_LEN = 3
+_HEADLINE_OPTIONS = "MaxWords=35, MinWords=15, MaxFragments=2, StartSel=<b>, StopSel=</b>"
+_SNIPPET_RADIUS = 40
+
+# 常量必须内联，不能作为绑定参数，否则与索引表达式不一致
+_TS_CONFIG = literal_column("'english'")
+_search_vector = literal_column(PROMPT_SEARCH_TSVECTOR)
+
+
+def _resolve_search_mode(search: str, search_mode: str) -> str:
+    if search_mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid search_mode: {search_mode}")
+    if search_mode != "auto":
+        return search_mode
+    q = search.strip()
+    if len(q) >= _FTS_MIN_QUERY_LEN and q.isascii() and any(c.isalpha() for c in q):
+        return "fulltext"
+    return "trigram"
+
+
+def _like_pattern(search: str) -> str:
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _plain_snippet(content: str, search: str) -> str:
+    # trigram 模式下没有 ts_headline，简单截取命中位置前后的一段
+    content = content or ""
+    pos = content.lower().find(search.lower())
+    if pos < 0:
+        return content[: _SNIPPET_RADIUS * 2]
+    start = max(pos - _SNIPPET_RADIUS, 0)
+    end = min(pos + len(search) + _SNIPPET_RADIUS, len(content))
+    return (
+        ("…" if start > 0 else "")
+        + content[start:pos]
+        + "<b>" + content[pos:pos + len(search)] + "</b>"
+        + content[pos + len(search):end]
+        + ("…" if end < len(content) else "")
     )
 
+
+def _apply_filters(q, user_id: uuid.UUID, tags: Optional[List[str]], category: Optional[str]):
+    q = q.where(Prompt.user_id == user_id)
     if tags:
         # PostgreSQL ARRAY overlap：数组有交集即匹配
         q = q.where(Prompt.tags.op("&&")(tags))
-
     if category:
         q = q.where(Prompt.category == category)
+    return q
+
+
+async def _search_fulltext(db, user_id, tags, search, limit, category):
+    tsquery = func.websearch_to_tsquery(_TS_CONFIG, search)
+    rank = func.ts_rank_cd(_search_vector, tsquery).label("rank")
+
+    # 先在索引上匹配 + 排序 + limit，再只对前 N 条计算 ts_headline（它比较贵）
+    top = _apply_filters(select(Prompt.id, rank), user_id, tags, category)
+    top = (
+        top.where(_search_vector.op("@@")(tsquery))
+        .order_by(rank.desc(), Prompt.usage_count.desc())
+        .limit(limit)
+        .subquery()
+    )
+    headline = func.ts_headline(_TS_CONFIG, Prompt.content, tsquery, _HEADLINE_OPTIONS)
+    q = (
+        select(Prompt, top.c.rank, headline)
+        .join(top, Prompt.id == top.c.id)
+        .order_by(top.c.rank.desc(), Prompt.usage_count.desc())
+    )
+    res = await db.execute(q)
+    return [(p, float(r), snippet) for p, r, snippet in res.all()]
+
 
-    if search:
-        # 简化的模糊匹配；若要全文检索可换成 to_tsvector/ts_rank
-        like = f"%{search}%"
-        q = q.where((Prompt.title.ilike(like)) | (Prompt.content.ilike(like)))
+async def _search_trigram(db, user_id, tags, search, limit, category):
+    like = _like_pattern(search)
+    score = func.greatest(
+        func.similarity(Prompt.title, search),
+        func.word_similarity(search, Prompt.content),
+    ).label("rank")
+    q = _apply_filters(select(Prompt, score), user_id, tags, category)
+    q = (
+        q.where(Prompt.title.ilike(like, escape="\\") | Prompt.content.ilike(like, escape="\\"))
+        .order_by(score.desc(), Prompt.usage_count.desc())
+        .limit(limit)
+    )
+    res = await db.execute(q)
+    return [(p, float(r), _plain_snippet(p.content, search)) for p, r in res.all()]
 
+
+async def _search_like(db, user_id, tags, search, limit, category):
+    # 旧实现：顺序扫描所有正文
+    like = f"%{search}%"
+    q = _apply_filters(select(Prompt), user_id, tags, category)
+    q = q.where((Prompt.title.ilike(like)) | (Prompt.content.ilike(like)))
     q = q.order_by(Prompt.usage_count.desc()).limit(limit)
     res = await db.execute(q)
-    rows = res.scalars().all()
+    return [(p, None, None) for p in res.scalars().all()]
+
 
+async def _list_by_usage(db, user_id, tags, limit, category) -> List[Prompt]:
+    # 先从部分索引 idx_prompts_user_usage_used 取用过的提示词，
+    # 不够 limit 条再用从未使用过的（按更新时间）补齐
+    used_q = _apply_filters(select(Prompt), user_id, tags, category)
+    used_q = (
+        used_q.where(Prompt.usage_count > 0)
+        .order_by(Prompt.usage_count.desc(), Prompt.id)
+        .limit(limit)
+    )
+    rows = list((await db.execute(used_q)).scalars().all())
+    if len(rows) < limit:
+        unused_q = _apply_filters(select(Prompt), user_id, tags, category)
+        unused_q = (
+            unused_q.where(or_(Prompt.usage_count == 0, Prompt.usage_count.is_(None)))
+            .order_by(Prompt.updated_at.desc(), Prompt.id.desc())
+            .limit(limit - len(rows))
+        )
+        rows.extend((await db.execute(unused_q)).scalars().all())
+    return rows
+
+
+# 列出用户可用的提示词
+async def mcp_list_available_prompts(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    tags: Optional[List[str]],
+    search: Optional[str],
+    limit: int,
+    category: Optional[str],
+    search_mode: str = "auto",
+) -> Dict[str, Any]:
+    if search and search.strip():
+        mode = _resolve_search_mode(search, search_mode)
+        searcher = {
+            "fulltext": _search_fulltext,
+            "trigram": _search_trigram,
+            "like": _search_like,
+        }[mode]
+        rows = await searcher(db, user_id, tags, search.strip(), limit, category)
+    else:
+        rows = [(p, None, None) for p in await _list_by_usage(db, user_id, tags, limit, category)]
+
+    # 结构化列表和可读文本在同一次遍历里生成
     items = []
-    for p in rows:
-        items.append({
-            "id": str(p.id),
+    lines = []
+    for p, rank, snippet in rows:
+        pid = str(p.id)
+        item = {
+            "id": pid,
             "title": p.title,
             "tags": p.tags or [],
             "description": p.description,
             "category": p.category,
             "created_at": p.created_at.isoformat() if p.created_at else None,
             "usage_count": p.usage_count or 0
-        })
+        }
+        if rank is not None:
+            item["rank"] = rank
+        if snippet is not None:
+            item["snippet"] = snippet
+        items.append(item)
+        lines.append(f"• {p.title} (ID: {pid})")
 
     # MCP 期望的 result.content 可返回“可读文本”，同时附带结构化数据
-    readable = "找到 {} 个匹配的提示词:\n".format(len(items)) + "\n".join(
-        [f"• {x['title']} (ID: {x['id']})" for x in items]
-    )
+    readable = "找到 {} 个匹配的提示词:\n".format(len(items)) + "\n".join(lines)
 
     return {
         "content": [{"type": "text", "text": readable}],
@@ -99,25 +424,23 @@ async def mcp_list_available_prompts(
     }
 
 
-async def mcp_get_prompt_content(
-    db: AsyncSession,
-    user_id: uuid.UUID,
-    prompt_id: str
-) -> Dict[str, Any]:
-    try:
-        pid = uuid.UUID(prompt_id)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid prompt_id")
+def _compiled_for(p: Prompt) -> template_service.CompiledTemplate:
+    """取提示词当前版本的编译模板：进程内缓存 -> compiled_template 列 -> 现场编译"""
+    version = p.version or 1
+    tpl = template_service.memo_get(p.id, version)
+    if tpl is None:
+        stored = p.compiled_template
+        if stored and stored.get("v") == version:
+            tpl = template_service.CompiledTemplate.from_json(stored)
+        else:
+            # 老数据没有编译结果（或已过期）：首次使用时编译，由调用方决定是否回写
+            tpl = template_service.compile_template(p.content, version=version)
+        template_service.memo_put(p.id, tpl)
+    return tpl
 
-    q = select(Prompt).where(Prompt.id == pid, Prompt.user_id == user_id)
-    res = await db.execute(q)
-    p = res.scalar_one_or_none()
-    if not p:
-        raise HTTPException(status_code=404, detail="Prompt not found")
 
-    # 简单变量提取 {{var}}（可在后续替换为更健壮实现）
-    import re
-    variables = sorted(list(set(re.findall(r"\{\{(\w+)\}\}", p.content or ""))))
+def _build_prompt_content(p: Prompt) -> Dict[str, Any]:
+    variables = sorted(_compiled_for(p).variables)
 
     readable = f"提示词: {p.title}\n\n{p.content}"
 
@@ -138,4 +461,85 @@ async def mcp_get_prompt_content(
                 "usage_count": p.usage_count or 0
             }
         }
-    }
\ No newline at end of file
+    }
+
+
+async def mcp_get_prompt_content_raw(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    prompt_id: str
+) -> bytes:
+    """
+    返回序列化好的响应 JSON；先查 prompt_cache，未命中才查库并回填。
+    命中缓存时 metadata.usage_count 是缓存写入时的快照（计数本身也是后台批量写回的），只作参考
+    """
+    try:
+        pid = uuid.UUID(prompt_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid prompt_id")
+
+    cached = await prompt_cache.get(pid, user_id)
+    if cached is not None:
+        usage_aggregator.record(pid)
+        return cached
+
+    q = select(Prompt).where(Prompt.id == pid, Prompt.user_id == user_id)
+    res = await db.execute(q)
+    p = res.scalar_one_or_none()
+    if not p and use_primary(db):
+        p = (await db.execute(q)).scalar_one_or_none()
+    if not p:
+        raise HTTPException(status_code=404, detail="Prompt not found")
+
+    # 只在内存里计数，后台批量写回
+    usage_aggregator.record(p.id)
+
+    payload = orjson.dumps(_build_prompt_content(p))
+    await prompt_cache.put(p.id, p.version or 1, user_id, payload)
+    return payload
+
+
+async def mcp_get_prompt_content(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    prompt_id: str
+) -> Dict[str, Any]:
+    return orjson.loads(await mcp_get_prompt_content_raw(db, user_id, prompt_id))
+
+
+# 服务端渲染：一组变量，或 variable_sets 批量渲染
+async def render_prompt(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    prompt_id: uuid.UUID,
+    variable_sets: List[Dict[str, Any]],
+    strict: bool = False,
+) -> Dict[str, Any]:
+    q = select(Prompt.id, Prompt.version, Prompt.compiled_template).where(
+        Prompt.id == prompt_id, Prompt.user_id == user_id
+    )
+    row = (await db.execute(q)).one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Prompt not found")
+
+    version = row.version or 1
+    tpl = template_service.memo_get(row.id, version)
+    if tpl is None:
+        if row.compiled_template and row.compiled_template.get("v") == version:
+            tpl = template_service.CompiledTemplate.from_json(row.compiled_template)
+        else:
+            # 没有预编译结果（旧数据）：只编译进本进程的 memo，读路径不写库（可能是只读副本）；
+            # 落库由 recompute_variables 任务在主库上批量补
+            content = (await db.execute(
+                select(Prompt.content).where(Prompt.id == prompt_id, Prompt.user_id == user_id)
+            )).scalar_one()
+            tpl = template_service.compile_template(content, version=version)
+        template_service.memo_put(row.id, tpl)
+
+    usage_aggregator.record(row.id, len(variable_sets))
+    return {
+        "prompt_id": str(row.id),
+        "version": version,
+        "variables": tpl.variables,
+        "rendered": template_service.render_many(tpl, variable_sets, strict=strict),
+    }
@@ -0,0 +1,189 @@
+# backend/app/services/quota_service.py
+# 每日调用配额：请求路径上只在内存里计数和判断，后台任务定期把增量批量 upsert 到 api_usage_daily，
+# 并用 RETURNING 拿回库里的当日总数（包含其它 worker 的计数），作为之后判断的基数
+import asyncio
+import logging
+import math
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.core.instrumentation import register_gauges
+from app.db.session import AsyncSessionLocal
+from app.models.quota import DailyApiUsage
+
+logger = logging.getLogger(__name__)
+
+
+def _utc_day(ts: float) -> Tuple[date, float]:
+    """返回 (UTC 日期, 当天结束的时间戳)"""
+    day = datetime.utcfromtimestamp(ts).date()
+    end = datetime.combine(day + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc).timestamp()
+    return day, end
+
+
+@dataclass(slots=True)
+class QuotaDecision:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: float  # 距离 UTC 零点的秒数
+
+    def headers(self) -> Dict[str, str]:
+        h = {"X-Quota-Limit": str(self.limit), "X-Quota-Remaining": str(self.remaining)}
+        if not self.allowed:
+            h["Retry-After"] = str(math.ceil(self.reset))
+        return h
+
+
+class QuotaTracker:
+    """
+    已用次数 = 最近一次 flush 拿回的库内当日总数 + 正在写回的一批 + 本进程尚未写回的增量。
+    多 worker 时各进程看到的别人的计数最多落后一个 flush 周期，所以配额是近似的（可能小幅超出）。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        daily_limit: int = 0,
+        flush_interval: float = 10.0,
+    ):
+        self.session_factory = session_factory
+        self.daily_limit = daily_limit
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[uuid.UUID, date], int] = {}
+        # 正在 upsert 的一批：拿回的总数装进 _known（或失败后并回 _pending）之前仍要计入已用次数
+        self._inflight: Dict[Tuple[uuid.UUID, date], int] = {}
+        self._known: Dict[uuid.UUID, Tuple[date, int]] = {}  # user_id -> (日期, 库内总数)
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.rejected = 0
+        self.flushed_rows = 0
+        self.flush_errors = 0
+        self._day, self._day_end = _utc_day(time.time())
+
+    def _today(self, now: float) -> date:
+        # 日期缓存到当天结束，热路径上只比较一次时间戳
+        if now >= self._day_end:
+            self._day, self._day_end = _utc_day(now)
+        return self._day
+
+    def used(self, user_id: uuid.UUID, day: Optional[date] = None) -> int:
+        day = day or self._today(time.time())
+        known = self._known.get(user_id)
+        base = known[1] if known is not None and known[0] == day else 0
+        key = (user_id, day)
+        return base + self._inflight.get(key, 0) + self._pending.get(key, 0)
+
+    def consume(self, user_id: uuid.UUID, n: int = 1) -> Optional[QuotaDecision]:
+        """配额够就记账并放行；未设置配额时只记账，返回 None"""
+        now = time.time()
+        day = self._today(now)
+        if self.daily_limit <= 0:
+            self._pending[(user_id, day)] = self._pending.get((user_id, day), 0) + n
+            return None
+        used = self.used(user_id, day)
+        if used + n > self.daily_limit:
+            self.rejected += 1
+            return QuotaDecision(False, self.daily_limit, max(0, self.daily_limit - used), self._day_end - now)
+        self._pending[(user_id, day)] = self._pending.get((user_id, day), 0) + n
+        return QuotaDecision(True, self.daily_limit, self.daily_limit - used - n, self._day_end - now)
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+            # 排序保证多个 worker 并发 upsert 时加锁顺序一致
+            rows = [
+                {"user_id": uid, "day": day, "calls": n}
+                for (uid, day), n in sorted(batch.items(), key=lambda kv: (str(kv[0][0]), kv[0][1]))
+            ]
+            stmt = pg_insert(DailyApiUsage).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id", "day"],
+                set_={"calls": DailyApiUsage.calls + stmt.excluded.calls},
+            ).returning(DailyApiUsage.user_id, DailyApiUsage.day, DailyApiUsage.calls)
+            try:
+                async with self.session_factory() as db:
+                    res = await db.execute(stmt)
+                    totals = res.all()
+                    await db.commit()
+            except Exception:
+                self.flush_errors += 1
+                for key, n in batch.items():
+                    self._pending[key] = self._pending.get(key, 0) + n
+                self._inflight = {}
+                logger.exception("quota flush failed (%d rows)", len(rows))
+                return 0
+
+            today = self._today(time.time())
+            for uid, day, calls in totals:
+                if day == today:
+                    self._known[uid] = (day, calls)
+            # 跨天后丢掉旧日期的基数
+            self._known = {uid: v for uid, v in self._known.items() if v[0] == today}
+            self._inflight = {}  # 已包含在刚装入的总数里
+            self.flushed_rows += len(rows)
+            return len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="quota-tracker")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "daily_limit": self.daily_limit,
+            "pending_rows": len(self._pending),
+            "inflight_rows": len(self._inflight),
+            "known_users": len(self._known),
+            "rejected": self.rejected,
+            "flushed_rows": self.flushed_rows,
+            "flush_errors": self.flush_errors,
+        }
+
+
+def _build_tracker() -> QuotaTracker:
+    settings = get_settings()
+    return QuotaTracker(
+        session_factory=AsyncSessionLocal,
+        daily_limit=settings.QUOTA_DAILY_CALLS,
+        flush_interval=settings.QUOTA_FLUSH_INTERVAL_SECONDS,
+    )
+
+
+quota_tracker = _build_tracker()
+
+
+def _gauges() -> Dict[str, Any]:
+    s = quota_tracker.stats()
+    return {
+        "quota_rejected": s["rejected"],
+        "quota_pending_rows": s["pending_rows"],
+        "quota_flush_errors": s["flush_errors"],
+    }
+
+
+register_gauges("quota", _gauges)
@@ -0,0 +1,265 @@
+# backend/app/services/tag_service.py
+# 标签目录：增量维护每个用户的标签分面计数（prompt_tag_facets）和全局 Tag.usage_count，
+# 分面查询只读物化表，不再对 prompts 做 unnest(tags) GROUP BY
+import uuid
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.tag import PromptTagFacet, Tag
+
+_TAG_MAX_LEN = 100
+# 删除归零行时每条语句的 key 数（asyncpg 单条语句最多 32767 个绑定参数）
+_DELETE_BATCH = 5000
+
+FacetKey = Tuple[str, str, str]  # (category, filter_tag, facet_tag)
+
+
+def _norm_tags(tags: Optional[Iterable[str]]) -> List[str]:
+    # 去重、去空、截到 tags.name 的长度；规则与 _RECOMPUTE_SQL 里的 left(btrim(x), 100) 一致
+    return sorted({t.strip(" ")[:_TAG_MAX_LEN] for t in (tags or []) if t and t.strip(" ")})
+
+
+def facet_keys(category: Optional[str], tags: Optional[Iterable[str]]) -> List[FacetKey]:
+    """一条提示词对分面表的全部贡献（见 PromptTagFacet 文档）"""
+    c = category or ""
+    ts = _norm_tags(tags)
+    keys: List[FacetKey] = [(c, "", "")]
+    keys.extend((c, "", t) for t in ts)
+    keys.extend((c, f, t) for f in ts for t in ts if f != t)
+    return keys
+
+
+def _batches(rows: List[Any]) -> Iterable[List[Any]]:
+    for i in range(0, len(rows), _DELETE_BATCH):
+        yield rows[i:i + _DELETE_BATCH]
+
+
+# 分面增量：四个等长数组一次传入（unnest 保持数组顺序），语句只编译一次，行数也不受单条语句的参数上限限制
+_FACET_UPSERT_SQL = text("""
+INSERT INTO prompt_tag_facets (user_id, category, filter_tag, facet_tag, prompt_count)
+SELECT :uid, d.c, d.f, d.t, d.n
+  FROM unnest(CAST(:c AS varchar[]), CAST(:f AS varchar[]), CAST(:t AS varchar[]), CAST(:n AS int[])) AS d(c, f, t, n)
+ON CONFLICT (user_id, category, filter_tag, facet_tag)
+DO UPDATE SET prompt_count = greatest(prompt_tag_facets.prompt_count + excluded.prompt_count, 0)
+""")
+
+
+async def _apply_deltas(db: AsyncSession, user_id: uuid.UUID, delta: Counter, tag_delta: Counter) -> None:
+    """
+    按 key 排序 upsert（并发事务加锁顺序一致），已有行减到 0 为止；
+    负增量的 key 原本不存在时会先插入一行负数，随后在同一个事务里删掉，外面看不到。
+    分面行数随标签数平方增长（一块导入可达几万行），不能拼成一条多行 VALUES（asyncpg 单条语句最多 32767 个参数）：
+    分面用数组 + unnest，标签目录行数少，按 executemany 传参
+    """
+    keys = [(k, n) for k, n in sorted(delta.items()) if n != 0]
+    if keys:
+        await db.execute(_FACET_UPSERT_SQL, {
+            "uid": user_id,
+            "c": [c for (c, _, _), _ in keys],
+            "f": [f for (_, f, _), _ in keys],
+            "t": [t for (_, _, t), _ in keys],
+            "n": [n for _, n in keys],
+        })
+    removed = [k for k, n in keys if n < 0]
+    for batch in _batches(removed):
+        # 计数归零的分面行直接删掉，表的大小跟着实际用到的组合走
+        await db.execute(delete(PromptTagFacet).where(
+            PromptTagFacet.user_id == user_id,
+            tuple_(PromptTagFacet.category, PromptTagFacet.filter_tag, PromptTagFacet.facet_tag).in_(batch),
+            PromptTagFacet.prompt_count <= 0,
+        ))
+
+    # 全局标签目录：Tag.usage_count = 使用该标签的提示词数
+    tag_rows = [
+        {"id": uuid.uuid4(), "name": name, "usage_count": n}
+        for name, n in sorted(tag_delta.items())
+        if n != 0
+    ]
+    if tag_rows:
+        stmt = pg_insert(Tag)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["name"],
+            set_={"usage_count": func.greatest(Tag.usage_count + stmt.excluded.usage_count, 0)},
+        )
+        await db.execute(stmt, tag_rows)
+    removed_names = [r["name"] for r in tag_rows if r["usage_count"] < 0]
+    for batch in _batches(removed_names):
+        # 已有的标签更新后不会小于 0；小于 0 的只能是本事务刚为不存在的标签插入的行。计数为 0 的标签保留（颜色 / 描述）
+        await db.execute(delete(Tag).where(Tag.name.in_(batch), Tag.usage_count < 0))
+
+
+async def apply_prompt_change(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    old: Optional[Tuple[Optional[str], Optional[Iterable[str]]]],
+    new: Optional[Tuple[Optional[str], Optional[Iterable[str]]]],
+) -> None:
+    """
+    在提示词写事务里调用（不 commit）：old/new 为 (category, tags)，新建时 old=None，删除时 new=None。
+    只写变化的 key；分面计数减到 0 的行随即删除。
+    """
+    delta: Counter = Counter()
+    tag_delta: Counter = Counter()
+    if old is not None:
+        delta.subtract(facet_keys(*old))
+        tag_delta.subtract(_norm_tags(old[1]))
+    if new is not None:
+        delta.update(facet_keys(*new))
+        tag_delta.update(_norm_tags(new[1]))
+    await _apply_deltas(db, user_id, delta, tag_delta)
+
+
+async def apply_bulk_additions(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    items: Iterable[Tuple[Optional[str], Optional[Iterable[str]]]],
+) -> None:
+    """批量导入：整批新增的 (category, tags) 先在内存里合并，再一次 upsert"""
+    delta: Counter = Counter()
+    tag_delta: Counter = Counter()
+    for category, tags in items:
+        delta.update(facet_keys(category, tags))
+        tag_delta.update(_norm_tags(tags))
+    await _apply_deltas(db, user_id, delta, tag_delta)
+
+
+async def apply_bulk_removals(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    items: Iterable[Tuple[Optional[str], Optional[Iterable[str]]]],
+) -> None:
+    """批量删除：与 apply_bulk_additions 对称"""
+    delta: Counter = Counter()
+    tag_delta: Counter = Counter()
+    for category, tags in items:
+        delta.subtract(facet_keys(category, tags))
+        tag_delta.subtract(_norm_tags(tags))
+    await _apply_deltas(db, user_id, delta, tag_delta)
+
+
+# ==== 查询 ====
+async def top_tags(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    limit: int = 20,
+    category: Optional[str] = None,
+    tag: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """用户最常用的标签；可按分类、或“同时带有某个标签”过滤"""
+    total = func.sum(PromptTagFacet.prompt_count).label("count")
+    q = select(PromptTagFacet.facet_tag, total).where(
+        PromptTagFacet.user_id == user_id,
+        PromptTagFacet.filter_tag == (tag or ""),
+        PromptTagFacet.facet_tag != "",
+    )
+    if category is not None:
+        q = q.where(PromptTagFacet.category == category)
+    q = (
+        q.group_by(PromptTagFacet.facet_tag)
+        .having(total > 0)
+        .order_by(total.desc(), PromptTagFacet.facet_tag)
+        .limit(limit)
+    )
+    res = await db.execute(q)
+    return [{"tag": t, "count": int(n)} for t, n in res.all()]
+
+
+async def facet_counts(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    category: Optional[str] = None,
+    tag: Optional[str] = None,
+    limit: int = 50,
+) -> Dict[str, Any]:
+    """
+    分面计数：在 (category, tag) 过滤条件下的总数、各标签数、各分类数。
+    tag 过滤为单个标签（“带有该标签的提示词”）。
+    """
+    # 分类分面：不带 tag 过滤时读 (c, "", "")，带 tag 时读 (c, "", tag)
+    cat_count = func.sum(PromptTagFacet.prompt_count).label("count")
+    cat_q = (
+        select(PromptTagFacet.category, cat_count)
+        .where(
+            PromptTagFacet.user_id == user_id,
+            PromptTagFacet.filter_tag == "",
+            PromptTagFacet.facet_tag == (tag or ""),
+        )
+        .group_by(PromptTagFacet.category)
+        .having(cat_count > 0)
+        .order_by(cat_count.desc())
+    )
+    categories = [
+        {"category": c or None, "count": int(n)} for c, n in (await db.execute(cat_q)).all()
+    ]
+
+    if category is not None:
+        total = next((x["count"] for x in categories if (x["category"] or "") == category), 0)
+    else:
+        total = sum(x["count"] for x in categories)
+
+    return {
+        "total": total,
+        "tags": await top_tags(db, user_id, limit=limit, category=category, tag=tag),
+        "categories": categories,
+    }
+
+
+# ==== 对账 ====
+_RECOMPUTE_SQL = """
+INSERT INTO prompt_tag_facets (user_id, category, filter_tag, facet_tag, prompt_count)
+SELECT user_id, category, filter_tag, facet_tag, count(*) FROM (
+    SELECT p.user_id, coalesce(p.category, '') AS category, '' AS filter_tag, '' AS facet_tag
+      FROM prompts p {where}
+    UNION ALL
+    SELECT p.user_id, coalesce(p.category, ''), '', a.t
+      FROM prompts p
+      CROSS JOIN LATERAL (SELECT DISTINCT left(btrim(x), 100) AS t FROM unnest(p.tags) x
+                          WHERE btrim(x) <> '') a {where}
+    UNION ALL
+    SELECT p.user_id, coalesce(p.category, ''), a.t, b.t
+      FROM prompts p
+      CROSS JOIN LATERAL (SELECT DISTINCT left(btrim(x), 100) AS t FROM unnest(p.tags) x
+                          WHERE btrim(x) <> '') a
+      CROSS JOIN LATERAL (SELECT DISTINCT left(btrim(x), 100) AS t FROM unnest(p.tags) x
+                          WHERE btrim(x) <> '') b
+      {where_pairs}
+) s
+GROUP BY user_id, category, filter_tag, facet_tag
+"""
+
+
+async def reconcile_user_tags(db: AsyncSession, user_id: Optional[uuid.UUID] = None) -> int:
+    """
+    从 prompts 重新计算分面表，修复增量维护产生的漂移（比如绕过 service 直接改库）。
+    user_id 为空时重算全部用户并同时校正 Tag.usage_count。返回写入的分面行数。
+    """
+    params: Dict[str, Any] = {}
+    if user_id is not None:
+        where, where_pairs = "WHERE p.user_id = :uid", "WHERE p.user_id = :uid AND a.t <> b.t"
+        params["uid"] = user_id
+        await db.execute(delete(PromptTagFacet).where(PromptTagFacet.user_id == user_id))
+    else:
+        where, where_pairs = "", "WHERE a.t <> b.t"
+        await db.execute(delete(PromptTagFacet))
+
+    res = await db.execute(text(_RECOMPUTE_SQL.format(where=where, where_pairs=where_pairs)), params)
+
+    if user_id is None:
+        await db.execute(text("""
+            UPDATE tags t SET usage_count = coalesce(s.n, 0)
+              FROM tags t2
+              LEFT JOIN (
+                  SELECT x.t AS name, count(*) AS n
+                    FROM prompts p
+                    CROSS JOIN LATERAL (SELECT DISTINCT left(btrim(y), 100) AS t
+                                          FROM unnest(p.tags) y WHERE btrim(y) <> '') x
+                   GROUP BY x.t
+              ) s ON s.name = t2.name
+             WHERE t.id = t2.id AND t.usage_count IS DISTINCT FROM coalesce(s.n, 0)
+        """))
+    await db.commit()
+    return res.rowcount or 0
@@ -0,0 +1,91 @@
+# backend/app/services/template_service.py
+# 提示词模板：把 {{var}} 内容预编译成片段列表，渲染时只做字符串拼接，不再跑正则
+import re
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+# 与原先 mcp_get_prompt_content 里的变量语法保持一致
+_VAR_PATTERN = re.compile(r"\{\{(\w+)\}\}")
+
+_MEMO_MAX = 4096
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledTemplate:
+    """
+    literals 比 slots 多一个：literals[0] slots[0] literals[1] slots[1] ... literals[-1]
+    variables 为去重后的变量名（按首次出现顺序）
+    """
+    version: int
+    literals: Tuple[str, ...]
+    slots: Tuple[str, ...]
+
+    @property
+    def variables(self) -> List[str]:
+        return list(dict.fromkeys(self.slots))
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"v": self.version, "literals": list(self.literals), "slots": list(self.slots)}
+
+    @classmethod
+    def from_json(cls, data: Mapping[str, Any]) -> "CompiledTemplate":
+        return cls(int(data["v"]), tuple(data["literals"]), tuple(data["slots"]))
+
+    def missing(self, values: Mapping[str, Any]) -> List[str]:
+        return [v for v in self.variables if v not in values]
+
+    def render(self, values: Mapping[str, Any]) -> str:
+        """缺失的变量保留原样 {{name}}"""
+        literals, slots = self.literals, self.slots
+        out = [literals[0]]
+        for i, name in enumerate(slots):
+            value = values.get(name)
+            out.append("{{" + name + "}}" if value is None else str(value))
+            out.append(literals[i + 1])
+        return "".join(out)
+
+
+def compile_template(content: str, version: int = 1) -> CompiledTemplate:
+    # re.split 带捕获组：偶数位是字面量，奇数位是变量名
+    parts = _VAR_PATTERN.split(content or "")
+    return CompiledTemplate(version, tuple(parts[0::2]), tuple(parts[1::2]))
+
+
+# 进程内按 (prompt_id, version) 记住已反序列化的模板，避免每次渲染都从 JSONB 重建
+_memo: "OrderedDict[Tuple[uuid.UUID, int], CompiledTemplate]" = OrderedDict()
+
+
+def memo_get(prompt_id: uuid.UUID, version: int) -> Optional[CompiledTemplate]:
+    tpl = _memo.get((prompt_id, version))
+    if tpl is not None:
+        _memo.move_to_end((prompt_id, version))
+    return tpl
+
+
+def memo_put(prompt_id: uuid.UUID, tpl: CompiledTemplate) -> None:
+    _memo[(prompt_id, tpl.version)] = tpl
+    _memo.move_to_end((prompt_id, tpl.version))
+    while len(_memo) > _MEMO_MAX:
+        _memo.popitem(last=False)
+
+
+def render_many(
+    tpl: CompiledTemplate,
+    variable_sets: Sequence[Mapping[str, Any]],
+    strict: bool = False,
+) -> List[str]:
+    """一个模板 + N 组变量（评测任务的批量渲染）"""
+    if strict:
+        for i, values in enumerate(variable_sets):
+            missing = tpl.missing(values)
+            if missing:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Missing variables in set {i}: {', '.join(missing)}",
+                )
+    render = tpl.render
+    return [render(values) for values in variable_sets]
@@ -0,0 +1,174 @@
+# backend/app/services/usage_service.py
+# 提示词使用次数统计：内存里聚合，后台任务定期批量写回 prompts.usage_count
+# 每次调用都 UPDATE ... SET usage_count = usage_count + 1 会在热门提示词上产生行锁竞争
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import Integer, column, update, values
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.core.instrumentation import register_gauges
+from app.db.session import AsyncSessionLocal
+from app.models.prompt import Prompt
+
+logger = logging.getLogger(__name__)
+
+
+class UsageAggregator:
+    """
+    record() 只在内存里累加（不 await、不碰数据库）；
+    后台任务每 flush_interval 秒把累计的增量用一条 UPDATE ... FROM (VALUES ...) 写回。
+    缓冲区按不同 prompt 数量设上限，满了会提前唤醒 flush，新 key 会被丢弃并计数。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        flush_interval: float = 5.0,
+        max_keys: int = 10000,
+        enabled: bool = True,
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self.enabled = enabled
+        self._pending: Dict[uuid.UUID, int] = {}
+        self._oldest_pending_at: Optional[float] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        # 统计
+        self.dropped = 0
+        self.flushed_rows = 0
+        self.flush_errors = 0
+        self.last_flush_at: Optional[float] = None
+        self.last_flush_duration_ms: float = 0.0
+
+    def record(self, prompt_id: uuid.UUID, n: int = 1) -> None:
+        if not self.enabled:
+            return
+        if prompt_id not in self._pending and len(self._pending) >= self.max_keys:
+            self.dropped += n
+            self._wakeup.set()
+            return
+        if not self._pending:
+            self._oldest_pending_at = time.monotonic()
+        self._pending[prompt_id] = self._pending.get(prompt_id, 0) + n
+
+    async def flush(self) -> int:
+        """把当前缓冲写回数据库，返回更新的 prompt 数"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            self._oldest_pending_at = None
+
+            started = time.perf_counter()
+            # 按 id 排序，多个 worker 并发 flush 时加锁顺序一致，避免死锁
+            rows = sorted(batch.items())
+            deltas = values(
+                column("id", UUID(as_uuid=True)),
+                column("delta", Integer),
+                name="deltas",
+            ).data(rows)
+            stmt = (
+                update(Prompt)
+                .where(Prompt.id == deltas.c.id)
+                # 显式保留 updated_at，使用计数不算内容修改（否则会触发 onupdate）
+                .values(
+                    usage_count=Prompt.usage_count + deltas.c.delta,
+                    updated_at=Prompt.updated_at,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(stmt)
+                    await db.commit()
+            except Exception:
+                # 写失败把增量放回去，下次再试（不丢计数）
+                self.flush_errors += 1
+                for pid, n in batch.items():
+                    self._pending[pid] = self._pending.get(pid, 0) + n
+                if self._oldest_pending_at is None:
+                    self._oldest_pending_at = time.monotonic()
+                logger.exception("usage_count flush failed (%d prompts)", len(batch))
+                return 0
+
+            self.flushed_rows += len(rows)
+            self.last_flush_at = time.time()
+            self.last_flush_duration_ms = (time.perf_counter() - started) * 1000
+            return len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="usage-aggregator")
+
+    async def stop(self) -> None:
+        """停机：取消后台任务并做最后一次 flush"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def flush_lag_seconds(self) -> float:
+        """最早一条未写回的计数已经等待了多久"""
+        if self._oldest_pending_at is None:
+            return 0.0
+        return time.monotonic() - self._oldest_pending_at
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "pending_prompts": len(self._pending),
+            "pending_hits": sum(self._pending.values()),
+            "dropped": self.dropped,
+            "flushed_rows": self.flushed_rows,
+            "flush_errors": self.flush_errors,
+            "flush_lag_seconds": self.flush_lag_seconds(),
+            "last_flush_at": self.last_flush_at,
+            "last_flush_duration_ms": self.last_flush_duration_ms,
+        }
+
+
+def _build_aggregator() -> UsageAggregator:
+    settings = get_settings()
+    return UsageAggregator(
+        session_factory=AsyncSessionLocal,
+        flush_interval=settings.USAGE_FLUSH_INTERVAL_SECONDS,
+        max_keys=settings.USAGE_BUFFER_MAX_KEYS,
+        enabled=settings.USAGE_TRACKING_ENABLED,
+    )
+
+
+usage_aggregator = _build_aggregator()
+
+
+def _gauges() -> Dict[str, Any]:
+    s = usage_aggregator.stats()
+    return {
+        "usage_pending_prompts": s["pending_prompts"],
+        "usage_flush_lag_seconds": s["flush_lag_seconds"],
+        "usage_flush_errors": s["flush_errors"],
+    }
+
+
+register_gauges("usage", _gauges)
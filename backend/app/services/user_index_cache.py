@@ -0,0 +1,129 @@
+# backend/app/services/user_index_cache.py
+# 按用户缓存的进程内索引（语义向量、MinHash 签名等）的公共部分：
+#   首次查询时从库里整批加载；本进程的写入提交后直接改内存；
+#   其它进程的写入靠每 recheck_seconds 秒一次的 (count, max(updated_at)) 指纹检查发现，变化则整体重载；
+#   所有用户的索引总字节数超过 max_bytes 时按 LRU 淘汰
+import asyncio
+import time
+from abc import ABC, abstractmethod
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+T = TypeVar("T")  # 索引对象，需要有 nbytes 属性和 __contains__
+
+
+class UserIndexCache(ABC, Generic[T]):
+    def __init__(self, max_bytes: int, recheck_seconds: float):
+        self.max_bytes = max_bytes
+        self.recheck_seconds = recheck_seconds
+        self._entries: "OrderedDict[uuid.UUID, T]" = OrderedDict()
+        # user_id -> [指纹, 上次检查的 monotonic 时间]
+        self._meta: Dict[uuid.UUID, List[Any]] = {}
+        self._load_locks: Dict[uuid.UUID, asyncio.Lock] = {}
+        self.loads = 0
+        self.evictions = 0
+
+    # ---- 子类实现 ----
+    @abstractmethod
+    def _where(self, user_id: uuid.UUID):
+        """该用户在存储表里的行"""
+
+    @abstractmethod
+    def _updated_at(self):
+        """存储表的 updated_at 列（指纹用）"""
+
+    @abstractmethod
+    async def _load(self, db: AsyncSession, user_id: uuid.UUID) -> T:
+        """从库里整批加载该用户的索引"""
+
+    # ---- 公共逻辑 ----
+    async def fingerprint(self, db: AsyncSession, user_id: uuid.UUID) -> Tuple:
+        row = (await db.execute(
+            select(func.count(), func.max(self._updated_at())).where(self._where(user_id))
+        )).one()
+        return (row[0], row[1])
+
+    def loaded(self, user_id: uuid.UUID) -> Optional[T]:
+        return self._entries.get(user_id)
+
+    async def get(self, db: AsyncSession, user_id: uuid.UUID) -> T:
+        entry = self._entries.get(user_id)
+        now = time.monotonic()
+        if entry is not None:
+            self._entries.move_to_end(user_id)
+            meta = self._meta[user_id]
+            if now - meta[1] < self.recheck_seconds:
+                return entry
+            meta[1] = now
+            if await self.fingerprint(db, user_id) == meta[0]:
+                return entry
+        lock = self._load_locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            current = self._entries.get(user_id)
+            if current is not None and current is not entry:
+                return current  # 等锁期间别的请求已经重载过
+            # 先取指纹再加载：加载期间的写入会让下次检查不一致，多重载一次而不会漏掉
+            fingerprint = await self.fingerprint(db, user_id)
+            entry = await self._load(db, user_id)
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            self._meta[user_id] = [fingerprint, time.monotonic()]
+            self.loads += 1
+            self._evict()
+        self._load_locks.pop(user_id, None)
+        return entry
+
+    def _evict(self) -> None:
+        total = sum(e.nbytes for e in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            user_id, old = self._entries.popitem(last=False)
+            self._meta.pop(user_id, None)
+            total -= old.nbytes
+            self.evictions += 1
+
+    def note_upsert(self, user_id: uuid.UUID, key: Hashable, updated_at) -> Optional[T]:
+        """
+        本进程写入并提交后、改内存索引之前调用：同步更新指纹，避免下次检查时无谓地重载。
+        返回该用户已加载的索引（没加载过返回 None，下次查询时从库里读）
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        meta = self._meta[user_id]
+        count, last = meta[0]
+        if key not in entry:
+            count += 1
+        meta[0] = (count, max(last, updated_at) if last else updated_at)
+        return entry
+
+    def note_remove(self, user_id: uuid.UUID, key: Hashable) -> Optional[T]:
+        entry = self._entries.get(user_id)
+        if entry is None or key not in entry:
+            return None
+        meta = self._meta[user_id]
+        count, last = meta[0]
+        # 删掉的若正好是 max(updated_at) 那一行，下次检查会不一致，重载一次即可
+        meta[0] = (count - 1, last)
+        return entry
+
+    def expire(self, user_id: uuid.UUID) -> None:
+        """其它进程改了该用户的数据（失效总线）：下次查询时立即做指纹检查，不等 recheck_seconds"""
+        meta = self._meta.get(user_id)
+        if meta is not None:
+            meta[1] = float("-inf")
+
+    def expire_all(self) -> None:
+        for meta in self._meta.values():
+            meta[1] = float("-inf")
+
+    def base_stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._entries),
+            "bytes": sum(e.nbytes for e in self._entries.values()),
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
@@ -15,6 +15,11 @@ from sqlalchemy.exc import IntegrityError
 
 from app.models.user import User
 from app.schemas.user import UserCreate
+from app.core.config import get_settings
+from app.core.principal_cache import principal_cache
+from app.core.tokens import deny_list
+from app.services import cache_bus
+from app.services.mcp_sessions import session_registry
 
 import secrets
 
@@ -75,4 +80,51 @@ async def get_user_by_id(db: AsyncSession, user_id: str) -> Optional[User]:
 # 对backend/app/core/security.py的一个补充
 async def get_user_by_api_key(db: AsyncSession, api_key: str) -> User | None:
     res = await db.execute(select(User).where(User.api_key == api_key))
-    return res.scalar_one_or_none()
\ No newline at end of file
+    return res.scalar_one_or_none()
+
+# token_epoch + 1：已签发的 token 全部作废（refresh 时比对 epoch，access token 进吊销名单直到过期）
+def _bump_token_epoch(user: User) -> None:
+    user.token_epoch = (user.token_epoch or 0) + 1
+
+
+def _after_epoch_bump(user: User) -> None:
+    principal_cache.invalidate_user(user.id)
+    session_registry.close_user(user.id)
+    deny_list.deny_user(str(user.id), user.token_epoch, get_settings().ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+
+# 停用用户：同时让认证缓存失效、已签发的 token 作废，避免停用后还能通过认证
+async def deactivate_user(db: AsyncSession, user_id: UUID) -> Optional[User]:
+    user = await db.get(User, user_id)
+    if not user:
+        return None
+    user.is_active = False
+    _bump_token_epoch(user)
+    await cache_bus.publish(db, cache_bus.user_changed(user.id, user.token_epoch))
+    await db.commit()
+    _after_epoch_bump(user)
+    return user
+
+# 轮换 API Key：旧 Key 的缓存条目一并清掉，JWT 也一起作废
+async def rotate_api_key(db: AsyncSession, user_id: UUID) -> Optional[User]:
+    user = await db.get(User, user_id)
+    if not user:
+        return None
+    user.api_key = await _gen_unique_api_key(db)
+    _bump_token_epoch(user)
+    await cache_bus.publish(db, cache_bus.user_changed(user.id, user.token_epoch))
+    await db.commit()
+    _after_epoch_bump(user)
+    await db.refresh(user)
+    return user
+
+# 全部登出：所有设备上的 token 作废
+async def revoke_all_tokens(db: AsyncSession, user_id: UUID) -> Optional[User]:
+    user = await db.get(User, user_id)
+    if not user:
+        return None
+    _bump_token_epoch(user)
+    await cache_bus.publish(db, cache_bus.user_changed(user.id, user.token_epoch))
+    await db.commit()
+    _after_epoch_bump(user)
+    return user
@@ -0,0 +1,268 @@
+# backend/app/services/vector_index.py
+# 向量检索的内存结构（纯 NumPy）：向量都已 L2 归一化，内积即余弦相似度。
+#   VectorSet  可增删的精确检索（暴力 matmul），小规模或作为 IVF 的增量缓冲
+#   IVFIndex   倒排文件近似检索：k-means 聚类，查询只扫最近的 nprobe 个簇
+import threading
+from typing import Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+Hits = List[Tuple[Hashable, float]]
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """返回分数最高的 k 个下标（降序）；argpartition 是 O(n)，只对这 k 个排序"""
+    if k >= scores.shape[0]:
+        return np.argsort(-scores)
+    idx = np.argpartition(-scores, k)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+class VectorSet:
+    """
+    连续的 float32 矩阵 + id -> 行号。容量按倍数扩张，删除时把最后一行挪过来填洞，
+    增删都是 O(dim)，检索是一次 (n, dim) @ (dim,) 的 matmul。
+    """
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.dim = dim
+        self._mat = np.zeros((max(1, capacity), dim), dtype=np.float32)
+        self._ids: List[Hashable] = []
+        self._pos: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._pos
+
+    @property
+    def nbytes(self) -> int:
+        return self._mat.nbytes
+
+    @property
+    def ids(self) -> List[Hashable]:
+        return self._ids
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """已用部分的视图（不复制）"""
+        return self._mat[: len(self._ids)]
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        i = self._pos.get(key)
+        return None if i is None else self._mat[i]
+
+    def upsert(self, key: Hashable, vec: np.ndarray) -> None:
+        i = self._pos.get(key)
+        if i is None:
+            i = len(self._ids)
+            if i == self._mat.shape[0]:
+                grown = np.zeros((self._mat.shape[0] * 2, self.dim), dtype=np.float32)
+                grown[:i] = self._mat
+                self._mat = grown
+            self._ids.append(key)
+            self._pos[key] = i
+        self._mat[i] = vec
+
+    def remove(self, key: Hashable) -> bool:
+        i = self._pos.pop(key, None)
+        if i is None:
+            return False
+        last = len(self._ids) - 1
+        if i != last:
+            moved = self._ids[last]
+            self._mat[i] = self._mat[last]
+            self._ids[i] = moved
+            self._pos[moved] = i
+        self._ids.pop()
+        return True
+
+    @classmethod
+    def from_arrays(cls, ids: Sequence[Hashable], mat: np.ndarray) -> "VectorSet":
+        vs = cls(mat.shape[1], capacity=max(64, len(ids)))
+        vs._mat[: len(ids)] = mat
+        vs._ids = list(ids)
+        vs._pos = {k: i for i, k in enumerate(vs._ids)}
+        return vs
+
+    def search(self, q: np.ndarray, k: int, exclude: Optional[Set[Hashable]] = None) -> Hits:
+        n = len(self._ids)
+        if n == 0:
+            return []
+        scores = self._mat[:n] @ q
+        want = k + (len(exclude) if exclude else 0)
+        out: Hits = []
+        for i in top_k(scores, want):
+            key = self._ids[i]
+            if exclude and key in exclude:
+                continue
+            out.append((key, float(scores[i])))
+            if len(out) == k:
+                break
+        return out
+
+
+def _kmeans(sample: np.ndarray, nlist: int, iters: int, rng: np.random.Generator) -> np.ndarray:
+    """球面 k-means（余弦距离）：质心每轮重新归一化；空簇用随机样本补"""
+    centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """
+    构建后只读。向量按所属簇重排成连续块，查询时扫描 nprobe 个簇的块（内存连续，matmul 友好）。
+    召回率由 nprobe / nlist 决定；benchmarks/bench_semantic 给出不同 nprobe 下的召回和延迟。
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[Hashable],
+        mat: np.ndarray,
+        nlist: Optional[int] = None,
+        iters: int = 8,
+        sample_per_list: int = 64,
+        seed: int = 0,
+    ):
+        n = mat.shape[0]
+        self.nlist = max(1, min(nlist or int(np.sqrt(n)), n))
+        rng = np.random.default_rng(seed)
+        sample_size = min(n, self.nlist * sample_per_list)
+        sample = mat[rng.choice(n, sample_size, replace=False)] if sample_size < n else mat
+        self.centroids = _kmeans(sample, self.nlist, iters, rng)
+
+        # 分批分配，避免 (n, nlist) 的中间矩阵太大
+        assign = np.empty(n, dtype=np.int32)
+        step = 65536
+        for start in range(0, n, step):
+            assign[start:start + step] = np.argmax(mat[start:start + step] @ self.centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        self.vectors = np.ascontiguousarray(mat[order])
+        self.ids = [ids[i] for i in order]
+        counts = np.bincount(assign, minlength=self.nlist)
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + self.centroids.nbytes
+
+    def search(
+        self, q: np.ndarray, k: int, nprobe: int = 8, skip: Optional[Set[Hashable]] = None
+    ) -> Hits:
+        """skip：构建之后被删除 / 改过的 id（最新版本由调用方从增量缓冲里补）"""
+        probe = top_k(self.centroids @ q, min(nprobe, self.nlist))
+        blocks = [(int(self.offsets[c]), int(self.offsets[c + 1])) for c in probe]
+        rows = np.concatenate([np.arange(a, b) for a, b in blocks if b > a]) if blocks else np.empty(0, np.int64)
+        if rows.size == 0:
+            return []
+        scores = self.vectors[rows] @ q
+        want = k + (len(skip) if skip else 0)
+        out: Hits = []
+        for i in top_k(scores, min(want, rows.size)):
+            key = self.ids[rows[i]]
+            if skip and key in skip:
+                continue
+            out.append((key, float(scores[i])))
+            if len(out) == k:
+                break
+        return out
+
+
+class UserVectors:
+    """
+    单个用户的向量集合。VectorSet 是全量的真实数据；数量超过 ivf_min_size 时另建一份 IVF，
+    之后的增删记在 dirty 里：查询 = IVF（跳过 dirty）∪ 精确扫描 dirty 中仍存在的向量。
+    dirty 超过 IVF 规模的 rebuild_ratio 时需要重建（由调用方在线程里执行 rebuild_ivf）。
+    """
+
+    def __init__(self, vectors: VectorSet, ivf_min_size: int, nprobe: int, rebuild_ratio: float = 0.1):
+        self.vectors = vectors
+        self.ivf_min_size = ivf_min_size
+        self.nprobe = nprobe
+        self.rebuild_ratio = rebuild_ratio
+        self.ivf: Optional[IVFIndex] = None
+        self.dirty: Set[Hashable] = set()
+        self._building: Optional[Set[Hashable]] = None  # 重建期间发生的改动
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.vectors
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + (self.ivf.nbytes if self.ivf is not None else 0)
+
+    def needs_rebuild(self) -> bool:
+        n = len(self.vectors)
+        if n < self.ivf_min_size:
+            return False
+        return self.ivf is None or len(self.dirty) > self.rebuild_ratio * max(1, len(self.ivf))
+
+    def rebuild_ivf(self) -> None:
+        """CPU 密集，调用方用 asyncio.to_thread 执行"""
+        with self._lock:
+            if self._building is not None:
+                return
+            ids = list(self.vectors.ids)
+            mat = self.vectors.matrix.copy()
+            self._building = set()
+        try:
+            ivf = IVFIndex(ids, mat)
+        except BaseException:
+            with self._lock:
+                self._building = None
+            raise
+        with self._lock:
+            # 构建期间新产生的改动不在新索引里，继续留在 dirty
+            self.ivf = ivf
+            self.dirty = self._building
+            self._building = None
+
+    def upsert(self, key: Hashable, vec: np.ndarray) -> None:
+        with self._lock:
+            self.vectors.upsert(key, vec)
+            self._touch(key)
+            if len(self.vectors) < self.ivf_min_size:
+                self.ivf = None
+                self.dirty.clear()
+
+    def remove(self, key: Hashable) -> None:
+        with self._lock:
+            self.vectors.remove(key)
+            self._touch(key)
+
+    def _touch(self, key: Hashable) -> None:
+        if self.ivf is not None:
+            self.dirty.add(key)
+        if self._building is not None:
+            self._building.add(key)
+
+    def search(self, q: np.ndarray, k: int, exclude: Optional[Set[Hashable]] = None) -> Hits:
+        if self.ivf is None:
+            return self.vectors.search(q, k, exclude)
+        skip = self.dirty | (exclude or set())
+        hits = self.ivf.search(q, k, self.nprobe, skip=skip)
+        for key in self.dirty:
+            if exclude and key in exclude:
+                continue
+            vec = self.vectors.get(key)
+            if vec is not None:
+                hits.append((key, float(vec @ q)))
+        hits.sort(key=lambda h: -h[1])
+        return hits[:k]
+
+
+__all__ = ["VectorSet", "IVFIndex", "UserVectors", "top_k"]
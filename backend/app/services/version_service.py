@@ -0,0 +1,279 @@
+# backend/app/services/version_service.py
+# 提示词版本历史：周期性完整快照 + 中间版本只存与上一版本的差异（按行），payload 用 zlib 压缩
+import difflib
+import uuid
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import orjson
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.models.prompt import Prompt, PromptVersion
+
+settings = get_settings()
+
+# 进入版本历史的字段（usage_count / is_public 等运行时字段不算修订）
+VERSIONED_FIELDS = ("title", "content", "description", "tags", "category", "variables")
+
+# 差异操作：正整数 = 沿用上一版本的 n 行，负整数 = 丢弃 n 行，列表 = 插入这些行
+Op = Union[int, List[str]]
+
+
+def snapshot_of(p: Prompt) -> Dict[str, Any]:
+    data = {f: getattr(p, f) for f in VERSIONED_FIELDS}
+    # 列表字段复制一份，避免之后原地修改影响比较
+    data["tags"] = list(data["tags"] or [])
+    data["variables"] = list(data["variables"] or [])
+    return data
+
+
+def _lines(text: Optional[str]) -> List[str]:
+    return (text or "").splitlines(keepends=True)
+
+
+# ==== 差异编码 ====
+def diff_lines(old: Sequence[str], new: Sequence[str]) -> List[Op]:
+    ops: List[Op] = []
+    sm = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in sm.get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(-(i2 - i1))
+        if j2 > j1:
+            ops.append(list(new[j1:j2]))
+    return ops
+
+
+def patch_lines(old: Sequence[str], ops: Sequence[Op]) -> List[str]:
+    out: List[str] = []
+    i = 0
+    for op in ops:
+        if isinstance(op, list):
+            out.extend(op)
+        elif op > 0:
+            out.extend(old[i:i + op])
+            i += op
+        else:
+            i -= op
+    return out
+
+
+def make_delta(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """{"f": 其它变化字段的新值, "c": content 的行差异}；没变的字段不出现"""
+    delta: Dict[str, Any] = {}
+    fields = {f: new[f] for f in VERSIONED_FIELDS if f != "content" and new[f] != old[f]}
+    if fields:
+        delta["f"] = fields
+    if new["content"] != old["content"]:
+        delta["c"] = diff_lines(_lines(old["content"]), _lines(new["content"]))
+    return delta
+
+
+def apply_delta(old: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    new = dict(old)
+    new.update(delta.get("f", {}))
+    if "c" in delta:
+        new["content"] = "".join(patch_lines(_lines(old["content"]), delta["c"]))
+    return new
+
+
+def _encode(data: Dict[str, Any]) -> bytes:
+    return orjson.dumps(data)
+
+
+def _pack(raw: bytes) -> bytes:
+    return zlib.compress(raw, 6)
+
+
+def _unpack(payload: bytes) -> Dict[str, Any]:
+    return orjson.loads(zlib.decompress(payload))
+
+
+# ==== 写入 ====
+async def record_version(
+    db: AsyncSession, p: Prompt, previous: Optional[Dict[str, Any]] = None
+) -> PromptVersion:
+    """
+    在提示词写事务里调用（不 commit）。p 已是新版本；previous 为更新前的 snapshot_of(p)，新建时为 None。
+    历史缺失（如批量导入的提示词）时，先把 previous 补成一份快照，再接着写差异。
+    """
+    new = snapshot_of(p)
+    if previous is None:
+        row = _snapshot_row(p, p.version, new, list(VERSIONED_FIELDS), created_at=p.updated_at)
+    else:
+        res = await db.execute(
+            select(PromptVersion.version, PromptVersion.base_version)
+            .where(PromptVersion.prompt_id == p.id)
+            .order_by(PromptVersion.version.desc())
+            .limit(1)
+        )
+        last = res.first()
+        if last is not None and last.version == p.version - 1:
+            base_version = last.base_version
+        else:
+            base_version = p.version - 1
+            db.add(_snapshot_row(p, base_version, previous, list(VERSIONED_FIELDS)))
+
+        changed = [f for f in VERSIONED_FIELDS if new[f] != previous[f]]
+        raw = _encode(make_delta(previous, new))
+        snapshot_raw = _encode(new)
+        # 链长到上限，或差异不比快照小（几乎整篇重写）时存快照，保证重建有界
+        if p.version - base_version >= settings.PROMPT_VERSION_SNAPSHOT_INTERVAL or len(raw) >= len(snapshot_raw):
+            row = _snapshot_row(p, p.version, new, changed, raw=snapshot_raw, created_at=p.updated_at)
+        else:
+            row = PromptVersion(
+                prompt_id=p.id,
+                user_id=p.user_id,
+                version=p.version,
+                kind="delta",
+                base_version=base_version,
+                changed_fields=changed,
+                payload=_pack(raw),
+                size_bytes=len(raw),
+                created_at=p.updated_at,
+            )
+    db.add(row)
+    return row
+
+
+def _snapshot_row(
+    p: Prompt,
+    version: int,
+    data: Dict[str, Any],
+    changed: List[str],
+    raw: Optional[bytes] = None,
+    created_at: Optional[datetime] = None,
+) -> PromptVersion:
+    raw = raw if raw is not None else _encode(data)
+    return PromptVersion(
+        prompt_id=p.id,
+        user_id=p.user_id,
+        version=version,
+        kind="snapshot",
+        base_version=version,
+        changed_fields=changed,
+        payload=_pack(raw),
+        size_bytes=len(raw),
+        created_at=created_at or datetime.utcnow(),
+    )
+
+
+# ==== 读取 ====
+async def _get_owned_prompt(db: AsyncSession, user_id: uuid.UUID, prompt_id: uuid.UUID) -> Prompt:
+    res = await db.execute(select(Prompt).where(Prompt.id == prompt_id, Prompt.user_id == user_id))
+    p = res.scalar_one_or_none()
+    if not p:
+        raise HTTPException(status_code=404, detail="Prompt not found")
+    return p
+
+
+async def list_versions(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    prompt_id: uuid.UUID,
+    limit: int = 50,
+    before: Optional[int] = None,
+) -> Dict[str, Any]:
+    """版本列表（新到旧），只读元数据不读 payload；before 为上一页最后一个版本号"""
+    p = await _get_owned_prompt(db, user_id, prompt_id)
+    q = select(
+        PromptVersion.version,
+        PromptVersion.kind,
+        PromptVersion.changed_fields,
+        PromptVersion.size_bytes,
+        PromptVersion.created_at,
+    ).where(PromptVersion.prompt_id == prompt_id)
+    if before is not None:
+        q = q.where(PromptVersion.version < before)
+    res = await db.execute(q.order_by(PromptVersion.version.desc()).limit(limit + 1))
+    rows = res.all()
+    items = [
+        {
+            "version": r.version,
+            "kind": r.kind,
+            "changed_fields": r.changed_fields or [],
+            "size_bytes": r.size_bytes,
+            "created_at": r.created_at,
+        }
+        for r in rows[:limit]
+    ]
+    return {
+        "prompt_id": prompt_id,
+        "current_version": p.version,
+        "items": items,
+        "next_before": items[-1]["version"] if len(rows) > limit else None,
+    }
+
+
+async def _reconstruct(db: AsyncSession, prompt_id: uuid.UUID, version: int) -> Optional[Dict[str, Any]]:
+    # 一次查询取回 [最近的快照, version] 这一段链
+    base = (
+        select(func.max(PromptVersion.version))
+        .where(
+            PromptVersion.prompt_id == prompt_id,
+            PromptVersion.version <= version,
+            PromptVersion.kind == "snapshot",
+        )
+        .scalar_subquery()
+    )
+    res = await db.execute(
+        select(PromptVersion.version, PromptVersion.kind, PromptVersion.payload, PromptVersion.created_at)
+        .where(
+            PromptVersion.prompt_id == prompt_id,
+            PromptVersion.version >= base,
+            PromptVersion.version <= version,
+        )
+        .order_by(PromptVersion.version)
+    )
+    rows = res.all()
+    if not rows or rows[-1].version != version:
+        return None
+    state = _unpack(rows[0].payload)
+    for r in rows[1:]:
+        state = apply_delta(state, _unpack(r.payload))
+    return {**state, "created_at": rows[-1].created_at}
+
+
+async def get_version(
+    db: AsyncSession, user_id: uuid.UUID, prompt_id: uuid.UUID, version: int
+) -> Dict[str, Any]:
+    p = await _get_owned_prompt(db, user_id, prompt_id)
+    state = await _reconstruct(db, prompt_id, version)
+    if state is None:
+        # 没有历史记录的提示词（如批量导入）至少能取到当前版本
+        if version != p.version:
+            raise HTTPException(status_code=404, detail="Version not found")
+        state = {**snapshot_of(p), "created_at": p.updated_at}
+    return {"prompt_id": prompt_id, "version": version, **state}
+
+
+async def diff_versions(
+    db: AsyncSession, user_id: uuid.UUID, prompt_id: uuid.UUID, from_version: int, to_version: int
+) -> Dict[str, Any]:
+    """两个版本之间的变化：content 给 unified diff，其它字段给新旧值"""
+    a = await get_version(db, user_id, prompt_id, from_version)
+    b = await get_version(db, user_id, prompt_id, to_version)
+    fields = {
+        f: {"from": a[f], "to": b[f]}
+        for f in VERSIONED_FIELDS
+        if f != "content" and a[f] != b[f]
+    }
+    content_diff = "".join(difflib.unified_diff(
+        _lines(a["content"]), _lines(b["content"]),
+        fromfile=f"v{from_version}", tofile=f"v{to_version}",
+    ))
+    changed = [f for f in VERSIONED_FIELDS if a[f] != b[f]]
+    return {
+        "prompt_id": prompt_id,
+        "from_version": from_version,
+        "to_version": to_version,
+        "changed_fields": changed,
+        "fields": fields,
+        "content_diff": content_diff,
+    }
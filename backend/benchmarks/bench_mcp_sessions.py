@@ -0,0 +1,204 @@
+# backend/benchmarks/bench_mcp_sessions.py
+"""
+MCP SSE 会话的浸泡测试：在一个进程里挂上几千个空闲的 GET /mcp/v1/sse 长连接，测
+  memory    每个空闲会话占的内存（tracemalloc，含 ASGI 请求、StreamingResponse、发送队列）和进程 RSS
+  fanout    给所有用户推 notifications/prompts/list_changed，从发布到每个会话收到的延迟
+  burst     同一用户连续改多次时的合并（每个会话只收到一次）
+  call      通过会话发一个 tools/list，从 POST 到响应出现在流里的延迟
+  cleanup   全部断开后会话表是否清空、内存是否回落
+直接按 ASGI 协议驱动 app（不走 socket），所以几千个连接不受文件句柄限制。
+默认用本地 SQLite（需要 aiosqlite）：
+    PYTHONPATH=./backend python -m benchmarks.bench_mcp_sessions --sessions 5000 --users 200
+"""
+import argparse
+import asyncio
+import gc
+import os
+import time
+import tracemalloc
+import uuid
+from typing import List, Optional
+
+os.environ.setdefault("DATABASE_URL", os.getenv("BENCH_DATABASE_URL", "sqlite+aiosqlite:///./bench_mcp_sessions.db"))
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("API_KEY", "bench-key")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("PUBLIC_GALLERY_REFRESH_ENABLED", "false")
+
+import httpx  # noqa: E402
+
+from app.db.session import AsyncSessionLocal, get_engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.quota import DailyApiUsage  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services.mcp_sessions import PROMPTS_LIST_CHANGED, session_registry  # noqa: E402
+from benchmarks._common import percentile, print_table  # noqa: E402
+
+
+def _rss_mib() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return 0.0
+
+
+class Conn:
+    """一个 SSE 客户端：按 ASGI 协议直接调用 app，记录收到的事件"""
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.session_id: Optional[str] = None
+        self.status: Optional[int] = None
+        self.ready = asyncio.Event()
+        self.notified = asyncio.Event()
+        self.notifications = 0
+        self.messages: List[bytes] = []
+        self.message_event = asyncio.Event()
+        self.notified_at: Optional[float] = None
+        self._disconnect = asyncio.Event()
+        self._sent_request = False
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        scope = {
+            "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": "/mcp/v1/sse", "raw_path": b"/mcp/v1/sse",
+            "root_path": "", "query_string": b"", "client": ("127.0.0.1", 1), "server": ("bench", 80),
+            "headers": [(b"host", b"bench"), (b"authorization", f"Bearer {self.api_key}".encode())],
+        }
+        self.task = asyncio.create_task(app(scope, self._receive, self._send))
+
+    async def _receive(self):
+        if not self._sent_request:
+            self._sent_request = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await self._disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def _send(self, message) -> None:
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            if self.status != 200:
+                self.ready.set()
+            return
+        body = message.get("body", b"")
+        for frame in body.split(b"\n\n"):
+            if frame.startswith(b"event: endpoint"):
+                self.session_id = frame.split(b"session_id=", 1)[1].decode()
+                self.ready.set()
+            elif frame.startswith(b"event: message"):
+                data = frame.split(b"data: ", 1)[1]
+                if PROMPTS_LIST_CHANGED.encode() in data:
+                    self.notifications += 1
+                    self.notified_at = time.perf_counter()
+                    self.notified.set()
+                else:
+                    self.messages.append(data)
+                    self.message_event.set()
+
+    async def close(self) -> None:
+        self._disconnect.set()
+        if self.task is not None:
+            await self.task
+
+
+async def seed(users: int) -> List[User]:
+    engine = get_engine()
+    async with engine.begin() as conn:
+        # 会话内的工具调用会记当日调用次数，停机时写回 api_usage_daily
+        for table in (DailyApiUsage.__table__, User.__table__):
+            await conn.run_sync(table.drop, checkfirst=True)
+        for table in (User.__table__, DailyApiUsage.__table__):
+            await conn.run_sync(table.create)
+    out = [User(id=uuid.uuid4(), username=f"sse{i}", email=f"sse{i}@example.com", api_key=uuid.uuid4().hex,
+                is_active=True, token_epoch=0) for i in range(users)]
+    async with AsyncSessionLocal() as db:
+        db.add_all(out)
+        await db.commit()
+    return out
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=250, help="会话平均分给这么多用户（每个用户不超过 MCP_SESSION_MAX_PER_USER）")
+    parser.add_argument("--idle", type=float, default=3.0, help="全部连上后空闲多少秒再开始推送")
+    parser.add_argument("--burst", type=int, default=20, help="同一用户连续修改的次数")
+    args = parser.parse_args()
+
+    users = await seed(args.users)
+    rows = []
+    async with app.router.lifespan_context(app):
+        gc.collect()
+        tracemalloc.start()
+        mem0, rss0 = tracemalloc.get_traced_memory()[0], _rss_mib()
+
+        t0 = time.perf_counter()
+        conns = [Conn(users[i % len(users)].api_key) for i in range(args.sessions)]
+        for c in conns:
+            c.start()
+        await asyncio.gather(*(c.ready.wait() for c in conns))
+        open_s = time.perf_counter() - t0
+        failed = sum(1 for c in conns if c.session_id is None)
+        await asyncio.sleep(args.idle)
+        gc.collect()
+        mem1, rss1 = tracemalloc.get_traced_memory()[0], _rss_mib()
+        tracemalloc.stop()
+        per_session_kib = (mem1 - mem0) / max(args.sessions, 1) / 1024
+        print(f"opened {args.sessions - failed}/{args.sessions} sessions in {open_s:.2f}s; "
+              f"{per_session_kib:.1f} KiB/session (tracemalloc), RSS {rss0:.0f} -> {rss1:.0f} MiB "
+              f"({(rss1 - rss0) * 1024 / max(args.sessions, 1):.1f} KiB/session)")
+
+        # 扇出：每个用户推一次，等所有会话收到
+        started = time.perf_counter()
+        for u in users:
+            session_registry.notify(u.id, PROMPTS_LIST_CHANGED)
+        await asyncio.gather(*(c.notified.wait() for c in conns if c.session_id))
+        lat = [(c.notified_at - started) * 1000 for c in conns if c.notified_at]
+        rows.append({"case": f"fanout to {len(lat)} sessions", "p50_ms": percentile(lat, 50),
+                     "p99_ms": percentile(lat, 99), "max_ms": max(lat)})
+
+        # 突发：同一用户在写出循环发出之前连改 burst 次，每个会话只收到一次
+        for c in conns:
+            c.notified.clear()
+        target = users[0]
+        mine = [c for c in conns if c.api_key == target.api_key and c.session_id]
+        before = sum(c.notifications for c in mine)
+        for _ in range(args.burst):
+            session_registry.notify(target.id, PROMPTS_LIST_CHANGED)
+        await asyncio.gather(*(c.notified.wait() for c in mine))
+        await asyncio.sleep(0.05)
+        received = sum(c.notifications for c in mine) - before
+        print(f"burst: {args.burst} changes -> {received} notifications over {len(mine)} sessions")
+
+        # 会话内调用：POST /mcp/v1/messages，响应从流里收到
+        probe = mine[0]
+        lat = []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for i in range(200):
+                probe.message_event.clear()
+                t = time.perf_counter()
+                r = await client.post(f"/mcp/v1/messages?session_id={probe.session_id}",
+                                      json={"jsonrpc": "2.0", "id": i, "method": "tools/list"})
+                assert r.status_code == 202, r.text
+                await probe.message_event.wait()
+                lat.append((time.perf_counter() - t) * 1000)
+        rows.append({"case": "tools/list via session", "p50_ms": percentile(lat, 50),
+                     "p99_ms": percentile(lat, 99), "max_ms": max(lat)})
+
+        stats = session_registry.stats()
+        t0 = time.perf_counter()
+        await asyncio.gather(*(c.close() for c in conns))
+        close_s = time.perf_counter() - t0
+        gc.collect()
+        left = session_registry.stats()["sessions"]
+
+    print_table(rows)
+    print(f"registry: {stats}")
+    print(f"disconnect all: {close_s:.2f}s, sessions left {left}, RSS {_rss_mib():.0f} MiB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
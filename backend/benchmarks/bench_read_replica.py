@@ -0,0 +1,172 @@
+# backend/benchmarks/bench_read_replica.py
+"""
+读写分离的行为测试：两个本地数据库分别当主库和副本（没有真正的复制，副本的数据由脚本手动“复制”），
+进程内启动 app，通过 MCP 认证（POST /mcp/v1/tools/list）验证选库，并统计两个引擎各自的连接 checkout 次数：
+  routing   两边都有的用户：读走副本
+  lagging   只在主库上的新用户（还没复制过来）：副本查不到 -> 回主库重查
+  ryw       在主库上停用用户：read-your-writes 窗口内读主库（403），窗口过后读到副本上的旧状态，复制后 403
+  lag       复制延迟超过 DB_READ_MAX_LAG_SECONDS：全部回退主库
+  down      副本连不上：全部回退主库，恢复后切回
+默认两个 SQLite 文件（需要 aiosqlite），也可以用两个 Postgres 库：
+    PYTHONPATH=./backend python -m benchmarks.bench_read_replica --requests 200
+    BENCH_DATABASE_URL=postgresql+asyncpg://u:p@localhost/primary BENCH_READ_DATABASE_URL=postgresql+asyncpg://u:p@localhost/replica \
+        PYTHONPATH=./backend python -m benchmarks.bench_read_replica
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from typing import Dict, List
+
+os.environ.setdefault("DATABASE_URL", os.getenv("BENCH_DATABASE_URL", "sqlite+aiosqlite:///./bench_primary.db"))
+os.environ.setdefault("DATABASE_READ_URL", os.getenv("BENCH_READ_DATABASE_URL", "sqlite+aiosqlite:///./bench_replica.db"))
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("API_KEY", "bench-key")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("PUBLIC_GALLERY_REFRESH_ENABLED", "false")
+os.environ.setdefault("STARTUP_WARMUP", "false")
+os.environ.setdefault("DB_READ_STICKY_SECONDS", "0.5")
+
+import httpx  # noqa: E402
+
+from app.core.principal_cache import principal_cache  # noqa: E402
+from app.db.replica import get_read_engine, read_router  # noqa: E402
+from app.db.session import AsyncSessionLocal, get_engine, pool_status  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.quota import DailyApiUsage  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import user_service  # noqa: E402
+from benchmarks._common import print_table  # noqa: E402
+
+_TABLES = (User.__table__, DailyApiUsage.__table__)
+
+
+def _user(i: int) -> Dict:
+    return {"id": uuid.uuid4(), "username": f"rr{i}", "email": f"rr{i}@example.com",
+            "api_key": uuid.uuid4().hex, "is_active": True, "token_epoch": 0}
+
+
+async def _reset(engine) -> None:
+    async with engine.begin() as conn:
+        for table in reversed(_TABLES):
+            await conn.run_sync(table.drop, checkfirst=True)
+        for table in _TABLES:
+            await conn.run_sync(table.create)
+
+
+async def _insert(engine, rows: List[Dict]) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(User.__table__.insert(), rows)
+
+
+async def _replicate_user(user_id: uuid.UUID) -> None:
+    """手动把主库上该用户的行“复制”到副本"""
+    async with get_engine().connect() as src:
+        row = (await src.execute(User.__table__.select().where(User.id == user_id))).mappings().one()
+    async with get_read_engine().begin() as dst:
+        await dst.execute(User.__table__.delete().where(User.id == user_id))
+        await dst.execute(User.__table__.insert(), [dict(row)])
+
+
+def _checkouts() -> Dict[str, int]:
+    return {
+        "primary": pool_status(get_engine())["checkouts"],
+        "replica": pool_status(get_read_engine())["checkouts"],
+    }
+
+
+class Runner:
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.rows = []
+
+    async def auth(self, key: str) -> int:
+        r = await self.client.post("/mcp/v1/tools/list", headers={"Authorization": f"Bearer {key}"})
+        return r.status_code
+
+    async def case(self, name: str, keys: List[str], expect: int, evict: bool = True) -> None:
+        before, stats0 = _checkouts(), read_router.stats()
+        statuses = []
+        started = time.perf_counter()
+        for key in keys:
+            if evict:
+                principal_cache.clear()  # 每次都真正查库
+            statuses.append(await self.auth(key))
+        elapsed = time.perf_counter() - started
+        after, stats1 = _checkouts(), read_router.stats()
+        self.rows.append({
+            "case": name,
+            "requests": len(keys),
+            "ok": sum(1 for s in statuses if s == expect),
+            "expect": expect,
+            "primary_conns": after["primary"] - before["primary"],
+            "replica_conns": after["replica"] - before["replica"],
+            "retries": stats1["retries"] - stats0["retries"],
+            "sticky": stats1["sticky_reads"] - stats0["sticky_reads"],
+            "fallback": stats1["unhealthy_reads"] - stats0["unhealthy_reads"],
+            "ms_per_req": elapsed * 1000 / max(len(keys), 1),
+        })
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+
+    primary, replica = get_engine(), get_read_engine()
+    for engine in (primary, replica):
+        await _reset(engine)
+    users = [_user(i) for i in range(args.users)]
+    for engine in (primary, replica):
+        await _insert(engine, users)
+    keys = [users[i % len(users)]["api_key"] for i in range(args.requests)]
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            run = Runner(client)
+            await run.case("routing", keys, 200)
+
+            fresh = _user(10_000)
+            await _insert(primary, [fresh])
+            await run.case("lagging (new user)", [fresh["api_key"]], 200)
+
+            # 通过 service 在主库上停用：publish 记录 read-your-writes，副本上仍是 active
+            target = users[0]
+            async with AsyncSessionLocal() as db:
+                await user_service.deactivate_user(db, target["id"])
+            await run.case("ryw: inside window", [target["api_key"]], 403)
+            await asyncio.sleep(read_router.sticky_seconds + 0.05)
+            await run.case("ryw: after window, stale", [target["api_key"]], 200)
+            await _replicate_user(target["id"])
+            await run.case("ryw: after replication", [target["api_key"]], 403)
+
+            live = [u["api_key"] for u in users[1:]]  # 去掉已停用的 target
+            probe = read_router.probe
+
+            async def lagging() -> float:
+                return read_router.max_lag_seconds + 10
+
+            read_router.probe = lagging
+            await read_router.check()
+            await run.case("lag > max", live[:50], 200)
+
+            async def down() -> float:
+                raise ConnectionRefusedError("replica down")
+
+            read_router.probe = down
+            await read_router.check()
+            await run.case("replica down", live[:50], 200)
+
+            read_router.probe = probe
+            await read_router.check()
+            await run.case("recovered", live[:50], 200)
+
+    print_table(run.rows)
+    print(f"router: {read_router.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
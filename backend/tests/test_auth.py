@@ -0,0 +1,128 @@
+# backend/tests/test_auth.py
+import uuid
+
+import pytest
+
+from app.api import deps
+from app.core.principal_cache import principal_cache
+from app.core.security import create_access_token
+from app.core.tokens import deny_list
+from app.db.session import AsyncSessionLocal
+from app.services import user_service
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def _clean_auth_state():
+    principal_cache.clear()
+    deny_list.clear()
+    yield
+    principal_cache.clear()
+    deny_list.clear()
+
+
+@pytest.fixture(params=[True, False], ids=["stateless", "db"])
+def stateless(request, monkeypatch):
+    monkeypatch.setattr(deps.settings, "AUTH_STATELESS_ENABLED", request.param)
+    return request.param
+
+
+async def _login(client, user) -> dict:
+    r = await client.post("/api/v1/users/login", json={"email": user.email})
+    assert r.status_code == 200
+    return r.json()
+
+
+async def _me(client, access_token) -> int:
+    r = await client.get("/api/v1/users/me", headers={"Authorization": f"Bearer {access_token}"})
+    return r.status_code
+
+
+async def test_refresh_rotates_the_pair(users_table, make_user, client):
+    user = await make_user()
+    pair = await _login(client, user)
+    r = await client.post("/api/v1/users/token/refresh", json={"refresh_token": pair["refresh_token"]})
+    assert r.status_code == 200
+    fresh = r.json()
+    assert fresh["refresh_token"] != pair["refresh_token"]
+    assert await _me(client, fresh["access_token"]) == 200
+    # 旧 refresh token 用过一次即作废
+    r = await client.post("/api/v1/users/token/refresh", json={"refresh_token": pair["refresh_token"]})
+    assert r.status_code == 401
+    # access token 不能拿来换新
+    r = await client.post("/api/v1/users/token/refresh", json={"refresh_token": fresh["access_token"]})
+    assert r.status_code == 401
+
+
+async def test_refresh_token_rejected_on_api_routes(users_table, make_user, client, stateless):
+    user = await make_user()
+    pair = await _login(client, user)
+    assert await _me(client, pair["refresh_token"]) == 401
+
+
+async def test_logout_revokes_the_token(users_table, make_user, client, stateless):
+    user = await make_user()
+    pair = await _login(client, user)
+    other = await _login(client, user)
+    assert await _me(client, pair["access_token"]) == 200  # 查库路径下这一步会把用户放进缓存
+    r = await client.post("/api/v1/users/logout", json={"refresh_token": pair["refresh_token"]},
+                          headers={"Authorization": f"Bearer {pair['access_token']}"})
+    assert r.status_code == 200
+    assert await _me(client, pair["access_token"]) == 401
+    r = await client.post("/api/v1/users/token/refresh", json={"refresh_token": pair["refresh_token"]})
+    assert r.status_code == 401
+    # 同一用户的其它 token 不受影响
+    assert await _me(client, other["access_token"]) == 200
+
+
+async def test_logout_all_bumps_epoch(users_table, make_user, client, stateless):
+    user = await make_user()
+    pair = await _login(client, user)
+    assert await _me(client, pair["access_token"]) == 200
+    r = await client.post("/api/v1/users/logout-all", headers={"Authorization": f"Bearer {pair['access_token']}"})
+    assert r.status_code == 200
+    assert await _me(client, pair["access_token"]) == 401
+    r = await client.post("/api/v1/users/token/refresh", json={"refresh_token": pair["refresh_token"]})
+    assert r.status_code == 401
+    # 重新登录拿到的是新 epoch 的 token
+    assert await _me(client, (await _login(client, user))["access_token"]) == 200
+
+
+async def test_deactivate_bumps_epoch(users_table, make_user, client, stateless):
+    user = await make_user()
+    pair = await _login(client, user)
+    assert await _me(client, pair["access_token"]) == 200
+    async with AsyncSessionLocal() as db:
+        await user_service.deactivate_user(db, user.id)
+    assert await _me(client, pair["access_token"]) == 401
+    r = await client.post("/api/v1/users/token/refresh", json={"refresh_token": pair["refresh_token"]})
+    assert r.status_code == 401
+    r = await client.post("/api/v1/users/login", json={"email": user.email})
+    assert r.status_code == 403
+
+
+async def test_legacy_token_checks_deny_list_and_is_active(users_table, make_user, client, stateless):
+    # 没有 act / ep 声明的旧格式 token 总是走缓存 / 查库
+    active, inactive = await make_user(), await make_user(is_active=False)
+    legacy = create_access_token({"sub": str(active.id), "jti": uuid.uuid4().hex})
+    assert await _me(client, legacy) == 200
+    assert await _me(client, create_access_token({"sub": str(inactive.id)})) == 403
+
+    async with AsyncSessionLocal() as db:
+        await user_service.revoke_all_tokens(db, active.id)
+    assert await _me(client, legacy) == 401  # 旧 token 没有 ep，按 0 算，小于新的 epoch
+
+
+async def test_stateless_disabled_reads_current_user_state(users_table, make_user, client, monkeypatch):
+    # 关掉无状态路径后，token 里的 act 声明不再可信：以库里（或缓存里）的状态为准
+    monkeypatch.setattr(deps.settings, "AUTH_STATELESS_ENABLED", False)
+    user = await make_user()
+    pair = await _login(client, user)
+    assert await _me(client, pair["access_token"]) == 200
+    async with AsyncSessionLocal() as db:
+        db_user = await db.get(user_service.User, user.id)
+        db_user.is_active = False
+        await db.commit()
+    principal_cache.invalidate_user(user.id)
+    assert await _me(client, pair["access_token"]) == 403
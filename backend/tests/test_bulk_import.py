@@ -0,0 +1,134 @@
+# backend/tests/test_bulk_import.py
+import orjson
+import pytest
+from sqlalchemy import func, select
+
+from app.models.prompt import Prompt
+from tests.conftest import auth_headers, requires_postgres
+
+pytestmark = [pytest.mark.anyio, requires_postgres]
+
+
+def _lines(n, bad=()):
+    return [b"{oops\n" if i in bad else orjson.dumps({"title": f"t{i}", "content": f"c {i}", "tags": ["x"]}) + b"\n"
+            for i in range(1, n + 1)]
+
+
+async def _stream(lines, fail_after=None):
+    for i, line in enumerate(lines, 1):
+        if fail_after is not None and i > fail_after:
+            raise ConnectionError("client went away")
+        yield line
+
+
+async def _count(engine, user_id):
+    async with engine.connect() as conn:
+        return (await conn.execute(select(func.count()).select_from(Prompt).where(Prompt.user_id == user_id))).scalar()
+
+
+async def test_http_import_records_progress(pg_schema, make_user, client):
+    user = await make_user()
+    r = await client.post("/api/v1/prompts/import?chunk_size=10", content=b"".join(_lines(25, bad={7})),
+                          headers=auth_headers(user))
+    assert r.status_code == 200
+    body = r.json()
+    assert (body["rows_processed"], body["imported"], body["failed"]) == (25, 24, 1)
+    job = (await client.get(f"/api/v1/jobs/{body['job_id']}", headers=auth_headers(user))).json()
+    assert job["kind"] == "import_prompts" and job["status"] == "succeeded"
+    assert job["result"]["rows_processed"] == 25 and job["result"]["errors"][0]["row"] == 7
+    # 已完成的导入不能再续传
+    r = await client.post(f"/api/v1/prompts/import?job_id={body['job_id']}", content=b"", headers=auth_headers(user))
+    assert r.status_code == 404
+
+
+async def test_interrupted_import_resumes_over_http(pg_schema, make_user, client):
+    from app.db.session import AsyncSessionLocal
+    from app.services import bulk_service
+
+    user = await make_user()
+    lines = _lines(25, bad={3})
+    async with AsyncSessionLocal() as db:
+        with pytest.raises(ConnectionError):
+            await bulk_service.import_with_job(db, user.id, _stream(lines, fail_after=17), "ndjson", chunk_size=5)
+    async with AsyncSessionLocal() as db:
+        (job,) = (await db.execute(select(bulk_service.Job).where(bulk_service.Job.user_id == user.id))).scalars()
+    # 读到第 18 行时断开：每 5 条有效行一块，已提交到第 16 行（第 3 行是坏行），第 17 行还在内存里没写
+    assert job.status == "failed" and job.result["rows_processed"] == 16 and job.result["imported"] == 15
+    assert await _count(pg_schema, user.id) == 15
+
+    r = await client.get(f"/api/v1/jobs/{job.id}", headers=auth_headers(user))
+    assert r.json()["result"]["rows_processed"] == 16
+    # csv 续传 ndjson 的导入：400
+    r = await client.post(f"/api/v1/prompts/import?format=csv&job_id={job.id}", content=b"", headers=auth_headers(user))
+    assert r.status_code == 400
+
+    r = await client.post(f"/api/v1/prompts/import?chunk_size=5&job_id={job.id}", content=b"".join(lines),
+                          headers=auth_headers(user))
+    assert r.status_code == 200
+    body = r.json()
+    assert (body["job_id"], body["rows_processed"], body["imported"], body["failed"]) == (str(job.id), 25, 24, 1)
+    assert await _count(pg_schema, user.id) == 24
+    async with AsyncSessionLocal() as db:
+        titles = (await db.execute(select(Prompt.title).where(Prompt.user_id == user.id))).scalars().all()
+    assert len(set(titles)) == 24
+
+
+async def test_takeover_stops_the_old_request(pg_schema, make_user, monkeypatch):
+    from app.db.session import AsyncSessionLocal
+    from app.services import bulk_service
+
+    user = await make_user()
+    lines = _lines(20)
+    open_job = bulk_service._open_import_job
+    async with AsyncSessionLocal() as db:
+        opened = await open_job(db, user.id, "ndjson", None)
+    taken = {}
+
+    async def old_stream():
+        for i, line in enumerate(lines, 1):
+            if i == 8:
+                # 第一块（5 行）已提交，另一个请求带着 job_id 续传接管
+                async with AsyncSessionLocal() as other:
+                    _, _, taken["report"] = await open_job(other, user.id, "ndjson", opened[0])
+            yield line
+
+    async def reuse(*_):
+        return opened
+
+    monkeypatch.setattr(bulk_service, "_open_import_job", reuse)
+    async with AsyncSessionLocal() as db:
+        with pytest.raises(bulk_service.ImportSuperseded):
+            await bulk_service.import_with_job(db, user.id, old_stream(), "ndjson", chunk_size=5)
+    assert taken["report"].rows_processed == 5
+    assert await _count(pg_schema, user.id) == 5  # 第二块在写进度时发现被接管，回滚
+
+
+async def test_bad_row_falls_back_row_by_row(pg_schema, make_user, caplog):
+    from app.db.session import AsyncSessionLocal
+    from app.services import bulk_service
+
+    user = await make_user()
+    lines = _lines(10)
+    lines[3] = orjson.dumps({"title": "nul", "content": "a\u0000b"}) + b"\n"  # Postgres 的 text 存不下 NUL
+    async with AsyncSessionLocal() as db:
+        report = await bulk_service.import_prompts(db, user.id, bulk_service.parse_stream(_stream(lines), "ndjson"),
+                                                   chunk_size=5)
+    assert (report.method, report.imported, report.failed) == ("copy", 9, 1)
+    assert report.errors[0]["row"] == 4
+    assert "rows 1-5 failed, retrying row by row" in caplog.text
+    assert await _count(pg_schema, user.id) == 9
+
+
+async def test_other_errors_are_not_retried_row_by_row(pg_schema, make_user, monkeypatch):
+    from app.db.session import AsyncSessionLocal
+    from app.services import bulk_service
+
+    async def broken(*_):
+        raise RuntimeError("tag service down")
+
+    monkeypatch.setattr(bulk_service.tag_service, "apply_bulk_additions", broken)
+    user = await make_user()
+    async with AsyncSessionLocal() as db:
+        with pytest.raises(RuntimeError):
+            await bulk_service.import_prompts(db, user.id, bulk_service.parse_stream(_stream(_lines(5)), "ndjson"))
+    assert await _count(pg_schema, user.id) == 0
@@ -0,0 +1,194 @@
+# backend/tests/test_cache_bus.py
+import asyncio
+import uuid
+
+import pytest
+
+from app.core.tokens import deny_list
+from app.services import cache_bus
+from app.services.cache_bus import Change, _merge
+from app.services.prompt_cache import prompt_cache
+from tests.conftest import requires_postgres
+
+pytestmark = pytest.mark.anyio
+
+
+def _deliver(bus: cache_bus.InvalidationBus, *changes: cache_bus.Change, origin: str = "other") -> None:
+    for c in changes:
+        bus._on_notify(None, 0, bus.channel, cache_bus.encode(origin, c))
+
+
+async def _until(cond, timeout: float = 5.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not cond():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_encode_decode_roundtrip():
+    for c in (cache_bus.prompt_changed(uuid.uuid4(), uuid.uuid4(), 7), cache_bus.prompt_changed(uuid.uuid4(), uuid.uuid4()),
+              cache_bus.user_prompts_changed(uuid.uuid4()), cache_bus.user_changed(uuid.uuid4(), 2)):
+        assert cache_bus.decode(cache_bus.encode("abc", c)) == ("abc", c)
+    with pytest.raises(ValueError):
+        cache_bus.decode("abc x 1 -")
+
+
+def test_merge():
+    a = Change(cache_bus.PROMPT, "p", 3, "u")
+    assert _merge(a, a._replace(version=5)).version == 5
+    assert _merge(a._replace(version=5), a).version == 5
+    # 有一条不带版本（删除 / 内容变了版本没变）就无条件失效
+    assert _merge(a, a._replace(version=None)).version is None
+    assert _merge(a._replace(version=None), a).version is None
+
+
+def test_on_notify_coalesces_per_key():
+    bus = cache_bus.InvalidationBus()
+    p, q, u = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    _deliver(bus, *(cache_bus.prompt_changed(p, u, v) for v in (1, 3, 2)))
+    _deliver(bus, cache_bus.prompt_changed(q, u, 1), cache_bus.user_prompts_changed(u))
+    _deliver(bus, cache_bus.prompt_changed(q, u, 9), origin=bus.origin)  # 自己发的
+    bus._on_notify(None, 0, bus.channel, "garbage")
+    assert bus._pending == {
+        (cache_bus.PROMPT, str(p)): cache_bus.prompt_changed(p, u, 3),
+        (cache_bus.PROMPT, str(q)): cache_bus.prompt_changed(q, u, 1),
+        (cache_bus.PROMPT_SET, str(u)): cache_bus.user_prompts_changed(u),
+    }
+    assert (bus.received, bus.coalesced, bus.own, bus.errors) == (7, 2, 1, 1)
+    assert bus._wake.is_set()
+
+
+async def test_apply_pending_evicts_older_versions_only():
+    bus = cache_bus.InvalidationBus()
+    u, fresh, stale = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    for pid in (fresh, stale):
+        await prompt_cache.put(pid, 3, u, b"{}")
+    try:
+        _deliver(bus, cache_bus.prompt_changed(fresh, u, 3), cache_bus.prompt_changed(stale, u, 4))
+        assert bus.apply_pending() == 2
+        assert await prompt_cache.get(fresh, u) == b"{}"
+        assert await prompt_cache.get(stale, u) is None
+        assert bus._pending == {} and bus.applied == 2
+    finally:
+        prompt_cache.clear()
+
+
+async def test_overflow_flushes_everything():
+    bus = cache_bus.InvalidationBus(max_pending=3)
+    u, cached = uuid.uuid4(), uuid.uuid4()
+    await prompt_cache.put(cached, 1, u, b"{}")
+    _deliver(bus, *(cache_bus.prompt_changed(uuid.uuid4(), u, 1) for _ in range(4)))
+    assert bus._overflow and bus._pending == {}
+    _deliver(bus, cache_bus.prompt_changed(uuid.uuid4(), u, 1))  # 溢出之后的消息不再逐条记
+    assert bus._pending == {}
+    assert bus.apply_pending() == 0
+    assert bus.full_flushes == 1 and not bus._overflow
+    assert await prompt_cache.get(cached, u) is None
+
+
+def test_remote_user_change_updates_deny_list():
+    user_id = uuid.uuid4()
+    bus = cache_bus.InvalidationBus()
+    _deliver(bus, cache_bus.user_changed(user_id, 3))
+    bus.apply_pending()
+    try:
+        assert deny_list.is_denied({"sub": str(user_id), "ep": 2})
+        assert not deny_list.is_denied({"sub": str(user_id), "ep": 3})
+    finally:
+        deny_list.clear()
+
+
+class FakeConn:
+    """代替 asyncpg 监听连接：fetchval 用于健康检查，broken 后探测失败（半开连接）"""
+
+    def __init__(self):
+        self.broken = False
+        self.closed = False
+
+    async def fetchval(self, sql):
+        if self.broken:
+            raise ConnectionResetError("half-open")
+        return 1
+
+    def is_closed(self):
+        return self.closed
+
+    def terminate(self):
+        self.closed = True
+
+
+async def test_reconnect_flushes_everything(monkeypatch):
+    bus = cache_bus.InvalidationBus(coalesce_seconds=0.01, healthcheck_seconds=0.05)
+    conns = []
+    attempts = 0
+
+    async def connect():
+        nonlocal attempts
+        attempts += 1
+        if attempts == 2:
+            raise OSError("connection refused")  # 重连失败一次，退避后再试
+        conns.append(FakeConn())
+        return conns[-1]
+
+    monkeypatch.setattr(bus, "_connect", connect)
+    u, cached = uuid.uuid4(), uuid.uuid4()
+    task = asyncio.create_task(bus._run())
+    try:
+        await _until(lambda: bus.connected)
+        assert bus.full_flushes == 1 and bus.reconnects == 0  # 首次连上也清空一次
+
+        await prompt_cache.put(cached, 1, u, b"{}")
+        _deliver(bus, cache_bus.user_prompts_changed(u))
+        await _until(lambda: bus.applied == 1)
+        assert await prompt_cache.get(cached, u) == b"{}"
+
+        # 连接被服务端断开（termination listener）
+        bus._on_terminate(conns[0])
+        await _until(lambda: bus.reconnects == 1)
+        assert conns[0].closed and len(conns) == 2 and bus.errors == 1
+        assert bus.full_flushes == 2
+        assert await prompt_cache.get(cached, u) is None
+
+        # 半开连接：健康检查失败同样重连并清空
+        await prompt_cache.put(cached, 1, u, b"{}")
+        conns[1].broken = True
+        await _until(lambda: bus.reconnects == 2)
+        assert conns[1].closed and bus.full_flushes == 3
+        assert await prompt_cache.get(cached, u) is None
+    finally:
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        prompt_cache.clear()
+
+
+@requires_postgres
+async def test_two_instances_over_postgres(engine):
+    """两个监听实例（相当于两个 worker）：一边事务里发布，提交后另一边收到并失效；回滚的不会送达"""
+    from app.db.session import AsyncSessionLocal
+
+    channel = f"test_bus_{uuid.uuid4().hex[:8]}"
+    a = cache_bus.InvalidationBus(channel=channel, coalesce_seconds=0.01)
+    b = cache_bus.InvalidationBus(channel=channel, coalesce_seconds=0.01)
+    u, pid = uuid.uuid4(), uuid.uuid4()
+    a.start()
+    b.start()
+    try:
+        await _until(lambda: a.connected and b.connected)
+        await prompt_cache.put(pid, 1, u, b"{}")
+
+        async with AsyncSessionLocal() as db:
+            await a.publish(db, [cache_bus.prompt_changed(pid, u, 5)])
+            await db.rollback()
+        async with AsyncSessionLocal() as db:
+            await a.publish(db, [cache_bus.prompt_changed(pid, u, 2), cache_bus.user_prompts_changed(u)])
+            await db.commit()
+
+        await _until(lambda: b.applied == 2 and a.own == 2)
+        assert b.received == 2 and a.applied == 0
+        assert await prompt_cache.get(pid, u) is None
+    finally:
+        await a.stop()
+        await b.stop()
+        prompt_cache.clear()
@@ -0,0 +1,157 @@
+# backend/tests/test_jobs.py
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app.models.job import Job
+from app.services import job_service
+from app.services.job_service import JobSpec, JobWorker
+from tests.conftest import requires_postgres
+
+pytestmark = [pytest.mark.anyio, requires_postgres]
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    """测试用任务：echo 原样返回 payload；flaky 前 payload["fail"] 次失败"""
+    calls = []
+
+    async def echo(db, payload):
+        calls.append(payload)
+        return {"echo": payload}
+
+    async def flaky(db, payload):
+        calls.append(payload)
+        if len(calls) <= payload.get("fail", 0):
+            raise RuntimeError(f"boom {len(calls)}")
+        return {"calls": len(calls)}
+
+    async def fatal(db, payload):
+        raise job_service.PermanentJobError("bad payload")
+
+    for kind, fn in (("test_echo", echo), ("test_flaky", flaky), ("test_fatal", fatal)):
+        monkeypatch.setitem(job_service.JOB_REGISTRY, kind, JobSpec(kind, kind, fn))
+    return calls
+
+
+async def _job(db, job_id) -> Job:
+    db.expire_all()
+    return (await db.execute(select(Job).where(Job.id == job_id))).scalar_one()
+
+
+async def test_claim_and_complete(pg_schema, handlers):
+    from app.db.session import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        ids = [(await job_service.enqueue(db, "test_echo", {"n": i})).id for i in range(3)]
+        later = (await job_service.enqueue(db, "test_echo", {"n": 9}, run_at=datetime.utcnow() + timedelta(hours=1))).id
+        worker = JobWorker(concurrency=2)
+        assert await worker.drain() == 3
+        for i, job_id in enumerate(ids):
+            job = await _job(db, job_id)
+            assert (job.status, job.attempts, job.result, job.locked_by) == ("succeeded", 1, {"echo": {"n": i}}, None)
+        assert (await _job(db, later)).status == "queued"  # 没到期的不领
+        assert worker.stats()["succeeded"] == 3
+
+
+async def test_claim_skips_locked_rows(pg_schema, handlers):
+    from app.db.session import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db, AsyncSessionLocal() as other:
+        a = (await job_service.enqueue(db, "test_echo", {"n": 1})).id
+        b = (await job_service.enqueue(db, "test_echo", {"n": 2})).id
+        # 另一个事务锁住 a（相当于别的 worker 正在领它）：不等锁，直接领后面的
+        await other.execute(select(Job).where(Job.id == a).with_for_update())
+        claimed = await job_service.claim_jobs(db, "w1", 10)
+        assert [j.id for j in claimed] == [b]
+        await other.rollback()
+        assert [j.id for j in await job_service.claim_jobs(db, "w2", 10)] == [a]
+
+
+async def test_failure_is_retried_with_backoff(pg_schema, handlers, monkeypatch):
+    from app.db.session import AsyncSessionLocal
+
+    monkeypatch.setattr(job_service.settings, "JOB_RETRY_BASE_SECONDS", 60)
+    monkeypatch.setattr(job_service.settings, "JOB_RETRY_MAX_SECONDS", 600)
+    async with AsyncSessionLocal() as db:
+        job = (await job_service.enqueue(db, "test_flaky", {"fail": 2}, max_attempts=3)).id
+        worker = JobWorker()
+        before = datetime.utcnow()
+        assert await worker.drain() == 1  # 失败后推迟 run_at，drain 不会马上再领
+        row = await _job(db, job)
+        assert (row.status, row.attempts, row.last_error) == ("queued", 1, "RuntimeError: boom 1")
+        assert timedelta(seconds=30) <= row.run_at - before <= timedelta(seconds=61)  # 第 1 次失败：[base/2, base]
+
+        await db.execute(update(Job).where(Job.id == job).values(run_at=datetime.utcnow()))
+        await db.commit()
+        assert await worker.drain() == 1
+        row = await _job(db, job)
+        assert (row.status, row.attempts) == ("queued", 2)
+        assert timedelta(seconds=60) <= row.run_at - datetime.utcnow() <= timedelta(seconds=121)  # 第 2 次翻倍
+
+        await db.execute(update(Job).where(Job.id == job).values(run_at=datetime.utcnow()))
+        await db.commit()
+        assert await worker.drain() == 1
+        row = await _job(db, job)
+        assert (row.status, row.attempts, row.result, row.last_error) == ("succeeded", 3, {"calls": 3}, None)
+
+
+async def test_retries_run_out_and_permanent_errors_fail(pg_schema, handlers):
+    from app.db.session import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        flaky = (await job_service.enqueue(db, "test_flaky", {"fail": 5}, max_attempts=1)).id
+        fatal = (await job_service.enqueue(db, "test_fatal", {}, max_attempts=5)).id
+        assert await JobWorker().drain() == 2
+        assert (await _job(db, flaky)).status == "failed"
+        row = await _job(db, fatal)
+        assert (row.status, row.attempts, row.last_error) == ("failed", 1, "bad payload")
+
+
+async def test_expired_lease_is_requeued(pg_schema, handlers):
+    from app.db.session import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        job = (await job_service.enqueue(db, "test_echo", {"n": 1})).id
+        last = (await job_service.enqueue(db, "test_echo", {"n": 2}, max_attempts=1)).id
+        # 领走后 worker 挂了：不再续租
+        assert len(await job_service.claim_jobs(db, "dead-worker", 10)) == 2
+        assert await job_service.requeue_expired(db, lease_seconds=60) == 0  # 租约还没过期
+        await db.execute(update(Job).values(locked_at=datetime.utcnow() - timedelta(seconds=120)))
+        await db.commit()
+        assert await job_service.requeue_expired(db, lease_seconds=60) == 2
+
+        row = await _job(db, job)
+        assert (row.status, row.locked_by, row.last_error) == ("queued", None, "lease expired")
+        assert (await _job(db, last)).status == "failed"  # 重试次数已用完
+
+        # 旧 worker 回来也不能覆盖结果
+        await job_service.mark_succeeded(db, job_service.ClaimedJob(job, "test_echo", {}, 1, 5), "dead-worker", {})
+        assert (await _job(db, job)).status == "queued"
+        assert await JobWorker().drain() == 1
+        row = await _job(db, job)
+        assert (row.status, row.attempts) == ("succeeded", 2)
+
+
+async def test_reconcile_tags_job(pg_schema, make_user):
+    from app.db.session import AsyncSessionLocal
+    from app.models.tag import PromptTagFacet
+    from app.schemas.prompt import PromptCreate
+    from app.services import prompt_service, tag_service
+
+    user = await make_user()
+    async with AsyncSessionLocal() as db:
+        for tags in (["a", "b"], ["b"]):
+            await prompt_service.create_prompt(db, user.id, PromptCreate(title="t", content="c", tags=tags))
+        expected = await tag_service.facet_counts(db, user.id)
+        # 绕过 service 改库造成的漂移
+        await db.execute(update(PromptTagFacet).where(PromptTagFacet.user_id == user.id).values(prompt_count=7))
+        await db.commit()
+        assert await tag_service.facet_counts(db, user.id) != expected
+
+        job = (await job_service.enqueue(db, "reconcile_tags", {"user_id": str(user.id)}, user_id=user.id)).id
+        assert await JobWorker().drain() == 1
+        row = await _job(db, job)
+        assert (row.status, row.result) == ("succeeded", {"facet_rows": 5})
+        assert await tag_service.facet_counts(db, user.id) == expected
@@ -0,0 +1,77 @@
+# backend/tests/test_mcp.py
+import logging
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from app.api import mcp
+from app.api.mcp import MCPRequest, ToolSpec, dispatch_batch
+from app.core.principal_cache import Principal
+
+pytestmark = pytest.mark.anyio
+
+USER = Principal(id=uuid.uuid4(), email="mcp@example.com", is_active=True)
+
+
+class EchoArgs(BaseModel):
+    text: str
+
+
+@pytest.fixture(autouse=True)
+def tools(monkeypatch):
+    """测试用工具：echo 原样返回；denied 抛 HTTPException；broken 抛带敏感信息的异常"""
+    async def echo(db, user, args):
+        return {"text": args.text}
+
+    async def denied(db, user, args):
+        raise HTTPException(status_code=404, detail="Prompt not found")
+
+    async def broken(db, user, args):
+        raise RuntimeError("connection to postgresql://app:secret@db/prod failed")
+
+    for name, fn in (("test_echo", echo), ("test_denied", denied), ("test_broken", broken)):
+        monkeypatch.setitem(mcp.TOOL_REGISTRY, name, ToolSpec(name, name, EchoArgs, fn))
+
+
+def _call(req_id, name, **arguments) -> MCPRequest:
+    return MCPRequest(id=req_id, method="tools/call", params={"name": name, "arguments": arguments})
+
+
+async def test_batch_skips_notifications_and_keeps_order():
+    reqs = [
+        MCPRequest(method="notifications/initialized"),
+        _call(1, "test_echo", text="a"),
+        MCPRequest(id="p", method="ping"),
+        MCPRequest(method="notifications/cancelled", params={"requestId": 1}),
+        _call(2, "test_echo", text="b"),
+    ]
+    out = await dispatch_batch(USER, reqs)
+    assert [m["id"] for m in out] == [1, "p", 2]
+    assert [m["result"] for m in out] == [{"text": "a"}, {}, {"text": "b"}]
+
+
+async def test_empty_batch():
+    assert await dispatch_batch(USER, []) == []
+    assert await dispatch_batch(USER, [MCPRequest(method="notifications/initialized")]) == []
+
+
+async def test_batch_errors_are_per_call(caplog):
+    reqs = [
+        _call(1, "test_echo", text="ok"),
+        _call(2, "no_such_tool"),
+        _call(3, "test_echo"),
+        _call(4, "test_denied", text="x"),
+        _call(5, "test_broken", text="x"),
+        MCPRequest(id=6, method="nope"),
+    ]
+    with caplog.at_level(logging.ERROR, logger="app.api.mcp"):
+        out = await dispatch_batch(USER, reqs)
+    assert out[0]["result"] == {"text": "ok"} and out[0]["error"] is None
+    codes = [m["error"]["code"] for m in out[1:]]
+    assert codes == [-32601, -32602, 404, -32603, -32601]
+    assert out[4]["error"]["message"] == "Internal error"
+    # 原始异常只进日志，不回给客户端
+    assert "secret" not in mcp.encode_message(out[4]).decode()
+    assert "secret" in caplog.text
@@ -0,0 +1,44 @@
+# backend/tests/test_mcp_sessions.py
+import uuid
+
+import pytest
+
+from app.db.session import AsyncSessionLocal
+from app.services import cache_bus, user_service
+from app.services.mcp_sessions import PROMPTS_LIST_CHANGED, SessionRegistry, session_registry
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_close_user_only_closes_that_user():
+    reg = SessionRegistry()
+    a, b = uuid.uuid4(), uuid.uuid4()
+    sa = [reg.open(a), reg.open(a)]
+    sb = reg.open(b)
+    assert reg.close_user(a) == 2
+    assert all(reg.get(s.id) is None for s in sa)
+    assert await sa[0].next_frame(0.1) is None  # 写出循环结束，流关闭
+    assert reg.get(sb.id) is sb
+    assert reg.notify(b, PROMPTS_LIST_CHANGED) == 1
+    assert reg.stats()["users"] == 1
+
+
+@pytest.mark.parametrize("action", ["deactivate_user", "rotate_api_key", "revoke_all_tokens"])
+async def test_user_changes_close_sessions(users_table, make_user, action):
+    user = await make_user()
+    s = session_registry.open(user.id)
+    try:
+        async with AsyncSessionLocal() as db:
+            await getattr(user_service, action)(db, user.id)
+        assert session_registry.get(s.id) is None
+    finally:
+        session_registry.discard(s)
+
+
+async def test_remote_user_change_closes_sessions():
+    user_id = uuid.uuid4()
+    s = session_registry.open(user_id)
+    bus = cache_bus.InvalidationBus()
+    bus._on_notify(None, 0, bus.channel, cache_bus.encode("other", cache_bus.user_changed(user_id, 3)))
+    bus.apply_pending()
+    assert session_registry.get(s.id) is None
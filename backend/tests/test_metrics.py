@@ -0,0 +1,107 @@
+# backend/tests/test_metrics.py
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.core import instrumentation
+from app.core.config import get_settings
+from app.core.instrumentation import (
+    REQUEST_DB_QUERIES,
+    REQUEST_LATENCY,
+    Histogram,
+    RequestMetricsMiddleware,
+    observe_query,
+    register_gauges,
+    render_prometheus,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def test_histogram_render_is_cumulative():
+    h = Histogram("t_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.1, 0.5, 3.0):
+        h.observe(('/a"b',), v)
+    assert h.render() == [
+        "# HELP t_seconds test",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{route="/a\\"b",le="0.1"} 2',
+        't_seconds_bucket{route="/a\\"b",le="1.0"} 3',
+        't_seconds_bucket{route="/a\\"b",le="+Inf"} 4',
+        't_seconds_sum{route="/a\\"b"} 3.65',
+        't_seconds_count{route="/a\\"b"} 4',
+    ]
+
+
+def test_render_prometheus_collects_registered_gauges(monkeypatch):
+    monkeypatch.setattr(instrumentation, "_GAUGE_SOURCES", {})
+
+    def broken():
+        raise RuntimeError("boom")
+
+    register_gauges("ok", lambda: {"t_items": 3, "t_unknown": None})
+    register_gauges("broken", broken)
+    text = render_prometheus({"t_extra": 1})
+    assert "# TYPE t_items gauge\nt_items 3.0\n" in text
+    assert "t_extra 1.0" in text
+    assert "t_unknown" not in text  # None 不导出；出错的来源被跳过，不影响其它指标
+
+
+def _app(**kw) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        observe_query("SELECT 1", (), False, 0.004)
+        observe_query("SELECT 2", (), False, 0.006)
+        return {"id": item_id}
+
+    app.add_middleware(RequestMetricsMiddleware, **kw)
+    return app
+
+
+async def _get(app, path: str) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+        return await c.get(path)
+
+
+def _count(metric, key) -> float:
+    row = metric._data.get(key)
+    if row is None:
+        return 0
+    return sum(row[:-1]) if isinstance(row, list) else row
+
+
+async def test_middleware_records_route_template_and_server_timing():
+    key = ("GET", "/items/{item_id}", "200")
+    before, queries = _count(REQUEST_LATENCY, key), _count(REQUEST_DB_QUERIES, ("/items/{item_id}",))
+    r = await _get(_app(server_timing_enabled=True), "/items/7")
+    assert r.status_code == 200
+    # 按路由模板记，不按具体 id
+    assert _count(REQUEST_LATENCY, key) == before + 1
+    assert _count(REQUEST_DB_QUERIES, ("/items/{item_id}",)) == queries + 2
+    app_part, db_part, total_part = r.headers["server-timing"].split(", ")
+    assert app_part.startswith("app;dur=") and total_part.startswith("total;dur=")
+    assert db_part == 'db;dur=10.0;desc="2 queries"'
+
+    r = await _get(_app(server_timing_enabled=False), "/nope")
+    assert r.status_code == 404 and "server-timing" not in r.headers
+    assert _count(REQUEST_LATENCY, ("GET", "unmatched", "404")) >= 1
+
+
+async def test_metrics_endpoint_requires_api_key(monkeypatch):
+    from app.main import create_app
+
+    settings = get_settings()
+    monkeypatch.setattr(settings, "METRICS_ENABLED", True)
+    monkeypatch.setattr(settings, "METRICS_REQUIRE_API_KEY", True)
+    app = create_app(settings)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+        assert (await c.get("/metrics")).status_code == 422
+        assert (await c.get("/metrics", headers={"X-API-Key": "wrong"})).status_code == 403
+        r = await c.get("/metrics", headers={"X-API-Key": settings.API_KEY})
+    assert r.status_code == 200
+    assert "principal_cache_hits" in r.text and "http_request_duration_seconds" in r.text
+
+    monkeypatch.setattr(settings, "METRICS_REQUIRE_API_KEY", False)
+    assert (await _get(create_app(settings), "/metrics")).status_code == 200
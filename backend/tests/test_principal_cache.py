@@ -0,0 +1,112 @@
+# backend/tests/test_principal_cache.py
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import principal_cache as pc
+from app.core.principal_cache import Principal, PrincipalCache
+
+pytestmark = pytest.mark.anyio
+
+
+def _principal(active: bool = True) -> Principal:
+    n = uuid.uuid4()
+    return Principal(id=n, email=f"{n.hex[:8]}@example.com", is_active=active)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(pc, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = PrincipalCache(ttl_seconds=60)
+    p = _principal()
+    cache.put_by_id(p)
+    cache.put_by_api_key("k", p)
+    clock[0] += 59
+    assert cache.get_by_id(p.id) is p and cache.get_by_api_key("k") is p
+    clock[0] += 2
+    assert cache.get_by_id(p.id) is None and cache.get_by_api_key("k") is None
+    assert cache.stats()["size"] == 0 and (cache.hits, cache.misses) == (2, 2)
+
+
+def test_lru_eviction(clock):
+    cache = PrincipalCache(max_size=2)
+    a, b, c = _principal(), _principal(), _principal()
+    cache.put_by_id(a)
+    cache.put_by_id(b)
+    assert cache.get_by_id(a.id) is a  # a 变成最近使用
+    cache.put_by_id(c)
+    assert cache.get_by_id(b.id) is None
+    assert cache.get_by_id(a.id) is a and cache.get_by_id(c.id) is c
+    assert b.id not in cache._keys_by_user
+
+
+def test_invalidate_user_drops_both_keys():
+    cache = PrincipalCache()
+    p, other = _principal(), _principal()
+    cache.put_by_id(p)
+    cache.put_by_api_key("k", p)
+    cache.put_by_id(other)
+    cache.invalidate_user(str(p.id))
+    assert cache.get_by_id(p.id) is None and cache.get_by_api_key("k") is None
+    assert cache.get_by_id(other.id) is other
+
+
+def test_put_after_invalidation_is_skipped():
+    cache = PrincipalCache()
+    p, other = _principal(), _principal(active=False)
+    gen = cache.generation()  # 查库前
+    cache.invalidate_user(p.id)  # 查库期间被停用 / 轮换 Key
+    cache.put_by_id(p, gen)
+    cache.put_by_api_key("k", p, gen)
+    assert cache.get_by_id(p.id) is None and cache.get_by_api_key("k") is None
+    # 别的用户被失效不影响这一次回填；失效之后开始的查库照常回填
+    cache.put_by_id(other, gen)
+    assert cache.get_by_id(other.id) is other
+    cache.put_by_id(p, cache.generation())
+    assert cache.get_by_id(p.id) is p
+
+
+def test_clear_skips_in_flight_puts():
+    cache = PrincipalCache(max_size=2)
+    p = _principal()
+    gen = cache.generation()
+    cache.clear()
+    cache.put_by_id(p, gen)
+    assert cache.get_by_id(p.id) is None
+    # 失效记录超过 max_size 时整体清掉，之前的快照同样不回填
+    gen = cache.generation()
+    for _ in range(3):
+        cache.invalidate_user(uuid.uuid4())
+    assert len(cache._invalidated_at) <= 2
+    cache.put_by_id(p, gen)
+    assert cache.get_by_id(p.id) is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = PrincipalCache(enabled=False)
+    p = _principal()
+    cache.put_by_id(p)
+    assert cache.get_by_id(p.id) is None and cache.stats()["size"] == 0
+
+
+async def test_db_fallback_does_not_cache_a_stale_user(monkeypatch):
+    from app.api import deps
+
+    monkeypatch.setattr(deps, "principal_cache", PrincipalCache())
+    user = SimpleNamespace(id=uuid.uuid4(), email="a@example.com", is_active=True)
+
+    async def load(db, user_id):
+        deps.principal_cache.invalidate_user(user.id)  # 查库返回之前，另一个请求停用了该用户
+        return user
+
+    monkeypatch.setattr(deps, "get_user_by_id", load)
+    monkeypatch.setattr(deps, "bind_user", lambda db, user_id: None)
+    principal = await deps._load_principal(None, str(user.id))
+    assert principal.id == user.id
+    assert deps.principal_cache.get_by_id(user.id) is None
@@ -0,0 +1,38 @@
+# backend/tests/test_prompt_cache.py
+import uuid
+
+import pytest
+
+from app.services.prompt_cache import LocalMemoryTier, PromptContentCache
+
+pytestmark = pytest.mark.anyio
+
+
+def _counts(cache):
+    return cache.hits, cache.tier2_hits, cache.misses
+
+
+async def test_hit_miss_counting():
+    cache = PromptContentCache()
+    owner, other, pid = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    assert await cache.get(pid, owner) is None
+    await cache.put(pid, 1, owner, b'{"a":1}')
+    assert await cache.get(pid, owner) == b'{"a":1}'
+    assert _counts(cache) == (1, 0, 1)
+    # 别的用户查同一个 id：返回 None，算未命中而不是命中
+    assert await cache.get(pid, other) is None
+    assert _counts(cache) == (1, 0, 2)
+
+
+async def test_second_tier_counting():
+    tier = LocalMemoryTier()
+    writer, reader = PromptContentCache(second_tier=tier), PromptContentCache(second_tier=tier)
+    owner, other, pid = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    await writer.put(pid, 2, owner, b"{}")
+    assert await reader.get(pid, other) is None
+    assert _counts(reader) == (0, 0, 1)
+    assert await reader.get(pid, owner) == b"{}"  # 上一次已回填到一级
+    assert _counts(reader) == (1, 0, 1)
+    fresh = PromptContentCache(second_tier=tier)
+    assert await fresh.get(pid, owner) == b"{}"
+    assert _counts(fresh) == (0, 1, 0)
@@ -0,0 +1,172 @@
+# backend/tests/test_prompts.py
+import pytest
+from pydantic import ValidationError
+
+from app.schemas.prompt import PromptCreate, PromptUpdate
+from tests.conftest import auth_headers, requires_postgres
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("field", ["title", "content", "tags", "variables", "is_public"])
+def test_update_rejects_null(field):
+    with pytest.raises(ValidationError):
+        PromptUpdate(**{field: None})
+
+
+def test_update_rejects_empty_content():
+    with pytest.raises(ValidationError):
+        PromptUpdate(content="")
+
+
+def test_tags_are_capped():
+    from app.schemas.prompt import MAX_TAGS
+
+    tags = [f"t{i}" for i in range(MAX_TAGS + 1)]
+    PromptCreate(title="t", content="c", tags=tags[:-1])
+    with pytest.raises(ValidationError):
+        PromptCreate(title="t", content="c", tags=tags)
+    with pytest.raises(ValidationError):
+        PromptUpdate(tags=tags)
+
+
+def test_update_allows_clearing_nullable_fields():
+    body = PromptUpdate(description=None, category=None)
+    assert body.model_dump(exclude_unset=True) == {"description": None, "category": None}
+    assert PromptUpdate().model_dump(exclude_unset=True) == {}
+
+
+async def _create(db, user, **kw):
+    from app.services import prompt_service
+
+    return await prompt_service.create_prompt(
+        db, user.id, PromptCreate(title="t", content="hello {{name}}", tags=["a"], **kw)
+    )
+
+
+@requires_postgres
+async def test_create_writes_embedding_and_signature(pg_schema, make_user, monkeypatch):
+    from sqlalchemy import func, select
+
+    from app.db.session import AsyncSessionLocal
+    from app.models.dedupe import PromptSignature
+    from app.models.embedding import PromptEmbedding
+    from app.services import dedupe_service
+
+    monkeypatch.setattr(dedupe_service, "enabled", lambda: True)
+    user = await make_user()
+    async with AsyncSessionLocal() as db:
+        p = await _create(db, user)
+        for model in (PromptEmbedding, PromptSignature):
+            assert await db.scalar(select(func.count()).select_from(model).where(model.prompt_id == p.id)) == 1
+
+
+@requires_postgres
+async def test_patch_null_is_422(pg_schema, make_user, client):
+    from app.db.session import AsyncSessionLocal
+
+    user = await make_user()
+    async with AsyncSessionLocal() as db:
+        p = await _create(db, user)
+    r = await client.patch(f"/api/v1/prompts/{p.id}", json={"content": None}, headers=auth_headers(user))
+    assert r.status_code == 422
+    r = await client.patch(f"/api/v1/prompts/{p.id}", json={"title": "t2", "description": None},
+                           headers=auth_headers(user))
+    assert r.status_code == 200
+    assert (r.json()["title"], r.json()["content"], r.json()["version"]) == ("t2", "hello {{name}}", 2)
+
+
+@requires_postgres
+async def test_concurrent_updates_serialize(pg_schema, make_user):
+    import asyncio
+
+    from sqlalchemy import select
+
+    from app.db.session import AsyncSessionLocal
+    from app.models.prompt import PromptVersion
+    from app.services import prompt_service, version_service
+
+    user = await make_user()
+    async with AsyncSessionLocal() as db:
+        p = await _create(db, user)
+
+    async def patch(i):
+        async with AsyncSessionLocal() as db:
+            await prompt_service.update_prompt(db, user.id, p.id, PromptUpdate(content=f"v{i} {{{{name}}}}"))
+
+    await asyncio.gather(*(patch(i) for i in range(8)))
+    async with AsyncSessionLocal() as db:
+        cur = await prompt_service.get_user_prompt_or_404(db, user.id, p.id)
+        versions = (await db.execute(
+            select(PromptVersion.version).where(PromptVersion.prompt_id == p.id).order_by(PromptVersion.version)
+        )).scalars().all()
+        assert cur.version == 9
+        assert versions == list(range(1, 10))
+        assert (await version_service.get_version(db, user.id, p.id, 9))["content"] == cur.content
+
+
+@requires_postgres
+async def test_content_change_recomputes_variables(pg_schema, make_user):
+    from app.db.session import AsyncSessionLocal
+    from app.services import prompt_service
+
+    user = await make_user()
+    async with AsyncSessionLocal() as db:
+        p = await _create(db, user)
+        assert p.variables == ["name"]
+        p = await prompt_service.update_prompt(db, user.id, p.id, PromptUpdate(content="{{a}} and {{b}}"))
+        assert p.variables == ["a", "b"]
+        # 显式给出的 variables 优先；不改正文时不动 variables
+        p = await prompt_service.update_prompt(db, user.id, p.id, PromptUpdate(content="{{c}}", variables=["x"]))
+        assert p.variables == ["x"]
+        p = await prompt_service.update_prompt(db, user.id, p.id, PromptUpdate(title="t2"))
+        assert p.variables == ["x"]
+
+
+@requires_postgres
+async def test_render_does_not_write_back(pg_schema, make_user):
+    from sqlalchemy import select, update
+
+    from app.db.session import AsyncSessionLocal
+    from app.models.prompt import Prompt
+    from app.services import prompt_service, template_service
+
+    user = await make_user()
+    async with AsyncSessionLocal() as db:
+        p = await _create(db, user)
+        # 旧数据：没有预编译结果
+        await db.execute(update(Prompt).where(Prompt.id == p.id).values(compiled_template=None))
+        await db.commit()
+        out = await prompt_service.render_prompt(db, user.id, p.id, [{"name": "x"}])
+        assert out["rendered"] == ["hello x"]
+        assert template_service.memo_get(p.id, 1) is not None  # 编译结果留在进程内
+        assert await db.scalar(select(Prompt.compiled_template).where(Prompt.id == p.id)) is None
+
+
+@requires_postgres
+async def test_noop_patch_keeps_version(pg_schema, make_user, client, monkeypatch):
+    from sqlalchemy import func, select
+
+    from app.db.session import AsyncSessionLocal
+    from app.models.prompt import PromptVersion
+    from app.services import prompt_service
+
+    user = await make_user()
+    async with AsyncSessionLocal() as db:
+        p = await _create(db, user)
+    published = []
+
+    async def publish(db, *changes):
+        published.extend(changes)
+
+    monkeypatch.setattr(prompt_service.cache_bus, "publish", publish)
+    for body in ({}, {"title": "t", "tags": ["a"], "content": "hello {{name}}"}):
+        r = await client.patch(f"/api/v1/prompts/{p.id}", json=body, headers=auth_headers(user))
+        assert r.status_code == 200
+        assert (r.json()["version"], r.json()["title"]) == (1, "t")
+    r = await client.patch(f"/api/v1/prompts/{p.id}", json={"content": ""}, headers=auth_headers(user))
+    assert r.status_code == 422
+    assert published == []
+    async with AsyncSessionLocal() as db:
+        count = select(func.count()).select_from(PromptVersion).where(PromptVersion.prompt_id == p.id)
+        assert await db.scalar(count) == 1
@@ -0,0 +1,31 @@
+# backend/tests/test_public.py
+import pytest
+from sqlalchemy import update
+
+from app.models.prompt import Prompt
+from app.schemas.prompt import PromptCreate
+from tests.conftest import requires_postgres
+
+pytestmark = [pytest.mark.anyio, requires_postgres]
+
+
+async def test_detail_etag_follows_usage_count(pg_schema, make_user, client):
+    from app.db.session import AsyncSessionLocal
+    from app.services import prompt_service
+
+    user = await make_user()
+    async with AsyncSessionLocal() as db:
+        p = await prompt_service.create_prompt(db, user.id, PromptCreate(title="t", content="c", is_public=True))
+    url = f"/api/v1/public/prompts/{p.id}"
+
+    r = await client.get(url)
+    assert r.status_code == 200
+    etag = r.headers["etag"]
+    assert (await client.get(url, headers={"If-None-Match": etag})).status_code == 304
+
+    # 使用量写回后版本不变，但响应体变了：旧 ETag 不能再 304
+    async with pg_schema.begin() as conn:
+        await conn.execute(update(Prompt).where(Prompt.id == p.id).values(usage_count=Prompt.usage_count + 5))
+    r = await client.get(url, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["usage_count"] == 5 and r.headers["etag"] != etag
@@ -0,0 +1,88 @@
+# backend/tests/test_quota.py
+import asyncio
+import time
+import uuid
+
+import pytest
+
+from app.services.quota_service import QuotaTracker
+from tests.conftest import requires_postgres
+
+pytestmark = pytest.mark.anyio
+
+
+class BlockingSession:
+    """upsert 卡在 release 上，之后按 fail 返回库内总数或抛错"""
+
+    def __init__(self, tracker, fail=False):
+        self.tracker = tracker
+        self.fail = fail
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt):
+        self.started.set()
+        await self.release.wait()
+        if self.fail:
+            raise ConnectionError("db down")
+        # 库里另有别的 worker 记的 100 次
+        rows = [(uid, day, 100 + n) for (uid, day), n in self.tracker._inflight.items()]
+        return type("Res", (), {"all": lambda _self: rows})()
+
+    async def commit(self):
+        pass
+
+
+@pytest.mark.parametrize("fail", [False, True], ids=["ok", "failed"])
+async def test_inflight_batch_still_counts(fail):
+    tracker = QuotaTracker(session_factory=None, daily_limit=105)
+    session = BlockingSession(tracker, fail=fail)
+    tracker.session_factory = session
+    user = uuid.uuid4()
+    for _ in range(3):
+        assert tracker.consume(user).allowed
+
+    flush = asyncio.create_task(tracker.flush())
+    await session.started.wait()
+    # 写回进行中：这 3 次既不在 _pending 也还没进 _known，仍要算已用
+    assert tracker.used(user) == 3
+    tracker.consume(user)
+    assert tracker.used(user) == 4
+
+    session.release.set()
+    await flush
+    assert tracker._inflight == {}
+    if fail:
+        assert tracker.used(user) == 4 and tracker.flush_errors == 1
+        assert tracker._pending[(user, tracker._today(time.time()))] == 4
+    else:
+        assert tracker.used(user) == 104  # 库内 103 + 刚才写回期间新记的 1
+        assert tracker.consume(user).allowed and not tracker.consume(user).allowed
+
+
+@requires_postgres
+async def test_flush_roundtrip(engine, make_user):
+    from app.api import Base
+    from app.db.session import AsyncSessionLocal
+    from app.models.quota import DailyApiUsage
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all, tables=[Base.metadata.tables["users"], DailyApiUsage.__table__])
+    user = await make_user()
+    a, b = QuotaTracker(AsyncSessionLocal, daily_limit=10), QuotaTracker(AsyncSessionLocal, daily_limit=10)
+    for _ in range(4):
+        a.consume(user.id)
+    for _ in range(3):
+        b.consume(user.id)
+    assert await a.flush() == 1 and await b.flush() == 1
+    assert b.used(user.id) == 7 and a.used(user.id) == 4  # a 下次 flush 才看到 b 的计数
@@ -0,0 +1,41 @@
+# backend/tests/test_replica.py
+import pytest
+from sqlalchemy import delete, insert, select, text, update
+
+from app.db import replica
+from app.db.replica import RoutingSession, read_router
+from app.db.session import get_engine
+from app.models.prompt import Prompt
+
+
+@pytest.fixture
+def healthy_replica(monkeypatch, tmp_path):
+    monkeypatch.setattr(replica.settings, "DATABASE_READ_URL", f"sqlite+aiosqlite:///{tmp_path}/replica.db")
+    monkeypatch.setattr(replica, "_read_engine", None)
+    monkeypatch.setattr(read_router, "healthy", True)
+    return replica.get_read_engine().sync_engine
+
+
+def test_reads_go_to_replica(healthy_replica):
+    s = RoutingSession()
+    assert s.get_bind(clause=select(Prompt.id)) is healthy_replica
+    assert s.get_bind(clause=text("SELECT 1")) is healthy_replica
+
+
+@pytest.mark.parametrize("stmt", [
+    update(Prompt).values(usage_count=1),
+    insert(Prompt).values(title="t"),
+    delete(Prompt),
+    select(Prompt.id).with_for_update(),
+], ids=["update", "insert", "delete", "for_update"])
+def test_writes_go_to_primary(healthy_replica, stmt):
+    s = RoutingSession()
+    primary = get_engine().sync_engine
+    assert s.get_bind(clause=stmt) is primary
+    # 写过之后同一个 session 的读也留在主库
+    assert s.get_bind(clause=select(Prompt.id)) is primary
+
+
+def test_unhealthy_replica_falls_back(healthy_replica, monkeypatch):
+    monkeypatch.setattr(read_router, "healthy", False)
+    assert RoutingSession().get_bind(clause=select(Prompt.id)) is get_engine().sync_engine
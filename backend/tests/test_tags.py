@@ -0,0 +1,95 @@
+# backend/tests/test_tags.py
+import pytest
+from sqlalchemy import select
+
+from app.models.tag import PromptTagFacet, Tag
+from app.schemas.prompt import PromptCreate, PromptUpdate
+from app.services import tag_service
+from tests.conftest import requires_postgres
+
+pytestmark = [pytest.mark.anyio, requires_postgres]
+
+
+async def _facets(db, user_id):
+    rows = await db.execute(
+        select(PromptTagFacet.category, PromptTagFacet.filter_tag, PromptTagFacet.facet_tag, PromptTagFacet.prompt_count)
+        .where(PromptTagFacet.user_id == user_id)
+    )
+    return {(c, f, t): n for c, f, t, n in rows.all()}
+
+
+async def _tags(db):
+    return dict((await db.execute(select(Tag.name, Tag.usage_count))).all())
+
+
+async def test_removed_keys_are_deleted_not_negative(pg_schema, make_user):
+    from app.db.session import AsyncSessionLocal
+    from app.services import prompt_service
+
+    user = await make_user()
+    async with AsyncSessionLocal() as db:
+        p = await prompt_service.create_prompt(db, user.id, PromptCreate(title="t", content="c", tags=["a", "b"]))
+        await prompt_service.update_prompt(db, user.id, p.id, PromptUpdate(tags=["a"], category="x"))
+        assert await _facets(db, user.id) == {("x", "", ""): 1, ("x", "", "a"): 1}
+        assert await _tags(db) == {"a": 1, "b": 0}
+
+        # 漂移：减掉一份从没计过的贡献（如绕过 service 改过库）——不插入负数行，已有行不低于 0
+        await tag_service.apply_prompt_change(db, user.id, ("x", ["a", "zz"]), None)
+        await tag_service.apply_prompt_change(db, user.id, ("x", ["a", "zz"]), None)
+        await db.commit()
+        assert await _facets(db, user.id) == {}
+        assert await _tags(db) == {"a": 0, "b": 0}
+
+        await prompt_service.delete_prompt(db, user.id, p.id)
+        await tag_service.reconcile_user_tags(db, user.id)
+        assert await _facets(db, user.id) == {}
+
+
+async def test_incremental_matches_reconcile(pg_schema, make_user):
+    from app.db.session import AsyncSessionLocal
+    from app.services import prompt_service
+
+    user = await make_user()
+    async with AsyncSessionLocal() as db:
+        ids = []
+        for i, tags in enumerate((["a", "b"], ["b", "c"], ["a", "b", "c"], [])):
+            p = await prompt_service.create_prompt(
+                db, user.id, PromptCreate(title=f"t{i}", content="c", tags=tags, category="k" if i % 2 else None)
+            )
+            ids.append(p.id)
+        await prompt_service.update_prompt(db, user.id, ids[0], PromptUpdate(tags=["c"]))
+        await prompt_service.delete_prompt(db, user.id, ids[2])
+        incremental = await _facets(db, user.id)
+        assert all(n > 0 for n in incremental.values())
+        await tag_service.reconcile_user_tags(db, user.id)
+        assert await _facets(db, user.id) == incremental
+
+
+async def test_many_tags(pg_schema, make_user, client):
+    from app.db.session import AsyncSessionLocal
+    from app.schemas.prompt import MAX_TAGS
+    from tests.conftest import auth_headers
+
+    user = await make_user()
+    tags = [f"t{i:02}" for i in range(MAX_TAGS)]
+    r = await client.post("/api/v1/prompts/", json={"title": "t", "content": "c", "tags": tags},
+                          headers=auth_headers(user))
+    assert r.status_code == 200, r.text
+    # 换成另一组标签：一次改动 2 * 50 * 50 个分面 key
+    r = await client.patch(f"/api/v1/prompts/{r.json()['id']}", json={"tags": [f"u{i:02}" for i in range(MAX_TAGS)]},
+                         headers=auth_headers(user))
+    assert r.status_code == 200, r.text
+    r = await client.post("/api/v1/prompts/", json={"title": "t", "content": "c", "tags": tags + ["x"]},
+                          headers=auth_headers(user))
+    assert r.status_code == 422
+
+    async with AsyncSessionLocal() as db:
+        # 批量导入的一整块：合并后的 delta 远超单条语句的绑定参数上限
+        await tag_service.apply_bulk_additions(
+            db, user.id, [(None, [f"b{j}-{i}" for i in range(MAX_TAGS)]) for j in range(20)]
+        )
+        await db.commit()
+        facets = await _facets(db, user.id)
+        assert len(facets) == 1 + 21 * MAX_TAGS * MAX_TAGS  # 每条：MAX_TAGS 个单标签 + 两两组合
+        assert facets[("", "", "")] == 21 and facets[("", "u00", "u01")] == 1 and ("", "t00", "t01") not in facets
+        assert (await _tags(db))["t00"] == 0
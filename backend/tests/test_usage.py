@@ -0,0 +1,118 @@
+# backend/tests/test_usage.py
+import uuid
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from app.services.usage_service import UsageAggregator
+from tests.conftest import requires_postgres
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeSession:
+    """记录执行过的语句；fail=True 时 execute 抛错"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.statements = []
+        self.commits = 0
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt):
+        if self.fail:
+            raise ConnectionError("db down")
+        self.statements.append(stmt)
+
+    async def commit(self):
+        self.commits += 1
+
+    def compiled(self, i=-1):
+        return self.statements[i].compile(dialect=postgresql.dialect())
+
+
+async def test_flush_adds_deltas_and_keeps_updated_at():
+    db = FakeSession()
+    agg = UsageAggregator(db)
+    a, b = sorted([uuid.uuid4(), uuid.uuid4()])
+    for pid in (a, b, a, a):
+        agg.record(pid)
+    assert agg.stats()["pending_hits"] == 4
+    assert await agg.flush() == 2
+    assert await agg.flush() == 0  # 缓冲已清空，不再发语句
+    assert len(db.statements) == 1 and db.commits == 1
+
+    compiled = db.compiled()
+    sql = " ".join(str(compiled).split())
+    assert "usage_count=(prompts.usage_count + deltas.delta)" in sql
+    assert "updated_at=prompts.updated_at" in sql  # 不触发 onupdate
+    assert sorted(v for v in compiled.params.values() if isinstance(v, int)) == [1, 3]
+    assert agg.stats()["pending_prompts"] == 0 and agg.flushed_rows == 2
+
+
+async def test_failed_flush_keeps_the_counts():
+    db = FakeSession(fail=True)
+    agg = UsageAggregator(db)
+    pid = uuid.uuid4()
+    agg.record(pid, 2)
+    assert await agg.flush() == 0
+    agg.record(pid)
+    assert agg._pending == {pid: 3} and agg.flush_errors == 1
+    db.fail = False
+    assert await agg.flush() == 1
+    assert 3 in db.compiled().params.values()
+
+
+async def test_buffer_is_bounded():
+    agg = UsageAggregator(FakeSession(), max_keys=2)
+    a, b, c = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    agg.record(a)
+    agg.record(b)
+    agg.record(c, 5)
+    agg.record(a)  # 已有的 key 照常累加
+    assert agg._pending == {a: 2, b: 1}
+    assert agg.dropped == 5
+    assert agg._wakeup.is_set()  # 满了提前唤醒 flush
+
+
+async def test_stop_drains_the_buffer():
+    db = FakeSession()
+    agg = UsageAggregator(db, flush_interval=3600)
+    agg.start()
+    agg.record(uuid.uuid4())
+    assert db.statements == []
+    await agg.stop()
+    assert agg._task is None and len(db.statements) == 1 and agg.stats()["pending_prompts"] == 0
+
+
+@requires_postgres
+async def test_flush_against_postgres(pg_schema, make_user):
+    from app.db.session import AsyncSessionLocal
+    from app.models.prompt import Prompt
+    from app.schemas.prompt import PromptCreate
+    from app.services import prompt_service
+
+    user = await make_user()
+    async with AsyncSessionLocal() as db:
+        p = await prompt_service.create_prompt(db, user.id, PromptCreate(title="t", content="c"))
+        pid, before = p.id, (p.usage_count, p.updated_at)
+
+    agg = UsageAggregator(AsyncSessionLocal)
+    for _ in range(3):
+        agg.record(pid)
+    agg.record(uuid.uuid4())  # 已删除的提示词：没有匹配行，不报错
+    assert await agg.flush() == 2
+
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(select(Prompt.usage_count, Prompt.updated_at).where(Prompt.id == pid))).one()
+    assert row.usage_count == (before[0] or 0) + 3
+    assert row.updated_at == before[1]